@@ -0,0 +1,154 @@
+"""
+Compares lookups with a fixed ALPHA against lookups with an adaptive ALPHA
+in a simulated network of peers with variable latency and failures.
+
+The simulated network is made of SIZE peers. The local node knows about a
+random subset of them. When asked, each peer replies with the K peers in the
+network closest to the target (as a well populated routing table would). A
+proportion of peers are slow to respond and another proportion fail to
+respond at all.
+
+For each mode the report contains the mean and worst duration of the
+lookups along with the mean number of RPCs sent per lookup.
+"""
+import sys
+import os
+import random
+import asyncio
+import uuid
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht import constants
+from drogulus.dht.contact import PeerNode, make_network_id
+from drogulus.dht.routingtable import RoutingTable
+from drogulus.dht.timerwheel import TimerWheel
+from drogulus.dht.lookup import Lookup
+from drogulus.dht.messages import FindNode, Nodes
+from drogulus.dht.utils import sort_peer_nodes
+from drogulus.version import get_version
+
+
+#: Number of peers in the simulated network.
+SIZE = 2000
+#: Number of peers known to the local node.
+KNOWN = 100
+#: Number of concurrent lookups to run for each mode.
+LOOKUPS = 30
+#: Proportion of peers that respond slowly.
+SLOW = 0.15
+#: Proportion of peers that fail to respond.
+FAILING = 0.1
+#: Seed for the random number generator (so runs are repeatable).
+SEED = 1908
+
+
+class SimulatedNode(object):
+    """
+    Stands in for the local node. Requests are "sent" to a simulated network
+    with variable latency and failures.
+    """
+
+    def __init__(self, network, event_loop, adaptive_alpha):
+        self.network_id = make_network_id('local node')
+        self.version = get_version()
+        self.event_loop = event_loop
+        self.adaptive_alpha = adaptive_alpha
+        self.network = network
+        self.pending = {}
+        self.timers = TimerWheel(event_loop)
+        self.routing_table = RoutingTable(self.network_id)
+        for contact in random.sample(network.peers, KNOWN):
+            self.routing_table.add_contact(contact)
+
+    def _respond(self, message_id, target):
+        future = self.pending.pop(message_id)
+        if future.done():
+            return
+        closest = sort_peer_nodes(self.network.peers, target)[:constants.K]
+        nodes = [(p.public_key, p.version, p.uri) for p in closest]
+        future.set_result(Nodes(message_id, self.network_id, self.network_id,
+                                1908, self.version, 'seal', nodes))
+
+    def _fail(self, message_id):
+        future = self.pending.pop(message_id)
+        if not future.done():
+            future.set_exception(Exception('Timed out'))
+
+    def send_find(self, contact, target, message_type):
+        message_id = str(uuid.uuid4())
+        future = asyncio.Future()
+        self.pending[message_id] = future
+        behaviour = self.network.behaviour[contact.network_id]
+        if behaviour == 'failing':
+            self.event_loop.call_later(2.0, self._fail, message_id)
+        else:
+            if behaviour == 'slow':
+                delay = random.uniform(1.5, 3.0)
+            else:
+                delay = random.uniform(0.05, 0.5)
+            self.event_loop.call_later(delay, self._respond, message_id,
+                                       target)
+        return (message_id, future)
+
+
+class SimulatedNetwork(object):
+    """
+    The peers that make up the simulated network and how each of them
+    behaves ('normal', 'slow' or 'failing').
+    """
+
+    def __init__(self):
+        version = get_version()
+        self.peers = []
+        self.behaviour = {}
+        for i in range(SIZE):
+            uri = 'netstring://10.0.{}.{}:1908/'.format(i // 256, i % 256)
+            contact = PeerNode('public key {}'.format(i), version, uri)
+            roll = random.random()
+            if roll < FAILING:
+                behaviour = 'failing'
+            elif roll < FAILING + SLOW:
+                behaviour = 'slow'
+            else:
+                behaviour = 'normal'
+            self.peers.append(contact)
+            self.behaviour[contact.network_id] = behaviour
+
+
+def run(network, targets, adaptive_alpha):
+    """
+    Runs a lookup for each target concurrently and returns a list of the
+    stats for each lookup.
+    """
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    node = SimulatedNode(network, event_loop, adaptive_alpha)
+    lookups = [Lookup(FindNode, target, node, event_loop)
+               for target in targets]
+    event_loop.run_until_complete(asyncio.wait(lookups))
+    event_loop.close()
+    return [lookup.stats() for lookup in lookups]
+
+
+def report(label, stats):
+    """
+    Prints a summary of the lookup stats.
+    """
+    durations = [s['duration'] for s in stats]
+    rpcs = [s['rpcs_sent'] for s in stats]
+    print('{:>9}: mean {:.2f}s, worst {:.2f}s, {:.1f} RPCs per lookup'.format(
+        label, sum(durations) / len(durations), max(durations),
+        sum(rpcs) / len(rpcs)))
+
+
+if __name__ == '__main__':
+    random.seed(SEED)
+    network = SimulatedNetwork()
+    targets = [make_network_id('target {}'.format(i))
+               for i in range(LOOKUPS)]
+    print('{} lookups in a network of {} peers ({:.0%} slow, {:.0%} '
+          'failing):'.format(LOOKUPS, SIZE, SLOW, FAILING))
+    state = random.getstate()
+    report('fixed', run(network, targets, False))
+    random.setstate(state)
+    report('adaptive', run(network, targets, True))
@@ -0,0 +1,64 @@
+"""
+Measures the compression ratio and CPU cost of compressing values of various
+sizes. Used to choose COMPRESSION_THRESHOLD: values smaller than the
+threshold aren't worth the CPU time spent compressing and decompressing them.
+
+For each size, SAMPLES JSON documents (made of words drawn from a small
+vocabulary and some numbers, as typical values are) are compressed and
+decompressed with the settings in drogulus/dht/constants.py. The sizes can be
+given on the command line, for example::
+
+    python benchmarks/compression.py 256 1024 65536
+"""
+import sys
+import os
+import json
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht.compression import compress, decompress, compression_stats
+from drogulus.dht.metrics import MetricsRegistry
+
+
+#: The (approximate) sizes of the values in bytes.
+SIZES = (128, 256, 512, 1024, 4096, 16384, 65536, 262144)
+#: The number of values of each size.
+SAMPLES = 100
+#: The words from which values are made.
+WORDS = ['drogulus', 'peer', 'node', 'key', 'value', 'hash', 'table',
+         'network', 'store', 'find', 'item', 'public', 'signature', 'lorem',
+         'ipsum', 'dolor', 'sit', 'amet', 'the', 'a', 'of', 'and']
+
+
+def make_value(size):
+    """
+    Returns a JSON document whose serialisation is roughly size bytes long.
+    """
+    value = {'title': ' '.join(random.choice(WORDS) for i in range(5)),
+             'numbers': [], 'text': []}
+    length = len(json.dumps(value))
+    while length < size:
+        line = ' '.join(random.choice(WORDS) for i in range(10))
+        number = random.random()
+        value['text'].append(line)
+        value['numbers'].append(number)
+        length += len(json.dumps(line)) + len(repr(number)) + 4
+    return value
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    random.seed(1908)
+    print('{:>8} {:>8} {:>14} {:>16}'.format(
+        'bytes', 'ratio', 'compress us', 'decompress us'))
+    for size in sizes:
+        metrics = MetricsRegistry()
+        for i in range(SAMPLES):
+            data = json.dumps(make_value(size)).encode('utf-8')
+            compressed = compress(data, 0, metrics=metrics)
+            if compressed is not None:
+                decompress(compressed, metrics=metrics)
+        stats = compression_stats(metrics)
+        print('{:>8} {:>8.2f} {:>14.1f} {:>16.1f}'.format(
+            size, stats['ratio'], stats['compress_seconds'] * 1000000,
+            stats['decompress_seconds'] * 1000000))
@@ -0,0 +1,59 @@
+"""
+Measures the Reed-Solomon erasure coding used to store values as fragments
+(see drogulus.dht.erasure) rather than as DUPLICATION_COUNT full copies.
+
+For each size of value, random data is encoded into ERASURE_FRAGMENTS
+fragments and decoded from ERASURE_DATA_FRAGMENTS of them: first from the
+data fragments (no decoding needed) and then from the parity fragments (the
+worst case). The storage used is compared with that of full copies. The sizes
+(in bytes) can be given on the command line, for example::
+
+    python benchmarks/erasure.py 1024 1048576
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht.erasure import encode, decode
+from drogulus.dht.constants import (ERASURE_DATA_FRAGMENTS, ERASURE_FRAGMENTS,
+                                    DUPLICATION_COUNT)
+
+
+#: The sizes (in bytes) of the values to encode.
+SIZES = [1024, 64 * 1024, 1024 * 1024]
+#: The number of times each size of value is encoded and decoded.
+SAMPLES = 10
+
+
+def timed(function, *args):
+    """
+    Returns the result of the function and the average time (in seconds) it
+    took over SAMPLES calls.
+    """
+    start = time.perf_counter()
+    for i in range(SAMPLES):
+        result = function(*args)
+    return result, (time.perf_counter() - start) / SAMPLES
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    k, n = ERASURE_DATA_FRAGMENTS, ERASURE_FRAGMENTS
+    print('{} of {} fragments:'.format(k, n))
+    print('{:>8} {:>12} {:>12} {:>12} {:>10} {:>10}'.format(
+        'bytes', 'encode MB/s', 'data MB/s', 'parity MB/s', 'stored',
+        'copies'))
+    for size in sizes:
+        data = os.urandom(size)
+        fragments, encoding = timed(encode, data, k, n)
+        systematic = dict((i, fragments[i]) for i in range(k))
+        parity = dict((i, fragments[i]) for i in range(n - k, n))
+        result, plain = timed(decode, systematic, k, n, size)
+        assert result == data
+        result, decoding = timed(decode, parity, k, n, size)
+        assert result == data
+        stored = sum(len(fragment) for fragment in fragments)
+        print('{:>8} {:>12.1f} {:>12.1f} {:>12.1f} {:>10} {:>10}'.format(
+            size, size / encoding / 2 ** 20, size / plain / 2 ** 20,
+            size / decoding / 2 ** 20, stored, size * DUPLICATION_COUNT))
@@ -0,0 +1,74 @@
+"""
+Measures the ordered key index used by the data stores for range scans and
+closest-key queries.
+
+KEYS random keys are added to a SortedKeyList one at a time (as items arrive
+at a node). Then QUERIES range scans (of the keys starting with a random
+REPUBLISH_PREFIX_LENGTH character prefix) and QUERIES closest key queries (of
+the K keys closest to a random target) are timed and compared with scanning
+every key. The number of keys can be given on the command line, for
+example::
+
+    python benchmarks/keyindex.py 100000
+"""
+import sys
+import os
+import time
+import heapq
+import random
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht.keyindex import SortedKeyList, closest_keys, prefix_range
+from drogulus.dht.constants import K, REPUBLISH_PREFIX_LENGTH
+
+
+#: The number of keys in the index.
+KEYS = 1000000
+#: The number of each type of query.
+QUERIES = 100
+#: The number of queries answered by scanning every key (slow).
+SCANS = 5
+
+
+def random_key():
+    return '{:0128x}'.format(random.getrandbits(512))
+
+
+def report(label, elapsed, count):
+    print('{:>28}: {:>10.3f} ms/op'.format(label, elapsed * 1000 / count))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else KEYS
+    random.seed(1908)
+    keys = [random_key() for i in range(count)]
+    print('{} keys:'.format(count))
+    index = SortedKeyList()
+    start = time.perf_counter()
+    for key in keys:
+        index.add(key)
+    report('add', time.perf_counter() - start, count)
+    prefixes = [random_key()[:REPUBLISH_PREFIX_LENGTH] for i in range(QUERIES)]
+    start = time.perf_counter()
+    for prefix in prefixes:
+        list(index.irange(*prefix_range(prefix)))
+    report('range scan', time.perf_counter() - start, QUERIES)
+    start = time.perf_counter()
+    for prefix in prefixes[:SCANS]:
+        [key for key in keys if key.startswith(prefix)]
+    report('range (scan every key)', time.perf_counter() - start, SCANS)
+    targets = [random_key() for i in range(QUERIES)]
+    start = time.perf_counter()
+    for target in targets:
+        result = closest_keys(index.irange, target)
+        [next(result) for i in range(K)]
+    report('closest', time.perf_counter() - start, QUERIES)
+    start = time.perf_counter()
+    for target in targets[:SCANS]:
+        value = int(target, 16)
+        heapq.nsmallest(K, keys, key=lambda key: int(key, 16) ^ value)
+    report('closest (scan every key)', time.perf_counter() - start, SCANS)
+    start = time.perf_counter()
+    for key in keys[:QUERIES * 100]:
+        index.discard(key)
+    report('discard', time.perf_counter() - start, QUERIES * 100)
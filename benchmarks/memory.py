@@ -0,0 +1,70 @@
+"""
+Compares the memory used to hold ITEMS items in the in-memory DictDataStore
+with the CompactDataStore.
+
+The items come from PUBLISHERS publishers. As when items arrive down the wire,
+every item carries its own copy of its publisher's public key and the key and
+signature are hexadecimal strings. Memory is measured with tracemalloc after
+the items have been stored (only the data store keeps references to them).
+The number of items can be given on the command line, for example::
+
+    python benchmarks/memory.py 100000
+"""
+import sys
+import os
+import time
+import random
+import tracemalloc
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht.storage import DictDataStore, CompactDataStore
+from drogulus.dht.messages import Store
+from drogulus.version import get_version
+
+
+#: The number of items to store.
+ITEMS = 1000000
+#: The number of distinct publishers of the items.
+PUBLISHERS = 100
+#: The (approximate) length of a PEM encoded public key.
+PUBLIC_KEY_LENGTH = 450
+
+
+def make_items(count):
+    """
+    Yields count Store messages. The signatures are fake since the data
+    stores don't check them.
+    """
+    version = get_version()
+    publishers = ['-----BEGIN RSA PUBLIC KEY-----\n' +
+                  '{:x}'.format(random.getrandbits(PUBLIC_KEY_LENGTH * 4)) +
+                  '\n-----END RSA PUBLIC KEY-----\n'
+                  for i in range(PUBLISHERS)]
+    for i in range(count):
+        key = '{:0128x}'.format(random.getrandbits(512))
+        signature = '{:0512x}'.format(random.getrandbits(2048))
+        # A fresh copy of the public key (as if decoded from a message).
+        public_key = (random.choice(publishers) + ' ')[:-1]
+        yield Store('uuid', public_key, public_key, 1908, version, 'seal',
+                    key, 'value {}'.format(i), time.time(), 0.0, version,
+                    public_key, 'name {}'.format(i), signature)
+
+
+def measure(label, data_store, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for item in make_items(count):
+        data_store[item.key] = item
+    elapsed = time.perf_counter() - start
+    item = None
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('{:>16}: {:>8.1f} MB {:>6.0f} bytes/item {:>9.0f} inserts/s'.format(
+        label, current / 2 ** 20, current / count, count / elapsed))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else ITEMS
+    print('{} items from {} publishers:'.format(count, PUBLISHERS))
+    measure('DictDataStore', DictDataStore(), count)
+    measure('CompactDataStore', CompactDataStore(), count)
@@ -0,0 +1,83 @@
+"""
+Compares the number of inserts and reads per second of the in-memory
+DictDataStore with the persistent SQLiteDataStore and LogDataStore.
+
+Each data store has ITEMS items inserted and then read back (in a random
+order) READS times. Reads touch the item (updating its last-access time) as
+the node does when handling a FindValue request. The SQLiteDataStore is
+measured with the default group commit batch size and with a commit after
+every write (as an SQLite store without group commit would behave).
+"""
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht.storage import DictDataStore, SQLiteDataStore
+from drogulus.dht.logstore import LogDataStore
+from drogulus.dht.messages import Store
+from drogulus.version import get_version
+
+
+#: The number of items to insert.
+ITEMS = 20000
+#: The number of reads to perform.
+READS = 20000
+
+
+def make_items():
+    """
+    Returns a list of ITEMS Store messages. The signatures are fake since the
+    data store doesn't check them.
+    """
+    version = get_version()
+    items = []
+    for i in range(ITEMS):
+        key = '{:0128x}'.format(random.getrandbits(512))
+        items.append(Store('uuid', 'recipient', 'sender', 1908, version,
+                           'seal', key, 'value {}'.format(i) * 10,
+                           time.time(), 0.0, version, 'public_key',
+                           'name {}'.format(i), 'signature'))
+    return items
+
+
+def measure(label, data_store, items):
+    start = time.perf_counter()
+    for item in items:
+        data_store[item.key] = item
+    if hasattr(data_store, 'flush'):
+        data_store.flush()
+    inserted = time.perf_counter() - start
+    keys = [random.choice(items).key for i in range(READS)]
+    start = time.perf_counter()
+    for key in keys:
+        data_store[key]
+        data_store.touch(key)
+    if hasattr(data_store, 'flush'):
+        data_store.flush()
+    read = time.perf_counter() - start
+    print('{:>28}: {:>9.0f} inserts/s {:>9.0f} reads/s'.format(
+        label, ITEMS / inserted, READS / read))
+
+
+if __name__ == '__main__':
+    items = make_items()
+    directory = tempfile.mkdtemp()
+    try:
+        print('{} items, {} reads:'.format(ITEMS, READS))
+        measure('DictDataStore', DictDataStore(), items)
+        store = SQLiteDataStore(os.path.join(directory, 'grouped.db'))
+        measure('SQLiteDataStore', store, items)
+        store.close()
+        store = SQLiteDataStore(os.path.join(directory, 'single.db'),
+                                batch_size=1)
+        measure('SQLiteDataStore (no group)', store, items)
+        store.close()
+        store = LogDataStore(os.path.join(directory, 'log'))
+        measure('LogDataStore', store, items)
+        store.close()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,87 @@
+"""
+Compares the cost of tracking RPC timeouts with the event loop's call_later
+against the node's TimerWheel under sustained RPC load.
+
+Each simulated RPC schedules a RESPONSE_TIMEOUT and the response arrives
+once another IN_FLIGHT RPCs have been sent. Three strategies are measured:
+
+* call_later without cancelling the handle when the response arrives (how
+  the node used to behave).
+* call_later with the handle cancelled when the response arrives.
+* the TimerWheel with the timer cancelled when the response arrives.
+
+For each strategy the report contains the CPU time taken and the number of
+handles left in the event loop's heap.
+"""
+import sys
+import os
+import time
+import asyncio
+from collections import deque
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from drogulus.dht.constants import RESPONSE_TIMEOUT
+from drogulus.dht.timerwheel import TimerWheel
+
+
+#: The number of RPCs to simulate.
+RPCS = 200000
+#: The number of RPCs awaiting a response at any one time.
+IN_FLIGHT = 1000
+
+
+def noop():
+    pass
+
+
+def simulate(event_loop, schedule, cancel):
+    """
+    Simulates RPCS requests using the schedule and cancel functions to manage
+    timeouts. Returns the CPU time taken.
+    """
+    outstanding = deque()
+    start = time.process_time()
+    for i in range(RPCS):
+        outstanding.append(schedule(RESPONSE_TIMEOUT, noop))
+        if len(outstanding) > IN_FLIGHT:
+            cancel(outstanding.popleft())
+    # Let the event loop do its housekeeping (e.g. removing cancelled
+    # handles from its heap).
+    event_loop.run_until_complete(asyncio.sleep(0))
+    return time.process_time() - start
+
+
+def heap_size(event_loop):
+    """
+    Returns the number of handles in the event loop's heap.
+    """
+    return len(getattr(event_loop, '_scheduled', []))
+
+
+def run(label, make_strategy):
+    event_loop = asyncio.new_event_loop()
+    schedule, cancel = make_strategy(event_loop)
+    cpu = simulate(event_loop, schedule, cancel)
+    print('{:>24}: {:.2f}s CPU, {} handles in the event loop heap'.format(
+        label, cpu, heap_size(event_loop)))
+    event_loop.close()
+
+
+def uncancelled(event_loop):
+    return (event_loop.call_later, lambda handle: None)
+
+
+def cancelled(event_loop):
+    return (event_loop.call_later, lambda handle: handle.cancel())
+
+
+def wheel(event_loop):
+    timers = TimerWheel(event_loop)
+    return (timers.schedule, lambda timer: timer.cancel())
+
+
+if __name__ == '__main__':
+    print('{} RPCs with {} in flight:'.format(RPCS, IN_FLIGHT))
+    run('call_later (uncancelled)', uncancelled)
+    run('call_later (cancelled)', cancelled)
+    run('TimerWheel', wheel)
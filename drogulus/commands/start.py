@@ -4,6 +4,9 @@ Defines the command for starting a node in the drogulus.
 """
 from ..node import Drogulus
 from ..net.http import HttpConnector, make_http_handler
+from ..dht.storage import SQLiteDataStore
+from ..dht.logstore import LogDataStore
+from ..dht.snapshot import Snapshotter
 from .utils import data_dir, log_dir, get_keys, get_whoami, APPNAME
 from cliff.command import Command
 from getpass import getpass
@@ -40,6 +43,45 @@ class Start(Command):
                             help='The whoami.json file to use to identify ' +
                             'the owner of the local node to the wider ' +
                             'network.')
+        parser.add_argument('--database', nargs='?', default='', type=str,
+                            help='The SQLite database file in which to ' +
+                            'persist the items held by the local node ' +
+                            '(by default items are only held in memory).')
+        parser.add_argument('--snapshot', nargs='?', default='', type=str,
+                            help='The file in which snapshots of the local ' +
+                            'node\'s state are periodically saved and from ' +
+                            'which it is restored on startup (defaults to ' +
+                            'snapshot.bin in the data directory).')
+        parser.add_argument('--blob-threshold', nargs='?', default=0,
+                            type=int, help='Hold each distinct value at ' +
+                            'least this many bytes long only once in ' +
+                            'memory (shared by every key that refers to ' +
+                            'it). Ignored if a database is used.')
+        parser.add_argument('--compress-threshold', nargs='?', default=0,
+                            type=int, help='Hold items whose ' +
+                            'serialisation is at least this many bytes ' +
+                            'long compressed (by default items are held ' +
+                            'uncompressed).')
+        parser.add_argument('--log-store', nargs='?', default='', type=str,
+                            help='The directory of the log-structured ' +
+                            'store in which to persist the items held by ' +
+                            'the local node (an alternative to --database ' +
+                            'for write-heavy nodes).')
+        parser.add_argument('--compact', action='store_true',
+                            help='Hold the items in memory as compact ' +
+                            'records (slower to read but smaller). ' +
+                            'Ignored if a database or log store is used.')
+        parser.add_argument('--trace-sample-rate', nargs='?', default=0.0,
+                            type=float, help='The proportion (between 0.0 ' +
+                            'and 1.0) of lookups whose traces are kept ' +
+                            '(defaults to 0.0).')
+        parser.add_argument('--metrics', nargs='?', default='', type=str,
+                            help='The file to which the local node\'s ' +
+                            'metrics are written (as JSON) when it stops.')
+        parser.add_argument('--traces', nargs='?', default='', type=str,
+                            help='The file to which the sampled lookup ' +
+                            'traces are written (one JSON object per ' +
+                            'line) when the local node stops.')
         return parser
 
     def take_action(self, parsed_args):
@@ -57,6 +99,17 @@ class Start(Command):
         whoami = parsed_args.whoami
         key_dir = parsed_args.keys
         peer_file = parsed_args.peers
+        database = parsed_args.database
+        blob_threshold = parsed_args.blob_threshold
+        compress_threshold = parsed_args.compress_threshold or None
+        log_store = parsed_args.log_store
+        compact = parsed_args.compact
+        trace_sample_rate = parsed_args.trace_sample_rate
+        metrics_file = parsed_args.metrics
+        traces_file = parsed_args.traces
+        if database and log_store:
+            raise ValueError('Use either a database or a log store.')
+        snapshot_file = parsed_args.snapshot
 
         # Setup logging
         logfile = os.path.join(log_dir(), 'drogulus.log')
@@ -96,16 +149,54 @@ class Start(Command):
         # Asyncio boilerplate.
         event_loop = asyncio.get_event_loop()
         connector = HttpConnector(event_loop)  # NetstringConnector(event_loop)
+        data_store = None
+        if database:
+            data_store = SQLiteDataStore(
+                database, event_loop=event_loop,
+                compress_threshold=compress_threshold)
+            print('Storing items in {}'.format(database))
+        elif log_store:
+            data_store = LogDataStore(log_store, event_loop=event_loop)
+            print('Storing items in {}'.format(log_store))
+        elif blob_threshold:
+            print('Sharing values of at least {} bytes'.format(
+                blob_threshold))
+        if data_store is None and compact:
+            print('Holding items as compact records')
         instance = Drogulus(private_key, public_key, event_loop, connector,
-                            port, whoami)
+                            port, whoami, data_store=data_store,
+                            blob_threshold=blob_threshold,
+                            compress_threshold=compress_threshold,
+                            compact=compact,
+                            trace_sample_rate=trace_sample_rate)
         app = make_http_handler(event_loop, connector, instance._node)
         app_task = event_loop.create_server(app, '0.0.0.0', port)
         server = event_loop.run_until_complete(app_task)
 
+        # Restore the most recent snapshot (items are only held in the
+        # snapshot if they're not persisted in a database but the deadlines
+        # of their republication checks always are).
+        if not snapshot_file:
+            snapshot_file = os.path.join(data_dir(), 'snapshot.bin')
+        snapshotter = Snapshotter(instance._node, snapshot_file,
+                                  items=data_store is None)
+        snapshot = snapshotter.load()
+        snapshotter.start()
+        if data_store is not None:
+            # Ensure the items persisted in the database without a deadline
+            # in the snapshot are republished and aged out.
+            instance._node.schedule_stored()
+
         # Join the network
         if peer_file:
             peer_details = json.load(open(peer_file))
             instance.join(peer_details)
+        elif snapshot and snapshot['contacts']:
+            print('Joining peers from {}'.format(snapshot_file))
+            instance.join({
+                'contacts': snapshot['contacts'],
+                'blacklist': snapshot['blacklist'],
+            })
 
         # Run the server
         try:
@@ -113,6 +204,13 @@ class Start(Command):
         except KeyboardInterrupt:
             log.info('Manual exit')
         finally:
+            snapshotter.stop()
+            try:
+                snapshotter.save_now()
+                log.info('Saved snapshot')
+            except Exception as ex:
+                log.error('Unable to save snapshot {}'.format(snapshot_file))
+                log.error(ex)
             # dump peers
             if not peer_file:
                 peer_file = os.path.join(data_dir(), 'peers.json')
@@ -120,6 +218,18 @@ class Start(Command):
                 json.dump(instance._node.routing_table.dump(), output,
                           indent=2)
                 log.info('Dumped peers')
+            # dump metrics
+            if metrics_file:
+                with open(metrics_file, 'w') as output:
+                    json.dump(instance.dump_metrics(), output, indent=2)
+                    log.info('Dumped metrics')
+            if traces_file:
+                with open(traces_file, 'w') as output:
+                    instance._node.metrics.dump_traces(output)
+                    log.info('Dumped traces')
+            if data_store is not None:
+                data_store.close()
+                log.info('Closed data store')
             log.info('STOPPED')
             server.close()
             event_loop.close()
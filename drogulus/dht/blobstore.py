@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Contains a content-addressed store of large values so that a value shared by
+many items (for example, the same document stored under several keys) is
+held in memory only once.
+
+Each distinct value is identified by its digest: the sha512 hexdigest of the
+value's compact JSON serialisation with sorted keys (the same on every node
+so digests can be sent to peers in place of the value itself). Values are
+reference counted: a value is forgotten once no items refer to it. Only
+values whose serialisation is at least threshold bytes long are held (small
+values aren't worth the cost of hashing and sharing).
+"""
+from .constants import BLOB_THRESHOLD
+from hashlib import sha512
+import json
+
+
+def serialise(value):
+    """
+    Returns the bytes of the canonical serialisation of the value.
+    """
+    return json.dumps(value, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def value_digest(value):
+    """
+    Returns the digest identifying the value.
+    """
+    return sha512(serialise(value)).hexdigest()
+
+
+class BlobStore(object):
+    """
+    Holds each distinct (large) value once, by digest, along with the number
+    of items that refer to it.
+    """
+
+    def __init__(self, threshold=BLOB_THRESHOLD):
+        """
+        Only values whose serialisation is at least threshold bytes long are
+        held.
+        """
+        self.threshold = threshold
+        # Maps digests to a list containing the value, the size of its
+        # serialisation and the number of references to it.
+        self._blobs = {}
+        # The total size of the held values.
+        self.bytes = 0
+        # The total size of the references to the values.
+        self.referenced_bytes = 0
+
+    def __contains__(self, digest):
+        return digest in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def get(self, digest, default=None):
+        """
+        Returns the value with the given digest (or default if it isn't
+        held).
+        """
+        entry = self._blobs.get(digest)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def add(self, value):
+        """
+        Adds a reference to the value. Returns a tuple containing the value's
+        digest and the shared copy of the value (which should be held in
+        place of the value passed in) or None if the value is too small to be
+        held.
+        """
+        data = serialise(value)
+        size = len(data)
+        if size < self.threshold:
+            return None
+        digest = sha512(data).hexdigest()
+        entry = self._blobs.get(digest)
+        if entry is None:
+            entry = [value, size, 0]
+            self._blobs[digest] = entry
+            self.bytes += size
+        entry[2] += 1
+        self.referenced_bytes += size
+        return digest, entry[0]
+
+    def release(self, digest):
+        """
+        Removes a reference to the value with the given digest. The value is
+        forgotten once nothing refers to it.
+        """
+        entry = self._blobs[digest]
+        entry[2] -= 1
+        self.referenced_bytes -= entry[1]
+        if not entry[2]:
+            del self._blobs[digest]
+            self.bytes -= entry[1]
+
+    def references(self, digest):
+        """
+        Returns the number of references to the value with the given digest.
+        """
+        entry = self._blobs.get(digest)
+        return entry[2] if entry else 0
+
+    def stats(self):
+        """
+        Returns a dictionary describing the contents of the blob store. The
+        saved_bytes are the bytes that would be used if every reference held
+        its own copy of the value.
+        """
+        return {
+            'blobs': len(self._blobs),
+            'bytes': self.bytes,
+            'saved_bytes': self.referenced_bytes - self.bytes,
+        }
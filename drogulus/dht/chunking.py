@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the functions used to store and retrieve values too large to send
+in a single message (see Drogulus.set_chunked and Drogulus.get_chunked).
+
+A large value (bytes) is split into chunks of CHUNK_SIZE bytes. Each chunk is
+stored as a separate item, signed by the publisher, whose name is derived
+from the sha512 digest of its content. Since the key of an item is derived
+from its publisher's public key and name, each chunk lives at its own place
+in the key space and is held by the nodes closest to it. Chunks are content
+addressed, so identical chunks (within a value or in different values from
+the same publisher) are only stored once.
+
+Once every chunk has been stored, a manifest is stored under the value's own
+name. It's a dictionary like this:
+
+    {
+        'manifest': 1,  # The version of the manifest format.
+        'size': 123456789,  # The length of the whole value in bytes.
+        'chunk_size': 1048576,
+        'digest': '...',  # The sha512 hexdigest of the whole value.
+        'chunks': ['...', '...', ...]  # The digest of each chunk in order.
+    }
+
+Since the manifest is stored last, a peer that finds it can expect to find
+every chunk it refers to.
+
+Chunks are retrieved in parallel (each with its own lookup, from the nodes
+closest to its key) through a sliding window of no more than
+CHUNK_CONCURRENCY chunks. Chunks are passed on in order as soon as they (and
+the chunks before them) arrive, so no more than the window of chunks is ever
+held in memory. This means multi-hundred megabyte values can be moved
+through the DHT without building messages larger than a single chunk.
+"""
+from .crypto import construct_key, get_signed_item
+from .errors import BadChunk
+from .constants import (CHUNK_SIZE, CHUNK_CONCURRENCY, DUPLICATION_COUNT,
+                        EXPIRY_DURATION)
+from hashlib import sha512
+import asyncio
+import base64
+import binascii
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+#: The version of the manifest format.
+MANIFEST_VERSION = 1
+
+#: Prefixes the digest of a chunk to make the name under which it's stored.
+CHUNK_PREFIX = 'chunk:'
+
+
+def chunk_name(digest):
+    """
+    Returns the name under which the chunk with the given digest is stored.
+    """
+    return CHUNK_PREFIX + digest
+
+
+def read_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    Yields chunks of no more than chunk_size bytes from the source. The source
+    is either a bytes-like object or a binary file-like object with a read
+    method (so the whole value needn't be held in memory).
+    """
+    if chunk_size < 1:
+        raise ValueError('Chunk size may not be less than 1')
+    if hasattr(source, 'read'):
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                return
+            yield bytes(data)
+    else:
+        view = memoryview(source)
+        for i in range(0, len(view), chunk_size):
+            yield view[i:i + chunk_size].tobytes()
+
+
+def encode_chunk(data):
+    """
+    Returns the chunk of bytes as a string that can be stored as a value.
+    """
+    return base64.b64encode(data).decode('ascii')
+
+
+def decode_chunk(value):
+    """
+    Returns the bytes of a chunk from its stored value. Raises BadChunk if the
+    value isn't an encoded chunk.
+    """
+    try:
+        return base64.b64decode(value.encode('ascii'), validate=True)
+    except (AttributeError, UnicodeEncodeError, binascii.Error):
+        raise BadChunk('Value is not an encoded chunk')
+
+
+def check_manifest(value):
+    """
+    Raises BadChunk if the value isn't a manifest of a chunked value.
+    """
+    if not isinstance(value, dict):
+        raise BadChunk('Value is not a manifest')
+    if value.get('manifest') != MANIFEST_VERSION:
+        raise BadChunk('Unsupported manifest version: {}'.format(
+            value.get('manifest')))
+    for field, field_type in (('size', int), ('chunk_size', int),
+                              ('digest', str), ('chunks', list)):
+        if not isinstance(value.get(field), field_type):
+            raise BadChunk('Manifest has a bad {} field'.format(field))
+
+
+def store_item(local_node, name, value, duplicate, expires, write_quorum):
+    """
+    Signs the value as an item with the given name and replicates it to
+    duplicate number of nodes. Returns a future that fires once write_quorum
+    of them have acknowledged it.
+    """
+    item = get_signed_item(name, value, local_node.public_key,
+                           local_node.private_key, expires)
+    return local_node.replicate(duplicate, item['key'], item['value'],
+                                item['timestamp'], item['expires'],
+                                item['created_with'], item['public_key'],
+                                item['name'], item['signature'],
+                                write_quorum)
+
+
+@asyncio.coroutine
+def store_chunked(local_node, name, source, duplicate=DUPLICATION_COUNT,
+                  expires=EXPIRY_DURATION, write_quorum=1,
+                  chunk_size=CHUNK_SIZE, concurrency=CHUNK_CONCURRENCY):
+    """
+    Stores the source (bytes or a binary file-like object) as chunks
+    followed by a manifest with the given name. No more than concurrency
+    chunks are being stored at once. The chunks and the manifest are
+    replicated to duplicate number of nodes and each must be acknowledged by
+    write_quorum of them (see Node.replicate).
+
+    Returns the manifest once it has been stored. If a chunk can't be stored
+    the exception is raised and the manifest isn't stored.
+    """
+    digests = []
+    whole = sha512()
+    size = 0
+    stored = set()
+    pending = set()
+    try:
+        for data in read_chunks(source, chunk_size):
+            digest = sha512(data).hexdigest()
+            digests.append(digest)
+            whole.update(data)
+            size += len(data)
+            if digest in stored:
+                continue
+            stored.add(digest)
+            if len(pending) >= concurrency:
+                done, pending = yield from asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(store_item(local_node, chunk_name(digest),
+                                   encode_chunk(data), duplicate, expires,
+                                   write_quorum))
+        if pending:
+            done, pending = yield from asyncio.wait(pending)
+            for future in done:
+                future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+    local_node.metrics.increment('chunking.chunks_stored', len(stored))
+    manifest = {
+        'manifest': MANIFEST_VERSION,
+        'size': size,
+        'chunk_size': chunk_size,
+        'digest': whole.hexdigest(),
+        'chunks': digests,
+    }
+    yield from store_item(local_node, name, manifest, duplicate, expires,
+                          write_quorum)
+    log.info('Stored {} as {} chunks ({} bytes).'.format(
+        name, len(digests), size))
+    return manifest
+
+
+@asyncio.coroutine
+def fetch_chunk(local_node, public_key, digest):
+    """
+    Returns the bytes of the chunk with the given digest stored by the
+    publisher with the public key. The local data store is checked before
+    looking the chunk up in the DHT. Raises BadChunk if the chunk doesn't
+    match its digest.
+    """
+    key = construct_key(public_key, chunk_name(digest))
+    item = local_node.get_live_item(key)
+    if not item:
+        item = yield from local_node.retrieve(key)
+    data = decode_chunk(item.value)
+    if sha512(data).hexdigest() != digest:
+        raise BadChunk('Chunk does not match its digest: {}'.format(digest))
+    local_node.metrics.increment('chunking.chunks_fetched')
+    return data
+
+
+@asyncio.coroutine
+def retrieve_chunked(local_node, public_key, name, sink=None,
+                     concurrency=CHUNK_CONCURRENCY):
+    """
+    Retrieves the chunked value with the given name stored by the publisher
+    with the public key. No more than concurrency chunks are fetched (or
+    held waiting for an earlier chunk) at once.
+
+    If a sink (a callable such as the write method of a binary file) is
+    given, each chunk is passed to it in order as soon as possible and the
+    number of bytes in the whole value is returned. Otherwise the whole value
+    is returned as bytes.
+
+    Raises BadChunk if the manifest is malformed or the reassembled value
+    doesn't match it (in which case anything already passed to the sink
+    should be discarded).
+    """
+    result = yield from local_node.retrieve(construct_key(public_key, name))
+    manifest = result.value
+    check_manifest(manifest)
+    digests = manifest['chunks']
+    parts = None
+    if sink is None:
+        parts = []
+        sink = parts.append
+    whole = sha512()
+    size = 0
+    # Fetches of chunks that haven't yet been passed to the sink by index.
+    tasks = {}
+    started = 0
+    try:
+        for i in range(len(digests)):
+            while started < len(digests) and started < i + concurrency:
+                tasks[started] = asyncio.Task(
+                    fetch_chunk(local_node, public_key, digests[started]))
+                started += 1
+            data = yield from tasks.pop(i)
+            whole.update(data)
+            size += len(data)
+            sink(data)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    if size != manifest['size'] or whole.hexdigest() != manifest['digest']:
+        raise BadChunk('Reassembled value does not match its manifest')
+    if parts is None:
+        return size
+    return b''.join(parts)
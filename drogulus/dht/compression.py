@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Contains functions for the zlib compression of large values held in data
+stores ("at rest") and of large messages sent between nodes ("on the wire").
+
+Compression is transparent: values are always decompressed before they're
+used so the form of an item that is signed and verified never changes. Only
+data at least threshold bytes long is compressed and the compressed form is
+only kept if it is smaller.
+
+If given a MetricsRegistry, the functions record the bytes before
+("<name>.bytes_in") and after ("<name>.bytes_out") compression, the number of
+times data was compressed ("<name>.compressed") or left alone because
+compression didn't help ("<name>.incompressible") and the CPU time spent
+compressing ("<name>.compress_seconds") and decompressing
+("<name>.decompress_seconds"). See compression_stats.
+"""
+from .constants import COMPRESSION_THRESHOLD, COMPRESSION_LEVEL
+import json
+import time
+import zlib
+
+
+#: The name of the compression codec (used when negotiating compression with
+#: peers).
+CODEC = 'zlib'
+#: The upper bounds (in seconds) of the buckets of the histograms of CPU time
+#: spent compressing and decompressing.
+CPU_BOUNDS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+              0.1, 0.5)
+
+
+class Compressed(object):
+    """
+    Holds the compressed JSON serialisation of a value at rest.
+    """
+
+    __slots__ = ('data', )
+
+    def __init__(self, data):
+        self.data = data
+
+
+def compress(data, threshold=COMPRESSION_THRESHOLD, level=COMPRESSION_LEVEL,
+             metrics=None, name='compression'):
+    """
+    Returns the compressed form of the data (bytes) or None if the data is
+    shorter than threshold bytes or doesn't get any smaller.
+    """
+    if threshold is None or len(data) < threshold:
+        return None
+    start = time.process_time()
+    result = zlib.compress(data, level)
+    if metrics is not None:
+        metrics.observe(name + '.compress_seconds',
+                        time.process_time() - start, CPU_BOUNDS)
+    if len(result) >= len(data):
+        if metrics is not None:
+            metrics.increment(name + '.incompressible')
+        return None
+    if metrics is not None:
+        metrics.increment(name + '.compressed')
+        metrics.increment(name + '.bytes_in', len(data))
+        metrics.increment(name + '.bytes_out', len(result))
+    return result
+
+
+def decompress(data, max_length=0, metrics=None, name='compression'):
+    """
+    Returns the decompressed form of the data (bytes). Raises a ValueError if
+    the data is corrupt or decompresses to more than max_length bytes (0
+    means there is no limit).
+    """
+    start = time.process_time()
+    decompressor = zlib.decompressobj()
+    try:
+        result = decompressor.decompress(data, max_length)
+    except zlib.error as ex:
+        raise ValueError('Corrupt compressed data: {}'.format(ex))
+    if decompressor.unconsumed_tail:
+        raise ValueError('Decompressed data too long')
+    if metrics is not None:
+        metrics.observe(name + '.decompress_seconds',
+                        time.process_time() - start, CPU_BOUNDS)
+    return result
+
+
+def pack_value(value, threshold=COMPRESSION_THRESHOLD, metrics=None,
+               name='storage.compression'):
+    """
+    Returns the value to be held at rest: a Compressed instance if the
+    value's JSON serialisation is large enough (and compresses), otherwise
+    the value itself.
+    """
+    if threshold is None or isinstance(value, (int, float, bool)):
+        return value
+    data = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    compressed = compress(data, threshold, metrics=metrics, name=name)
+    if compressed is None:
+        return value
+    return Compressed(compressed)
+
+
+def unpack_value(value, metrics=None, name='storage.compression'):
+    """
+    Reverses pack_value.
+    """
+    if isinstance(value, Compressed):
+        data = decompress(value.data, metrics=metrics, name=name)
+        return json.loads(data.decode('utf-8'))
+    return value
+
+
+def compression_stats(metrics, name='compression'):
+    """
+    Returns a dictionary summarising the compression recorded in the
+    MetricsRegistry: the bytes before and after compression, the ratio
+    between them and the mean CPU time (in seconds) spent compressing and
+    decompressing.
+    """
+    counters = metrics.counters
+    bytes_in = counters.get(name + '.bytes_in', 0)
+    bytes_out = counters.get(name + '.bytes_out', 0)
+    result = {
+        'compressed': counters.get(name + '.compressed', 0),
+        'incompressible': counters.get(name + '.incompressible', 0),
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+        'ratio': bytes_in / bytes_out if bytes_out else 1.0,
+    }
+    for operation in ('compress', 'decompress'):
+        histogram = metrics.histograms.get(
+            '{}.{}_seconds'.format(name, operation))
+        result[operation + '_seconds'] = (histogram.mean() if histogram
+                                          else 0.0)
+    return result
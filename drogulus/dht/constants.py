@@ -8,6 +8,21 @@ Kademlia paper as are the suggested default values.
 #: Represents the degree of parallelism in network calls.
 ALPHA = 3
 
+#: The minimum degree of parallelism an adaptive lookup may narrow to.
+ALPHA_MIN = 1
+
+#: The maximum degree of parallelism an adaptive lookup may widen to.
+ALPHA_MAX = 10
+
+#: Responses to lookup requests that take longer than this (in seconds) are
+#: considered slow and cause an adaptive lookup to widen its parallelism.
+SLOW_RESPONSE = 1.0
+
+#: The maximum number of RPCs a node should have in flight at any one time.
+#: Lookups will not send further requests once this budget is exhausted
+#: (although each lookup is always allowed at least one pending request).
+MAX_INFLIGHT_RPCS = 256
+
 #: The maximum number of contacts stored in a bucket. Must be an even number.
 K = 20
 
@@ -28,6 +43,137 @@ REFRESH_TIMEOUT = 3600  # 1 hour
 #: How long to wait before a node replicates any data it stores (in seconds).
 REPLICATE_INTERVAL = REFRESH_TIMEOUT
 
+#: How often (in seconds) the republish scheduler checks for keys that are due
+#: a republication check.
+REPUBLISH_TICK = 1.0
+
+#: The maximum number of keys the republish scheduler processes per tick. This
+#: limits the rate at which items are republished.
+REPUBLISH_BATCH_SIZE = 500
+
+#: Items due republication whose keys share this many leading (hexadecimal)
+#: characters are treated as a single region of the key space and replicated
+#: using a single lookup.
+REPUBLISH_PREFIX_LENGTH = 3
+
+#: The maximum number of items sent in a single StoreMany message.
+STORE_MANY_BATCH_SIZE = 50
+
+#: The maximum (approximate) number of bytes of items sent in a single
+#: StoreMany message. This is well under the largest message peers accept
+#: (see drogulus.net.netstring.NetstringProtocol.MAX_LENGTH). An item that is
+#: bigger on its own is sent in a Store message.
+STORE_MANY_MAX_BYTES = 1024 * 1024 * 4
+
+#: Values whose (compact JSON) serialisation is at least this many bytes long
+#: are held once (by digest) in a BlobStore shared by every key that refers
+#: to them and are pushed to peers by digest before being sent in full.
+BLOB_THRESHOLD = 1024
+
+#: Values (at rest) and messages (on the wire) whose serialisation is at
+#: least this many bytes long are compressed (see drogulus.dht.compression).
+COMPRESSION_THRESHOLD = 1024
+
+#: The zlib compression level (1 is fastest, 9 is smallest).
+COMPRESSION_LEVEL = 6
+
+#: Values stored with Drogulus.set_chunked are split into chunks of this many
+#: bytes, each stored as a separate signed item (see drogulus.dht.chunking).
+#: Chunks are base64 encoded so each message is about a third larger.
+CHUNK_SIZE = 1024 * 1024  # 1mb.
+
+#: The maximum number of chunks being stored or retrieved at the same time.
+CHUNK_CONCURRENCY = 8
+
+#: The number of fragments an erasure coded value is split into (see
+#: drogulus.dht.erasure). Any ERASURE_DATA_FRAGMENTS of them are enough to
+#: rebuild the value.
+ERASURE_FRAGMENTS = K
+
+#: The number of fragments needed to rebuild an erasure coded value. The
+#: storage overhead is ERASURE_FRAGMENTS / ERASURE_DATA_FRAGMENTS (2x rather
+#: than the DUPLICATION_COUNT of full copies).
+ERASURE_DATA_FRAGMENTS = 10
+
+#: The half-life (in seconds) of the decaying count of the requests for each
+#: key used to estimate the rate at which the key is requested.
+REQUEST_RATE_HALF_LIFE = 60
+
+#: The maximum number of keys whose request rates are tracked. The coldest
+#: keys are forgotten first.
+REQUEST_RATE_KEYS = 10000
+
+#: A key requested from a node at least this many times a second is "hot":
+#: the node reports its load in HotValue responses and the requesting node
+#: caches an extra copy of the item for each multiple of this rate.
+HOT_KEY_RATE = 1.0
+
+#: The maximum number of copies of an item cached by a single lookup.
+CACHE_COPIES_MAX = 8
+
+#: The shortest time (in seconds) a cached copy of an item is kept without
+#: being requested. Cached copies further from the key than the K closest
+#: nodes are kept for REPLICATE_INTERVAL halved for each extra bit of
+#: distance, down to this minimum.
+CACHE_MIN_LIFETIME = 60
+
+#: The default lease (in seconds) of a subscription to the updates of a key.
+#: A watching node renews its subscriptions when half the lease has passed.
+SUBSCRIPTION_LEASE = 5 * 60
+
+#: The longest lease (in seconds) a node grants to a subscriber.
+SUBSCRIPTION_LEASE_MAX = 60 * 60
+
+#: The maximum number of subscriptions (to all keys) a node holds.
+SUBSCRIPTIONS_MAX = 10000
+
+#: How often (in seconds) a node in sync mode synchronises the items it holds
+#: with its neighbours.
+SYNC_INTERVAL = REPLICATE_INTERVAL
+
+#: The number of (hexadecimal) characters following the prefix of a synced
+#: range of the key space used to split the range into buckets (two
+#: characters means at most 256 buckets).
+SYNC_BUCKET_DEPTH = 2
+
+#: The number of (hexadecimal) characters of each bucket's digest sent in a
+#: Summary message.
+SYNC_DIGEST_LENGTH = 16
+
+#: The minimum length of the prefix of a synced range of the key space (two
+#: characters means a range holds about 1/256th of the keys). A node whose
+#: neighbourhood is wider (a small network) relies on republication and
+#: Summary messages for wider ranges are refused.
+SYNC_MIN_PREFIX_LENGTH = 2
+
+#: The maximum number of entries (keys and timestamps) in a Differences
+#: message. The entries of differing buckets that don't fit are left out (so
+#: the items in those buckets are pushed in full).
+SYNC_MAX_ENTRIES = 5000
+
+#: How often (in seconds) a node hands items off to one of the newly joined
+#: peers that are amongst the K closest nodes to the items' keys.
+HANDOFF_TICK = 1.0
+
+#: The maximum number of locally held keys (closest to a newly joined peer's
+#: network id) considered for handing off to the new peer.
+HANDOFF_MAX_ITEMS = 1000
+
+#: Items are only handed off to the same peer once in this many seconds (even
+#: if the peer leaves and rejoins the routing table).
+HANDOFF_INTERVAL = REPLICATE_INTERVAL
+
+#: How often (in seconds) a snapshot of the local node's state is written to
+#: disk (see drogulus.dht.snapshot).
+SNAPSHOT_INTERVAL = 300  # 5 minutes.
+
+#: How often (in seconds) a node deletes expired items from its data store.
+EXPIRY_SWEEP_INTERVAL = 1.0
+
+#: The maximum number of expired items deleted by a single sweep. If a sweep
+#: reaches this limit the next sweep follows immediately.
+EXPIRY_SWEEP_SIZE = 100
+
 #: How long to wait before a node checks whether any buckets need refreshing or
 #: data needs republishing (in seconds).
 REFRESH_INTERVAL = int(REFRESH_TIMEOUT / 6)  # Every 10 minutes.
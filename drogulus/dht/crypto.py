@@ -83,8 +83,10 @@ def verify_item(raw_item):
     """
     item = raw_item.copy()
     try:
+        # Message fields (and the load reported in HotValue messages) are not
+        # part of the signed item.
         ignore_fields = ['uuid', 'recipient', 'sender', 'reply_port',
-                         'version', 'seal', 'message']
+                         'version', 'seal', 'message', 'load']
         for field in ignore_fields:
             if field in item:
                 del item[field]
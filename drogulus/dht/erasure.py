@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the Reed-Solomon erasure coding used to store a value as n
+fragments, any k of which are enough to rebuild it (see Drogulus.set with the
+erasure argument and Drogulus.get_coded). This is an opt-in alternative to
+storing DUPLICATION_COUNT full copies of large, rarely updated values: with
+the defaults (ERASURE_DATA_FRAGMENTS of ERASURE_FRAGMENTS) the value takes up
+twice its size in the DHT rather than twenty times and survives the loss of
+any half of the fragments.
+
+The code works over the finite field GF(256) so each byte is a symbol. The
+(serialised) value is padded and split into k data fragments of equal length.
+These are stored as they are (the code is systematic) along with n - k parity
+fragments. Each parity fragment is a combination of the data fragments with
+coefficients taken from a Cauchy matrix, so any k rows of the whole coding
+matrix (the identity above the Cauchy matrix) are invertible and any k
+fragments can be decoded back into the data fragments.
+
+Multiplying a fragment by a constant is done with bytes.translate and a
+table of the constant's products, and fragments are added (XOR-ed) as
+integers, so the arithmetic on each fragment is done in C rather than a byte
+at a time.
+
+Each fragment is stored as a separate signed item whose name is made from
+the value's name and the fragment's index, so the fragments are held by
+different nodes. A manifest is then stored under the value's own name:
+
+    {
+        'erasure': 1,  # The version of the manifest format.
+        'k': 10,  # The number of fragments needed to rebuild the value.
+        'n': 20,  # The number of fragments.
+        'size': 123456,  # The length of the serialised value in bytes.
+        'digest': '...',  # The sha512 hexdigest of the serialised value.
+        'fragments': ['...', ...]  # The digest of each fragment in order.
+    }
+
+Fragments are retrieved in parallel: k fetches are started (data fragments
+first, since they need no decoding) and another is started whenever one
+fails, until k fragments have arrived.
+
+Fragments that go missing (for example, because the nodes holding them left
+the network) are rebuilt from the others and only the missing fragments are
+stored again (see repair_coded). Since fragments are signed, only the
+publisher can do this. For the same reason the nodes holding fragments never
+copy them to other nodes: fragments are exempt from republication (see
+Node.republish), handoff and replica synchronisation, which would otherwise
+replicate each fragment to K nodes and undo the saving. Fragments are
+recognised by their names alone, so names ending in ':fragment:<n>' are
+reserved for them and may not be used for other values (see check_name).
+"""
+from .crypto import construct_key
+from .errors import BadChunk, TooFewFragments
+from .blobstore import serialise
+from .chunking import encode_chunk, decode_chunk, store_item
+from .constants import (ERASURE_DATA_FRAGMENTS, ERASURE_FRAGMENTS,
+                        DUPLICATION_COUNT, EXPIRY_DURATION)
+from hashlib import sha512
+import asyncio
+import json
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+#: The version of the manifest format.
+MANIFEST_VERSION = 1
+
+#: The primitive polynomial (x^8 + x^4 + x^3 + x^2 + 1) used to build GF(256).
+PRIMITIVE = 0x11d
+
+#: Powers of the generator (2) in GF(256), repeated so the sum of two
+#: logarithms can be looked up without reducing it modulo 255.
+EXP = [0] * 512
+
+#: The discrete logarithm (to base 2) of each non-zero element of GF(256).
+LOG = [0] * 256
+
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= PRIMITIVE
+for _i in range(255, 512):
+    EXP[_i] = EXP[_i - 255]
+del _x, _i
+
+# Translation tables of the products of each constant, built on demand.
+_tables = {}
+
+
+def gf_mul(a, b):
+    """
+    Returns the product of a and b in GF(256).
+    """
+    if a == 0 or b == 0:
+        return 0
+    return EXP[LOG[a] + LOG[b]]
+
+
+def gf_inv(a):
+    """
+    Returns the multiplicative inverse of a (which may not be zero) in
+    GF(256).
+    """
+    if a == 0:
+        raise ZeroDivisionError('Zero has no inverse in GF(256)')
+    return EXP[255 - LOG[a]]
+
+
+def mul_table(c):
+    """
+    Returns a translation table (for bytes.translate) that multiplies each
+    byte by c in GF(256).
+    """
+    table = _tables.get(c)
+    if table is None:
+        table = bytes(gf_mul(c, x) for x in range(256))
+        _tables[c] = table
+    return table
+
+
+def combine(coefficients, fragments):
+    """
+    Returns the sum of the fragments (bytes of equal length) each multiplied
+    by the corresponding coefficient in GF(256).
+    """
+    length = len(fragments[0])
+    result = 0
+    for c, fragment in zip(coefficients, fragments):
+        if c == 0:
+            continue
+        if c != 1:
+            fragment = fragment.translate(mul_table(c))
+        result ^= int.from_bytes(fragment, 'big')
+    return result.to_bytes(length, 'big')
+
+
+def coding_row(index, k):
+    """
+    Returns the row of the coding matrix that produces the fragment with the
+    given index from the k data fragments. The first k rows are the identity
+    and the rest are a Cauchy matrix.
+    """
+    if index < k:
+        return [1 if j == index else 0 for j in range(k)]
+    return [gf_inv(index ^ j) for j in range(k)]
+
+
+def invert(matrix):
+    """
+    Returns the inverse of the square matrix (a list of rows) in GF(256).
+    Raises ValueError if the matrix is singular.
+    """
+    size = len(matrix)
+    rows = [list(row) + [1 if i == j else 0 for j in range(size)]
+            for i, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = None
+        for i in range(column, size):
+            if rows[i][column]:
+                pivot = i
+                break
+        if pivot is None:
+            raise ValueError('Matrix is singular')
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        inverse = gf_inv(rows[column][column])
+        rows[column] = [gf_mul(inverse, x) for x in rows[column]]
+        for i in range(size):
+            factor = rows[i][column]
+            if i != column and factor:
+                rows[i] = [x ^ gf_mul(factor, y)
+                           for x, y in zip(rows[i], rows[column])]
+    return [row[size:] for row in rows]
+
+
+def check_parameters(k, n):
+    """
+    Raises ValueError unless k of n fragments is a possible code.
+    """
+    if k < 1:
+        raise ValueError('At least one data fragment is needed')
+    if n < k:
+        raise ValueError('There may not be fewer fragments than data '
+                         'fragments')
+    if n > 256:
+        raise ValueError('There may not be more than 256 fragments')
+
+
+def fragment_size(size, k):
+    """
+    Returns the length of each of the k fragments of data of the given size.
+    """
+    return max(1, -(-size // k))
+
+
+def encode(data, k, n, indices=None):
+    """
+    Returns a list of the n fragments of the data (bytes), any k of which
+    are enough to rebuild it. If a list of indices is given only the
+    fragments with those indices are returned.
+    """
+    check_parameters(k, n)
+    length = fragment_size(len(data), k)
+    data = data.ljust(length * k, b'\x00')
+    shards = [data[i * length:(i + 1) * length] for i in range(k)]
+    if indices is None:
+        indices = range(n)
+    return [combine(coding_row(i, k), shards) for i in indices]
+
+
+def decode(fragments, k, n, size):
+    """
+    Returns the data of the given size rebuilt from a dictionary of at least
+    k fragments keyed by index. Raises TooFewFragments if there aren't
+    enough.
+    """
+    check_parameters(k, n)
+    if len(fragments) < k:
+        raise TooFewFragments('{} fragments are needed but only {} were '
+                              'given'.format(k, len(fragments)))
+    # Prefer the data fragments since they needn't be decoded.
+    chosen = sorted(fragments)[:k]
+    available = [fragments[i] for i in chosen]
+    if chosen != list(range(k)):
+        inverse = invert([coding_row(i, k) for i in chosen])
+        shards = []
+        for j in range(k):
+            if j in fragments:
+                shards.append(fragments[j])
+            else:
+                shards.append(combine(inverse[j], available))
+        available = shards
+    return b''.join(available)[:size]
+
+
+def fragment_name(name, index):
+    """
+    Returns the name under which the fragment with the given index of the
+    value with the given name is stored.
+    """
+    return '{}:fragment:{}'.format(name, index)
+
+
+def is_fragment(name):
+    """
+    Returns a boolean indication of whether the name is that of a fragment
+    of an erasure coded value (see fragment_name).
+    """
+    head, separator, index = name.rpartition(':fragment:')
+    return bool(separator) and index.isdigit()
+
+
+def check_name(name):
+    """
+    Raises ValueError if the name is reserved for the fragments of erasure
+    coded values (see is_fragment) and so may not be used for other values.
+    """
+    if is_fragment(name):
+        raise ValueError('Names ending in ":fragment:<n>" are reserved for '
+                         'erasure coded fragments: {}'.format(name))
+
+
+def check_manifest(value):
+    """
+    Raises BadChunk if the value isn't a manifest of an erasure coded value.
+    """
+    if not isinstance(value, dict):
+        raise BadChunk('Value is not a manifest')
+    if value.get('erasure') != MANIFEST_VERSION:
+        raise BadChunk('Unsupported manifest version: {}'.format(
+            value.get('erasure')))
+    for field, field_type in (('k', int), ('n', int), ('size', int),
+                              ('digest', str), ('fragments', list)):
+        if not isinstance(value.get(field), field_type):
+            raise BadChunk('Manifest has a bad {} field'.format(field))
+    try:
+        check_parameters(value['k'], value['n'])
+    except ValueError as ex:
+        raise BadChunk(str(ex))
+    if len(value['fragments']) != value['n']:
+        raise BadChunk('Manifest has the wrong number of fragments')
+
+
+@asyncio.coroutine
+def wait_for_all(futures):
+    """
+    Waits for the futures to complete and raises the first exception any of
+    them encountered.
+    """
+    if futures:
+        done, pending = yield from asyncio.wait(futures)
+        for future in done:
+            future.result()
+
+
+@asyncio.coroutine
+def store_coded(local_node, name, value, k=ERASURE_DATA_FRAGMENTS,
+                n=ERASURE_FRAGMENTS, duplicate=DUPLICATION_COUNT,
+                expires=EXPIRY_DURATION, write_quorum=1):
+    """
+    Stores the value as n erasure coded fragments followed by a manifest with
+    the given name. Each fragment is stored (in parallel) at the single node
+    closest to its key and the (small) manifest is replicated to duplicate
+    number of nodes, which must be acknowledged by write_quorum of them.
+
+    Returns the manifest once it has been stored. If a fragment can't be
+    stored the exception is raised and the manifest isn't stored. Raises
+    ValueError if the name is reserved for fragments (see check_name).
+    """
+    check_name(name)
+    check_parameters(k, n)
+    data = serialise(value)
+    fragments = encode(data, k, n)
+    futures = [store_item(local_node, fragment_name(name, i),
+                          encode_chunk(fragment), 1, expires, 1)
+               for i, fragment in enumerate(fragments)]
+    try:
+        yield from wait_for_all(futures)
+    finally:
+        for future in futures:
+            future.cancel()
+    local_node.metrics.increment('erasure.fragments_stored', n)
+    manifest = {
+        'erasure': MANIFEST_VERSION,
+        'k': k,
+        'n': n,
+        'size': len(data),
+        'digest': sha512(data).hexdigest(),
+        'fragments': [sha512(fragment).hexdigest()
+                      for fragment in fragments],
+    }
+    yield from store_item(local_node, name, manifest, duplicate, expires,
+                          write_quorum)
+    log.info('Stored {} as {} of {} fragments ({} bytes).'.format(
+        name, k, n, len(data)))
+    return manifest
+
+
+@asyncio.coroutine
+def fetch_fragment(local_node, public_key, name, index, digest):
+    """
+    Returns the bytes of the fragment with the given index of the value with
+    the given name stored by the publisher with the public key. The local
+    data store is checked before looking the fragment up in the DHT. Raises
+    BadChunk if the fragment doesn't match its digest.
+    """
+    key = construct_key(public_key, fragment_name(name, index))
+    item = local_node.get_live_item(key)
+    if not item:
+        item = yield from local_node.retrieve(key)
+    data = decode_chunk(item.value)
+    if sha512(data).hexdigest() != digest:
+        raise BadChunk('Fragment {} of {} does not match its digest'.format(
+            index, name))
+    return data
+
+
+@asyncio.coroutine
+def fetch_fragments(local_node, public_key, name, manifest, needed):
+    """
+    Fetches fragments of the value described by the manifest in parallel
+    until needed of them have arrived (or there are no more to try). No more
+    than needed fetches are in flight at once. Returns a dictionary of the
+    fragments found keyed by index.
+    """
+    indices = iter(range(manifest['n']))
+    running = {}
+    found = {}
+
+    def start():
+        index = next(indices, None)
+        if index is not None:
+            task = asyncio.Task(fetch_fragment(
+                local_node, public_key, name, index,
+                manifest['fragments'][index]))
+            running[task] = index
+
+    for i in range(needed):
+        start()
+    try:
+        while running and len(found) < needed:
+            done, pending = yield from asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = running.pop(task)
+                try:
+                    found[index] = task.result()
+                except Exception as ex:
+                    log.info('Fragment {} of {} unavailable: {}'.format(
+                        index, name, ex))
+                    local_node.metrics.increment('erasure.fragments_missing')
+                    start()
+    finally:
+        for task in running:
+            task.cancel()
+    return found
+
+
+@asyncio.coroutine
+def retrieve_coded(local_node, public_key, name):
+    """
+    Retrieves and returns the erasure coded value with the given name stored
+    by the publisher with the public key. Raises TooFewFragments if fewer
+    than k fragments can be found and BadChunk if the manifest is malformed
+    or the rebuilt value doesn't match it.
+    """
+    result = yield from local_node.retrieve(construct_key(public_key, name))
+    manifest = result.value
+    check_manifest(manifest)
+    k = manifest['k']
+    found = yield from fetch_fragments(local_node, public_key, name,
+                                       manifest, k)
+    data = decode(found, k, manifest['n'], manifest['size'])
+    if sha512(data).hexdigest() != manifest['digest']:
+        raise BadChunk('Rebuilt value does not match its manifest')
+    return json.loads(data.decode('utf-8'))
+
+
+@asyncio.coroutine
+def repair_coded(local_node, name):
+    """
+    Checks every fragment of the erasure coded value with the given name
+    published by the local node, rebuilds those that are missing (or
+    corrupt) from the others and stores only them again. The rebuilt
+    fragments expire with the manifest. Returns the list of the indices of
+    the fragments that were stored again.
+    """
+    result = yield from local_node.retrieve(
+        construct_key(local_node.public_key, name))
+    manifest = result.value
+    check_manifest(manifest)
+    k, n = manifest['k'], manifest['n']
+    found = yield from fetch_fragments(local_node, local_node.public_key,
+                                       name, manifest, n)
+    missing = [i for i in range(n) if i not in found]
+    if not missing:
+        return missing
+    data = decode(found, k, n, manifest['size'])
+    if sha512(data).hexdigest() != manifest['digest']:
+        raise BadChunk('Rebuilt value does not match its manifest')
+    expires = EXPIRY_DURATION
+    if result.expires > 0.0:
+        # The manifest may (just) have expired while the fragments were
+        # fetched. A non-positive duration would mean they never expire.
+        expires = max(result.expires - time.time(), 1)
+    futures = [store_item(local_node, fragment_name(name, i),
+                          encode_chunk(fragment), 1, expires, 1)
+               for i, fragment in zip(missing, encode(data, k, n, missing))]
+    try:
+        yield from wait_for_all(futures)
+    finally:
+        for future in futures:
+            future.cancel()
+    local_node.metrics.increment('erasure.fragments_repaired', len(missing))
+    log.info('Repaired fragments {} of {}.'.format(missing, name))
+    return missing
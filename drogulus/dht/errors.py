@@ -73,6 +73,23 @@ class TooBig(Exception):
     pass
 
 
+class QuotaExceeded(Exception):
+    """
+    The receiving node already holds as many items from the publisher of the
+    incoming item (or as many subscriptions) as it is willing to store.
+    """
+    pass
+
+
+class SyncRefused(Exception):
+    """
+    The receiving node won't synchronise with the sender of the incoming
+    Summary message (it isn't in sync mode or the sender isn't one of its
+    neighbours).
+    """
+    pass
+
+
 class UnsupportedProtocol(Exception):
     """
     The incoming message uses a version of the protocol unsupported by the
@@ -95,3 +112,28 @@ class TimedOut(Exception):
     fashion.
     """
     pass
+
+
+class QuorumNotReached(Exception):
+    """
+    Fired when too few remote peers acknowledged the storing of an item to
+    satisfy the requested write quorum.
+    """
+    pass
+
+
+class BadChunk(Exception):
+    """
+    A chunked (or erasure coded) value could not be reassembled: its
+    manifest is malformed or a chunk (or the whole value) doesn't match the
+    digest in the manifest.
+    """
+    pass
+
+
+class TooFewFragments(Exception):
+    """
+    Fewer fragments of an erasure coded value could be found than are needed
+    to rebuild it.
+    """
+    pass
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the handoff of locally stored items to newly joined peers.
+
+From the original Kademlia paper:
+
+"When a new node joins the system, it must store any key-value pair to which
+it is one of the k closest. Existing nodes, by similarly exploiting complete
+knowledge of their surrounding subtrees, will know which key-value pairs the
+new node should store. Any node learning of a new node therefore issues STORE
+RPCs to transfer relevant key-value pairs to the new node."
+
+Rather than waiting for the next republication, when a new contact is added
+to the routing table it is queued for handoff. Contacts are handed off to one
+at a time (every HANDOFF_TICK seconds) so a burst of new peers doesn't cause
+a burst of traffic. A handoff considers the locally held keys closest to the
+new peer's network id and selects those for which the new peer is amongst
+the K closest known nodes and for which the local node is closer than any
+other known holder (so the K existing holders don't all send the same items).
+The new peer is sent an Offer listing the keys and timestamps of the selected
+items and replies with the keys of those it doesn't hold (or holds an older
+version of), which are then sent in StoreMany batches. The handoff is kept
+apart from replica synchronisation (see drogulus.dht.sync): the selected keys
+are only a subset of the local node's neighbourhood so must not be taken as a
+record of which buckets are in sync with the new peer.
+"""
+from .messages import OK, Missing
+from .erasure import is_fragment
+from .utils import distance
+from .constants import HANDOFF_TICK, HANDOFF_MAX_ITEMS, HANDOFF_INTERVAL
+from collections import deque
+import asyncio
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class Handoff(object):
+    """
+    Hands locally stored items off to newly joined peers that are amongst the
+    K closest nodes to the items' keys.
+    """
+
+    def __init__(self, local_node, tick=HANDOFF_TICK,
+                 max_items=HANDOFF_MAX_ITEMS, interval=HANDOFF_INTERVAL):
+        """
+        The local_node is the Node instance whose items are handed off. One
+        queued contact is handed off to every tick seconds, considering up
+        to max_items keys. Items are handed off to the same contact at most
+        once every interval seconds.
+        """
+        self.local_node = local_node
+        self.tick = tick
+        self.max_items = max_items
+        self.interval = interval
+        # Contacts waiting to be handed off to.
+        self.queue = deque()
+        # The network ids of the queued contacts.
+        self.queued = set()
+        # Maps the network ids of contacts recently handed off to the time of
+        # the handoff.
+        self.recent = {}
+        # The event loop handle for the next handoff.
+        self.handle = None
+
+    def contact_added(self, contact):
+        """
+        Called when the contact is newly added to the local node's routing
+        table. Queues the contact for handoff unless it is already queued or
+        was handed off to recently.
+        """
+        network_id = contact.network_id
+        if network_id in self.queued:
+            return
+        handed_off = self.recent.get(network_id)
+        if handed_off is not None and handed_off > time.time() - self.interval:
+            return
+        self.queue.append(contact)
+        self.queued.add(network_id)
+        self._schedule()
+
+    def _schedule(self):
+        """
+        Ensures the next queued contact is handed off to in self.tick seconds.
+        """
+        if self.handle is None and self.queue:
+            self.handle = self.local_node.event_loop.call_later(self.tick,
+                                                                self._tick)
+
+    def stop(self):
+        """
+        Stops handing off to queued contacts.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _tick(self):
+        """
+        Hands off to the next queued contact then schedules the next handoff.
+        """
+        self.handle = None
+        contact = self.queue.popleft()
+        self.queued.discard(contact.network_id)
+        now = time.time()
+        self.recent = dict((network_id, handed_off) for network_id, handed_off
+                           in self.recent.items()
+                           if handed_off > now - self.interval)
+        self.recent[contact.network_id] = now
+        try:
+            self.handoff(contact)
+        except Exception as ex:
+            log.error('Handoff to {} failed'.format(contact))
+            log.error(ex)
+        self._schedule()
+
+    def candidates(self, contact):
+        """
+        Returns a list of the locally held keys (of those closest to the
+        contact's network id) for which the contact is amongst the K closest
+        known nodes and the local node is closer than the other known nodes.
+        """
+        node = self.local_node
+        result = []
+        for key in list(node.data_store.closest(contact.network_id,
+                                                self.max_items)):
+            closest = node.routing_table.find_close_nodes(key)
+            if contact not in closest:
+                continue
+            others = [peer for peer in closest if peer != contact]
+            if others and (distance(node.network_id, key) >
+                           distance(others[0].network_id, key)):
+                # Another holder is closer and will hand the item off.
+                continue
+            result.append(key)
+        return result
+
+    def handoff(self, contact):
+        """
+        Pushes the items the contact should hold (but doesn't) to the
+        contact. Returns a Future that resolves with the list of the pushed
+        keys (or None if there's nothing to hand off).
+        """
+        node = self.local_node
+        now = time.time()
+        entries = {}
+        for key in self.candidates(contact):
+            item = node.data_store[key]
+            if item.expires > 0.0 and item.expires < now:
+                continue
+            if is_fragment(item.name):
+                # Fragments are held by a single node (see erasure).
+                continue
+            entries[key] = item.timestamp
+        if not entries:
+            return None
+        log.info('Handing off {} keys to {}'.format(len(entries), contact))
+        result = asyncio.Future()
+        uuid, task = node.send_offer(contact, entries)
+        node.metrics.increment('handoff.sessions')
+        node.metrics.increment('handoff.keys', len(entries))
+
+        def on_response(task, contact=contact, result=result):
+            """
+            Called with the response to the Offer message. Pushes the items
+            the contact is missing (or holds an older version of).
+            """
+            if task.cancelled():
+                result.cancel()
+                return
+            if task.exception():
+                result.set_exception(task.exception())
+                return
+            response = task.result()
+            if isinstance(response, OK):
+                # The contact already holds every offered item.
+                result.set_result([])
+            elif isinstance(response, Missing):
+                keys = [key for key in response.keys if key in entries]
+                result.set_result(self.push(contact, keys))
+            else:
+                result.set_exception(ValueError(
+                    'Unexpected response: {}'.format(response)))
+
+        task.add_done_callback(on_response)
+        return result
+
+    def push(self, contact, keys):
+        """
+        Sends the locally held items with the given keys to the contact.
+        Returns the list of the pushed keys.
+        """
+        node = self.local_node
+        data_store = node.data_store
+        items = [data_store[key] for key in keys if key in data_store]
+        if items:
+            sent = node.send_items(contact, items)
+            node.metrics.increment('handoff.items_pushed', len(items))
+            node.metrics.increment('handoff.bytes_sent',
+                                   sum(size for task, size in sent))
+        return [item.key for item in items]
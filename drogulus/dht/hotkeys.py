@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the classes and functions used to spread the load of "hot" keys
+(keys requested by many peers at once, such as in a flash crowd) by caching
+copies of their items along the lookup path.
+
+As the original Kademlia paper explains:
+
+"For caching purposes, once a lookup succeeds, the requesting node stores the
+<key, value> pair at the closest node it observed to the key that did not
+return the value. Because of the unidirectionality of the topology, future
+searches for the same key are likely to hit cached entries before querying
+the closest node. During times of high popularity for a certain key, the
+system might end up caching it at many nodes. To avoid "over-caching," we make
+the expiration time of a <key, value> pair in any node's database
+exponentially inversely proportional to the number of nodes between the
+current node and the node whose ID is closest to the key ID."
+
+The rate at which each key is requested from a node is tracked by a
+RequestRates instance. When a node serves a hot key (one requested at least
+HOT_KEY_RATE times a second) it reports its load in a HotValue response. The
+requesting node then caches one copy of the item for each multiple of
+HOT_KEY_RATE (see cache_copies) at the closest nodes on the lookup path that
+didn't have it, so the load is spread further the hotter the key.
+
+A node that isn't amongst the K closest nodes it knows of to an item's key
+holds a cached copy. Cached copies aren't republished and are deleted once
+they haven't been requested for their lifetime. The lifetime halves for each
+bit the node is further from the key than the K closest nodes it knows of
+(see cache_lifetime), so copies far from the key (where fewer requests pass)
+disappear quickly while copies of hot keys stay for as long as they're
+requested.
+"""
+from .constants import (REQUEST_RATE_HALF_LIFE, REQUEST_RATE_KEYS,
+                        HOT_KEY_RATE, CACHE_COPIES_MAX, CACHE_MIN_LIFETIME,
+                        REPLICATE_INTERVAL)
+import heapq
+import math
+import time
+
+
+def cache_copies(load, hot_rate=HOT_KEY_RATE, maximum=CACHE_COPIES_MAX):
+    """
+    Returns the number of copies of an item to cache given the load
+    (requests per second) reported by the node that returned it: one copy
+    for each multiple of the hot_rate (at least one and at most maximum).
+    """
+    if load < hot_rate:
+        return 1
+    return max(1, min(maximum, int(math.ceil(load / hot_rate))))
+
+
+def cache_lifetime(excess, longest=REPLICATE_INTERVAL,
+                   shortest=CACHE_MIN_LIFETIME):
+    """
+    Returns the number of seconds a cached copy of an item is kept without
+    being requested given the number of bits (the excess) by which the
+    distance of the local node from the item's key exceeds the distance of
+    the furthest of the K closest nodes it knows of. The longest lifetime is
+    halved for each bit, down to the shortest.
+    """
+    if excess >= 64:
+        return shortest
+    return max(shortest, longest / 2 ** max(excess, 0))
+
+
+class RequestRates(object):
+    """
+    Estimates the rate at which each key is requested with an exponentially
+    decaying count of the requests for the key. The count halves every
+    half_life seconds, so the rate follows changes in demand within a few
+    half lives. No more than capacity keys are tracked; once there are more,
+    the keys with the lowest rates are forgotten.
+    """
+
+    def __init__(self, half_life=REQUEST_RATE_HALF_LIFE,
+                 capacity=REQUEST_RATE_KEYS):
+        self.half_life = half_life
+        self.capacity = capacity
+        # Maps keys to a (count, time of last request) tuple.
+        self._counts = {}
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def _decayed(self, key, now):
+        """
+        Returns the count of requests for the key decayed to time now.
+        """
+        count, last = self._counts.get(key, (0.0, now))
+        return count * 2 ** (-max(now - last, 0.0) / self.half_life)
+
+    def _to_rate(self, count):
+        """
+        Converts a decayed count into requests per second. A steady rate r
+        produces a count of r * half_life / ln(2).
+        """
+        return count * math.log(2) / self.half_life
+
+    def record(self, key, now=None):
+        """
+        Records a request for the key (at time now, defaulting to the current
+        time) and returns the key's updated rate.
+        """
+        if now is None:
+            now = time.time()
+        count = self._decayed(key, now) + 1.0
+        self._counts[key] = (count, now)
+        if len(self._counts) > self.capacity + self.capacity // 10:
+            self._prune(now)
+        return self._to_rate(count)
+
+    def rate(self, key, now=None):
+        """
+        Returns the rate (requests per second) at which the key is requested
+        (at time now, defaulting to the current time).
+        """
+        if now is None:
+            now = time.time()
+        return self._to_rate(self._decayed(key, now))
+
+    def hottest(self, limit=10, now=None):
+        """
+        Returns a list of up to limit (key, rate) tuples for the keys with the
+        highest rates, hottest first.
+        """
+        if now is None:
+            now = time.time()
+        return heapq.nlargest(limit, ((key, self.rate(key, now))
+                                      for key in self._counts),
+                              key=lambda entry: entry[1])
+
+    def _prune(self, now):
+        """
+        Forgets the keys with the lowest rates so no more than capacity keys
+        are tracked.
+        """
+        keep = heapq.nlargest(self.capacity, self._counts,
+                              key=lambda key: self._decayed(key, now))
+        self._counts = dict((key, self._counts[key]) for key in keep)
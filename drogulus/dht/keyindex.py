@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Contains an ordered index of the keys held in a data store so the keys in a
+region of the key space can be found without scanning every key.
+
+Keys are hexadecimal strings of the same length so their lexical order is the
+same as their numeric order. The SortedKeyList holds the keys in a list of
+sorted blocks (each no longer than twice LOAD) so that adding or removing a
+key only shifts the contents of a single block, rather than of a single list
+containing every key.
+"""
+from bisect import bisect_left
+from itertools import islice
+
+
+#: The preferred number of keys in each block of a SortedKeyList. Blocks are
+#: split in two once they grow to twice this size.
+LOAD = 1000
+
+#: When looking for the keys closest to a target, a region of the key space
+#: containing no more than this number of keys is sorted by distance rather
+#: than split further.
+CLOSEST_THRESHOLD = 64
+
+
+def prefix_range(prefix):
+    """
+    Returns a tuple containing the lower (inclusive) and upper (exclusive)
+    bounds of the keys that start with the hexadecimal prefix. None means
+    there is no bound.
+    """
+    if not prefix:
+        return (None, None)
+    upper = int(prefix, 16) + 1
+    if upper >= 16 ** len(prefix):
+        return (prefix, None)
+    return (prefix, '{:0{}x}'.format(upper, len(prefix)))
+
+
+def closest_keys(key_range, target):
+    """
+    Yields keys in order of their XOR distance from target (a hexadecimal
+    key). The key_range argument is a callable that takes lower (inclusive)
+    and upper (exclusive) bounds and returns an iterator over the keys
+    between them in order (for example, DataStore.range).
+
+    The key space is treated as a binary tree: the keys in the half of a
+    region on the same side as the target are all closer than the keys in
+    the other half. Empty regions are skipped and small regions are sorted
+    by distance so only the regions containing the closest keys are visited.
+    """
+    length = len(target)
+    target_value = int(target, 16)
+
+    def bound(value):
+        if value >= 16 ** length:
+            return None
+        return '{:0{}x}'.format(value, length)
+
+    def walk(base, bits):
+        lower = bound(base)
+        upper = bound(base + (1 << bits))
+        keys = list(islice(key_range(lower, upper), CLOSEST_THRESHOLD + 1))
+        if len(keys) <= CLOSEST_THRESHOLD:
+            keys.sort(key=lambda key: int(key, 16) ^ target_value)
+            for key in keys:
+                yield key
+            return
+        half = 1 << (bits - 1)
+        if target_value & half:
+            near, far = base + half, base
+        else:
+            near, far = base, base + half
+        for key in walk(near, bits - 1):
+            yield key
+        for key in walk(far, bits - 1):
+            yield key
+
+    return walk(0, length * 4)
+
+
+class SortedKeyList(object):
+    """
+    A set of keys that can be iterated over in order and queried for the
+    keys in a range.
+    """
+
+    def __init__(self, keys=None, load=LOAD):
+        """
+        Creates an index of the (optional) iterable of keys. The load is the
+        preferred number of keys in each block.
+        """
+        self.load = load
+        self._blocks = []
+        # The last (greatest) key in each block.
+        self._maxes = []
+        self._len = 0
+        if keys:
+            keys = sorted(set(keys))
+            for i in range(0, len(keys), load):
+                block = keys[i:i + load]
+                self._blocks.append(block)
+                self._maxes.append(block[-1])
+            self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for block in self._blocks:
+            for key in block:
+                yield key
+
+    def __contains__(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        return block[j] == key
+
+    def add(self, key):
+        """
+        Adds the key to the index (if it isn't already there).
+        """
+        if not self._maxes:
+            self._blocks.append([key, ])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            # The new greatest key.
+            i -= 1
+            self._blocks[i].append(key)
+            self._maxes[i] = key
+        else:
+            block = self._blocks[i]
+            j = bisect_left(block, key)
+            if block[j] == key:
+                return
+            block.insert(j, key)
+        self._len += 1
+        block = self._blocks[i]
+        if len(block) > 2 * self.load:
+            # Split the block in two.
+            self._blocks.insert(i + 1, block[self.load:])
+            del block[self.load:]
+            self._maxes.insert(i, block[-1])
+
+    def discard(self, key):
+        """
+        Removes the key from the index (if it is there).
+        """
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if block[j] != key:
+            return
+        del block[j]
+        self._len -= 1
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def irange(self, lower=None, upper=None):
+        """
+        Yields the keys greater than or equal to lower and less than upper
+        in order (None means there is no bound).
+        """
+        if lower is None:
+            i, j = 0, 0
+        else:
+            i = bisect_left(self._maxes, lower)
+            if i == len(self._maxes):
+                return
+            j = bisect_left(self._blocks[i], lower)
+        while i < len(self._blocks):
+            block = self._blocks[i]
+            if upper is not None and block[-1] >= upper:
+                for key in block[j:bisect_left(block, upper)]:
+                    yield key
+                return
+            for key in block[j:]:
+                yield key
+            i += 1
+            j = 0
@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+"""
+Contains a log-structured (Bitcask style) data store for write-heavy nodes.
+
+Items are appended to the end of the active segment file as length-prefixed
+records so writing is sequential and there is no per-item fsync. An
+in-memory hash index maps each key to the location of its most recent record
+(along with the item's updated, accessed and expiry times) so a read is a
+single slice of a memory mapped segment.
+
+When the active segment grows beyond segment_size it is sealed and a hint
+file (containing the index entries for the segment) is written alongside it.
+On startup the index is rebuilt from the hint files, only segments without a
+hint file (e.g. the active segment of a node that crashed) are scanned.
+
+Superseded, deleted and expired items are dropped by compaction, which
+merges all the sealed segments into one. Compaction scheduled by the data
+store copies the records in the event loop's default executor (so the loop
+isn't blocked by the copying) and only updates the index on the loop once
+the copy is complete.
+"""
+from .storage import DataStore
+from .messages import from_dict, to_dict
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+
+
+log = logging.getLogger(__name__)
+
+
+#: The default size (in bytes) beyond which the active segment is sealed.
+SEGMENT_SIZE = 64 * 1024 * 1024
+#: Compaction is triggered when at least this proportion of the bytes in the
+#: sealed segments belong to superseded or deleted records.
+COMPACTION_THRESHOLD = 0.5
+
+#: A record's header: the CRC32 of the rest of the record, the lengths of the
+#: key and of the payload (the item serialised as JSON, zero for a deletion)
+#: and the item's updated and accessed times.
+RECORD = struct.Struct('>IHIdd')
+#: A hint's header: the lengths of the key and of the record, the offset of
+#: the record in the segment, the item's updated, accessed and expiry times
+#: and a flag to indicate a deletion.
+HINT = struct.Struct('>HIQdddB')
+
+
+class Location(object):
+    """
+    An entry in the in-memory index describing where the most recent record
+    for a key is and the times associated with the item.
+    """
+
+    __slots__ = ('segment', 'offset', 'length', 'updated', 'accessed',
+                 'expires')
+
+    def __init__(self, segment, offset, length, updated, accessed, expires):
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.updated = updated
+        self.accessed = accessed
+        self.expires = expires
+
+
+def encode_record(key, payload, updated, accessed):
+    """
+    Returns the bytes of a record for the key (a string) and payload (bytes,
+    empty for a deletion).
+    """
+    raw_key = key.encode('utf-8')
+    body = RECORD.pack(0, len(raw_key), len(payload), updated,
+                       accessed)[4:] + raw_key + payload
+    return struct.pack('>I', zlib.crc32(body) & 0xffffffff) + body
+
+
+def decode_record(data, offset):
+    """
+    Decodes the record at offset in data. Returns a tuple containing the key,
+    payload, updated and accessed times and the length of the record or None
+    if the record is truncated or corrupt.
+    """
+    if offset + RECORD.size > len(data):
+        return None
+    crc, key_length, payload_length, updated, accessed = RECORD.unpack_from(
+        data, offset)
+    length = RECORD.size + key_length + payload_length
+    if offset + length > len(data):
+        return None
+    body = data[offset + 4:offset + length]
+    if zlib.crc32(body) & 0xffffffff != crc:
+        return None
+    start = offset + RECORD.size
+    key = bytes(data[start:start + key_length]).decode('utf-8')
+    payload = bytes(data[start + key_length:offset + length])
+    return key, payload, updated, accessed, length
+
+
+def copy_records(path, sources):
+    """
+    Writes the records at the given (segment path, offset, length) locations
+    to a new file at path and ensures it is on disk. Returns a list of the
+    offsets of the copied records. Only reads the (sealed) segment files so
+    it is safe to run in an executor.
+    """
+    offsets = []
+    files = {}
+    offset = 0
+    try:
+        with open(path, 'wb') as merged:
+            for source, start, length in sources:
+                segment_file = files.get(source)
+                if segment_file is None:
+                    segment_file = files[source] = open(source, 'rb')
+                segment_file.seek(start)
+                merged.write(segment_file.read(length))
+                offsets.append(offset)
+                offset += length
+            merged.flush()
+            os.fsync(merged.fileno())
+    finally:
+        for segment_file in files.values():
+            segment_file.close()
+    return offsets
+
+
+class LogDataStore(DataStore):
+    """
+    A data store that appends items to segment files in a directory and keeps
+    an in-memory index of the location of each key's most recent record.
+
+    Updates of an item's access time (on every read) and last-update time
+    (when an identical item is stored again) are only held in the index;
+    they're persisted in the hint files when a segment is sealed, when the
+    data store is compacted or when it is closed.
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE,
+                 threshold=COMPACTION_THRESHOLD, event_loop=None):
+        """
+        The directory holds the segment and hint files (it is created if it
+        doesn't exist). If an event_loop is given compaction is automatically
+        started in the background (see compact_in_background) when a segment
+        is sealed and the proportion of dead bytes in the sealed segments
+        reaches threshold.
+        """
+        super(LogDataStore, self).__init__()
+        self.directory = directory
+        self.segment_size = segment_size
+        self.threshold = threshold
+        self.event_loop = event_loop
+        os.makedirs(directory, exist_ok=True)
+        # Maps keys to Location instances.
+        self.index = {}
+        # Maps segment ids to memory maps of the segment files.
+        self._maps = {}
+        # Maps segment ids to the set of keys deleted in them.
+        self._deleted = {}
+        # The (approximate) number of bytes of superseded or deleted records.
+        self.dead_bytes = 0
+        self.compactions = 0
+        # Flags a compaction in progress.
+        self._compacting = False
+        # The Task of the most recently started background compaction.
+        self._compaction = None
+        segments = self._segments()
+        if segments and not os.path.getsize(self._path(segments[-1], 'log')):
+            # Re-use an empty segment left by the previous run.
+            self.active = segments.pop()
+            hint_path = self._path(self.active, 'hint')
+            if os.path.exists(hint_path):
+                os.remove(hint_path)
+        else:
+            self.active = segments[-1] + 1 if segments else 0
+        for segment in segments:
+            self._load(segment)
+        for key, location in self.index.items():
+            self._index_expiry(key, location.expires)
+        self._active_file = open(self._path(self.active, 'log'), 'ab')
+        self._active_size = 0
+
+    def _path(self, segment, extension):
+        """
+        Returns the path of the segment's file with the given extension.
+        """
+        return os.path.join(self.directory,
+                            '{:010d}.{}'.format(segment, extension))
+
+    def _segments(self):
+        """
+        Returns an ordered list of the ids of the segments in the directory.
+        """
+        result = []
+        for name in os.listdir(self.directory):
+            base, extension = os.path.splitext(name)
+            if extension == '.log' and base.isdigit():
+                result.append(int(base))
+        return sorted(result)
+
+    def _apply(self, key, location, deleted, segment):
+        """
+        Updates the index with an entry (a location or a deletion) read from
+        a hint file or segment while loading.
+        """
+        previous = self.index.pop(key, None)
+        if previous is not None:
+            self.dead_bytes += previous.length
+        if deleted:
+            self._deleted.setdefault(segment, set()).add(key)
+        else:
+            self.index[key] = location
+
+    def _load(self, segment):
+        """
+        Adds the entries in the (sealed) segment to the index. Reads the
+        segment's hint file if there is one, otherwise scans the segment
+        (truncating any incomplete record at its end) and writes the hint
+        file.
+        """
+        hint_path = self._path(segment, 'hint')
+        if os.path.exists(hint_path):
+            with open(hint_path, 'rb') as hint_file:
+                data = hint_file.read()
+            offset = 0
+            while offset + HINT.size <= len(data):
+                (key_length, length, record_offset, updated, accessed,
+                 expires, deleted) = HINT.unpack_from(data, offset)
+                offset += HINT.size
+                key = data[offset:offset + key_length].decode('utf-8')
+                offset += key_length
+                location = Location(segment, record_offset, length, updated,
+                                    accessed, expires)
+                self._apply(key, location, deleted, segment)
+            return
+        log.info('Scanning segment {} in {}'.format(segment, self.directory))
+        path = self._path(segment, 'log')
+        with open(path, 'rb') as segment_file:
+            data = segment_file.read()
+        offset = 0
+        while offset < len(data):
+            record = decode_record(data, offset)
+            if record is None:
+                log.error('Truncating segment {} at {}'.format(segment,
+                                                               offset))
+                with open(path, 'r+b') as segment_file:
+                    segment_file.truncate(offset)
+                break
+            key, payload, updated, accessed, length = record
+            expires = 0.0
+            if payload:
+                expires = json.loads(payload.decode('utf-8'))['expires']
+            location = Location(segment, offset, length, updated, accessed,
+                                expires)
+            self._apply(key, location, not payload, segment)
+            offset += length
+        self._write_hint(segment)
+
+    def _write_hint(self, segment):
+        """
+        Writes the hint file for the segment (atomically replacing any
+        existing hint file).
+        """
+        parts = []
+        for key, location in self.index.items():
+            if location.segment == segment:
+                raw_key = key.encode('utf-8')
+                parts.append(HINT.pack(len(raw_key), location.length,
+                                       location.offset, location.updated,
+                                       location.accessed, location.expires,
+                                       0) + raw_key)
+        for key in self._deleted.get(segment, ()):
+            raw_key = key.encode('utf-8')
+            parts.append(HINT.pack(len(raw_key), 0, 0, 0.0, 0.0, 0.0, 1) +
+                         raw_key)
+        path = self._path(segment, 'hint')
+        with open(path + '.tmp', 'wb') as hint_file:
+            hint_file.write(b''.join(parts))
+        os.replace(path + '.tmp', path)
+
+    def _map(self, segment, end):
+        """
+        Returns a memory map of the segment that covers at least end bytes.
+        """
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            if segment == self.active:
+                self._active_file.flush()
+            with open(self._path(segment, 'log'), 'rb') as segment_file:
+                mapped = mmap.mmap(segment_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def _append(self, key, payload, updated, accessed):
+        """
+        Appends a record to the active segment. Returns a tuple of the offset
+        and length of the record.
+        """
+        record = encode_record(key, payload, updated, accessed)
+        offset = self._active_size
+        self._active_file.write(record)
+        self._active_size += len(record)
+        return offset, len(record)
+
+    def _supersede(self, key):
+        """
+        Removes the key from the index, counting the bytes of its record as
+        dead.
+        """
+        previous = self.index.pop(key, None)
+        if previous is not None:
+            self.dead_bytes += previous.length
+        return previous
+
+    def _roll(self):
+        """
+        Seals the active segment (writing its hint file) and starts a new one.
+        Schedules a compaction if enough of the sealed segments is dead.
+        """
+        self._active_file.close()
+        sealed = self.active
+        self._write_hint(sealed)
+        self.active += 1
+        self._active_file = open(self._path(self.active, 'log'), 'ab')
+        self._active_size = 0
+        if (self.event_loop and not self._compacting and
+                (self._compaction is None or self._compaction.done()) and
+                self._dead_ratio() >= self.threshold):
+            self._compaction = asyncio.Task(self.compact_in_background(),
+                                            loop=self.event_loop)
+
+    def _dead_ratio(self):
+        """
+        Returns the proportion of the bytes in the segments that belong to
+        superseded or deleted records.
+        """
+        total = self._active_size
+        for segment in self._segments():
+            if segment != self.active:
+                total += os.path.getsize(self._path(segment, 'log'))
+        if not total:
+            return 0.0
+        return self.dead_bytes / total
+
+    def flush(self):
+        """
+        Ensures the appended records have been handed to the operating
+        system (so they survive the process dying).
+        """
+        self._active_file.flush()
+
+    def sync(self):
+        """
+        Ensures the appended records have been written to disk.
+        """
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+
+    def close(self):
+        """
+        Writes the appended records to disk, seals the active segment and
+        closes all the files.
+        """
+        self.sync()
+        self._active_file.close()
+        for segment in self._segments():
+            self._write_hint(segment)
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+
+    def compact(self):
+        """
+        Merges all the sealed segments into a single segment containing only
+        the most recent records of the live (unexpired) items. The merged
+        segment takes the id of the newest sealed segment. Returns a boolean
+        indication of whether the segments were compacted (there must be a
+        sealed segment and no compaction already in progress).
+
+        The merged segment is written to a temporary file before replacing
+        the newest sealed segment. The newest sealed segment's hint file
+        (which describes the records of the segment being replaced) is
+        deleted first, so should the process die before the merged
+        segment's hint file is written the merged segment is scanned on
+        startup rather than read at the offsets of the old hint. The older
+        segments are deleted last. Should the process die before they are
+        deleted, the items dropped because they were deleted may reappear
+        (and will be removed again by the node in due course).
+        """
+        plan = self._plan_compaction()
+        if plan is None:
+            return False
+        try:
+            offsets = copy_records(self._path(plan[1], 'log') + '.tmp',
+                                   plan[2])
+            self._finish_compaction(plan, offsets)
+        finally:
+            self._compacting = False
+        return True
+
+    @asyncio.coroutine
+    def compact_in_background(self):
+        """
+        Compacts the sealed segments (see compact) with the records copied
+        in the event loop's default executor. Items stored, deleted or
+        expired while the records are being copied are taken into account
+        when the index is updated. Returns a boolean indication of whether
+        the segments were compacted.
+        """
+        plan = self._plan_compaction()
+        if plan is None:
+            return False
+        try:
+            offsets = yield from self.event_loop.run_in_executor(
+                None, copy_records, self._path(plan[1], 'log') + '.tmp',
+                plan[2])
+            if self._active_file.closed:
+                # The data store was closed while copying.
+                os.remove(self._path(plan[1], 'log') + '.tmp')
+                return False
+            self._finish_compaction(plan, offsets)
+        except Exception as ex:
+            log.error('Compaction of {} failed'.format(self.directory))
+            log.error(ex)
+            return False
+        finally:
+            self._compacting = False
+        return True
+
+    def _plan_compaction(self):
+        """
+        Starts a compaction: drops the expired items in the sealed segments
+        from the index and returns a tuple containing the ids of the sealed
+        segments, the id of the merged segment, a list of the (segment path,
+        offset, length) locations of the records to copy, a list of the
+        (key, location) pairs of the items being moved and the number of
+        dead bytes so far. Returns None if there is nothing to compact or a
+        compaction is already in progress.
+        """
+        if self._compacting:
+            return None
+        sealed = [segment for segment in self._segments()
+                  if segment != self.active]
+        if not sealed:
+            return None
+        self._compacting = True
+        now = time.time()
+        sources = []
+        moved = []
+        for key, location in list(self.index.items()):
+            if location.segment == self.active:
+                continue
+            if location.expires > 0.0 and location.expires < now:
+                self._unindex_item(key)
+                del self.index[key]
+                continue
+            sources.append((self._path(location.segment, 'log'),
+                            location.offset, location.length))
+            moved.append((key, location))
+        return sealed, sealed[-1], sources, moved, self.dead_bytes
+
+    def _finish_compaction(self, plan, offsets):
+        """
+        Replaces the newest sealed segment with the merged segment (whose
+        records are at the given offsets) and updates the index entries of
+        the moved items that haven't been superseded or deleted since the
+        compaction was planned. Deletes the other sealed segments.
+        """
+        sealed, target, sources, moved, dead_bytes = plan
+        path = self._path(target, 'log')
+        for segment in sealed:
+            mapped = self._maps.pop(segment, None)
+            if mapped is not None:
+                mapped.close()
+        hint_path = self._path(target, 'hint')
+        if os.path.exists(hint_path):
+            os.remove(hint_path)
+        os.replace(path + '.tmp', path)
+        for (key, location), offset in zip(moved, offsets):
+            if self.index.get(key) is location:
+                # The item hasn't been superseded or deleted.
+                location.segment = target
+                location.offset = offset
+        self._deleted = dict((segment, keys) for segment, keys
+                             in self._deleted.items()
+                             if segment not in sealed)
+        self._write_hint(target)
+        for segment in sealed[:-1]:
+            os.remove(self._path(segment, 'log'))
+            hint_path = self._path(segment, 'hint')
+            if os.path.exists(hint_path):
+                os.remove(hint_path)
+        # Only the records superseded since the compaction was planned are
+        # dead (including those superseded in the merged segment).
+        self.dead_bytes = max(0, self.dead_bytes - dead_bytes)
+        self.compactions += 1
+        log.info('Compacted {} segments into {}'.format(len(sealed), target))
+
+    def __delitem__(self, key):
+        """
+        Delete the specified key (and its value) by appending a deletion
+        record.
+        """
+        if key not in self.index:
+            raise KeyError(key)
+        self._unindex_item(key)
+        self._supersede(key)
+        self._append(key, b'', 0.0, 0.0)
+        self._deleted.setdefault(self.active, set()).add(key)
+        if self._active_size >= self.segment_size:
+            self._roll()
+
+    def __iter__(self):
+        """
+        Iterates over the keys in the data store.
+        """
+        return iter(list(self.index))
+
+    def __len__(self):
+        """
+        Returns the number of items in the data store.
+        """
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def keys(self):
+        """
+        Return a view object of the keys in this data store.
+        """
+        return self.index.keys()
+
+    def _set_item(self, key, value):
+        """
+        Appends a record for the value (a tuple of the item, updated and
+        accessed times) of the key/value pair identified by key.
+        """
+        item, updated, accessed = value
+        payload = json.dumps(to_dict(item)).encode('utf-8')
+        self._supersede(key)
+        if self.active in self._deleted:
+            self._deleted[self.active].discard(key)
+        offset, length = self._append(key, payload, updated, accessed)
+        self.index[key] = Location(self.active, offset, length, updated,
+                                   accessed, item.expires)
+        if self._active_size >= self.segment_size:
+            self._roll()
+
+    def _get_item(self, key):
+        """
+        Get the tuple of the item, updated and accessed times for the given
+        key. Raises a KeyError if the key isn't in the data store or the
+        record at the indexed location is corrupt or belongs to another key.
+        """
+        location = self.index[key]
+        mapped = self._map(location.segment,
+                           location.offset + location.length)
+        record = decode_record(mapped, location.offset)
+        if record is None or record[0] != key:
+            log.error('Bad record for {} in segment {} at {}'.format(
+                key, location.segment, location.offset))
+            raise KeyError(key)
+        payload = record[1]
+        item = from_dict(json.loads(payload.decode('utf-8')))
+        return (item, location.updated, location.accessed)
+
+    def __setitem__(self, key, value):
+        """
+        Associate a key with a specified value keeping the last access time
+        of any existing item (without reading the existing item).
+        """
+        previous = self.index.get(key)
+        accessed = previous.accessed if previous else 0.0
+        self._set_item(key, (value, time.time(), accessed))
+        self._index_item(key, value)
+
+    def touch(self, key):
+        """
+        Updates the last-access timestamp associated with the key/value pair.
+        """
+        self.index[key].accessed = time.time()
+
+    def refresh(self, key):
+        """
+        Updates the last-update timestamp associated with the key/value pair.
+        """
+        self.index[key].updated = time.time()
+
+    def updated(self, key):
+        return self.index[key].updated
+
+    def accessed(self, key):
+        return self.index[key].accessed
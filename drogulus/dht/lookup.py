@@ -7,14 +7,78 @@ import time
 import logging
 from . import constants
 from .contact import PeerNode
-from .utils import sort_peer_nodes
+from .utils import sort_peer_nodes, distance
 from .errors import RoutingTableEmpty, ValueNotFound
-from .messages import Nodes, FindValue, Value
+from .messages import (Nodes, FindValue, Value, HotValue, FindValues,
+                       MultiResult)
 
 
 log = logging.getLogger(__name__)
 
 
+class AlphaController(object):
+    """
+    Controls the degree of parallelism (ALPHA) of a single lookup.
+
+    An adaptive controller widens the parallelism when responses are slow or
+    failing (so a lookup doesn't stall when peers churn) and narrows it when
+    fast responses bring the lookup closer to its target (so the shortlist
+    converges without flooding peers). The value of alpha is always kept
+    within the minimum and maximum bounds. A controller whose bounds are the
+    same as its initial value represents a fixed degree of parallelism.
+    """
+
+    def __init__(self, alpha=constants.ALPHA, minimum=constants.ALPHA_MIN,
+                 maximum=constants.ALPHA_MAX, slow=constants.SLOW_RESPONSE):
+        """
+        The alpha argument is the initial degree of parallelism, minimum and
+        maximum are the bounds within which it may change and slow is the
+        latency (in seconds) above which a response is considered slow.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.alpha = max(minimum, min(alpha, maximum))
+        self.slow = slow
+
+    def widen(self):
+        """
+        Increases alpha by one (if possible). Returns a boolean indication of
+        change.
+        """
+        if self.alpha < self.maximum:
+            self.alpha += 1
+            return True
+        return False
+
+    def narrow(self):
+        """
+        Decreases alpha by one (if possible). Returns a boolean indication of
+        change.
+        """
+        if self.alpha > self.minimum:
+            self.alpha -= 1
+            return True
+        return False
+
+    def on_response(self, latency, improved):
+        """
+        Called when a response arrives after latency seconds. The improved
+        flag indicates if the response revealed a node nearer to the target.
+        Returns True if alpha was widened.
+        """
+        if latency > self.slow:
+            return self.widen()
+        if improved:
+            self.narrow()
+        return False
+
+    def on_failure(self):
+        """
+        Called when a request fails. Returns True if alpha was widened.
+        """
+        return self.widen()
+
+
 class Lookup(asyncio.Future):
     """
     Encapsulates a lookup in the DHT given a particular target key and message
@@ -56,7 +120,9 @@ class Lookup(asyncio.Future):
     self.contacted - a set of nodes that have been contacted for this lookup.
     self.nearest_node - the node nearest to the target so far.
     self.pending_requests - a dictionary of currently pending requests.
-    constants.ALPHA - the number of concurrent asynchronous calls allowed.
+    self.concurrency - the controller of the number of concurrent
+      asynchronous calls allowed (see the AlphaController class).
+    constants.ALPHA - the default number of concurrent asynchronous calls.
     constants.K - the number of closest nodes to return when complete.
     constants.LOOKUP_TIMEOUT - the default maximum duration for a lookup.
 
@@ -114,26 +180,91 @@ class Lookup(asyncio.Future):
 
     Note on validating values: In the future there may be constraints added to
     the FindValue query (such as only accepting values created after time T).
+
+    Quorum reads: if a FindValue lookup is created with a quorum greater than
+    one, step 7 is changed. Rather than resolving with the first suitable
+    value, each value is recorded (along with the contact that returned it)
+    and the lookup continues until "quorum" values have been found. The
+    lookup then resolves with the value with the newest timestamp. If the
+    optional deadline (in seconds) passes before the quorum is reached the
+    lookup resolves with the newest value found so far (or with the first
+    value to arrive after the deadline). If the lookup runs out of peers to
+    contact having found at least one value, it resolves with the newest of
+    them rather than a ValueNotFound error. This stops a stale replica
+    "winning" simply because it was the first to respond.
+
+    Instrumentation: each lookup records its start and end times, the number
+    of rounds of requests, the number of RPCs sent, succeeded, failed and
+    cancelled, the peers contacted, how the distance between the target and
+    the nearest node improves over time and the reason the lookup terminated.
+    When the lookup is done these are published to the local node's metrics
+    registry (see the stats method).
+
+    Adaptive concurrency: if the local node's adaptive_alpha flag is set, the
+    number of concurrent requests is controlled by an adaptive AlphaController
+    that varies between constants.ALPHA_MIN and constants.ALPHA_MAX depending
+    on the latency and usefulness of responses. Otherwise it is fixed at
+    constants.ALPHA. In both cases no new requests are made while the local
+    node has constants.MAX_INFLIGHT_RPCS or more requests pending (unless the
+    lookup has no pending requests of its own).
     """
 
     def __init__(self, message_type, target, local_node, event_loop,
-                 timeout=constants.LOOKUP_TIMEOUT):
+                 timeout=constants.LOOKUP_TIMEOUT, quorum=1, deadline=None):
         """
         Sets up the lookup to search for a certain target key using the
         specified message time and the DHT state found in the local_node.
         Will cancel after timeout seconds.
+
+        A FindValue lookup waits for quorum values (or for deadline seconds
+        to pass) and resolves with the newest of them.
         """
         asyncio.Future.__init__(self)
         self.message_type = message_type
         self.target = target
         self.local_node = local_node
         self.event_loop = event_loop
+        self.timeout = timeout
+        self.quorum = quorum
+        self.deadline = deadline
+        self.deadline_passed = False
+        # A list of (contact, Value) tuples found by a quorum read.
+        self.values = []
+        # Contacts that responded without a value for the target key.
+        self.responded_without_value = set()
         # A set of nodes that have been contacted for this lookup.
         self.contacted = set()
         # Holds currently pending requests.
         self.pending_requests = {}
+        # The time at which each pending request was sent.
+        self.sent_at = {}
+        # Controls the number of concurrent requests.
+        if getattr(local_node, 'adaptive_alpha', False):
+            self.concurrency = AlphaController()
+        else:
+            self.concurrency = AlphaController(constants.ALPHA,
+                                               constants.ALPHA,
+                                               constants.ALPHA)
+        # Instrumentation of the lookup's behaviour.
+        self.start_time = time.time()
+        self.end_time = None
+        self.rounds = 0
+        self.rpcs_sent = 0
+        self.rpcs_succeeded = 0
+        self.rpcs_failed = 0
+        self.rpcs_cancelled = 0
+        # A list of (elapsed seconds, distance) tuples recording how the
+        # distance between the target and the nearest node has improved.
+        self.distance_curve = []
+        self.termination = None
+        self.add_done_callback(self._publish_metrics)
         # Schedule cancelling the lookup after a "timeout" amount of time.
-        self.event_loop.call_later(timeout, self.cancel)
+        # The timers are cancelled once the lookup is done.
+        self.timers = [local_node.timers.schedule(timeout, self.cancel)]
+        if deadline is not None and self.quorum > 1:
+            self.timers.append(local_node.timers.schedule(deadline,
+                                                          self._on_deadline))
+        self.add_done_callback(self._cancel_timers)
         # To hold peers in the DHT that are known to the local node that are
         # possibly close to the target key. Closest nodes come first.
         self.shortlist = self.local_node.routing_table.\
@@ -148,9 +279,88 @@ class Lookup(asyncio.Future):
             return
         # Holds the currently closest node to the target.
         self.nearest_node = self.shortlist[0]
+        self._record_distance()
         # Start the lookup process
         self._lookup()
 
+    def _record_distance(self):
+        """
+        Adds the current distance between the nearest node and the target to
+        the distance improvement curve.
+        """
+        elapsed = time.time() - self.start_time
+        self.distance_curve.append((elapsed,
+                                    distance(self.nearest_node.network_id,
+                                             self.target)))
+
+    def _termination_reason(self):
+        """
+        Returns a string describing why the (done) lookup terminated.
+        """
+        if self.cancelled():
+            if self.end_time - self.start_time >= self.timeout:
+                return 'timed_out'
+            return 'cancelled'
+        ex = self.exception()
+        if isinstance(ex, RoutingTableEmpty):
+            return 'routing_table_empty'
+        elif isinstance(ex, ValueNotFound):
+            return 'value_not_found'
+        elif ex:
+            return 'error'
+        elif self.message_type == FindValue:
+            return 'value_found'
+        return 'nodes_found'
+
+    def stats(self):
+        """
+        Returns a dict describing the behaviour of this lookup that can be
+        serialised into JSON.
+        """
+        end_time = self.end_time or time.time()
+        return {
+            'message_type': self.message_type.__name__.lower(),
+            'target': self.target,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration': end_time - self.start_time,
+            'rounds': self.rounds,
+            'rpcs_sent': self.rpcs_sent,
+            'rpcs_succeeded': self.rpcs_succeeded,
+            'rpcs_failed': self.rpcs_failed,
+            'rpcs_cancelled': self.rpcs_cancelled,
+            'contacted': [contact.network_id for contact in self.contacted],
+            'distance_curve': [[elapsed, hex(d)] for elapsed, d
+                               in self.distance_curve],
+            'termination': self.termination,
+            'alpha': self.concurrency.alpha,
+        }
+
+    def _publish_metrics(self, lookup):
+        """
+        Called when the lookup is done. Records the end time and the reason
+        for termination before publishing the lookup's statistics to the
+        local node's metrics registry. A trace of the lookup may also be kept
+        (depending upon the registry's sample rate).
+        """
+        self.end_time = time.time()
+        self.termination = self._termination_reason()
+        metrics = getattr(self.local_node, 'metrics', None)
+        if metrics is None:
+            return
+        prefix = 'lookup.{}'.format(self.message_type.__name__.lower())
+        metrics.increment('{}.{}'.format(prefix, self.termination))
+        metrics.observe('{}.duration'.format(prefix),
+                        self.end_time - self.start_time)
+        metrics.increment('{}.rounds'.format(prefix), self.rounds)
+        metrics.increment('{}.rpcs_sent'.format(prefix), self.rpcs_sent)
+        metrics.increment('{}.rpcs_succeeded'.format(prefix),
+                          self.rpcs_succeeded)
+        metrics.increment('{}.rpcs_failed'.format(prefix), self.rpcs_failed)
+        metrics.increment('{}.rpcs_cancelled'.format(prefix),
+                          self.rpcs_cancelled)
+        metrics.sample_trace(self.stats())
+
     def _cancel_pending_requests(self):
         """
         Causes the Tasks waiting on pending requests to be cancelled in
@@ -158,8 +368,44 @@ class Lookup(asyncio.Future):
         """
         for task in self.pending_requests.values():
             self.event_loop.call_soon(task.cancel)
+        self.rpcs_cancelled += len(self.pending_requests)
         self.pending_requests = {}
 
+    def _cancel_timers(self, lookup):
+        """
+        Called when the lookup is done to cancel the timeout and deadline.
+        """
+        for timer in self.timers:
+            timer.cancel()
+
+    def newest_value(self):
+        """
+        Returns the Value with the newest timestamp found by a quorum read (or
+        None if no values have been found).
+        """
+        if not self.values:
+            return None
+        return max([value for contact, value in self.values],
+                   key=lambda value: value.timestamp)
+
+    def _resolve_quorum(self):
+        """
+        Cancels outstanding requests and resolves the lookup with the newest
+        value found so far.
+        """
+        self._cancel_pending_requests()
+        self.set_result(self.newest_value())
+
+    def _on_deadline(self):
+        """
+        Called when the deadline of a quorum read passes. If any values have
+        been found resolve with the newest, otherwise resolve with the next
+        value to arrive.
+        """
+        self.deadline_passed = True
+        if self.values and not self.done():
+            self._resolve_quorum()
+
     def cancel(self):
         """
         Cancels this lookup in a clean fashion.
@@ -175,7 +421,8 @@ class Lookup(asyncio.Future):
         Handles error conditions.
 
         If a node doesn't reply or an error is encountered it is removed from
-        self.shortlist and self.pending_requests. Start the _lookup again.
+        self.shortlist and self.pending_requests. Start the _lookup again. If
+        no further requests could be made the lookup has finished.
         """
         if contact in self.shortlist:
             self.shortlist.remove(contact)
@@ -184,7 +431,30 @@ class Lookup(asyncio.Future):
             del self.pending_requests[uuid]
         log.info('Problem during interaction with {}'.format(contact))
         log.info(error)
+        self.concurrency.on_failure()
         self._lookup()
+        if not (self.pending_requests or self.done()):
+            # There is nobody left to ask so the lookup has finished.
+            self._finish()
+
+    def _finish(self):
+        """
+        Called when every candidate in the shortlist has been contacted
+        without the lookup finding a value or a nearer node.
+
+        If the message is a FindValue errback with a ValueNotFound error
+        (unless a quorum read has found some values, in which case callback
+        with the newest). Otherwise callback with the nodes in the shortlist.
+        """
+        if self.values:
+            self.set_result(self.newest_value())
+        elif self.message_type == FindValue:
+            # Can't find a value at the key.
+            msg = "Unable to find value for key: {}".format(self.target)
+            self.set_exception(ValueNotFound(msg))
+        else:
+            # Success! Found nodes close to the specified target key.
+            self.set_result(self.shortlist)
 
     def _blacklist(self, contact):
         """
@@ -239,12 +509,18 @@ class Lookup(asyncio.Future):
         """
         # Remove originating request from pending requests.
         del self.pending_requests[uuid]
+        latency = time.time() - self.sent_at.pop(uuid, time.time())
+        if response.exception():
+            self.rpcs_failed += 1
+        else:
+            self.rpcs_succeeded += 1
+        nearest_node = self.nearest_node
 
         # Attempt to process the result or handle problem cases appropriately.
         try:
             result = response.result()
             # Ensure the response is of the expected type[s].
-            if not ((isinstance(result, Value) and
+            if not ((isinstance(result, (Value, HotValue)) and
                      self.message_type == FindValue) or
                     isinstance(result, Nodes)):
                 # Blacklist the problem contact from the routing table (since
@@ -253,8 +529,9 @@ class Lookup(asyncio.Future):
                 raise TypeError("Unexpected response type from {}"
                                 .format(contact))
 
-            # Is the response the expected Value we're looking for..?
-            if isinstance(result, Value):
+            # Is the response the expected Value (or HotValue) we're looking
+            # for..?
+            if isinstance(result, (Value, HotValue)):
                 # Check if it's a suitable value (the key matches)
                 if result.key == self.target:
                     # Ensure the Value has not expired.
@@ -264,17 +541,28 @@ class Lookup(asyncio.Future):
                         # _handle_error method).
                         raise ValueError("Expired value returned by {}"
                                          .format(contact))
-                    # Cancel outstanding requests.
-                    self._cancel_pending_requests()
                     # Ensure the returning contact is removed from the
                     # shortlist (so it's possible to discern the closest
                     # non-returning node)
                     if contact in self.shortlist:
                         self.shortlist.remove(contact)
-
-                    # Success! The correct Value has been found. Set the
-                    # result for this instance.
-                    self.set_result(result)
+                    if self.quorum > 1:
+                        # A quorum read gathers values until there are enough
+                        # (or the deadline has passed).
+                        self.values.append((contact, result))
+                        if (len(self.values) >= self.quorum or
+                                self.deadline_passed):
+                            self._resolve_quorum()
+                        else:
+                            self._lookup()
+                            if not self.pending_requests:
+                                self._finish()
+                    else:
+                        # Cancel outstanding requests.
+                        self._cancel_pending_requests()
+                        # Success! The correct Value has been found. Set the
+                        # result for this instance.
+                        self.set_result(result)
                 else:
                     # Blacklist the problem contact from the routing table
                     # since it's not behaving properly.
@@ -286,6 +574,7 @@ class Lookup(asyncio.Future):
                 # nodes. Add the returned nodes to the shortlist. Sort the
                 # shortlist in order of closeness to the target and ensure
                 # the shortlist never gets longer than K.
+                self.responded_without_value.add(contact)
                 nodes = [PeerNode(n[0], n[1], n[2]) for n in result.nodes]
                 candidate_contacts = [candidate for candidate in nodes
                                       if candidate not in self.shortlist]
@@ -302,15 +591,7 @@ class Lookup(asyncio.Future):
                                       if candidate in self.contacted]
                         if len(candidates) == len(self.shortlist):
                             # There is a result.
-                            if self.message_type == FindValue:
-                                # Can't find a value at the key.
-                                msg = "Unable to find value for key: {}"\
-                                    .format(self.target)
-                                self.set_exception(ValueNotFound(msg))
-                            else:
-                                # Success! Found nodes close to the specified
-                                # target key.
-                                self.set_result(self.shortlist)
+                            self._finish()
                         else:
                             # There are still un-contacted peers in the
                             # shortlist so restart the lookup in order to
@@ -323,6 +604,7 @@ class Lookup(asyncio.Future):
                 else:
                     # There is a new nearest node.
                     self.nearest_node = self.shortlist[0]
+                    self._record_distance()
                     # Restart the lookup given the newly found nodes in the
                     # shortlist.
                     self._lookup()
@@ -330,31 +612,51 @@ class Lookup(asyncio.Future):
             # Catch all for problems that ensures the error is correctly
             # handled, logged and the problem node is dealt with.
             self._handle_error(uuid, contact, ex)
+            return
+        # Adjust the concurrency given the latency and usefulness of the
+        # response. If widened, use the extra capacity immediately.
+        improved = self.nearest_node != nearest_node
+        if self.concurrency.on_response(latency, improved):
+            if not self.done():
+                self._lookup()
 
     def _lookup(self):
         """
         Sends parallel lookup messages to the self.shortlist of contacts.
 
-        No more than constants.ALPHA nearest nodes that are in self.shortlist
-        but not in self.contacted are sent a message that is an instance of
-        self.message_type. Each request is added to the self.pending_requests
-        list. The length of self.pending_requests must never be more than
-        constants.ALPHA.
+        No more than self.concurrency.alpha nearest nodes that are in
+        self.shortlist but not in self.contacted are sent a message that is an
+        instance of self.message_type. Each request is added to the
+        self.pending_requests list. The length of self.pending_requests must
+        never be more than self.concurrency.alpha.
+
+        If the local node has constants.MAX_INFLIGHT_RPCS or more requests in
+        flight then no further requests are sent (unless this lookup has no
+        pending requests).
 
         As each node is contacted it is added to the self.contacted set.
         """
+        sent = 0
         for contact in self.shortlist:
             if contact not in self.contacted:
                 # Guard to ensure only ALPHA requests are ever active at any
                 # one time
-                if len(self.pending_requests) >= constants.ALPHA:
+                if len(self.pending_requests) >= self.concurrency.alpha:
+                    break
+                # Guard to ensure the node-wide budget of in flight RPCs is
+                # respected.
+                if (self.pending_requests and
+                        len(self.local_node.pending) >=
+                        constants.MAX_INFLIGHT_RPCS):
                     break
 
                 uuid, future = self.local_node.send_find(contact,
                                                          self.target,
                                                          self.message_type)
                 self.pending_requests[uuid] = future
+                self.sent_at[uuid] = time.time()
                 self.contacted.add(contact)
+                sent += 1
 
                 def callback(result, uuid=uuid, contact=contact):
                     """
@@ -370,3 +672,291 @@ class Lookup(asyncio.Future):
                         self._handle_response(uuid, contact, result)
 
                 future.add_done_callback(callback)
+        if sent:
+            self.rounds += 1
+            self.rpcs_sent += sent
+
+
+class MultiLookup(asyncio.Future):
+    """
+    Encapsulates a batched lookup in the DHT for many target keys at once.
+    Will callback with a dictionary of results when the lookup for every
+    target key has finished or errback otherwise. If defined, will timeout.
+
+    The lookup for each target key follows the same procedure as that of the
+    Lookup class. However, rather than sending a separate message for each
+    target key, all the target keys for which a peer is to be contacted in
+    the current round are batched together into a single FindValues (or
+    FindNodesMulti) message. Since the target keys are often close to each
+    other the same peers are usually involved in many of the individual
+    lookups so the number of messages sent (each of which is sealed and
+    carries the local node's public key) is much reduced.
+
+    Here's how this implementation works:
+
+    self.targets - a list of the target keys.
+    self.message_type - the message class (either FindNodesMulti or
+      FindValues).
+    self.shortlists - a dictionary mapping each target to an ordered list
+      containing nodes close to the target.
+    self.contacted - a dictionary mapping each target to the set of nodes
+      that have been contacted about the target.
+    self.in_flight - a dictionary mapping each target to the number of
+      pending requests that include the target.
+    self.pending_requests - a dictionary of currently pending requests.
+    self.pending_targets - a dictionary mapping the uuid of each pending
+      request to the list of targets it includes.
+    self.results - a dictionary mapping each finished target to its result.
+    self.finished - a set of the targets whose lookup has finished.
+
+    1. Locally known nodes from the routing table seed the shortlist for each
+       target.
+
+    2. For each unfinished target, up to constants.ALPHA nearest nodes in its
+       shortlist that have not been contacted about it are chosen (the
+       number of requests in flight for the target is never more than
+       constants.ALPHA). The chosen targets are grouped by node and each node
+       is sent a single message containing all the targets chosen for it
+       along with any other unfinished targets for which the node is in the
+       shortlist but has yet to be contacted.
+
+    3. When a response arrives, each target it includes is updated. For
+       FindValues messages a suitable value finishes the lookup for the
+       target. Otherwise returned nodes are added to the target's shortlist.
+
+    4. If a node doesn't reply or an error is encountered it is removed from
+       the shortlists of all the targets included in the request.
+
+    5. When the shortlist for a target has been completely contacted and
+       there are no requests in flight for it the lookup for the target is
+       finished. For FindNodesMulti messages the result is the shortlist. For
+       FindValues messages no result is recorded (the value wasn't found).
+
+    6. When all the targets are finished callback with a dictionary mapping
+       targets to results. Otherwise start from step 2 again.
+    """
+
+    def __init__(self, message_type, targets, local_node, event_loop,
+                 timeout=constants.LOOKUP_TIMEOUT):
+        """
+        Sets up the lookup to search for the target keys using the specified
+        message type and the DHT state found in the local_node. Will cancel
+        after timeout seconds.
+        """
+        asyncio.Future.__init__(self)
+        self.message_type = message_type
+        # Remove duplicate targets while retaining their original order.
+        self.targets = []
+        for target in targets:
+            if target not in self.targets:
+                self.targets.append(target)
+        self.local_node = local_node
+        self.event_loop = event_loop
+        self.shortlists = {}
+        self.contacted = {}
+        self.in_flight = {}
+        self.pending_requests = {}
+        self.pending_targets = {}
+        self.results = {}
+        self.finished = set()
+        # Schedule cancelling the lookup after a "timeout" amount of time.
+        self.timer = local_node.timers.schedule(timeout, self.cancel)
+        self.add_done_callback(lambda lookup: self.timer.cancel())
+        routing_table = self.local_node.routing_table
+        for target in self.targets:
+            shortlist = routing_table.find_close_nodes(target)
+            if not shortlist:
+                # The node knows of no other nodes within the DHT.
+                self.set_exception(RoutingTableEmpty())
+                return
+            if target != self.local_node.network_id:
+                routing_table.touch_bucket(target)
+            self.shortlists[target] = shortlist
+            self.contacted[target] = set()
+            self.in_flight[target] = 0
+        # Start the lookup process
+        self._lookup()
+
+    def _cancel_pending_requests(self):
+        """
+        Causes the Tasks waiting on pending requests to be cancelled in
+        a clean non-blocking fashion.
+        """
+        for task in self.pending_requests.values():
+            self.event_loop.call_soon(task.cancel)
+        self.pending_requests = {}
+        self.pending_targets = {}
+
+    def cancel(self):
+        """
+        Cancels this lookup in a clean fashion.
+        """
+        if self.done():
+            return False
+        log.info('Cancelling multi lookup for {} keys'.format(
+            len(self.targets)))
+        self._cancel_pending_requests()
+        return asyncio.Future.cancel(self)
+
+    def _finish_target(self, target):
+        """
+        Marks the lookup for the target as finished. Once all the targets are
+        finished the lookup is resolved with the dictionary of results.
+        """
+        self.finished.add(target)
+        if self.message_type != FindValues and target not in self.results:
+            self.results[target] = self.shortlists[target]
+        if len(self.finished) == len(self.targets) and not self.done():
+            self._cancel_pending_requests()
+            self.set_result(self.results)
+
+    def _handle_error(self, contact, targets, error):
+        """
+        Removes the contact from the shortlists of all the affected targets.
+        """
+        for target in targets:
+            if contact in self.shortlists[target]:
+                self.shortlists[target].remove(contact)
+        log.info('Problem during interaction with {}'.format(contact))
+        log.info(error)
+
+    def _blacklist(self, contact):
+        """
+        Removes a contact from the shortlists and routing table while adding
+        it to the global blacklist of misbehaving peers.
+        """
+        for shortlist in self.shortlists.values():
+            if contact in shortlist:
+                shortlist.remove(contact)
+        self.local_node.routing_table.blacklist(contact)
+        log.info('Blacklisting {}'.format(repr(contact)))
+
+    def _handle_value(self, target, contact, response, item):
+        """
+        Handles an item returned for the target. If it's suitable the lookup
+        for the target is finished with a Value message representing the item.
+        """
+        if self.message_type != FindValues or item['key'] != target:
+            self._blacklist(contact)
+            raise ValueError('Unexpected value returned by {}'
+                             .format(contact))
+        if contact in self.shortlists[target]:
+            self.shortlists[target].remove(contact)
+        if item['expires'] > 0 and (item['expires'] < time.time()):
+            log.info('Expired value returned by {}'.format(contact))
+            return
+        self.results[target] = Value(response.uuid, response.recipient,
+                                     response.sender, response.reply_port,
+                                     response.version, response.seal,
+                                     **item)
+        self._finish_target(target)
+
+    def _handle_nodes(self, target, nodes):
+        """
+        Adds the returned nodes to the shortlist for the target. Sorts the
+        shortlist in order of closeness to the target and ensures the
+        shortlist never gets longer than K.
+        """
+        shortlist = self.shortlists[target]
+        contacts = [PeerNode(n[0], n[1], n[2]) for n in nodes]
+        candidate_contacts = [candidate for candidate in contacts
+                              if candidate not in shortlist]
+        self.shortlists[target] = sort_peer_nodes(candidate_contacts +
+                                                  shortlist, target)
+
+    def _handle_response(self, uuid, contact, response):
+        """
+        Callback to handle responses to batched requests. Each target
+        included in the original request is updated given the related
+        result. Unexpected responses result in the remote node being
+        blacklisted.
+
+        Targets whose shortlists are exhausted are finished and, if the
+        lookup is still incomplete, further requests are made.
+        """
+        targets = self.pending_targets.pop(uuid)
+        del self.pending_requests[uuid]
+        for target in targets:
+            self.in_flight[target] -= 1
+        try:
+            result = response.result()
+            if not isinstance(result, MultiResult):
+                self._blacklist(contact)
+                raise TypeError("Unexpected response type from {}"
+                                .format(contact))
+            for target in targets:
+                if target in self.finished:
+                    continue
+                entry = result.results.get(target, None)
+                if isinstance(entry, dict):
+                    self._handle_value(target, contact, result, entry)
+                elif entry is not None:
+                    self._handle_nodes(target, entry)
+                elif contact in self.shortlists[target]:
+                    # No result for the target so ignore the contact.
+                    self.shortlists[target].remove(contact)
+        except Exception as ex:
+            # Catch all for problems that ensures the error is correctly
+            # handled, logged and the problem node is dealt with.
+            self._handle_error(contact, targets, ex)
+        if not self.done():
+            self._lookup()
+
+    def _lookup(self):
+        """
+        Sends batched lookup messages to the contacts in the shortlists of
+        the unfinished targets. Each contact is sent at most one message
+        containing all the targets for which it has been chosen.
+
+        Targets that have nothing left to do are finished.
+        """
+        batches = {}
+        for target in self.targets:
+            if target in self.finished:
+                continue
+            slots = constants.ALPHA - self.in_flight[target]
+            for contact in self.shortlists[target]:
+                if slots <= 0:
+                    break
+                if contact not in self.contacted[target]:
+                    if contact not in batches:
+                        batches[contact] = []
+                    batches[contact].append(target)
+                    self.contacted[target].add(contact)
+                    self.in_flight[target] += 1
+                    slots -= 1
+        # Piggyback any other unfinished targets for which a chosen contact
+        # is yet to be contacted. Such contacts would have to be contacted
+        # about those targets eventually so this saves further messages.
+        for contact, targets in batches.items():
+            for target in self.targets:
+                if target in self.finished or target in targets:
+                    continue
+                if (contact in self.shortlists[target] and
+                        contact not in self.contacted[target]):
+                    targets.append(target)
+                    self.contacted[target].add(contact)
+                    self.in_flight[target] += 1
+        for contact, targets in batches.items():
+            uuid, future = self.local_node.send_find_multi(contact, targets,
+                                                           self.message_type)
+            self.pending_requests[uuid] = future
+            self.pending_targets[uuid] = targets
+
+            def callback(result, uuid=uuid, contact=contact):
+                """
+                Passes the result to the MultiLookup instance to handle.
+                """
+                if not result.cancelled():
+                    self._handle_response(uuid, contact, result)
+
+            future.add_done_callback(callback)
+        # Finish any targets whose shortlists have been exhausted.
+        for target in self.targets:
+            if target in self.finished or self.in_flight[target]:
+                continue
+            uncontacted = [candidate for candidate
+                           in self.shortlists[target]
+                           if candidate not in self.contacted[target]]
+            if not uncontacted:
+                self._finish_target(target)
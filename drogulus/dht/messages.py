@@ -189,6 +189,250 @@ Value = _make_message_class('Value', ['key', 'value', 'timestamp', 'expires',
                                       'created_with', 'public_key', 'name',
                                       'signature'], d)
 
+d = """
+    A "find values" message is the batched form of the "find value" message.
+    For each of the requested keys the other node will return the
+    corresponding item if the key is in its store. Otherwise it returns k
+    nodes that it knows about that are closest to the key. The results for
+    all the keys are returned in a single "multi result" message.
+
+    * uuid - the interaction ID for this request.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * keys - a list of keys in the DHT whose values are being targetted.
+    """
+FindValues = _make_message_class('FindValues', ['keys', ], d)
+
+d = """
+    A "find nodes multi" message is the batched form of the "find node"
+    message. For each of the requested keys the other node returns k nodes
+    that it knows about that are closest to the key. The results for all the
+    keys are returned in a single "multi result" message.
+
+    * uuid - the interaction ID for this request.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * keys - a list of keys in the DHT that are being targetted.
+    """
+FindNodesMulti = _make_message_class('FindNodesMulti', ['keys', ], d)
+
+d = """
+    A response to either a FindValues or FindNodesMulti request. Contains a
+    result for each of the requested keys.
+
+    * uuid - the interaction ID of the source of this response.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * results - a dictionary mapping each requested key to either a list of
+                nodes on the DHT that are close to the key or a dictionary
+                containing the key, value, timestamp, expires, created_with,
+                public_key, name and signature fields of the item stored at
+                the key (see the Value message described above).
+    """
+MultiResult = _make_message_class('MultiResult', ['results', ], d)
+
+d = """
+    A "store many" message is the batched form of the "store" message. It
+    instructs another node on the network to store each of the given items.
+    Used when republishing many items that fall in the same region of the
+    key space. Each item is checked (and stored) as if it had arrived in its
+    own "store" message.
+
+    * uuid - the ID of the StoreMany request (generated by the requestee).
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * items - a list of dictionaries each containing the key, value,
+              timestamp, expires, created_with, public_key, name and
+              signature fields of an item (see the Store message described
+              above).
+    """
+StoreMany = _make_message_class('StoreMany', ['items', ], d)
+
+d = """
+    A "summary" message describes the items the sender holds in a range of
+    the key space so that a neighbouring node can work out which items
+    differ between them (anti-entropy replica synchronisation). The keys in
+    the range are split into buckets by their next few characters and each
+    bucket is summarised by a digest of the keys and timestamps it contains.
+    The other node replies with a "differences" message if it is in sync
+    mode and the sender is one of its neighbours.
+
+    * uuid - the interaction ID for this request.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * prefix - the prefix shared by all the keys in the range (at least
+               SYNC_MIN_PREFIX_LENGTH characters long).
+    * buckets - a dictionary mapping the prefix of each non-empty bucket to
+                the digest of its contents.
+    """
+Summary = _make_message_class('Summary', ['prefix', 'buckets'], d)
+
+d = """
+    A response to a "summary" message. Lists the buckets whose contents
+    differ between the two nodes along with the keys and timestamps of the
+    items the responding node holds in those buckets.
+
+    * uuid - the interaction ID of the source of this response.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * buckets - a dictionary mapping the prefix of each bucket that differs
+                to the digest of the responding node's contents of the bucket
+                (an empty string if the bucket is empty).
+    * entries - a dictionary mapping the keys in the differing buckets to the
+                timestamps of the items the responding node holds. Holds at
+                most SYNC_MAX_ENTRIES entries: a differing bucket whose
+                entries don't fit is left out (so its items are all pushed).
+    """
+Differences = _make_message_class('Differences', ['buckets', 'entries'], d)
+
+d = """
+    A "store digests" message is the form of the "store many" message used to
+    push items with large values to a node that may already hold the values
+    (under other keys). The value of each item is replaced by the digest of
+    the value (see drogulus.dht.blobstore). The other node stores the items
+    whose values it holds and replies with a "missing" message listing the
+    keys of the items whose values it doesn't hold (or an "ok" message if it
+    holds them all). Those items are then sent in full.
+
+    * uuid - the ID of the StoreDigests request (generated by the requestee).
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * items - a list of dictionaries each containing the key, value (the
+              digest of the value), timestamp, expires, created_with,
+              public_key, name and signature fields of an item (see the Store
+              message described above).
+    """
+StoreDigests = _make_message_class('StoreDigests', ['items', ], d)
+
+d = """
+    A response to a "store digests" message listing the keys of the items
+    whose values the responding node doesn't hold (so must be sent in full).
+    Also sent in response to an "offer" message listing the keys of the
+    offered items the responding node doesn't hold (or holds an older version
+    of).
+
+    * uuid - the interaction ID of the source of this response.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * keys - the keys of the items whose values (or items) are missing.
+    """
+Missing = _make_message_class('Missing', ['keys', ], d)
+
+d = """
+    An "offer" message lists the keys and timestamps of the items the sending
+    node expects the recipient to hold (for example, when the recipient has
+    just joined the network and is amongst the K closest nodes to the keys,
+    see drogulus.dht.handoff). The recipient replies with a "missing" message
+    listing the keys of the items it doesn't hold (or holds an older version
+    of), which are then sent to it, or an "ok" message if it holds them all.
+
+    * uuid - the ID of the Offer request (generated by the requestee).
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * entries - a dictionary mapping the keys of the offered items to their
+                timestamps.
+    """
+Offer = _make_message_class('Offer', ['entries', ], d)
+
+d = """
+    A response to a FindValue request for a "hot" key (one the responding
+    node is being asked for at least HOT_KEY_RATE times a second). Contains
+    the same fields as the Value message along with the responding node's
+    load so the requesting node can spread the load by caching extra copies
+    of the item along the lookup path (see drogulus.dht.hotkeys).
+
+    * uuid - the ID of the request that is causing the response.
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * key, value, timestamp, expires, created_with, public_key, name and
+      signature - the item (see the Value message described above).
+    * load - the rate (requests per second) at which the responding node is
+             being asked for the key.
+    """
+HotValue = _make_message_class('HotValue', ['key', 'value', 'timestamp',
+                                            'expires', 'created_with',
+                                            'public_key', 'name',
+                                            'signature', 'load'], d)
+
+d = """
+    A request to be sent a "notify" message whenever a new version of the
+    item with the referenced key is stored by the recipient. The
+    subscription lapses after the lease unless it is renewed by another
+    "subscribe" message. A lease of zero cancels the subscription. The
+    recipient replies with an "ok" message.
+
+    * uuid - the ID of the request (generated by the requestee).
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * key - the key of the item to watch.
+    * lease - the number of seconds the subscription lasts.
+    """
+Subscribe = _make_message_class('Subscribe', ['key', 'lease'], d)
+
+d = """
+    Pushes a new version of an item to a node subscribed to the item's key
+    (see the Subscribe message above). The subscriber replies with an "ok"
+    message.
+
+    * uuid - the ID of the notification (generated by the requestee).
+    * recipient - the public key of the recipient (the local node's public
+      key).
+    * sender - the public key of the sender of the message.
+    * version - the protocol version the message conforms to.
+    * seal - a cryptographic signature provided by the sender of the message
+             to act as a "wax seal" to prove the sender's identity.
+    * key, value, timestamp, expires, created_with, public_key, name and
+      signature - the item (see the Store message described above).
+    """
+Notify = _make_message_class('Notify', ['key', 'value', 'timestamp',
+                                        'expires', 'created_with',
+                                        'public_key', 'name', 'signature'],
+                             d)
+
 
 def to_dict(message):
     """
@@ -220,6 +464,30 @@ def from_dict(data):
         return make_message(FindValue, data)
     elif message == 'value':
         return make_message(Value, data)
+    elif message == 'findvalues':
+        return make_message(FindValues, data)
+    elif message == 'findnodesmulti':
+        return make_message(FindNodesMulti, data)
+    elif message == 'multiresult':
+        return make_message(MultiResult, data)
+    elif message == 'storemany':
+        return make_message(StoreMany, data)
+    elif message == 'summary':
+        return make_message(Summary, data)
+    elif message == 'differences':
+        return make_message(Differences, data)
+    elif message == 'storedigests':
+        return make_message(StoreDigests, data)
+    elif message == 'missing':
+        return make_message(Missing, data)
+    elif message == 'offer':
+        return make_message(Offer, data)
+    elif message == 'hotvalue':
+        return make_message(HotValue, data)
+    elif message == 'subscribe':
+        return make_message(Subscribe, data)
+    elif message == 'notify':
+        return make_message(Notify, data)
     else:
         # Unknown request.
         raise ValueError('{} is not a valid message type.'.format(message))
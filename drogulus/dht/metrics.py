@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Contains a simple in-process registry of metrics (counters, histograms and
+sampled traces) used to observe how the local node behaves in production.
+The gathered data is used to tune settings such as ALPHA, K and the various
+timeouts found in the constants module.
+"""
+from collections import deque
+import json
+import random
+
+
+#: The default upper bounds (in seconds) of the buckets in a latency
+#: histogram. Values greater than the last bound are counted in an extra
+#: overflow bucket.
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                  10.0, 30.0, 60.0)
+
+
+class Histogram(object):
+    """
+    Counts observed values in buckets with fixed upper bounds. Also tracks
+    the number, sum, minimum and maximum of the observed values.
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """
+        The bounds argument is an ordered sequence of the upper bounds of
+        each bucket.
+        """
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def observe(self, value):
+        """
+        Records the value in the appropriate bucket.
+        """
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def mean(self):
+        """
+        Returns the mean of the observed values (or 0.0 if there are none).
+        """
+        if self.count:
+            return self.total / self.count
+        return 0.0
+
+    def dump(self):
+        """
+        Returns a dict representation of the histogram that can be serialised
+        into JSON.
+        """
+        buckets = {}
+        for bound, count in zip(self.bounds, self.buckets):
+            buckets[repr(bound)] = count
+        buckets['+inf'] = self.buckets[-1]
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.mean(),
+            'min': self.minimum,
+            'max': self.maximum,
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry(object):
+    """
+    Holds named counters and histograms along with a bounded collection of
+    sampled traces (dicts describing an individual operation such as a
+    lookup).
+    """
+
+    def __init__(self, trace_sample_rate=0.0, max_traces=100):
+        """
+        The trace_sample_rate (between 0.0 and 1.0) is the probability that
+        an offered trace is kept. No more than max_traces traces are retained
+        (the oldest are discarded first).
+        """
+        self.trace_sample_rate = trace_sample_rate
+        self.counters = {}
+        self.histograms = {}
+        self.traces = deque(maxlen=max_traces)
+
+    def increment(self, name, amount=1):
+        """
+        Increments the named counter by the given amount.
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value, bounds=LATENCY_BOUNDS):
+        """
+        Records the value in the named histogram. The histogram is created
+        with the given bounds if it doesn't already exist.
+        """
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(bounds)
+        self.histograms[name].observe(value)
+
+    def sample_trace(self, trace):
+        """
+        Keeps the trace with a probability of self.trace_sample_rate. Returns
+        a boolean indication of whether the trace was kept.
+        """
+        if self.trace_sample_rate and (random.random() <
+                                       self.trace_sample_rate):
+            self.traces.append(trace)
+            return True
+        return False
+
+    def dump(self):
+        """
+        Returns a dict representation of all the metrics that can be
+        serialised into JSON.
+        """
+        histograms = {}
+        for name, histogram in self.histograms.items():
+            histograms[name] = histogram.dump()
+        return {
+            'counters': dict(self.counters),
+            'histograms': histograms,
+            'traces': list(self.traces),
+        }
+
+    def dump_traces(self, output):
+        """
+        Writes the sampled traces to the output file-like object as JSON (one
+        trace per line).
+        """
+        for trace in self.traces:
+            output.write(json.dumps(trace))
+            output.write('\n')
@@ -3,16 +3,35 @@
 Contains code that defines the behaviour of the local node in the DHT network.
 """
 from .routingtable import RoutingTable
-from .lookup import Lookup
-from .storage import DictDataStore
+from .lookup import Lookup, MultiLookup
+from .replication import Replication
+from .storage import DictDataStore, BoundedDataStore, CompactDataStore
+from .blobstore import BlobStore
+from .metrics import MetricsRegistry
+from .timerwheel import TimerWheel
+from .scheduler import RepublishScheduler
+from .sync import Synchroniser, payload_size, item_to_dict, batch_items
+from .handoff import Handoff
+from .hotkeys import RequestRates, cache_copies, cache_lifetime
+from .subscriptions import Subscriptions, Watch
+from .erasure import is_fragment
 from .contact import PeerNode
+from .utils import sort_peer_nodes
 from .crypto import check_seal, get_seal, verify_item, construct_key
 from .errors import (BadMessage, ExpiredMessage, OutOfDateMessage,
-                     UnverifiableProvenance, TimedOut)
+                     UnverifiableProvenance, TimedOut, QuotaExceeded,
+                     TooBig)
 from .messages import (OK, Store, FindNode, Nodes, FindValue,
-                       Value, from_dict, to_dict)
+                       Value, FindValues, FindNodesMulti, MultiResult,
+                       StoreMany, Summary, Differences, StoreDigests,
+                       Missing, Offer, HotValue, Subscribe, Notify,
+                       from_dict, to_dict)
+from .validators import ITEM_FIELDS
 from .constants import (REPLICATE_INTERVAL, REFRESH_INTERVAL,
-                        RESPONSE_TIMEOUT, K)
+                        RESPONSE_TIMEOUT, K, REPUBLISH_PREFIX_LENGTH,
+                        STORE_MANY_MAX_BYTES, EXPIRY_SWEEP_INTERVAL,
+                        EXPIRY_SWEEP_SIZE, HOT_KEY_RATE, SUBSCRIPTION_LEASE,
+                        SUBSCRIPTION_LEASE_MAX, HANDOFF_MAX_ITEMS)
 from ..version import get_version
 import logging
 import time
@@ -34,14 +53,29 @@ class Node(object):
     """
 
     def __init__(self, public_key, private_key, event_loop, connector,
-                 reply_port):
+                 reply_port, data_store=None, storage_budget=None,
+                 blob_threshold=None, compress_threshold=None,
+                 compact=False, trace_sample_rate=0.0):
         """
         Initialises the node with the credentials, event loop and object
         via which the node opens connections to peers. The reply_port
         argument tells other nodes on the network the port to use to contact
         this node. Such a port may not be the port used by the local machine
         but could be, for example, the port assigned by the UPnP setup of the
-        local router.
+        local router. The optional data_store argument is the DataStore
+        instance in which to hold items (defaults to an in-memory
+        DictDataStore). If no data_store is given, the optional
+        storage_budget argument is the maximum number of bytes of items to
+        hold in memory (see BoundedDataStore) and, if given a blob_threshold,
+        values whose serialisation is at least that many bytes long are held
+        once in a BlobStore shared by every key that refers to them. If the
+        compact flag is set (or given a compress_threshold) items are held
+        in a CompactDataStore, with the values whose serialisation is at
+        least compress_threshold bytes long held compressed (a bounded store
+        can be neither). A given data_store that reports to a
+        MetricsRegistry but doesn't have one reports to the node's. The
+        trace_sample_rate (between 0.0 and 1.0) is the proportion of lookups
+        whose traces are kept in the node's metrics.
         """
         self.public_key = public_key
         self.private_key = private_key
@@ -54,13 +88,68 @@ class Node(object):
         self.event_loop = event_loop
         # The routing table stores information about other nodes on the DHT.
         self.routing_table = RoutingTable(self.network_id)
+        # In-process metrics describing the behaviour of the node.
+        self.metrics = MetricsRegistry(trace_sample_rate)
         # The local key/value store containing data held by this node.
-        self.data_store = DictDataStore()
+        if data_store is None:
+            blobs = None
+            if blob_threshold:
+                blobs = BlobStore(blob_threshold)
+            if storage_budget:
+                if compact or compress_threshold:
+                    raise ValueError('Bounded data stores cannot be compact')
+                data_store = BoundedDataStore(storage_budget,
+                                              self.network_id,
+                                              self.routing_table,
+                                              self.metrics, blobs)
+            elif compact or compress_threshold:
+                data_store = CompactDataStore(blobs, compress_threshold,
+                                              self.metrics)
+            else:
+                data_store = DictDataStore(blobs)
+        elif getattr(data_store, 'metrics', False) is None:
+            data_store.metrics = self.metrics
+        self.data_store = data_store
         # A dictionary of IDs for messages pending a response and associated
         # Future instances to be fired when a response is completed.
         self.pending = {}
+        # Tracks the deadlines of pending RPCs and lookups.
+        self.timers = TimerWheel(event_loop)
         # The version of Drogulus that this node implements.
         self.version = get_version()
+        # Decides when locally stored items are checked for republication.
+        self.republisher = RepublishScheduler(
+            event_loop, self.republish, metrics=self.metrics,
+            flush=self.flush_republication)
+        # Items found by republication checks to need replicating. Flushed
+        # (grouped by region of the key space) after each batch of checks.
+        self.republication_queue = []
+        # Flag to indicate if lookups should adapt their concurrency (ALPHA)
+        # to the latency and usefulness of responses.
+        self.adaptive_alpha = False
+        # Flag to indicate if the items in the node's neighbourhood of the key
+        # space should be kept in step with its neighbours by anti-entropy
+        # synchronisation rather than blind republication.
+        self.sync_mode = False
+        self.synchroniser = Synchroniser(self)
+        # Hands items off to newly joined peers closer to the items' keys.
+        self.handoff = Handoff(self)
+        # The maximum number of items from any one publisher held in the
+        # local data store (None means there's no limit). Updates of items
+        # already held are always accepted.
+        self.publisher_quota = None
+        # Estimates the rate at which each key is requested from the node.
+        self.request_rates = RequestRates()
+        # The keys of the locally held items that are cached copies (the
+        # local node isn't amongst the K closest nodes it knows of to the
+        # key) mapped to the number of seconds each is kept without being
+        # requested (see drogulus.dht.hotkeys).
+        self.cache_lifetimes = {}
+        # The subscriptions of remote peers to the updates of items stored
+        # by the local node.
+        self.subscriptions = Subscriptions()
+        # Maps the keys watched by the local node to Watch instances.
+        self.watches = {}
         log.info('Initialised node with id: {}'.format(self.network_id))
 
     def join(self, data_dump):
@@ -74,11 +163,38 @@ class Node(object):
         self.routing_table.restore(data_dump)
         # Ensure the refresh of k-buckets is set up properly.
         self.event_loop.call_later(REFRESH_INTERVAL, self.refresh)
+        # Expired items are deleted from the data store in small sweeps.
+        self.event_loop.call_later(EXPIRY_SWEEP_INTERVAL, self.purge_expired)
+        # Replica synchronisation only happens if the node is in sync mode.
+        self.synchroniser.start()
         # Looking up the node's ID on the network will populate the routing
         # table with fresh nodes as well as tell us who our nearest neighbours
         # are.
         return Lookup(FindNode, self.network_id, self, self.event_loop)
 
+    def schedule_stored(self):
+        """
+        Schedules a republication check for each item already held in the
+        data store that doesn't have one (for example, the items persisted in
+        a database when the node restarts). Each check is due when the item
+        would next need republishing or removing (REPLICATE_INTERVAL after it
+        was last updated or accessed) or straight away if that has passed.
+        The republisher's rate limiting spreads the overdue checks over its
+        ticks. Returns the number of items scheduled.
+        """
+        now = time.time()
+        scheduled = 0
+        for key in list(self.data_store.keys()):
+            if key in self.republisher:
+                continue
+            last = min(self.data_store.updated(key),
+                       self.data_store.accessed(key))
+            self.republisher.schedule(
+                key, max(0.0, last + REPLICATE_INTERVAL - now))
+            scheduled += 1
+        log.info('Scheduled {} stored items.'.format(scheduled))
+        return scheduled
+
     def message_received(self, message, protocol, address, port):
         """
         Handles incoming messages.
@@ -97,7 +213,12 @@ class Node(object):
                               time.time())
         log.info('Message received from {}'.format(other_node))
         log.info(message)
+        is_new = not self._is_known(other_node)
         self.routing_table.add_contact(other_node)
+        if is_new and self._is_known(other_node):
+            # A newly joined peer may be amongst the closest nodes to some
+            # of the locally stored items.
+            self.handoff.contact_added(other_node)
         # Sort on message type and pass to handler method. Explicit > implicit.
         try:
             if isinstance(message, OK):
@@ -108,29 +229,68 @@ class Node(object):
                 return self.handle_find_node(message, other_node)
             elif isinstance(message, FindValue):
                 return self.handle_find_value(message, other_node)
-            elif isinstance(message, Value):
+            elif isinstance(message, (Value, HotValue)):
                 return self.handle_value(message, other_node)
             elif isinstance(message, Nodes):
                 return self.handle_nodes(message)
+            elif isinstance(message, FindNodesMulti):
+                return self.handle_find_nodes_multi(message, other_node)
+            elif isinstance(message, FindValues):
+                return self.handle_find_values(message, other_node)
+            elif isinstance(message, MultiResult):
+                return self.handle_multi_result(message, other_node)
+            elif isinstance(message, StoreMany):
+                return self.handle_store_many(message, other_node)
+            elif isinstance(message, Summary):
+                return self.handle_summary(message, other_node)
+            elif isinstance(message, Differences):
+                return self.handle_differences(message)
+            elif isinstance(message, StoreDigests):
+                return self.handle_store_digests(message, other_node)
+            elif isinstance(message, Missing):
+                return self.handle_missing(message)
+            elif isinstance(message, Offer):
+                return self.handle_offer(message, other_node)
+            elif isinstance(message, Subscribe):
+                return self.handle_subscribe(message, other_node)
+            elif isinstance(message, Notify):
+                return self.handle_notify(message, other_node)
         except Exception as ex:
             log.error('Problem handling message from {}'.format(other_node))
             log.error(message)
             log.error(ex)
 
+    def _is_known(self, contact):
+        """
+        Returns a boolean indication of whether the contact is in the routing
+        table.
+        """
+        try:
+            self.routing_table.get_contact(contact.network_id)
+        except ValueError:
+            return False
+        return True
+
     def send_message(self, contact, message, fire_and_forget=False):
         """
         Sends a message to the specified contact, adds the resulting future to
         the pending dictionary and ensures it times-out after the correct
         period. A callback is added to ensure that the task is removed from
         pending when it resolves (no matter the result). A timeout function
-        is scheduled after RESPONSE_TIMEOUT seconds to clean up the pending
-        task if the remote peer doesn't respond in a timely fashion.
+        is scheduled (in the node's timer wheel) after RESPONSE_TIMEOUT
+        seconds to clean up the pending task if the remote peer doesn't
+        respond in a timely fashion. The timeout is cancelled when the
+        response arrives.
         """
         # A Future that represents the delivery of the message.
         delivery = self.connector.send(contact, message, self)
         # A Future that resolves with the response to the outgoing message.
         response_received = asyncio.Future()
         self.pending[message.uuid] = response_received
+        # Used to record the latency of the response for this message type.
+        message_type = message.__class__.__name__.lower()
+        sent_at = time.time()
+        self.metrics.increment('rpc.{}.sent'.format(message_type))
 
         def on_delivery(task, node=self, response_received=response_received,
                         message=message):
@@ -151,19 +311,31 @@ class Node(object):
                                               'sent')
                 else:
                     error = TimedOut('Response took too long.')
-                    node.event_loop.call_later(RESPONSE_TIMEOUT,
-                                               node.trigger_task,
-                                               message, error)
+                    timer = node.timers.schedule(RESPONSE_TIMEOUT,
+                                                 node.trigger_task, message,
+                                                 error)
+                    response_received.add_done_callback(
+                        lambda future: timer.cancel())
 
         delivery.add_done_callback(on_delivery)
 
         def on_response(future, uuid=message.uuid):
             """
             Ensure the resolved response_received is removed from the pending
-            dictionary.
+            dictionary. Records the outcome and latency of the response in
+            the node's metrics.
             """
             if uuid in self.pending:
                 del self.pending[uuid]
+            if future.cancelled():
+                outcome = 'cancelled'
+            elif future.exception():
+                outcome = 'failed'
+            else:
+                outcome = 'succeeded'
+                self.metrics.observe('rpc.{}.latency'.format(message_type),
+                                     time.time() - sent_at)
+            self.metrics.increment('rpc.{}.{}'.format(message_type, outcome))
 
         response_received.add_done_callback(on_response)
         return message.uuid, response_received
@@ -191,45 +363,29 @@ class Node(object):
 
     def handle_store(self, message, contact):
         """
-        Handles an incoming Store message. Checks the provenance and timeliness
-        of the message before storing locally. If there is a problem, removes
-        the untrustworthy peer from the routing table. Otherwise, at
-        REPLICATE_INTERVAL minutes in the future, the local node will attempt
-        to replicate the Store message elsewhere in the DHT if such time is
-        <= the message's expiry time.
+        Handles an incoming Store message. Expired items are rejected. If an
+        identical copy of the item is already held locally its last-update
+        time is refreshed and an OK sent straight away (no signature
+        verification or extra republication check is needed). Otherwise,
+        checks the provenance and timeliness of the message before storing
+        locally. If there is a problem, removes the untrustworthy peer from
+        the routing table. Otherwise, at REPLICATE_INTERVAL minutes in the
+        future, the local node will attempt to replicate the Store message
+        elsewhere in the DHT if such time is <= the message's expiry time.
 
         Sends an OK message if successful.
         """
+        self._check_expires(message.expires)
+        if self._is_duplicate(item_to_dict(message)):
+            # An identical (so already verified) copy of the item is held
+            # locally, so simply refresh it. The republication check is
+            # already scheduled.
+            self.data_store.refresh(message.key)
+            self.metrics.increment('store.duplicates')
+            return self.make_ok(message)
         # Check provenance
         if verify_item(to_dict(message)):
-            # Ensure the key is correct.
-            k = construct_key(message.public_key, message.name)
-            if k != message.key:
-                # This may indicate a different / unknown / unsupported
-                # version of the drogulus created the original message.
-                raise BadMessage('Key mismatch')
-            # Ensure the value isn't expired.
-            now = time.time()
-            if message.expires > 0 and (message.expires < now):
-                # There's a non-zero expiry and it's less than the current
-                # time, so return an error.
-                raise ExpiredMessage(
-                    'Expired at {} (current time: {})'.format(message.expires,
-                                                              now))
-            # Ensure the node doesn't already have a more up-to-date version
-            # of the value.
-            current = self.data_store.get(message.key, False)
-            if current and (message.timestamp < current.timestamp):
-                # The node already has a later version of the value so
-                # return an error.
-                raise OutOfDateMessage(
-                    'Most recent timestamp: {}'.format(current.timestamp))
-            # Good to go, so store value.
-            self.data_store[message.key] = message
-            # At some future time attempt to replicate the Store message
-            # around the network IF it is within the message's expiry time.
-            self.event_loop.call_later(REPLICATE_INTERVAL, self.republish,
-                                       message.key)
+            self._store_item(message)
             # Reply with an OK so the other end updates its routing table.
             return self.make_ok(message)
         else:
@@ -238,6 +394,186 @@ class Node(object):
             self.routing_table.blacklist(contact)
             raise UnverifiableProvenance('Blacklisted')
 
+    def _check_expires(self, expires):
+        """
+        Raises an ExpiredMessage exception if the expiry time of an item has
+        passed (an expiry time of zero means the item never expires).
+        """
+        now = time.time()
+        if expires > 0 and (expires < now):
+            # There's a non-zero expiry and it's less than the current
+            # time, so return an error.
+            raise ExpiredMessage(
+                'Expired at {} (current time: {})'.format(expires, now))
+
+    def _is_duplicate(self, item):
+        """
+        Returns a boolean indication of whether the local data store already
+        holds an identical copy of the item (a dictionary of the item's
+        fields). This check is far cheaper than verifying the signature of
+        the item and is the common case when items are republished.
+        """
+        current = self.data_store.get(item['key'], False)
+        if not current:
+            return False
+        for field in ITEM_FIELDS:
+            if getattr(current, field) != item[field]:
+                return False
+        return True
+
+    def _store_item(self, message):
+        """
+        Checks the key and timeliness of the (already verified) Store message
+        before storing it locally. Raises an exception if there's a problem.
+        Otherwise, at REPLICATE_INTERVAL minutes in the future, the local node
+        will attempt to replicate the Store message elsewhere in the DHT if
+        such time is <= the message's expiry time. The new version of the item
+        is pushed to the nodes subscribed to its key.
+        """
+        # Ensure the key is correct.
+        k = construct_key(message.public_key, message.name)
+        if k != message.key:
+            # This may indicate a different / unknown / unsupported
+            # version of the drogulus created the original message.
+            raise BadMessage('Key mismatch')
+        # Ensure the value isn't expired.
+        self._check_expires(message.expires)
+        # Ensure the node doesn't already have a more up-to-date version
+        # of the value.
+        current = self.data_store.get(message.key, False)
+        if current and (message.timestamp < current.timestamp):
+            # The node already has a later version of the value so
+            # return an error.
+            raise OutOfDateMessage(
+                'Most recent timestamp: {}'.format(current.timestamp))
+        # Ensure the publisher hasn't used up its quota.
+        if not current and self.publisher_quota is not None:
+            publisher_id = self.data_store.publisher_id(message.public_key)
+            count = self.data_store.count_published(publisher_id)
+            if count >= self.publisher_quota:
+                self.metrics.increment('store.quota_exceeded')
+                raise QuotaExceeded('Publisher {} holds {} items'.format(
+                    publisher_id, count))
+        # Good to go, so store value.
+        self.data_store[message.key] = message
+        # Push the new version to the nodes watching the key.
+        self.notify_subscribers(message)
+        lifetime = self.cache_lifetime(message.key)
+        if lifetime is None:
+            # At some future time attempt to replicate the Store message
+            # around the network IF it is within the message's expiry time.
+            self.cache_lifetimes.pop(message.key, None)
+            self.republisher.schedule(message.key)
+        else:
+            # A cached copy, so check whether it's still wanted once its
+            # lifetime has passed.
+            self.cache_lifetimes[message.key] = lifetime
+            self.republisher.schedule(message.key, lifetime)
+
+    def cache_lifetime(self, key):
+        """
+        Returns the number of seconds a cached copy of the item with the key
+        is kept without being requested, or None if the local node is amongst
+        the K closest nodes it knows of to the key (so holds a replica rather
+        than a cached copy). The lifetime halves for each bit by which the
+        local node is further from the key than the furthest of those nodes
+        (see drogulus.dht.hotkeys.cache_lifetime).
+        """
+        contacts = self.routing_table.find_close_nodes(key)
+        if len(contacts) < K:
+            return None
+        target = int(key, 16)
+        local = int(self.network_id, 16) ^ target
+        furthest = max(int(contact.network_id, 16) ^ target
+                       for contact in contacts)
+        if local <= furthest:
+            return None
+        return cache_lifetime(local.bit_length() - furthest.bit_length())
+
+    def handle_store_many(self, message, contact):
+        """
+        Handles an incoming StoreMany message. Expired items are skipped and
+        identical copies of items already held locally are simply refreshed
+        (as in handle_store). The provenance of every other item is checked
+        first: if any item can't be verified the untrustworthy peer is
+        removed from the routing table and none of the items are stored.
+        Otherwise each item is stored as if it had arrived in its own Store
+        message. Items that are expired, out of date, over their publisher's
+        quota or have the wrong key are skipped (this is expected when items
+        are republished in batches) and logged.
+
+        Sends an OK message if successful.
+        """
+        self._store_items(message, message.items, contact)
+        return self.make_ok(message)
+
+    def _store_items(self, message, items, contact):
+        """
+        Stores the items (dictionaries of the fields of items) that arrived
+        in the referenced batched message from the contact (see
+        handle_store_many).
+        """
+        duplicates = []
+        fresh = []
+        for item in items:
+            try:
+                # Expired items are skipped (even if they're duplicates).
+                self._check_expires(item['expires'])
+            except ExpiredMessage as ex:
+                log.info('Skipped {} from {}: {}'.format(item['key'], contact,
+                                                         repr(ex)))
+                continue
+            if self._is_duplicate(item):
+                duplicates.append(item)
+            else:
+                fresh.append(item)
+        for item in fresh:
+            if not verify_item(item):
+                log.error('Problem with StoreMany command from {}'.format(
+                    contact))
+                self.routing_table.blacklist(contact)
+                raise UnverifiableProvenance('Blacklisted')
+        for item in duplicates:
+            self.data_store.refresh(item['key'])
+        self.metrics.increment('store.duplicates', len(duplicates))
+        for item in fresh:
+            store = Store(message.uuid, message.recipient, message.sender,
+                          message.reply_port, message.version, message.seal,
+                          *[item[field] for field in ITEM_FIELDS])
+            try:
+                self._store_item(store)
+            except (BadMessage, ExpiredMessage, OutOfDateMessage,
+                    QuotaExceeded) as ex:
+                log.info('Skipped {} from {}: {}'.format(store.key, contact,
+                                                         repr(ex)))
+
+    def handle_store_digests(self, message, contact):
+        """
+        Handles an incoming StoreDigests message. The value of each item is
+        looked up (by its digest) in the local data store's blob store. The
+        items whose values are held locally are handled as if they had
+        arrived in a StoreMany message. Replies with a Missing message
+        listing the keys of the other items (so they're sent in full) or an
+        OK message if every value was found.
+        """
+        blobs = self.data_store.blobs
+        found = []
+        missing = []
+        for item in message.items:
+            if blobs is not None and item['value'] in blobs:
+                item = dict(item)
+                item['value'] = blobs.get(item['value'])
+                found.append(item)
+            else:
+                missing.append(item['key'])
+        self.metrics.increment('blobs.digests_found', len(found))
+        self.metrics.increment('blobs.digests_missing', len(missing))
+        if found:
+            self._store_items(message, found, contact)
+        if missing:
+            return self.make_missing(message, missing)
+        return self.make_ok(message)
+
     def handle_find_node(self, message, contact):
         """
         Handles an incoming FindNode message. Finds the details of up to K
@@ -259,11 +595,20 @@ class Node(object):
         nodes closer to the target key that the local node knows about. In
         this case a "Nodes" message containing the list of matching nodes is
         sent to the remote peer.
+
+        The rate at which each key is requested is tracked. If the key is hot
+        (requested at least HOT_KEY_RATE times a second) the value is sent in
+        a "HotValue" message reporting the rate so the remote peer can spread
+        the load by caching extra copies of the item.
         """
-        match = self.data_store.get(message.key, False)
+        rate = self.request_rates.record(message.key)
+        match = self.get_live_item(message.key)
         if match:
             # Update the last access time for the matching value.
             self.data_store.touch(message.key)
+            if rate >= HOT_KEY_RATE:
+                self.metrics.increment('cache.hot_responses')
+                return self.make_hot_value(message, match, rate)
             return self.make_value(message, match.key, match.value,
                                    match.timestamp, match.expires,
                                    match.created_with, match.public_key,
@@ -271,6 +616,20 @@ class Node(object):
         else:
             return self.handle_find_node(message, contact)
 
+    def get_live_item(self, key):
+        """
+        Returns the item stored locally at key or False if there is no such
+        item. Expired items (that haven't yet been purged) are deleted
+        rather than returned, so they're never served to other peers.
+        """
+        match = self.data_store.get(key, False)
+        if match and match.expires > 0.0 and match.expires < time.time():
+            del self.data_store[key]
+            self.metrics.increment('storage.expired')
+            log.info('{} expired. Deleted from local data store.'.format(key))
+            return False
+        return match
+
     def handle_value(self, message, contact):
         """
         Handles an incoming Value message containing a value retrieved from
@@ -299,6 +658,160 @@ class Node(object):
         """
         self.trigger_task(message)
 
+    def handle_find_nodes_multi(self, message, contact):
+        """
+        Handles an incoming FindNodesMulti message. For each of the requested
+        keys finds the details of up to K other nodes closer to the key that
+        *this* node knows about. Responds with a "MultiResult" message
+        containing the lists of matching nodes.
+        """
+        results = {}
+        for key in message.keys:
+            results[key] = [[n.public_key, n.version, n.uri] for n in
+                            self.routing_table.find_close_nodes(key)]
+        return self.make_multi_result(message, results)
+
+    def handle_find_values(self, message, contact):
+        """
+        Handles an incoming FindValues message. For each of the requested keys
+        the result is either the matching item (if the local node contains a
+        value associated with the key) or details of up to K other nodes
+        closer to the key that the local node knows about. Responds with a
+        "MultiResult" message containing the results.
+        """
+        results = {}
+        for key in message.keys:
+            match = self.get_live_item(key)
+            if match:
+                # Update the last access time for the matching value.
+                self.data_store.touch(key)
+                results[key] = {
+                    'key': match.key,
+                    'value': match.value,
+                    'timestamp': match.timestamp,
+                    'expires': match.expires,
+                    'created_with': match.created_with,
+                    'public_key': match.public_key,
+                    'name': match.name,
+                    'signature': match.signature,
+                }
+            else:
+                results[key] = [[n.public_key, n.version, n.uri] for n in
+                                self.routing_table.find_close_nodes(key)]
+        return self.make_multi_result(message, results)
+
+    def handle_multi_result(self, message, contact):
+        """
+        Handles an incoming MultiResult message containing the results of a
+        batched request. Ensures all the items contained therein are valid
+        and resolves the referenced future to signal the arrival of the
+        results.
+
+        If any item is invalid then the response is logged, the remote peer
+        is blacklisted and the referenced future is resolved with an
+        UnverifiableProvenance exception.
+        """
+        for result in message.results.values():
+            if isinstance(result, dict) and not verify_item(result):
+                log.error('Problem with incoming MultiResult message from {}'
+                          .format(contact))
+                log.error(message)
+                self.routing_table.remove_contact(contact.network_id, True)
+                log.error('Remote peer removed from routing table.')
+                self.trigger_task(message,
+                                  error=UnverifiableProvenance('Blacklisted'))
+                return
+        self.trigger_task(message)
+
+    def handle_summary(self, message, contact):
+        """
+        Handles an incoming Summary message describing the items a
+        neighbouring node holds in a range of the key space. Responds with a
+        Differences message listing the buckets whose contents differ and the
+        keys and timestamps of the local items in those buckets. Summaries
+        are refused unless the local node is in sync mode and the contact is
+        one of its neighbours (see the Synchroniser class).
+        """
+        buckets, entries = self.synchroniser.handle_summary(message, contact)
+        return self.make_differences(message, buckets, entries)
+
+    def handle_differences(self, message):
+        """
+        Handles an incoming Differences message sent in response to a Summary
+        message.
+        """
+        self.trigger_task(message)
+
+    def handle_missing(self, message):
+        """
+        Handles an incoming Missing message sent in response to a
+        StoreDigests or Offer message.
+        """
+        self.trigger_task(message)
+
+    def handle_offer(self, message, contact):
+        """
+        Handles an incoming Offer message listing the keys and timestamps of
+        items the remote peer expects the local node to hold (see the Handoff
+        class). Replies with a Missing message listing the keys of the offered
+        items the local node doesn't hold (or holds an older version of) or
+        an OK message if it holds them all. Offers of more than
+        HANDOFF_MAX_ITEMS items are refused.
+        """
+        if len(message.entries) > HANDOFF_MAX_ITEMS:
+            raise TooBig('Offer of {} items'.format(len(message.entries)))
+        missing = []
+        for key, timestamp in sorted(message.entries.items()):
+            if key in self.data_store:
+                if self.data_store[key].timestamp >= timestamp:
+                    continue
+            missing.append(key)
+        if missing:
+            return self.make_missing(message, missing)
+        return self.make_ok(message)
+
+    def handle_subscribe(self, message, contact):
+        """
+        Handles an incoming Subscribe message. The remote peer is sent a
+        Notify message containing each new version of the item with the
+        referenced key stored by the local node until the lease (capped at
+        SUBSCRIPTION_LEASE_MAX seconds) lapses. A lease of zero cancels the
+        subscription.
+
+        Sends an OK message if successful.
+        """
+        if message.lease > 0:
+            self.subscriptions.add(message.key, contact, message.lease)
+            self.metrics.increment('subscriptions.added')
+        else:
+            self.subscriptions.remove(message.key, contact)
+            self.metrics.increment('subscriptions.removed')
+        return self.make_ok(message)
+
+    def handle_notify(self, message, contact):
+        """
+        Handles an incoming Notify message containing a new version of an
+        item whose key the local node is watching. Checks the provenance of
+        the item (removing the untrustworthy peer from the routing table if
+        there is a problem) before passing it to the callbacks of the watch
+        if it's newer than the latest version seen. Notifications for keys
+        that are no longer watched are ignored (the subscription will lapse).
+
+        Sends an OK message if successful.
+        """
+        if not verify_item(to_dict(message)):
+            log.error('Problem with Notify message from {}'.format(contact))
+            self.routing_table.blacklist(contact)
+            raise UnverifiableProvenance('Blacklisted')
+        if construct_key(message.public_key, message.name) != message.key:
+            raise BadMessage('Key mismatch')
+        watch = self.watches.get(message.key)
+        if watch and watch.update(message):
+            self.metrics.increment('subscriptions.updates')
+        else:
+            self.metrics.increment('subscriptions.ignored')
+        return self.make_ok(message)
+
     def make_ok(self, message):
         """
         Returns an OK acknowledgement appropriate given the incoming message.
@@ -340,6 +853,27 @@ class Node(object):
         msg_dict['message'] = 'value'
         return from_dict(msg_dict)
 
+    def make_hot_value(self, message, item, load):
+        """
+        Returns a valid HotValue message containing the item in response to
+        the referenced message. The load is the rate (requests per second) at
+        which the local node is being asked for the item.
+        """
+        msg_dict = {
+            'uuid': message.uuid,
+            'recipient': message.sender,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'load': float(load),
+        }
+        for field in ITEM_FIELDS:
+            msg_dict[field] = getattr(item, field)
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'hotvalue'
+        return from_dict(msg_dict)
+
     def make_nodes(self, message, nodes):
         """
         Returns a valid Nodes message in response to the referenced incoming
@@ -358,6 +892,24 @@ class Node(object):
         msg_dict['message'] = 'nodes'
         return from_dict(msg_dict)
 
+    def make_multi_result(self, message, results):
+        """
+        Returns a valid MultiResult message in response to the referenced
+        incoming batched request.
+        """
+        msg_dict = {
+            'uuid': message.uuid,
+            'recipient': message.sender,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'results': results,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'multiresult'
+        return from_dict(msg_dict)
+
     def send_store(self, contact, key, value, timestamp, expires,
                    created_with, public_key, name, signature):
         """
@@ -387,6 +939,203 @@ class Node(object):
         message = from_dict(msg_dict)
         return self.send_message(contact, message)
 
+    def make_differences(self, message, buckets, entries):
+        """
+        Returns a valid Differences message in response to the referenced
+        incoming Summary message.
+        """
+        msg_dict = {
+            'uuid': message.uuid,
+            'recipient': message.sender,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'buckets': buckets,
+            'entries': entries,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'differences'
+        return from_dict(msg_dict)
+
+    def make_missing(self, message, keys):
+        """
+        Returns a valid Missing message in response to the referenced
+        incoming StoreDigests or Offer message.
+        """
+        msg_dict = {
+            'uuid': message.uuid,
+            'recipient': message.sender,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'keys': keys,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'missing'
+        return from_dict(msg_dict)
+
+    def send_summary(self, contact, prefix, buckets):
+        """
+        Sends a Summary message to the given contact describing the items the
+        local node holds in the range of the key space identified by prefix
+        (see the Synchroniser class).
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'prefix': prefix,
+            'buckets': buckets,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'summary'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
+    def send_offer(self, contact, entries):
+        """
+        Sends an Offer message to the given contact. The entries argument is
+        a dictionary mapping the keys of the offered items to their
+        timestamps.
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'entries': entries,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'offer'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
+    def send_store_many(self, contact, items):
+        """
+        Sends a StoreMany message to the given contact. The items argument is
+        a list of the items (e.g. Store messages taken from the local data
+        store) to be stored by the contact.
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'items': [item_to_dict(item) for item in items],
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'storemany'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
+    def send_items(self, contact, items, sizes=None):
+        """
+        Sends the items (e.g. Store messages taken from the local data store)
+        to the given contact in StoreMany messages of at most
+        STORE_MANY_BATCH_SIZE items and STORE_MANY_MAX_BYTES bytes. An item
+        too big to share a message is sent in a Store message of its own.
+        The optional sizes argument is a dictionary mapping the keys of the
+        items to the size of their serialisation (so items sent to several
+        contacts are only measured once). Returns a list of (task, size)
+        tuples, one for each message sent.
+        """
+        if sizes is None:
+            sizes = dict((item.key, payload_size(item_to_dict(item)))
+                         for item in items)
+        result = []
+        for batch, size in batch_items(items, sizes):
+            if size > STORE_MANY_MAX_BYTES:
+                item = batch[0]
+                uuid, task = self.send_store(
+                    contact, item.key, item.value, item.timestamp,
+                    item.expires, item.created_with, item.public_key,
+                    item.name, item.signature)
+            else:
+                uuid, task = self.send_store_many(contact, batch)
+            result.append((task, size))
+        return result
+
+    def send_store_digests(self, contact, items):
+        """
+        Sends a StoreDigests message to the given contact. The items argument
+        is a list of dictionaries containing the fields of the items to be
+        stored by the contact with each value replaced by its digest.
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'items': items,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'storedigests'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
+    def send_subscribe(self, contact, key, lease):
+        """
+        Sends a Subscribe message to the given contact asking to be notified
+        of new versions of the item with the key for lease seconds (a lease
+        of zero cancels the subscription).
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'key': key,
+            'lease': lease,
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'subscribe'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
+    def send_notify(self, contact, item):
+        """
+        Sends a Notify message containing the item (e.g. a Store message) to
+        the given contact subscribed to the item's key.
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+        }
+        for field in ITEM_FIELDS:
+            msg_dict[field] = getattr(item, field)
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'notify'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
+    def notify_subscribers(self, item):
+        """
+        Sends the item (a newly stored Store message) to the remote peers
+        subscribed to its key. Returns the list of contacts notified.
+        """
+        contacts = self.subscriptions.subscribers(item.key)
+        for contact in contacts:
+            self.send_notify(contact, item)
+        self.metrics.increment('subscriptions.notified', len(contacts))
+        return contacts
+
     def send_find(self, contact, target, message_type):
         """
         Sends a Find[Node|Value] message to the given contact with the
@@ -412,6 +1161,32 @@ class Node(object):
         message = from_dict(msg_dict)
         return self.send_message(contact, message)
 
+    def send_find_multi(self, contact, targets, message_type):
+        """
+        Sends a batched FindValues or FindNodesMulti message to the given
+        contact with the intention of obtaining information about all the
+        given target keys at once. The type of batched find message is
+        specified by message_type.
+
+        This method is called by an instance of the MultiLookup class.
+        """
+        msg_dict = {
+            'uuid': str(uuid4()),
+            'recipient': contact.public_key,
+            'sender': self.public_key,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'keys': list(targets),
+        }
+        seal = get_seal(msg_dict, self.private_key)
+        msg_dict['seal'] = seal
+        if message_type is FindNodesMulti:
+            msg_dict['message'] = 'findnodesmulti'
+        else:
+            msg_dict['message'] = 'findvalues'
+        message = from_dict(msg_dict)
+        return self.send_message(contact, message)
+
     def _store_to_nodes(self, nearest_nodes, duplicate, key, value, timestamp,
                         expires, created_with, public_key, name, signature):
         """
@@ -435,7 +1210,8 @@ class Node(object):
         return list_of_tasks
 
     def replicate(self, duplicate, key, value, timestamp, expires,
-                  created_with, public_key, name, signature):
+                  created_with, public_key, name, signature,
+                  write_quorum=None):
         """
         Will replicate item to "duplicate" number of nodes in the distributed
         hash table. Returns a task that will fire with a list of send_store
@@ -443,19 +1219,33 @@ class Node(object):
 
         Obviously, the list can be consumed by asycnio.wait or asyncio.gather
         to fire when the store commands have completed.
+
+        If a write_quorum is given a Replication instance is returned
+        instead. It is a Future that fires with the list of contacts that
+        acknowledged the item as soon as write_quorum of them have done so
+        (see the Replication class for details of retries and the queue of
+        per-replica outcomes).
         """
         if duplicate < 1:
             # Guard to ensure meaningful duplication count. This may save
             # time.
             raise ValueError('Duplication count may not be less than 1')
 
-        result = asyncio.Future()
+        if write_quorum is None:
+            result = asyncio.Future()
+        else:
+            result = Replication(self, duplicate, write_quorum, key, value,
+                                 timestamp, expires, created_with,
+                                 public_key, name, signature)
         compound_key = construct_key(public_key, name)
         lookup = Lookup(FindNode, compound_key, self, self.event_loop)
         if lookup.done():
             # If we get here it's because lookup couldn't start due to an
             # empty routing table.
-            result.set_exception(lookup.exception())
+            if write_quorum is None:
+                result.set_exception(lookup.exception())
+            else:
+                result.abort(lookup.exception())
             return result
 
         def on_result(r, duplicate=duplicate, result=result, key=key,
@@ -468,24 +1258,35 @@ class Node(object):
             If successful, send a store message to "duplicate" number of
             contacts in the list of the close nodes have been found have by
             the lookup and resolve the "result" Future with the resulting
-            list of pending tasks.
+            list of pending tasks (or, if there is a write quorum, start the
+            Replication that is the "result").
 
             If there was an error simply pass the exception on via the
             Future representing the result.
             """
+            if result.done():
+                # A replication with a write quorum may have been cancelled.
+                return
             try:
                 contacts = r.result()
-                tasks = self._store_to_nodes(contacts, duplicate, key, value,
-                                             timestamp, expires, created_with,
-                                             public_key, name, signature)
-                result.set_result(tasks)
+                if write_quorum is None:
+                    tasks = self._store_to_nodes(contacts, duplicate, key,
+                                                 value, timestamp, expires,
+                                                 created_with, public_key,
+                                                 name, signature)
+                    result.set_result(tasks)
+                else:
+                    result.start(contacts)
             except Exception as ex:
-                result.set_exception(ex)
+                if write_quorum is None:
+                    result.set_exception(ex)
+                else:
+                    result.abort(ex)
 
         lookup.add_done_callback(on_result)
         return result
 
-    def retrieve(self, key):
+    def retrieve(self, key, quorum=1, deadline=None):
         """
         Given a key, will try to retrieve associated value from the distributed
         hash table. Returns a Future that will resolve when the operation is
@@ -498,8 +1299,24 @@ class Node(object):
         key that did not return the value."
 
         This method adds a callback to the NodeLookup to achieve this end.
+
+        If the value came in a HotValue message (the node that returned it is
+        being asked for it at least HOT_KEY_RATE times a second) the item is
+        cached at more of the closest nodes that did not return the value:
+        one for each multiple of HOT_KEY_RATE in the reported load (see
+        drogulus.dht.hotkeys). This spreads the load of flash crowds along the
+        lookup paths to the key.
+
+        If quorum is greater than one the lookup waits for that many values
+        (or for deadline seconds to pass) and resolves with the one with the
+        newest timestamp (see the Lookup class). Rather than caching, the
+        newest item is then pushed to the contacted peers that returned an
+        older version of it or didn't have it at all (read repair). This
+        means popular keys converge without waiting for the item to be
+        republished.
         """
-        lookup = Lookup(FindValue, key, self, self.event_loop)
+        lookup = Lookup(FindValue, key, self, self.event_loop, quorum=quorum,
+                        deadline=deadline)
         if lookup.done():
             # If we get here it's because lookup couldn't start due to an
             # empty routing table.
@@ -511,24 +1328,170 @@ class Node(object):
             node closest to the key that did not return the value. If the
             lookup encountered an exception then no further action is taken.
             """
-            if lookup.exception():
+            if lookup.cancelled() or lookup.exception():
                 return
-            caching_contact = None
-            for candidate in lookup.shortlist:
-                if candidate in lookup.contacted:
-                    caching_contact = candidate
-                    break
-            if caching_contact:
+            if lookup.quorum > 1:
+                self.read_repair(lookup)
+                return
+            result = lookup.result()
+            copies = cache_copies(getattr(result, 'load', 0.0))
+            caching_contacts = [candidate for candidate in lookup.shortlist
+                                if candidate in lookup.contacted][:copies]
+            for caching_contact in caching_contacts:
                 log.info("Caching to {}".format(caching_contact))
-                result = lookup.result()
                 self.send_store(caching_contact, lookup.target, result.value,
                                 result.timestamp, result.expires,
                                 result.created_with, result.public_key,
                                 result.name, result.signature)
+            if caching_contacts:
+                self.metrics.increment('cache.copies_sent',
+                                       len(caching_contacts))
 
         lookup.add_done_callback(cache_result)
         return lookup
 
+    def read_repair(self, lookup):
+        """
+        Given a resolved quorum read lookup, pushes the newest item found to
+        the peers that returned an older version of it. The item is also
+        pushed to the peers amongst the constants.K closest to the target
+        that were contacted but didn't have the item at all. Returns a list
+        of the contacts to which the item was sent.
+        """
+        newest = lookup.result()
+        stale = [contact for contact, value in lookup.values
+                 if value.timestamp < newest.timestamp]
+        missing = sort_peer_nodes(list(lookup.responded_without_value),
+                                  lookup.target)[:K]
+        contacts = stale + [contact for contact in missing
+                            if contact not in stale]
+        for contact in contacts:
+            log.info("Read repair of {} to {}".format(lookup.target, contact))
+            self.send_store(contact, lookup.target, newest.value,
+                            newest.timestamp, newest.expires,
+                            newest.created_with, newest.public_key,
+                            newest.name, newest.signature)
+        self.metrics.increment('read_repair.stores', len(contacts))
+        return contacts
+
+    def retrieve_many(self, keys):
+        """
+        Given a list of keys, will try to retrieve the associated values from
+        the distributed hash table in a single batched lookup. Each remote
+        peer receives at most one FindValues message per round covering all
+        the keys it is relevant for. Returns a Future that will resolve with a
+        dictionary mapping keys to the Value messages found for them (keys
+        for which no value could be found are not included). If there are
+        no keys the Future is already resolved with an empty dictionary.
+        """
+        if not keys:
+            result = asyncio.Future()
+            result.set_result({})
+            return result
+        return MultiLookup(FindValues, keys, self, self.event_loop)
+
+    def watch(self, key, callback, lease=SUBSCRIPTION_LEASE):
+        """
+        Given a key, will call the callback with each new version of the
+        associated item (a Notify message) pushed to the local node, rather
+        than have the caller poll for updates with retrieve.
+
+        The local node subscribes to the key with the K closest nodes it can
+        find to the key. The subscriptions last for lease seconds (at most
+        SUBSCRIPTION_LEASE_MAX) and are renewed, with a fresh lookup of the
+        closest nodes, when half the lease has passed until the key is no
+        longer watched (see unwatch). Returns a Future that will resolve with
+        the list of contacts that accepted the subscriptions.
+        """
+        watch = self.watches.get(key)
+        if watch is None:
+            watch = Watch(key, min(lease, SUBSCRIPTION_LEASE_MAX))
+            self.watches[key] = watch
+            watch.callbacks.append(callback)
+            self.subscribe(key)
+        else:
+            watch.callbacks.append(callback)
+        return watch.subscribed
+
+    def unwatch(self, key, callback=None):
+        """
+        Stops calling the callback with new versions of the item with the
+        key. Once there are no callbacks left (or if no callback is given)
+        the key is no longer watched and the subscriptions are cancelled.
+        Returns a list of the pending cancellation tasks.
+        """
+        watch = self.watches.get(key)
+        if watch is None:
+            return []
+        if callback in watch.callbacks:
+            watch.callbacks.remove(callback)
+        if callback is not None and watch.callbacks:
+            return []
+        del self.watches[key]
+        if watch.renewal:
+            watch.renewal.cancel()
+        tasks = []
+        for contact in watch.contacts:
+            uuid, task = self.send_subscribe(contact, key, 0)
+            tasks.append(task)
+        return tasks
+
+    def subscribe(self, key):
+        """
+        Subscribes to the updates of the watched key with the K closest nodes
+        that can be found to the key and schedules the renewal of the
+        subscriptions when half the lease has passed (even if the lookup
+        fails, so the subscriptions are retried). The watch's subscribed
+        Future resolves with the list of contacts that acknowledged the
+        subscriptions.
+        """
+        watch = self.watches.get(key)
+        if watch is None:
+            return
+        result = asyncio.Future()
+        watch.subscribed = result
+        watch.renewal = self.event_loop.call_later(watch.lease / 2,
+                                                   self.subscribe, key)
+        lookup = Lookup(FindNode, key, self, self.event_loop)
+        if lookup.done():
+            # The lookup couldn't start due to an empty routing table.
+            result.set_exception(lookup.exception())
+            return result
+
+        def on_contacts(found, watch=watch, result=result):
+            """
+            To be called when the lookup completes. Sends a Subscribe message
+            to each of the closest contacts.
+            """
+            try:
+                contacts = found.result()
+            except Exception as ex:
+                result.set_exception(ex)
+                return
+            pending = [(contact,
+                        self.send_subscribe(contact, key, watch.lease)[1])
+                       for contact in contacts]
+            self.metrics.increment('subscriptions.sent', len(pending))
+            replies = asyncio.gather(*[task for contact, task in pending],
+                                     return_exceptions=True)
+
+            def on_replies(replies, watch=watch, result=result):
+                """
+                To be called when every contact has replied (or failed to).
+                """
+                accepted = [contact for (contact, task), reply
+                            in zip(pending, replies.result())
+                            if not isinstance(reply, Exception)]
+                if self.watches.get(key) is watch:
+                    watch.contacts = accepted
+                if not result.done():
+                    result.set_result(accepted)
+
+            replies.add_done_callback(on_replies)
+
+        lookup.add_done_callback(on_contacts)
+        return result
+
     def refresh(self):
         """
         A periodically called method that will check and refresh the k-buckets
@@ -541,6 +1504,26 @@ class Node(object):
         # schedule the next refresh.
         self.event_loop.call_later(REFRESH_INTERVAL, self.refresh)
 
+    def purge_expired(self):
+        """
+        A periodically called method that deletes (up to EXPIRY_SWEEP_SIZE)
+        expired items from the local data store (along with the lapsed
+        subscriptions of remote peers). If there may be more expired
+        items the next sweep happens immediately, otherwise after
+        EXPIRY_SWEEP_INTERVAL seconds.
+        """
+        purged = self.data_store.purge_expired(limit=EXPIRY_SWEEP_SIZE)
+        self.subscriptions.expire()
+        if purged:
+            self.metrics.increment('storage.expired', len(purged))
+            log.info('Purged {} expired items.'.format(len(purged)))
+        # schedule the next sweep.
+        if len(purged) >= EXPIRY_SWEEP_SIZE:
+            self.event_loop.call_soon(self.purge_expired)
+        else:
+            self.event_loop.call_later(EXPIRY_SWEEP_INTERVAL,
+                                       self.purge_expired)
+
     def republish(self, item_key):
         """
         Periodically called to check and republish a locally stored item to
@@ -583,6 +1566,17 @@ class Node(object):
         REPLICATE_INTERVAL seconds. This ensures items are not over-cached but
         remain stored at peer nodes whose network ids are closest to the
         item's key.
+
+        Cached copies of items (held by a node that isn't amongst the K
+        closest nodes it knows of to the key) are never republished. They're
+        deleted once they haven't been requested for their lifetime, which is
+        shorter the further the local node is from the key (see
+        check_cached_copy).
+
+        The checks are scheduled with self.republisher (a RepublishScheduler)
+        which calls this method with due keys in rate-limited batches. Items
+        that need replicating are added to self.republication_queue which is
+        flushed (see flush_republication) after each batch.
         """
         log.info('Republish check for key: {}'.format(item_key))
         if item_key in self.data_store:
@@ -592,8 +1586,18 @@ class Node(object):
                 # The item has expired. If the item's expiry is 0 (or less)
                 # then the item should never expire.
                 del self.data_store[item_key]
+                self.cache_lifetimes.pop(item_key, None)
                 log.info('{} expired. Deleted from local data store.'
                          .format(item_key))
+            elif item_key in self.cache_lifetimes:
+                self.check_cached_copy(item_key, now)
+            elif is_fragment(item.name):
+                # Fragments of erasure coded values are held by a single
+                # node and repaired by their publisher, so are neither
+                # replicated nor removed due to lack of activity. Keep
+                # checking until the fragment expires.
+                log.info('Item {} is a fragment.'.format(item_key))
+                self.republisher.schedule(item_key)
             else:
                 updated = self.data_store.updated(item_key)
                 accessed = self.data_store.accessed(item_key)
@@ -603,28 +1607,152 @@ class Node(object):
                 if update_delta > REPLICATE_INTERVAL:
                     # The item needs republishing because it hasn't been
                     # updated within the specified time interval.
-                    log.info('Republishing item {}.'.format(item_key))
-                    self.replicate(K, item.key, item.value, item.timestamp,
-                                   item.expires, item.created_with,
-                                   item.public_key, item.name, item.signature)
+                    if self.synchroniser.covers(item_key):
+                        # Kept in step with the neighbours by replica
+                        # synchronisation instead.
+                        log.info('Item {} is synced.'.format(item_key))
+                    else:
+                        log.info('Republishing item {}.'.format(item_key))
+                        self.republication_queue.append(item)
                     replicated = True
-                # Re-schedule the republication check.
-                handler = self.event_loop.call_later(REPLICATE_INTERVAL,
-                                                     self.republish, item_key)
                 if access_delta > REPLICATE_INTERVAL:
                     # The item has not been accessed for a while so, if
                     # required, replicate the item and then remove it from the
-                    # local data store. Remember to cancel the scheduled
+                    # local data store. Remember to cancel any scheduled
                     # republication check.
                     log.info('Removing {} due to lack of activity.'
                              .format(item_key))
                     if not replicated:
-                        self.replicate(K, item.key, item.value,
-                                       item.timestamp, item.expires,
-                                       item.created_with, item.public_key,
-                                       item.name, item.signature)
+                        self.republication_queue.append(item)
                     del self.data_store[item_key]
-                    handler.cancel()
+                    self.republisher.unschedule(item_key)
+                else:
+                    # Re-schedule the republication check.
+                    self.republisher.schedule(item_key)
         else:
+            self.cache_lifetimes.pop(item_key, None)
             log.info('{} is no longer in local data store. Cancelled.'
                      .format(item_key))
+
+    def check_cached_copy(self, item_key, now):
+        """
+        Called by the republication check of a locally held cached copy of an
+        item. The copy is deleted if it hasn't been requested (or updated)
+        for its lifetime. Otherwise the next check is scheduled for when it
+        would reach the end of its lifetime.
+
+        The lifetime is recalculated since peers may have joined or left the
+        neighbourhood of the key. If the local node has become one of the K
+        closest nodes it knows of to the key, the copy is treated as a
+        replica from then on.
+        """
+        lifetime = self.cache_lifetime(item_key)
+        if lifetime is None:
+            log.info('Cached copy {} is now a replica.'.format(item_key))
+            del self.cache_lifetimes[item_key]
+            self.republisher.schedule(item_key)
+            return
+        self.cache_lifetimes[item_key] = lifetime
+        idle = now - max(self.data_store.updated(item_key),
+                         self.data_store.accessed(item_key))
+        if idle > lifetime:
+            log.info('Removing cached copy {} due to lack of activity.'
+                     .format(item_key))
+            del self.data_store[item_key]
+            del self.cache_lifetimes[item_key]
+            self.republisher.unschedule(item_key)
+            self.metrics.increment('cache.evicted')
+        else:
+            self.republisher.schedule(item_key, lifetime - idle)
+
+    def flush_republication(self):
+        """
+        Replicates the items queued by republication checks. Returns a list
+        of Futures, one for each region of the key space touched.
+
+        Rather than performing a lookup for each item, the items are grouped
+        by the first REPUBLISH_PREFIX_LENGTH characters of their keys. Items
+        sharing a prefix are close to each other in the key space so are
+        stored at (more or less) the same peers: a single lookup finds the
+        replica set for the whole region (see republish_region). Regions
+        containing a single item are replicated in the usual way.
+        """
+        queue = self.republication_queue
+        self.republication_queue = []
+        regions = {}
+        for item in queue:
+            regions.setdefault(item.key[:REPUBLISH_PREFIX_LENGTH],
+                               {})[item.key] = item
+        result = []
+        for prefix in sorted(regions):
+            items = list(regions[prefix].values())
+            if len(items) == 1:
+                item = items[0]
+                self.metrics.increment('republish.bytes_sent',
+                                       K * payload_size(item_to_dict(item)))
+                result.append(self.replicate(K, item.key, item.value,
+                                             item.timestamp, item.expires,
+                                             item.created_with,
+                                             item.public_key, item.name,
+                                             item.signature))
+            else:
+                result.append(self.republish_region(items))
+        return result
+
+    def republish_region(self, items):
+        """
+        Replicates a list of items from the same region of the key space
+        using a single lookup. Returns a Future that will fire with a list of
+        send_store_many tasks once the lookup has completed.
+
+        The lookup targets the median key of the region. For each item the K
+        closest peers are picked from the peers found by the lookup and those
+        in the local routing table that are close to the item's key. Each
+        peer is then sent the items it should hold in batches (see
+        send_items). Each item is only measured once however many peers
+        it's sent to.
+        """
+        items = sorted(items, key=lambda item: item.key)
+        target = items[len(items) // 2].key
+        result = asyncio.Future()
+        lookup = Lookup(FindNode, target, self, self.event_loop)
+        self.metrics.increment('republish.lookups')
+        if lookup.done():
+            # If we get here it's because lookup couldn't start due to an
+            # empty routing table.
+            result.set_exception(lookup.exception())
+            return result
+
+        def on_result(lookup, items=items, result=result):
+            """
+            To be called when the lookup completes. Sends the items to their
+            replicas in batches and resolves the result with the list of
+            pending tasks. If there was an error simply pass the exception on
+            via the Future representing the result.
+            """
+            try:
+                found = lookup.result()
+            except Exception as ex:
+                result.set_exception(ex)
+                return
+            sizes = dict((item.key, payload_size(item_to_dict(item)))
+                         for item in items)
+            replicas = {}
+            for item in items:
+                candidates = set(found)
+                candidates.update(self.routing_table.find_close_nodes(
+                    item.key))
+                for contact in sort_peer_nodes(list(candidates),
+                                               item.key)[:K]:
+                    replicas.setdefault(contact, []).append(item)
+            tasks = []
+            for contact, batch in replicas.items():
+                for task, size in self.send_items(contact, batch, sizes):
+                    tasks.append(task)
+                    self.metrics.increment('republish.store_many')
+                    self.metrics.increment('republish.bytes_sent', size)
+                self.metrics.increment('republish.items_sent', len(batch))
+            result.set_result(tasks)
+
+        lookup.add_done_callback(on_result)
+        return result
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Defines the class used to replicate an item to remote peers in the DHT with
+a write quorum.
+"""
+import asyncio
+import logging
+from .errors import QuorumNotReached
+
+
+log = logging.getLogger(__name__)
+
+
+class Replication(asyncio.Future):
+    """
+    Encapsulates the storing of an item at "duplicate" number of remote peers
+    taken from an ordered list of candidates (usually the result of a FindNode
+    lookup for the item's key). Will callback with the list of contacts that
+    acknowledged the item as soon as "write_quorum" of them have done so, or
+    errback with a QuorumNotReached error if this becomes impossible.
+
+    The candidates are passed to the start method (they're often not known
+    at the time the instance is created).
+
+    If storing to a peer fails, the item is sent to the next closest
+    candidate (if there are any left) so that there is still a chance of
+    reaching the write quorum.
+
+    Once the quorum is reached (or cannot be reached) the local node stops
+    waiting for responses to the outstanding requests. The item has already
+    been sent, so the remote peers will still store it.
+
+    The outcome of each request is put onto the self.outcomes queue as a
+    (contact, status) tuple where status is one of 'ok', 'failed' or
+    'cancelled'. None is put on the queue when there are no more outcomes to
+    report. Consume it like this:
+
+        while True:
+            outcome = yield from replication.outcomes.get()
+            if outcome is None:
+                break
+            contact, status = outcome
+            ...
+    """
+
+    def __init__(self, local_node, duplicate, write_quorum, key, value,
+                 timestamp, expires, created_with, public_key, name,
+                 signature):
+        """
+        Sets up the replication of the item to "duplicate" number of nodes
+        with the given write_quorum.
+        """
+        asyncio.Future.__init__(self)
+        if duplicate < 1:
+            raise ValueError('Duplication count may not be less than 1')
+        if write_quorum < 1 or write_quorum > duplicate:
+            raise ValueError('Write quorum must be between 1 and the '
+                             'duplication count')
+        self.local_node = local_node
+        self.duplicate = duplicate
+        self.write_quorum = write_quorum
+        self.item = (key, value, timestamp, expires, created_with,
+                     public_key, name, signature)
+        # Candidates that have not yet been sent the item.
+        self.candidates = []
+        # Contacts that acknowledged the item.
+        self.acknowledged = []
+        # Requests for which a response is still awaited.
+        self.pending_requests = {}
+        # The contact to which each pending request was sent.
+        self.pending_contacts = {}
+        self.outcomes = asyncio.Queue()
+
+    def start(self, candidates):
+        """
+        Sends the item to the first "duplicate" number of candidates (an
+        ordered list of contacts, closest first).
+        """
+        if len(candidates) < 1:
+            raise ValueError('Empty list of nearest nodes.')
+        self.candidates = list(candidates)
+        for i in range(min(self.duplicate, len(self.candidates))):
+            self._store_to_next()
+        if len(self.pending_requests) < self.write_quorum:
+            msg = 'Only {} nearest nodes for a write quorum of {}'.format(
+                len(self.pending_requests), self.write_quorum)
+            self._finish(QuorumNotReached(msg))
+
+    def _store_to_next(self):
+        """
+        Sends the item to the next closest candidate.
+        """
+        contact = self.candidates.pop(0)
+        uuid, task = self.local_node.send_store(contact, *self.item)
+        self.pending_requests[uuid] = task
+        self.pending_contacts[uuid] = contact
+
+        def callback(task, uuid=uuid, contact=contact):
+            """
+            Passes the outcome to the Replication instance to handle (unless
+            the request was cancelled).
+            """
+            if not task.cancelled():
+                self._handle_response(uuid, contact, task)
+
+        task.add_done_callback(callback)
+
+    def _handle_response(self, uuid, contact, task):
+        """
+        Records the outcome of a request to store the item at contact. May
+        resolve this instance or retry with the next closest candidate.
+        """
+        if uuid not in self.pending_requests:
+            return
+        del self.pending_requests[uuid]
+        del self.pending_contacts[uuid]
+        if task.exception():
+            log.info('Unable to replicate to {}'.format(contact))
+            log.info(task.exception())
+            self.outcomes.put_nowait((contact, 'failed'))
+            if not self.done():
+                if self.candidates:
+                    self._store_to_next()
+                elif (len(self.acknowledged) + len(self.pending_requests) <
+                        self.write_quorum):
+                    msg = 'Only {} of {} required acknowledgements'.format(
+                        len(self.acknowledged), self.write_quorum)
+                    self._finish(QuorumNotReached(msg))
+        else:
+            self.acknowledged.append(contact)
+            self.outcomes.put_nowait((contact, 'ok'))
+            if (not self.done() and
+                    len(self.acknowledged) >= self.write_quorum):
+                self._finish()
+
+    def _finish(self, error=None):
+        """
+        Resolves this instance and cleanly stops waiting for responses to the
+        outstanding requests.
+        """
+        if error:
+            self.set_exception(error)
+        else:
+            self.set_result(list(self.acknowledged))
+        self._cancel_pending_requests()
+
+    def _cancel_pending_requests(self):
+        """
+        Cancels the tasks waiting on pending requests, reports them as such on
+        the outcomes queue and signals there are no more outcomes to report.
+        """
+        for uuid, task in self.pending_requests.items():
+            self.local_node.event_loop.call_soon(task.cancel)
+            self.outcomes.put_nowait((self.pending_contacts[uuid],
+                                      'cancelled'))
+        self.pending_requests = {}
+        self.pending_contacts = {}
+        self.outcomes.put_nowait(None)
+
+    def abort(self, error):
+        """
+        Errbacks with the given error before the replication has started (for
+        example, if the lookup for the candidates failed).
+        """
+        if not self.done():
+            self._finish(error)
+
+    def cancel(self):
+        """
+        Cancels this replication in a clean fashion.
+        """
+        if self.done():
+            return False
+        self._cancel_pending_requests()
+        return asyncio.Future.cancel(self)
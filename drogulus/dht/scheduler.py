@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the scheduler used by the local node to decide when locally stored
+items should be checked for republication.
+"""
+from . import constants
+import heapq
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class RepublishScheduler(object):
+    """
+    Keeps track of the time at which each key held by the local node is due a
+    republication check.
+
+    Rather than scheduling a timer with the event loop for each key, the due
+    times are kept in a heap of (due, key) tuples with a dictionary mapping
+    each key to its current due time. Scheduling a key that is already
+    scheduled simply replaces its due time (the obsolete heap entry is
+    ignored when it reaches the top of the heap) so there is only ever one
+    pending check per key.
+
+    While there are keys scheduled, the scheduler ticks every "tick" seconds
+    and passes at most "batch_size" due keys to the callback. This limits the
+    rate at which republication (and the associated network activity)
+    happens, spreading a spike of due keys over several ticks.
+    """
+
+    def __init__(self, event_loop, callback,
+                 interval=constants.REPLICATE_INTERVAL,
+                 tick=constants.REPUBLISH_TICK,
+                 batch_size=constants.REPUBLISH_BATCH_SIZE, metrics=None,
+                 flush=None):
+        """
+        The callback is called with each key that is due. The interval is the
+        default number of seconds to wait before a key is due. The optional
+        metrics argument is a MetricsRegistry to which the number of keys
+        processed is reported. The optional flush callable is called (with no
+        arguments) once all the keys in a batch have been passed to the
+        callback so work can be aggregated across the batch.
+        """
+        self.event_loop = event_loop
+        self.callback = callback
+        self.interval = interval
+        self.tick = tick
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.flush = flush
+        # A heap of (due, key) tuples. May contain obsolete entries.
+        self.heap = []
+        # Maps keys to their current due time.
+        self.due = {}
+        # The event loop handle for the next tick (if ticking).
+        self.handle = None
+        # Instrumentation.
+        self.processed = 0
+        self.batches = 0
+        self.started = time.time()
+
+    def __len__(self):
+        """
+        The queue depth (number of scheduled keys).
+        """
+        return len(self.due)
+
+    def __contains__(self, key):
+        return key in self.due
+
+    def schedule(self, key, delay=None):
+        """
+        Ensures the key is due in delay seconds (defaults to the interval).
+        Replaces any existing schedule for the key.
+        """
+        if delay is None:
+            delay = self.interval
+        due = time.time() + delay
+        self.due[key] = due
+        heapq.heappush(self.heap, (due, key))
+        if len(self.heap) > 2 * len(self.due) + self.batch_size:
+            self._compact()
+        if self.handle is None:
+            self.handle = self.event_loop.call_later(self.tick, self._tick)
+
+    def unschedule(self, key):
+        """
+        Ensures the key is no longer scheduled.
+        """
+        self.due.pop(key, None)
+
+    def _compact(self):
+        """
+        Rebuilds the heap without obsolete entries.
+        """
+        self.heap = [(due, key) for key, due in self.due.items()]
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now, limit):
+        """
+        Returns a list of at most limit keys that are due at time now. The
+        returned keys are no longer scheduled.
+        """
+        result = []
+        while self.heap and len(result) < limit:
+            due, key = self.heap[0]
+            if due > now:
+                break
+            heapq.heappop(self.heap)
+            if self.due.get(key) == due:
+                del self.due[key]
+                result.append(key)
+        return result
+
+    def _tick(self):
+        """
+        Passes a batch of due keys to the callback. Keeps ticking while there
+        are keys scheduled.
+        """
+        self.handle = None
+        keys = self.pop_due(time.time(), self.batch_size)
+        if keys:
+            self.batches += 1
+            self.processed += len(keys)
+            if self.metrics:
+                self.metrics.increment('republish.processed', len(keys))
+        for key in keys:
+            try:
+                self.callback(key)
+            except Exception as ex:
+                log.error('Republish check for {} failed'.format(key))
+                log.error(ex)
+        if keys and self.flush:
+            try:
+                self.flush()
+            except Exception as ex:
+                log.error('Republish flush failed')
+                log.error(ex)
+        if self.due:
+            self.handle = self.event_loop.call_later(self.tick, self._tick)
+        elif self.heap:
+            self.heap = []
+
+    def stats(self):
+        """
+        Returns a dictionary describing the queue depth and throughput of the
+        scheduler that can be serialised into JSON.
+        """
+        now = time.time()
+        elapsed = now - self.started
+        due_now = len([due for due in self.due.values() if due <= now])
+        return {
+            'depth': len(self.due),
+            'due': due_now,
+            'processed': self.processed,
+            'batches': self.batches,
+            'throughput': self.processed / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def stop(self):
+        """
+        Stops the scheduler ticking.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Contains functions and a class for writing and reading snapshots of the state
+of a local node so a restarted node is useful straight away rather than having
+to re-learn its peers and wait for items to be republished to it.
+
+A snapshot contains the contacts in the routing table, the blacklisted public
+keys, the items held in the data store (with their last-update and
+last-access times), the time at which each scheduled key is due a
+republication check and the lifetimes of the held items that are cached
+copies (so a restored cached copy isn't republished as a replica). The
+deadlines and lifetimes are recorded even if the items aren't (because
+they're persisted in a database) so a restarted node checks its items when
+they were due rather than all at once. It's a versioned binary file:
+
+* a header (HEADER) containing MAGIC, the format VERSION, the time the
+  snapshot was taken and the number of contacts, blacklisted public keys,
+  items, deadlines and cached copies that follow,
+* each contact as three length prefixed UTF-8 strings (public key, version
+  and URI),
+* each blacklisted public key as a length prefixed UTF-8 string,
+* each item as an ITEM struct (updated and accessed times) followed by the
+  length prefixed compact JSON serialisation of the item,
+* each deadline as a length prefixed UTF-8 key followed by a DEADLINE struct
+  (the time the key is due a republication check),
+* each cached copy as a length prefixed UTF-8 key followed by a LIFETIME
+  struct (the number of seconds the copy is kept without being requested),
+* a CRC32 checksum of everything before it.
+
+Version 2 snapshots (which don't record cached copies) and version 1
+snapshots (which also only record the deadlines of the items they contain,
+in a due time appended to each ITEM) can still be read.
+
+Snapshots are written to a temporary file that replaces the previous snapshot
+(with os.replace) once it is safely on disk, so a crash while writing never
+leaves a partial snapshot.
+"""
+from .messages import from_dict, to_dict
+from .constants import SNAPSHOT_INTERVAL
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+
+log = logging.getLogger(__name__)
+
+
+#: Identifies a snapshot file.
+MAGIC = b'DROGSNAP'
+#: The version of the snapshot format.
+VERSION = 3
+#: The magic bytes and version that start every snapshot.
+PREFIX = struct.Struct('>8sH')
+#: The magic bytes, version, creation time and number of contacts,
+#: blacklisted public keys, items, deadlines and cached copies.
+HEADER = struct.Struct('>8sHdIIIII')
+#: The updated and accessed times of an item.
+ITEM = struct.Struct('>dd')
+#: The time a key is due a republication check.
+DEADLINE = struct.Struct('>d')
+#: The number of seconds a cached copy is kept without being requested.
+LIFETIME = struct.Struct('>d')
+#: The header of a version 2 snapshot (without the number of cached copies).
+HEADER_V2 = struct.Struct('>8sHdIIII')
+#: The header of a version 1 snapshot (without the number of deadlines).
+HEADER_V1 = struct.Struct('>8sHdIII')
+#: The updated, accessed and due times of an item in a version 1 snapshot
+#: (where a due time of -1 means the item isn't scheduled).
+ITEM_V1 = struct.Struct('>ddd')
+#: The length of a string.
+LENGTH = struct.Struct('>I')
+#: The checksum at the end of the file.
+CHECKSUM = struct.Struct('>I')
+
+
+def capture(node, items=True):
+    """
+    Returns a dictionary containing the state of the local node to be
+    written to a snapshot. Must be called by the thread running the node's
+    event loop. Items are only included if the items flag is set (there's no
+    need if the data store is persistent) but the deadlines of the scheduled
+    republication checks are always included.
+    """
+    dump = node.routing_table.dump()
+    state = {
+        'created': time.time(),
+        'contacts': dump.get('contacts', []),
+        'blacklist': dump.get('blacklist', []),
+        'items': [],
+        'deadlines': list(node.republisher.due.items()),
+        'cached': list(node.cache_lifetimes.items()),
+    }
+    if items:
+        data_store = node.data_store
+        for key in list(data_store.keys()):
+            state['items'].append((data_store[key], data_store.updated(key),
+                                   data_store.accessed(key)))
+    return state
+
+
+def _pack_string(chunks, text):
+    data = text.encode('utf-8')
+    chunks.append(LENGTH.pack(len(data)))
+    chunks.append(data)
+
+
+def encode(state):
+    """
+    Returns the bytes of a snapshot of the state (as returned by capture).
+    """
+    chunks = [HEADER.pack(MAGIC, VERSION, state['created'],
+                          len(state['contacts']), len(state['blacklist']),
+                          len(state['items']), len(state['deadlines']),
+                          len(state['cached']))]
+    for contact in state['contacts']:
+        _pack_string(chunks, contact['public_key'])
+        _pack_string(chunks, contact['version'])
+        _pack_string(chunks, contact['uri'])
+    for public_key in state['blacklist']:
+        _pack_string(chunks, public_key)
+    for item, updated, accessed in state['items']:
+        chunks.append(ITEM.pack(updated, accessed))
+        _pack_string(chunks, json.dumps(to_dict(item),
+                                        separators=(',', ':')))
+    for key, due in state['deadlines']:
+        _pack_string(chunks, key)
+        chunks.append(DEADLINE.pack(due))
+    for key, lifetime in state['cached']:
+        _pack_string(chunks, key)
+        chunks.append(LIFETIME.pack(lifetime))
+    data = b''.join(chunks)
+    return data + CHECKSUM.pack(zlib.crc32(data))
+
+
+def decode(data):
+    """
+    Returns the state (as returned by capture) contained in the bytes of a
+    snapshot. Raises a ValueError if the snapshot is corrupt or of an
+    unsupported version.
+    """
+    if len(data) < HEADER.size + CHECKSUM.size:
+        raise ValueError('Truncated snapshot')
+    body = memoryview(data)[:-CHECKSUM.size]
+    if CHECKSUM.unpack_from(data, len(body))[0] != zlib.crc32(body):
+        raise ValueError('Corrupt snapshot')
+    magic, version = PREFIX.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError('Not a snapshot')
+    if version == VERSION:
+        header, item_struct = HEADER, ITEM
+    elif version == 2:
+        header, item_struct = HEADER_V2, ITEM
+    elif version == 1:
+        header, item_struct = HEADER_V1, ITEM_V1
+    else:
+        raise ValueError('Unsupported snapshot version: {}'.format(version))
+    if len(body) < header.size:
+        raise ValueError('Truncated snapshot')
+    counts = header.unpack_from(body)[2:]
+    created, contact_count, blacklist_count, item_count = counts[:4]
+    offset = header.size
+
+    def string():
+        nonlocal offset
+        length = LENGTH.unpack_from(body, offset)[0]
+        offset += LENGTH.size
+        if offset + length > len(body):
+            raise ValueError('Truncated snapshot')
+        result = bytes(body[offset:offset + length]).decode('utf-8')
+        offset += length
+        return result
+
+    try:
+        contacts = []
+        for i in range(contact_count):
+            contacts.append({
+                'public_key': string(),
+                'version': string(),
+                'uri': string(),
+            })
+        blacklist = [string() for i in range(blacklist_count)]
+        items = []
+        deadlines = []
+        cached = []
+        for i in range(item_count):
+            times = item_struct.unpack_from(body, offset)
+            offset += item_struct.size
+            item = from_dict(json.loads(string()))
+            items.append((item, times[0], times[1]))
+            if version == 1 and times[2] >= 0:
+                deadlines.append((item.key, times[2]))
+        if version > 1:
+            for i in range(counts[4]):
+                key = string()
+                deadlines.append((key, DEADLINE.unpack_from(body, offset)[0]))
+                offset += DEADLINE.size
+        if version == VERSION:
+            for i in range(counts[5]):
+                key = string()
+                cached.append((key, LIFETIME.unpack_from(body, offset)[0]))
+                offset += LIFETIME.size
+    except struct.error:
+        raise ValueError('Truncated snapshot')
+    return {
+        'created': created,
+        'contacts': contacts,
+        'blacklist': blacklist,
+        'items': items,
+        'deadlines': deadlines,
+        'cached': cached,
+    }
+
+
+def write_snapshot(path, state):
+    """
+    Atomically replaces the snapshot at path with a snapshot of the state.
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(encode(state))
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temporary, path)
+
+
+def read_snapshot(path):
+    """
+    Returns the state contained in the snapshot at path.
+    """
+    with open(path, 'rb') as snapshot:
+        return decode(snapshot.read())
+
+
+def restore(node, state):
+    """
+    Restores the items in the state (as returned by read_snapshot) to the
+    local node's data store (keeping their last-update and last-access times)
+    and schedules the republication checks of the keys held in the data store
+    (whether restored or persisted in a database) when they were due (or
+    straight away if overdue). Expired items are skipped and restored items
+    without a deadline are checked after the usual interval. Held items that
+    were cached copies are restored as cached copies (with their lifetimes)
+    rather than replicas. The contacts in
+    the state should be used to join the network. Returns the number of
+    restored items.
+    """
+    now = time.time()
+    restored = []
+    for item, updated, accessed in state['items']:
+        if item.expires > 0.0 and item.expires < now:
+            continue
+        node.data_store.load_item(item.key, item, updated, accessed)
+        restored.append(item.key)
+    for key, lifetime in state.get('cached', []):
+        if key in node.data_store:
+            node.cache_lifetimes[key] = lifetime
+    for key, due in state['deadlines']:
+        if key in node.data_store:
+            node.republisher.schedule(key, max(0.0, due - now))
+    for key in restored:
+        if key not in node.republisher:
+            node.republisher.schedule(key, node.cache_lifetimes.get(key))
+    return len(restored)
+
+
+class Snapshotter(object):
+    """
+    Periodically writes a snapshot of the state of the local node to a file.
+    The state is captured by the event loop's thread and written to disk by
+    the event loop's default executor (so the event loop isn't blocked while
+    the snapshot is encoded and written).
+    """
+
+    def __init__(self, local_node, path, interval=SNAPSHOT_INTERVAL,
+                 items=True):
+        """
+        The snapshot of the local_node is written to path every interval
+        seconds. Items are only included if the items flag is set.
+        """
+        self.local_node = local_node
+        self.path = path
+        self.interval = interval
+        self.items = items
+        # The event loop handle for the next snapshot.
+        self.handle = None
+        # The Future representing the snapshot being written (if any).
+        self.writing = None
+
+    def start(self):
+        """
+        Ensures a snapshot is written every self.interval seconds.
+        """
+        if self.handle is None:
+            self.handle = self.local_node.event_loop.call_later(
+                self.interval, self._tick)
+
+    def stop(self):
+        """
+        Stops periodic snapshots.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _tick(self):
+        """
+        Writes a snapshot then schedules the next one.
+        """
+        self.handle = None
+        try:
+            self.save()
+        except Exception as ex:
+            log.error('Snapshot failed')
+            log.error(ex)
+        self.start()
+
+    def save(self):
+        """
+        Captures the state of the local node and writes it to disk in the
+        background. Returns a Future that resolves when the snapshot has been
+        written (or None if the previous snapshot is still being written).
+        """
+        if self.writing is not None and not self.writing.done():
+            log.info('Skipping snapshot: still writing the previous one')
+            return None
+        node = self.local_node
+        state = capture(node, self.items)
+        self.writing = node.event_loop.run_in_executor(
+            None, write_snapshot, self.path, state)
+        node.metrics.increment('snapshot.writes')
+        return self.writing
+
+    def save_now(self):
+        """
+        Captures the state of the local node and writes it to disk
+        immediately (for example, when the node is shutting down).
+        """
+        write_snapshot(self.path, capture(self.local_node, self.items))
+
+    def load(self):
+        """
+        Restores the items in the snapshot (if there is one) to the local
+        node. Returns the state read from the snapshot (or None if there
+        isn't a usable snapshot).
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            state = read_snapshot(self.path)
+        except (OSError, ValueError) as ex:
+            log.error('Unable to read snapshot {}'.format(self.path))
+            log.error(ex)
+            return None
+        restored = restore(self.local_node, state)
+        log.info('Restored {} items from {}'.format(restored, self.path))
+        return state
@@ -3,10 +3,59 @@
 Contains class definitions that define the local data store for the node.
 """
 
+from .messages import Value, from_dict, to_dict
+from .validators import ITEM_FIELDS
+from .utils import distance
+from .keyindex import SortedKeyList, closest_keys
+from .compression import pack_value, unpack_value, compress, decompress
+from .constants import K, EXPIRY_SWEEP_SIZE
 from collections import MutableMapping
+from hashlib import sha512
+from itertools import islice
+import binascii
+import heapq
+import json
+import re
+import sqlite3
+import sys
 import time
 
 
+#: The default maximum number of pending writes held by an SQLiteDataStore
+#: before they're committed to the database in a single transaction.
+BATCH_SIZE = 1000
+#: The default maximum number of seconds writes are held by an SQLiteDataStore
+#: (with an event loop) before they're committed to the database.
+COMMIT_INTERVAL = 1.0
+#: When a BoundedDataStore is over budget it evicts items until it is using
+#: no more than this proportion of its budget.
+LOW_WATER_MARK = 0.9
+#: Matches strings that can be held as bytes by a CompactDataStore (keys and
+#: signatures are lowercase hexadecimal).
+HEXADECIMAL = re.compile('^(?:[0-9a-f]{2})+$')
+# Indicates an argument that wasn't given (when None is meaningful).
+_UNKNOWN = object()
+
+
+def pack_hex(text):
+    """
+    Returns the bytes represented by the lowercase hexadecimal text (half the
+    size in memory). Any other text is returned unchanged.
+    """
+    if HEXADECIMAL.match(text):
+        return binascii.unhexlify(text)
+    return text
+
+
+def unpack_hex(data):
+    """
+    Reverses pack_hex.
+    """
+    if isinstance(data, bytes):
+        return binascii.hexlify(data).decode('ascii')
+    return data
+
+
 class DataStore(MutableMapping):
     """
     Base class for implementations of the storage mechanism for local nodes.
@@ -25,8 +74,44 @@ class DataStore(MutableMapping):
     The __get_item__ and __setitem__ methods silently handle the metadata
     requirements and actually call the _get_item and _set_item methods in
     which the storage and retrieval of items should be handled / overridden.
+
+    Items that expire are indexed by their expiry time (in a heap) so they
+    can be deleted in small incremental sweeps by purge_expired.
+
+    Items are also indexed by their publisher (identified by the network id
+    derived from the publisher's public key, as for nodes) so a publisher's
+    items can be listed, counted and exported without scanning the whole
+    data store. The keys are also held in order (in a SortedKeyList) so the
+    keys in a region of the key space, or closest to a target key, can be
+    found without scanning every key. Both indexes are built when first
+    needed and then maintained as items are stored and deleted. Child
+    classes call _index_item and _unindex_item when they store or delete
+    items without going through DataStore.__setitem__.
+
+    In-memory data stores may be given a BlobStore in which large values are
+    held once (by digest) and shared by every item with the same value. The
+    digest of each key's shared value is remembered so peers can be sent the
+    digest in place of the value (see value_digest).
     """
 
+    def __init__(self, blobs=None):
+        # A heap of (expires, key) tuples. Entries are removed lazily so the
+        # heap may contain entries for deleted or updated items.
+        self._expiry = []
+        # Maps the keys of items that expire to their current expiry time.
+        self._expiring = {}
+        # Maps publisher ids to the set of keys of their items (None until
+        # first needed).
+        self._by_publisher = None
+        # Caches the publisher id of each public key.
+        self._publisher_ids = {}
+        # The ordered index of keys (None until first needed).
+        self._sorted_keys = None
+        # The (optional) BlobStore holding shared copies of large values.
+        self.blobs = blobs
+        # Maps keys to the digest of their value in the blob store.
+        self._blob_digests = {}
+
     def __delitem__(self, key):
         '''
         Remove an item from the data store.
@@ -67,12 +152,204 @@ class DataStore(MutableMapping):
             item = self._get_item(key)
         else:
             item = False
+        value = self._share_value(key, value)
         updated_on = time.time()
         if item:
             # Need to keep the last access time if the item already exists.
             self._set_item(key, (value, updated_on, item[2]))
         else:
             self._set_item(key, (value, updated_on, 0.0))
+        self._index_item(key, value)
+
+    def load_item(self, key, value, updated, accessed):
+        """
+        Stores the value at key with the given last-update and last-access
+        times (for example, when restoring items from a snapshot).
+        """
+        value = self._share_value(key, value)
+        self._set_item(key, (value, updated, accessed))
+        self._index_item(key, value)
+
+    def _index_item(self, key, value):
+        """
+        Updates the indexes with the item (value) just stored at key.
+        """
+        self._index_expiry(key, getattr(value, 'expires', 0.0))
+        self._index_publisher(key, getattr(value, 'public_key', None))
+        if self._sorted_keys is not None:
+            self._sorted_keys.add(key)
+
+    def _unindex_item(self, key):
+        """
+        Removes the key (whose item is about to be deleted) from the indexes.
+        """
+        digest = self._blob_digests.pop(key, None)
+        if digest is not None:
+            self.blobs.release(digest)
+        self._unindex_publisher(key)
+        if self._sorted_keys is not None:
+            self._sorted_keys.discard(key)
+
+    def range(self, lower=None, upper=None):
+        """
+        Returns an iterator over the keys greater than or equal to lower and
+        less than upper, in order (None means there is no bound). The data
+        store must not be changed while iterating.
+        """
+        if self._sorted_keys is None:
+            self._sorted_keys = SortedKeyList(self.keys())
+        return self._sorted_keys.irange(lower, upper)
+
+    def closest(self, target, count):
+        """
+        Returns an iterator over (up to) count keys in order of their XOR
+        distance from target. The data store must not be changed while
+        iterating.
+        """
+        return islice(closest_keys(self.range, target), count)
+
+    def _share_value(self, key, item):
+        """
+        Returns the item (about to be stored at key) with its value replaced
+        by the shared copy held in the blob store (if there is one and the
+        value is large enough). Releases the value of any item previously
+        stored at key.
+        """
+        if self.blobs is None:
+            return item
+        previous = self._blob_digests.pop(key, None)
+        shared = self.blobs.add(item.value)
+        if shared is not None:
+            digest, value = shared
+            self._blob_digests[key] = digest
+            if value is not item.value:
+                item = item._replace(value=value)
+        if previous is not None:
+            self.blobs.release(previous)
+        return item
+
+    def value_digest(self, key):
+        """
+        Returns the digest of the value of the item stored at key if the
+        value is held in the blob store (otherwise None).
+        """
+        return self._blob_digests.get(key)
+
+    def _index_expiry(self, key, expires):
+        """
+        Records the expiry time of the item stored at key (an expiry of 0 or
+        less means the item never expires).
+        """
+        if expires > 0.0:
+            if self._expiring.get(key) != expires:
+                self._expiring[key] = expires
+                heapq.heappush(self._expiry, (expires, key))
+        else:
+            self._expiring.pop(key, None)
+
+    def purge_expired(self, now=None, limit=EXPIRY_SWEEP_SIZE):
+        """
+        Deletes up to limit items that expired before now (defaults to the
+        current time). Returns a list of the deleted keys.
+        """
+        if now is None:
+            now = time.time()
+        purged = []
+        while self._expiry and len(purged) < limit:
+            expires, key = self._expiry[0]
+            if expires >= now:
+                break
+            heapq.heappop(self._expiry)
+            if self._expiring.get(key) != expires:
+                # The item was updated with a different expiry time.
+                continue
+            del self._expiring[key]
+            if key in self:
+                del self[key]
+                purged.append(key)
+        return purged
+
+    def publisher_id(self, public_key):
+        """
+        Returns the id (the network id derived from the public key) of the
+        publisher with the given public key.
+        """
+        result = self._publisher_ids.get(public_key)
+        if result is None:
+            result = sha512(public_key.encode('ascii')).hexdigest()
+            self._publisher_ids[public_key] = result
+        return result
+
+    def _publisher_index(self):
+        """
+        Returns the dictionary mapping publisher ids to the set of keys of
+        their items, building it (by loading every item) if required.
+        """
+        if self._by_publisher is None:
+            self._by_publisher = {}
+            for key in list(self.keys()):
+                public_key = self[key].public_key
+                self._by_publisher.setdefault(
+                    self.publisher_id(public_key), set()).add(key)
+        return self._by_publisher
+
+    def _index_publisher(self, key, public_key):
+        """
+        Adds the key to the publisher index (if it has been built).
+        """
+        if self._by_publisher is None or public_key is None:
+            return
+        self._by_publisher.setdefault(self.publisher_id(public_key),
+                                      set()).add(key)
+
+    def _unindex_publisher(self, key):
+        """
+        Removes the key (that is about to be deleted) from the publisher
+        index (if it has been built).
+        """
+        if self._by_publisher is None or key not in self:
+            return
+        publisher_id = self.publisher_id(self[key].public_key)
+        keys = self._by_publisher.get(publisher_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_publisher[publisher_id]
+
+    def publisher_keys(self, publisher_id):
+        """
+        Returns a list of the keys of the items published by the publisher
+        with the given id.
+        """
+        return list(self._publisher_index().get(publisher_id, ()))
+
+    def count_published(self, publisher_id):
+        """
+        Returns the number of items published by the publisher with the given
+        id.
+        """
+        return len(self._publisher_index().get(publisher_id, ()))
+
+    def publisher_counts(self):
+        """
+        Returns a dictionary mapping the id of every publisher to the number
+        of their items in the data store.
+        """
+        return dict((publisher_id, len(keys)) for publisher_id, keys in
+                    self._publisher_index().items())
+
+    def export_published(self, publisher_id):
+        """
+        Returns a list of dictionaries (that can be serialised into JSON)
+        containing the fields of each item published by the publisher with
+        the given id.
+        """
+        result = []
+        for key in self.publisher_keys(publisher_id):
+            item = self[key]
+            result.append(dict((field, getattr(item, field))
+                               for field in ITEM_FIELDS))
+        return result
 
     def keys(self):
         """
@@ -91,6 +368,16 @@ class DataStore(MutableMapping):
         item = self._get_item(key)
         self._set_item(key, (item[0], item[1], accessed_on))
 
+    def refresh(self, key):
+        """
+        Updates the last-update timestamp associated with the key/value pair
+        without changing the stored item (for example, when an identical copy
+        of the item is stored again).
+        """
+        updated_on = time.time()
+        item = self._get_item(key)
+        self._set_item(key, (item[0], updated_on, item[2]))
+
     def updated(self, key):
         """
         Get the timestamp when a key/value pair identified by the key were
@@ -140,13 +427,15 @@ class DictDataStore(DataStore):
     A datastore using Python's in-memory dictionary.
     """
 
-    def __init__(self):
+    def __init__(self, blobs=None):
+        super(DictDataStore, self).__init__(blobs)
         self._dict = {}
 
     def __delitem__(self, key):
         """
         Delete the specified key (and its value)
         """
+        self._unindex_item(key)
         del self._dict[key]
 
     def __iter__(self):
@@ -178,3 +467,753 @@ class DictDataStore(DataStore):
         Get a named value from the data store.
         """
         return self._dict[key]
+
+
+class BoundedDataStore(DictDataStore):
+    """
+    An in-memory datastore that holds no more than (approximately) max_bytes
+    bytes of items. The size of each item is the length of its JSON
+    serialisation (as sent down the wire).
+
+    When over budget, items are evicted until the store is back under
+    LOW_WATER_MARK of its budget. Items whose keys are furthest (in XOR
+    distance) from the local node's network_id are evicted first and, at the
+    same distance (within the same power of two), the least recently
+    accessed. Items for which the local node is amongst the K closest known
+    nodes to the key are never evicted (so the store may exceed its budget
+    if it only holds such items): these are the items the local node is
+    responsible for rather than items cached on their way elsewhere.
+
+    Eviction is only attempted when storing an item grows the store beyond
+    its budget (touching or refreshing an item never does). The eviction
+    order is kept up to date in a heap as items are stored and accessed,
+    with superseded entries discarded as they're popped, so a pass costs
+    time in proportion to the items it looks at rather than the whole store.
+    If a pass can't get back under the low water mark (because the local
+    node is responsible for the remaining items) the store waits until
+    another low water mark's worth of items has been stored before trying
+    again.
+    """
+
+    def __init__(self, max_bytes, network_id, routing_table, metrics=None,
+                 blobs=None):
+        """
+        The network_id and routing_table belong to the local node and are
+        used to decide which items may be evicted. The optional metrics
+        argument is a MetricsRegistry to which evictions are reported. The
+        optional blobs argument is a BlobStore in which to share large
+        values.
+        """
+        super(BoundedDataStore, self).__init__(blobs)
+        self.max_bytes = max_bytes
+        self.network_id = network_id
+        self.routing_table = routing_table
+        self.metrics = metrics
+        # Maps keys to the size of their items.
+        self.sizes = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._local_id = int(network_id, 16)
+        # A heap of (rank, accessed, key) tuples in eviction order. Entries
+        # whose accessed time no longer matches the item are superseded.
+        self._order = []
+        # The number of bytes the store must grow beyond before eviction is
+        # attempted again after a pass that couldn't evict enough (or None).
+        self._stalled = None
+
+    def __delitem__(self, key):
+        """
+        Delete the specified key (and its value).
+        """
+        super(BoundedDataStore, self).__delitem__(key)
+        size = self.sizes.pop(key)
+        self.bytes -= size
+        if self._stalled is not None:
+            self._stalled -= size
+
+    def _rank(self, key):
+        """
+        Returns the position of the key in the eviction order by distance
+        from the local node (the further the key, the lower the rank).
+        """
+        return -(int(key, 16) ^ self._local_id).bit_length()
+
+    def _set_item(self, key, value):
+        """
+        Set the value of the key/value pair identified by key, evicting other
+        items if the store has grown beyond its budget.
+        """
+        current = self._dict.get(key)
+        grown = False
+        if current is None or current[0] is not value[0]:
+            # Only measure the item if it has changed (rather than been
+            # touched).
+            size = len(json.dumps(to_dict(value[0])))
+            grown = size > self.sizes.get(key, 0)
+            self.bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+        self._dict[key] = value
+        if current is None or current[2] != value[2]:
+            heapq.heappush(self._order, (self._rank(key), value[2], key))
+            if len(self._order) > 2 * len(self._dict) + 64:
+                self._order = [(self._rank(k), v[2], k)
+                               for k, v in self._dict.items()]
+                heapq.heapify(self._order)
+        if grown and self.bytes > self.max_bytes and (
+                self._stalled is None or self.bytes > self._stalled):
+            self.evict(keep=key)
+
+    def is_responsible(self, key):
+        """
+        Returns a boolean indication of whether the local node is amongst
+        the K closest nodes it knows about to the key.
+        """
+        closest = self.routing_table.find_close_nodes(key)
+        if len(closest) < K:
+            return True
+        furthest = distance(closest[-1].network_id, key)
+        return distance(self.network_id, key) < furthest
+
+    def eviction_order(self):
+        """
+        Returns an iterator over the keys in the order in which they should
+        be evicted (ignoring responsibility).
+        """
+        for rank, accessed, key in sorted(self._order):
+            if self._current(key, accessed):
+                yield key
+
+    def _current(self, key, accessed):
+        """
+        Returns a boolean indication of whether an entry in the eviction
+        order for the key with the accessed time hasn't been superseded.
+        """
+        value = self._dict.get(key)
+        return value is not None and value[2] == accessed
+
+    def evict(self, keep=None):
+        """
+        Evicts items (that the local node isn't responsible for) until the
+        store is back under LOW_WATER_MARK of its budget. The optional keep
+        argument is a key that must not be evicted (the item that has just
+        been stored). Returns a list of the evicted keys.
+        """
+        target = self.max_bytes * LOW_WATER_MARK
+        evicted = []
+        kept = []
+        while self._order and self.bytes > target:
+            entry = heapq.heappop(self._order)
+            rank, accessed, key = entry
+            if not self._current(key, accessed):
+                continue
+            if key == keep or self.is_responsible(key):
+                kept.append(entry)
+                continue
+            size = self.sizes[key]
+            del self[key]
+            evicted.append(key)
+            self.evictions += 1
+            self.evicted_bytes += size
+        for entry in kept:
+            heapq.heappush(self._order, entry)
+        if self.bytes > target:
+            self._stalled = self.bytes + self.max_bytes - target
+        else:
+            self._stalled = None
+        if evicted and self.metrics:
+            self.metrics.increment('storage.evictions', len(evicted))
+        return evicted
+
+    def stats(self):
+        """
+        Returns a dictionary describing the occupancy of the store and the
+        evictions so far that can be serialised into JSON.
+        """
+        return {
+            'items': len(self._dict),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'occupancy': self.bytes / self.max_bytes,
+            'evictions': self.evictions,
+            'evicted_bytes': self.evicted_bytes,
+        }
+
+
+class Record(object):
+    """
+    The compact representation of an item held by a CompactDataStore (the
+    key is only held by the data store's dictionary). The signature is held
+    as bytes and the public key is shared with all the other records from
+    the same publisher. The updated and accessed timestamps are updated in
+    place.
+    """
+
+    __slots__ = ('value', 'timestamp', 'expires', 'created_with',
+                 'public_key', 'name', 'signature', 'updated', 'accessed')
+
+    def __init__(self, value, timestamp, expires, created_with, public_key,
+                 name, signature, updated, accessed):
+        self.value = value
+        self.timestamp = timestamp
+        self.expires = expires
+        self.created_with = created_with
+        self.public_key = public_key
+        self.name = name
+        self.signature = signature
+        self.updated = updated
+        self.accessed = accessed
+
+
+class CompactDataStore(DataStore):
+    """
+    An in-memory datastore that holds items as compact Record instances
+    rather than (message, updated, accessed) tuples:
+
+    * keys and signatures are held as bytes rather than hexadecimal strings,
+    * the (long) public keys of publishers are shared by all their items,
+    * touch and refresh update the record in place (without allocating).
+
+    Only the fields describing the item are kept (the envelope of the
+    message that delivered it is discarded) so items are returned as Value
+    messages rebuilt on demand.
+
+    If given a compress_threshold, values whose JSON serialisation is at
+    least that many bytes long are held compressed (unless they're shared
+    via the blob store) and decompressed whenever the item is read.
+    """
+
+    def __init__(self, blobs=None, compress_threshold=None, metrics=None):
+        """
+        The optional blobs argument is a BlobStore in which to share large
+        values. The optional metrics argument is a MetricsRegistry to which
+        the cost of compression is reported.
+        """
+        super(CompactDataStore, self).__init__(blobs)
+        self.compress_threshold = compress_threshold
+        self.metrics = metrics
+        # Maps packed keys to Record instances.
+        self._records = {}
+        # Maps public keys to the shared copy and the number of records
+        # that refer to it.
+        self._publishers = {}
+
+    def _intern_publisher(self, public_key):
+        """
+        Returns the shared copy of the public key.
+        """
+        entry = self._publishers.get(public_key)
+        if entry is None:
+            entry = [public_key, 0]
+            self._publishers[public_key] = entry
+        entry[1] += 1
+        return entry[0]
+
+    def _release_publisher(self, public_key):
+        """
+        Forgets the public key once no records refer to it.
+        """
+        entry = self._publishers[public_key]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._publishers[public_key]
+
+    def _message(self, key, record):
+        """
+        Returns a Value message containing the item held in the record.
+        """
+        return Value('', record.public_key, record.public_key, 0,
+                     record.created_with, '', key,
+                     unpack_value(record.value, self.metrics),
+                     record.timestamp, record.expires, record.created_with,
+                     record.public_key, record.name,
+                     unpack_hex(record.signature))
+
+    def __contains__(self, key):
+        return pack_hex(key) in self._records
+
+    def __delitem__(self, key):
+        """
+        Delete the specified key (and its value).
+        """
+        self._unindex_item(key)
+        record = self._records.pop(pack_hex(key))
+        self._release_publisher(record.public_key)
+
+    def __getitem__(self, key):
+        """
+        Return the item (rebuilt as a Value message) for the given key.
+        """
+        return self._message(key, self._records[pack_hex(key)])
+
+    def __iter__(self):
+        """
+        Iterates over the keys in the data store.
+        """
+        for packed in list(self._records):
+            yield unpack_hex(packed)
+
+    def __len__(self):
+        """
+        Returns the number of items in the data store.
+        """
+        return len(self._records)
+
+    def __setitem__(self, key, value):
+        """
+        Associate a key with a specified value keeping the last access time
+        of any existing item.
+        """
+        existing = self._records.get(pack_hex(key))
+        accessed = existing.accessed if existing else 0.0
+        value = self._share_value(key, value)
+        self._set_item(key, (value, time.time(), accessed))
+        self._index_item(key, value)
+
+    def keys(self):
+        """
+        Return a list of the keys in this data store.
+        """
+        return list(self)
+
+    def touch(self, key):
+        """
+        Updates the last-access timestamp associated with the key/value pair.
+        """
+        self._records[pack_hex(key)].accessed = time.time()
+
+    def refresh(self, key):
+        """
+        Updates the last-update timestamp associated with the key/value pair.
+        """
+        self._records[pack_hex(key)].updated = time.time()
+
+    def updated(self, key):
+        """
+        Get the timestamp when the item was last updated in this data store.
+        """
+        return self._records[pack_hex(key)].updated
+
+    def accessed(self, key):
+        """
+        Get the timestamp when the item was last accessed by the local node.
+        """
+        return self._records[pack_hex(key)].accessed
+
+    def publisher(self, key):
+        """
+        Get the public key of the original publisher of the item.
+        """
+        return self._records[pack_hex(key)].public_key
+
+    def created(self, key):
+        """
+        Get the time the item was created according to the publisher.
+        """
+        return self._records[pack_hex(key)].timestamp
+
+    def _set_item(self, key, value):
+        """
+        Set the value (a tuple of the item, updated and accessed times) of
+        the key/value pair identified by key.
+        """
+        item, updated, accessed = value
+        packed = pack_hex(key)
+        previous = self._records.get(packed)
+        if previous is not None:
+            self._release_publisher(previous.public_key)
+        value = item.value
+        if key not in self._blob_digests:
+            value = pack_value(value, self.compress_threshold, self.metrics)
+        self._records[packed] = Record(
+            value, item.timestamp, item.expires,
+            sys.intern(item.created_with),
+            self._intern_publisher(item.public_key), item.name,
+            pack_hex(item.signature), updated, accessed)
+
+    def _get_item(self, key):
+        """
+        Get the tuple of the item, updated and accessed times for the given
+        key.
+        """
+        record = self._records[pack_hex(key)]
+        return (self._message(key, record), record.updated, record.accessed)
+
+
+class SQLiteDataStore(DataStore):
+    """
+    A datastore that persists items in an SQLite database so that a node
+    that is restarted still holds the items it was responsible for.
+
+    The database is opened in WAL (write-ahead log) mode so readers don't
+    block the writer. All SQL statements are fixed strings that are prepared
+    once and re-used from the connection's statement cache. There are
+    indexes on the updated, accessed, expires and publisher columns so items
+    can be efficiently selected for republication, expiry or by publisher.
+
+    Writes (including deletions and the updates of the access time caused by
+    every read of an item) are grouped: they're held in memory (where reads
+    see them) and committed in a single transaction once batch_size writes
+    are pending, when the flush method is called or, if an event loop is
+    given, at most commit_interval seconds after the first pending write.
+    Writes that are still pending when the process dies are lost (at most a
+    few moments' worth of items which the network will re-replicate).
+    """
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS items ('
+        'key TEXT PRIMARY KEY, item TEXT NOT NULL, updated REAL NOT NULL, '
+        'accessed REAL NOT NULL, expires REAL NOT NULL, '
+        'publisher TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS items_updated ON items (updated)',
+        'CREATE INDEX IF NOT EXISTS items_accessed ON items (accessed)',
+        'CREATE INDEX IF NOT EXISTS items_expires ON items (expires)',
+        'CREATE INDEX IF NOT EXISTS items_publisher ON items (publisher)',
+    )
+    _SELECT = ('SELECT key, item, updated, accessed, expires, publisher '
+               'FROM items WHERE key = ?')
+    _EXISTS = 'SELECT 1 FROM items WHERE key = ?'
+    _UPSERT = ('INSERT OR REPLACE INTO items '
+               '(key, item, updated, accessed, expires, publisher) '
+               'VALUES (?, ?, ?, ?, ?, ?)')
+    _DELETE = 'DELETE FROM items WHERE key = ?'
+    _KEYS = 'SELECT key FROM items'
+    _EXPIRED = ('SELECT key, publisher FROM items '
+                'WHERE expires > 0 AND expires < ? ORDER BY expires LIMIT ?')
+    _COUNT = 'SELECT COUNT(*) FROM items'
+    _RANGE = 'SELECT key FROM items WHERE key >= ? AND key < ? ORDER BY key'
+    _RANGE_FROM = 'SELECT key FROM items WHERE key >= ? ORDER BY key'
+    _RANGE_TO = 'SELECT key FROM items WHERE key < ? ORDER BY key'
+    _RANGE_ALL = 'SELECT key FROM items ORDER BY key'
+    _PUBLISHERS = 'SELECT DISTINCT publisher FROM items'
+    _PUBLISHER_OF = 'SELECT publisher FROM items WHERE key = ?'
+    # The publisher queries that return rows select the leading columns of
+    # the table so pending rows can be sliced to match.
+    _PUBLISHER_KEYS = 'SELECT key FROM items WHERE publisher = ?'
+    _PUBLISHER_COUNT = 'SELECT COUNT(*) FROM items WHERE publisher = ?'
+    _PUBLISHER_COUNTS = ('SELECT publisher, COUNT(*) FROM items '
+                         'GROUP BY publisher')
+    _PUBLISHER_ITEMS = 'SELECT key, item FROM items WHERE publisher = ?'
+
+    def __init__(self, path, batch_size=BATCH_SIZE,
+                 commit_interval=COMMIT_INTERVAL, event_loop=None,
+                 compress_threshold=None, metrics=None):
+        """
+        The path is the location of the database file (use ':memory:' for a
+        temporary database). The batch_size, commit_interval and optional
+        event_loop arguments control when pending writes are committed. If
+        given a compress_threshold, items whose JSON serialisation is at
+        least that many bytes long are stored compressed (as BLOBs). The
+        optional metrics argument is a MetricsRegistry to which the cost of
+        compression is reported.
+        """
+        super(SQLiteDataStore, self).__init__()
+        self.path = path
+        self.compress_threshold = compress_threshold
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.event_loop = event_loop
+        self._connection = sqlite3.connect(path, cached_statements=256)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._connection:
+            for statement in self._SCHEMA:
+                self._connection.execute(statement)
+        # Maps keys to the row to be written (or None for a deletion).
+        self._pending = {}
+        # Maps the public keys of publishers to the change the pending writes
+        # make to the number of their items in the database.
+        self._pending_counts = {}
+        # The event loop handle of the next scheduled commit (if any).
+        self._handle = None
+        # Maps publisher ids to public keys (None until first needed).
+        self._public_keys = None
+        # Instrumentation.
+        self.commits = 0
+
+    def _write(self, key, row, publisher=_UNKNOWN):
+        """
+        Adds the write (a row or None for a deletion) to the pending writes
+        and commits them if required. The optional publisher argument is the
+        public key of the publisher of the item being replaced (or None if
+        there isn't one) if the caller already knows it, otherwise it is
+        looked up. It's used to count the pending change to the number of
+        each publisher's items (so counts don't require a commit).
+        """
+        if key in self._pending:
+            previous = self._pending[key]
+            publisher = previous[5] if previous else None
+        elif publisher is _UNKNOWN:
+            previous = self._connection.execute(self._PUBLISHER_OF,
+                                                (key, )).fetchone()
+            publisher = previous[0] if previous else None
+        new_publisher = row[5] if row else None
+        if publisher != new_publisher:
+            counts = self._pending_counts
+            if publisher is not None:
+                counts[publisher] = counts.get(publisher, 0) - 1
+            if new_publisher is not None:
+                counts[new_publisher] = counts.get(new_publisher, 0) + 1
+        self._pending[key] = row
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self.event_loop and self._handle is None:
+            self._handle = self.event_loop.call_later(self.commit_interval,
+                                                      self.flush)
+
+    def flush(self):
+        """
+        Commits all the pending writes to the database in a single
+        transaction.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = {}
+        self._pending_counts = {}
+        deletions = [(key, ) for key, row in pending.items() if row is None]
+        rows = [row for row in pending.values() if row is not None]
+        with self._connection:
+            if deletions:
+                self._connection.executemany(self._DELETE, deletions)
+            if rows:
+                self._connection.executemany(self._UPSERT, rows)
+        self.commits += 1
+
+    def close(self):
+        """
+        Commits any pending writes and closes the database.
+        """
+        self.flush()
+        self._connection.close()
+
+    def __delitem__(self, key):
+        """
+        Delete the specified key (and its value).
+        """
+        row = self._get_row(key)
+        self._write(key, None, row[5])
+
+    def __iter__(self):
+        """
+        Iterates over the keys in the data store.
+        """
+        return iter(self.keys())
+
+    def __len__(self):
+        """
+        Returns the number of items in the data store.
+        """
+        self.flush()
+        return self._connection.execute(self._COUNT).fetchone()[0]
+
+    def keys(self):
+        """
+        Return a list of the keys in this data store.
+        """
+        self.flush()
+        return [row[0] for row in self._connection.execute(self._KEYS)]
+
+    def _set_item(self, key, value):
+        """
+        Set the value (a tuple of the item, updated and accessed times) of
+        the key/value pair identified by key.
+        """
+        item, updated, accessed = value
+        self._write(key, (key, self._encode_item(item), updated, accessed,
+                          item.expires, item.public_key))
+        if self._public_keys is not None:
+            self._public_keys[self.publisher_id(item.public_key)] = \
+                item.public_key
+
+    def _encode_item(self, item):
+        """
+        Returns the contents of the item column for the item: its JSON
+        serialisation, compressed (as bytes) if it's large enough.
+        """
+        data = json.dumps(to_dict(item))
+        compressed = compress(data.encode('utf-8'), self.compress_threshold,
+                              metrics=self.metrics,
+                              name='storage.compression')
+        if compressed is None:
+            return data
+        return compressed
+
+    def _decode_item(self, data):
+        """
+        Returns the dictionary of the fields of the item held in the
+        (possibly compressed) contents of the item column.
+        """
+        if isinstance(data, bytes):
+            data = decompress(data, metrics=self.metrics,
+                              name='storage.compression').decode('utf-8')
+        return json.loads(data)
+
+    def _get_row(self, key):
+        """
+        Returns the (possibly pending) row for the given key. Raises a
+        KeyError if the key isn't in the data store.
+        """
+        if key in self._pending:
+            row = self._pending[key]
+        else:
+            row = self._connection.execute(self._SELECT, (key, )).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def _get_item(self, key):
+        """
+        Get the tuple of the item, updated and accessed times for the given
+        key. Raises a KeyError if the key isn't in the data store.
+        """
+        row = self._get_row(key)
+        return (from_dict(self._decode_item(row[1])), row[2], row[3])
+
+    def __contains__(self, key):
+        """
+        Returns a boolean indication of whether the key is in the data store
+        (without loading the item).
+        """
+        if key in self._pending:
+            return self._pending[key] is not None
+        return self._connection.execute(self._EXISTS,
+                                        (key, )).fetchone() is not None
+
+    def __setitem__(self, key, value):
+        """
+        Associate a key with a specified value keeping the last access time
+        of any existing item (without loading the existing item).
+        """
+        try:
+            accessed = self._get_row(key)[3]
+        except KeyError:
+            accessed = 0.0
+        self._set_item(key, (value, time.time(), accessed))
+
+    def purge_expired(self, now=None, limit=EXPIRY_SWEEP_SIZE):
+        """
+        Deletes up to limit items that expired before now (defaults to the
+        current time) using the index on the expires column (rather than an
+        in-memory heap). Returns a list of the deleted keys.
+        """
+        if now is None:
+            now = time.time()
+        self.flush()
+        rows = self._connection.execute(self._EXPIRED, (now, limit)).fetchall()
+        for key, publisher in rows:
+            self._write(key, None, publisher)
+        return [row[0] for row in rows]
+
+    def range(self, lower=None, upper=None):
+        """
+        Returns an iterator over the keys greater than or equal to lower and
+        less than upper, in order (None means there is no bound). Uses the
+        primary key index of the table.
+        """
+        self.flush()
+        if lower is None and upper is None:
+            rows = self._connection.execute(self._RANGE_ALL)
+        elif upper is None:
+            rows = self._connection.execute(self._RANGE_FROM, (lower, ))
+        elif lower is None:
+            rows = self._connection.execute(self._RANGE_TO, (upper, ))
+        else:
+            rows = self._connection.execute(self._RANGE, (lower, upper))
+        return (row[0] for row in rows)
+
+    def _public_key(self, publisher_id):
+        """
+        Returns the public key of the publisher with the given id (or None if
+        the publisher is unknown). Publishers are queried using the index on
+        the publisher column (rather than an in-memory index of keys).
+        """
+        if self._public_keys is None:
+            self._public_keys = {}
+            for row in self._connection.execute(self._PUBLISHERS):
+                self._public_keys[self.publisher_id(row[0])] = row[0]
+            for row in self._pending.values():
+                if row is not None:
+                    self._public_keys[self.publisher_id(row[5])] = row[5]
+        return self._public_keys.get(publisher_id)
+
+    def _query_publisher(self, query, publisher_id):
+        """
+        Returns the rows returned by the query for the publisher's items
+        (whose leading column is the key) with the pending writes applied
+        (rather than committing them first).
+        """
+        public_key = self._public_key(publisher_id)
+        if public_key is None:
+            return []
+        cursor = self._connection.execute(query, (public_key, ))
+        width = len(cursor.description)
+        rows = [row for row in cursor if row[0] not in self._pending]
+        for row in self._pending.values():
+            if row is not None and row[5] == public_key:
+                rows.append(row[:width])
+        return rows
+
+    def publisher_keys(self, publisher_id):
+        """
+        Returns a list of the keys of the items published by the publisher
+        with the given id.
+        """
+        return [row[0] for row in
+                self._query_publisher(self._PUBLISHER_KEYS, publisher_id)]
+
+    def count_published(self, publisher_id):
+        """
+        Returns the number of items published by the publisher with the given
+        id.
+        """
+        public_key = self._public_key(publisher_id)
+        if public_key is None:
+            return 0
+        count = self._connection.execute(self._PUBLISHER_COUNT,
+                                         (public_key, )).fetchone()[0]
+        return count + self._pending_counts.get(public_key, 0)
+
+    def publisher_counts(self):
+        """
+        Returns a dictionary mapping the id of every publisher to the number
+        of their items in the data store.
+        """
+        counts = dict(self._connection.execute(self._PUBLISHER_COUNTS))
+        for public_key, change in self._pending_counts.items():
+            counts[public_key] = counts.get(public_key, 0) + change
+        return dict((self.publisher_id(public_key), count) for
+                    public_key, count in counts.items() if count)
+
+    def export_published(self, publisher_id):
+        """
+        Returns a list of dictionaries (that can be serialised into JSON)
+        containing the fields of each item published by the publisher with
+        the given id.
+        """
+        result = []
+        for row in self._query_publisher(self._PUBLISHER_ITEMS,
+                                         publisher_id):
+            item = self._decode_item(row[1])
+            result.append(dict((field, item[field]) for field in ITEM_FIELDS))
+        return result
+
+    def touch(self, key):
+        """
+        Updates the last-access timestamp associated with the key/value pair
+        (without loading the item).
+        """
+        row = self._get_row(key)
+        self._write(key, row[:3] + (time.time(), ) + row[4:], row[5])
+
+    def refresh(self, key):
+        """
+        Updates the last-update timestamp associated with the key/value pair
+        (without loading the item).
+        """
+        row = self._get_row(key)
+        self._write(key, row[:2] + (time.time(), ) + row[3:], row[5])
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the classes used to push new versions of items to the nodes
+watching their keys rather than have those nodes poll for updates.
+
+A node watching a key sends a Subscribe message to the K closest nodes it can
+find to the key (the nodes responsible for storing the key's item). Each
+subscription is a lease: it lapses after the given number of seconds unless
+it is renewed, so nodes that leave the network (or stop watching without
+saying so) don't cost their subscribers anything for long. The watching node
+renews its subscriptions when half the lease has passed, looking up the
+closest nodes afresh so subscriptions follow changes in the network.
+
+Whenever a node stores a new version of an item it sends a Notify message
+containing the item to each of the key's subscribers. Since several nodes
+hold each item the watching node may be told of the same version more than
+once, so only versions newer than the latest it has seen are passed on.
+"""
+from .constants import (SUBSCRIPTION_LEASE, SUBSCRIPTION_LEASE_MAX,
+                        SUBSCRIPTIONS_MAX)
+from .errors import QuotaExceeded
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class Subscriptions(object):
+    """
+    Holds the subscriptions of remote peers to the keys of the items stored
+    by the local node. No lease is longer than SUBSCRIPTION_LEASE_MAX seconds
+    and no more than capacity subscriptions are held.
+    """
+
+    def __init__(self, capacity=SUBSCRIPTIONS_MAX,
+                 longest=SUBSCRIPTION_LEASE_MAX):
+        self.capacity = capacity
+        self.longest = longest
+        # Maps keys to dictionaries mapping the network IDs of subscribers to
+        # (contact, expiry time) tuples.
+        self._subscribers = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key, contact, lease, now=None):
+        """
+        Subscribes the contact to the updates of the item with the key for
+        lease seconds (at most the longest lease) from now (defaulting to the
+        current time). A subscription that already exists is renewed. Returns
+        the lease granted. Raises QuotaExceeded if there are already as many
+        subscriptions as the capacity allows.
+        """
+        if now is None:
+            now = time.time()
+        lease = min(lease, self.longest)
+        subscribers = self._subscribers.get(key, {})
+        if contact.network_id not in subscribers:
+            if self._count >= self.capacity:
+                self.expire(now)
+            if self._count >= self.capacity:
+                raise QuotaExceeded('Holding {} subscriptions'.format(
+                    self._count))
+            self._count += 1
+        subscribers[contact.network_id] = (contact, now + lease)
+        self._subscribers[key] = subscribers
+        return lease
+
+    def remove(self, key, contact):
+        """
+        Cancels the subscription of the contact to the key (if it exists).
+        """
+        subscribers = self._subscribers.get(key, {})
+        if contact.network_id in subscribers:
+            del subscribers[contact.network_id]
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[key]
+
+    def subscribers(self, key, now=None):
+        """
+        Returns a list of the contacts whose subscriptions to the key haven't
+        lapsed by now (defaulting to the current time). Lapsed subscriptions
+        are removed.
+        """
+        if now is None:
+            now = time.time()
+        result = []
+        for contact, expires in list(self._subscribers.get(key, {}).values()):
+            if expires < now:
+                self.remove(key, contact)
+            else:
+                result.append(contact)
+        return result
+
+    def expire(self, now=None):
+        """
+        Removes the subscriptions that have lapsed by now (defaulting to the
+        current time). Returns the number of subscriptions removed.
+        """
+        if now is None:
+            now = time.time()
+        count = self._count
+        for key in list(self._subscribers.keys()):
+            self.subscribers(key, now)
+        return count - self._count
+
+
+class Watch(object):
+    """
+    Represents the local node's interest in the updates of the item with the
+    key. Holds the callables to be called with each new version of the item,
+    the lease of the subscriptions, the contacts that accepted them and the
+    timestamp of the latest version seen.
+    """
+
+    def __init__(self, key, lease=SUBSCRIPTION_LEASE):
+        self.key = key
+        self.lease = lease
+        self.callbacks = []
+        # The contacts that acknowledged the latest subscriptions.
+        self.contacts = []
+        # The timestamp of the latest version of the item passed on.
+        self.timestamp = 0.0
+        # A Future that resolves with the list of contacts that acknowledged
+        # the latest subscriptions.
+        self.subscribed = None
+        # The event loop handle of the next renewal of the subscriptions.
+        self.renewal = None
+
+    def update(self, item):
+        """
+        Passes the item (a Notify message) to each callback if it's newer
+        than the latest version seen. Returns a boolean indication of
+        whether the item was passed on.
+        """
+        if item.timestamp <= self.timestamp:
+            return False
+        self.timestamp = item.timestamp
+        for callback in list(self.callbacks):
+            try:
+                callback(item)
+            except Exception as ex:
+                log.error('Problem with watch callback for {}'.format(
+                    self.key))
+                log.exception(ex)
+        return True
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the anti-entropy replica synchronisation used by nodes in "sync
+mode" as an alternative to blindly republishing every item they hold.
+
+Neighbouring nodes hold (more or less) the same items since they're amongst
+the K closest peers to the same region of the key space. Rather than resending
+every item in full to K peers each REPLICATE_INTERVAL, a node in sync mode
+sends each of its neighbours a summary of the keys and timestamps it holds in
+its neighbourhood of the key space. The summary is a shallow Merkle tree: the
+range is split into buckets by the next SYNC_BUCKET_DEPTH characters of the
+keys and each bucket is represented by a digest of its contents. The
+neighbour replies with the keys and timestamps it holds in the buckets whose
+digests differ and the local node pushes (in StoreMany messages) only the
+items the neighbour is missing or holds an older version of.
+
+Synchronisation is push only: items the neighbour holds that the local node
+doesn't are pushed when the neighbour synchronises with the local node.
+
+Items whose values are held in the local data store's blob store (large
+values) are first pushed by digest in StoreDigests messages, since the
+neighbour may already hold the same value under another key. Only the items
+whose values the neighbour reports missing are then sent in full.
+
+An item is only left to synchronisation (rather than being republished) once
+its bucket has been successfully synchronised with every neighbour within the
+last two intervals: buckets that didn't differ as soon as the neighbour
+replies and the others once the pushed items are acknowledged. If the
+neighbourhood can't be synced (for example, a neighbour doesn't respond) the
+items fall back to blind republication.
+
+To bound the work done answering a Summary, a node only answers Summaries from
+its neighbours (when it's in sync mode itself) for ranges identified by a
+prefix of at least SYNC_MIN_PREFIX_LENGTH characters, and lists at most
+SYNC_MAX_ENTRIES entries in its reply. A node whose neighbourhood is wider
+than that (in a small network) relies on republication.
+"""
+from .messages import Differences, Missing
+from .errors import BadMessage, SyncRefused
+from .validators import ITEM_FIELDS
+from .keyindex import prefix_range
+from .erasure import is_fragment
+from .constants import (SYNC_INTERVAL, SYNC_BUCKET_DEPTH, SYNC_DIGEST_LENGTH,
+                        SYNC_MIN_PREFIX_LENGTH, SYNC_MAX_ENTRIES,
+                        STORE_MANY_BATCH_SIZE, STORE_MANY_MAX_BYTES)
+from hashlib import sha512
+import asyncio
+import json
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+def payload_size(data):
+    """
+    Returns the (approximate) number of bytes needed to send the data down
+    the wire. Used to record the bandwidth used by synchronisation and
+    republication.
+    """
+    return len(json.dumps(data))
+
+
+def batch_items(items, sizes, max_items=STORE_MANY_BATCH_SIZE,
+                max_bytes=STORE_MANY_MAX_BYTES):
+    """
+    Splits the list of items into batches of no more than max_items items
+    whose sizes (looked up by key in the sizes dictionary) add up to no more
+    than max_bytes. An item bigger than max_bytes is in a batch of its own.
+    Returns a list of (batch, size) tuples.
+    """
+    result = []
+    batch = []
+    total = 0
+    for item in items:
+        size = sizes[item.key]
+        if batch and (len(batch) >= max_items or total + size > max_bytes):
+            result.append((batch, total))
+            batch = []
+            total = 0
+        batch.append(item)
+        total += size
+    if batch:
+        result.append((batch, total))
+    return result
+
+
+def common_prefix(a, b):
+    """
+    Returns the prefix shared by the two keys.
+    """
+    i = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        i += 1
+    return a[:i]
+
+
+def item_to_dict(item):
+    """
+    Returns a dictionary containing the fields of the item (a Store or Value
+    message) that describe what is stored in the DHT.
+    """
+    return dict((field, getattr(item, field)) for field in ITEM_FIELDS)
+
+
+def bucket_digests(entries, prefix, depth=SYNC_BUCKET_DEPTH,
+                   length=SYNC_DIGEST_LENGTH):
+    """
+    Given a dictionary mapping keys to timestamps (all the keys in the
+    range identified by prefix) returns a dictionary mapping the prefix of
+    each non-empty bucket to the digest of its contents.
+    """
+    buckets = {}
+    for key in sorted(entries):
+        bucket = key[:len(prefix) + depth]
+        buckets.setdefault(bucket, []).append('{}:{!r}'.format(
+            key, entries[key]))
+    result = {}
+    for bucket, lines in buckets.items():
+        digest = sha512('\n'.join(lines).encode('utf-8')).hexdigest()
+        result[bucket] = digest[:length]
+    return result
+
+
+def differing_buckets(remote, local):
+    """
+    Given the bucket digests of a remote peer and of the local node returns
+    a dictionary mapping the prefix of each bucket that differs to the local
+    digest (an empty string if the bucket is empty locally).
+    """
+    result = {}
+    for bucket in set(remote) | set(local):
+        if remote.get(bucket) != local.get(bucket):
+            result[bucket] = local.get(bucket, '')
+    return result
+
+
+class Synchroniser(object):
+    """
+    Periodically synchronises the items held by the local node with its
+    neighbours (the K closest peers in the routing table) if the local node's
+    sync_mode flag is set. Also answers the Summary messages sent by its
+    neighbours.
+    """
+
+    def __init__(self, local_node, interval=SYNC_INTERVAL,
+                 depth=SYNC_BUCKET_DEPTH, min_prefix=SYNC_MIN_PREFIX_LENGTH,
+                 max_entries=SYNC_MAX_ENTRIES):
+        """
+        The local_node is the Node instance whose items are synchronised
+        every interval seconds. The depth is the number of characters after
+        the prefix of a range used to split the range into buckets. Only
+        ranges whose prefix is at least min_prefix characters long are
+        synced and at most max_entries entries are sent in reply to a
+        Summary.
+        """
+        self.local_node = local_node
+        self.interval = interval
+        self.depth = depth
+        self.min_prefix = min_prefix
+        self.max_entries = max_entries
+        # The prefix of the range of the key space most recently synced.
+        self.prefix = None
+        # The network IDs of the neighbours most recently synced with.
+        self.neighbours = []
+        # Maps the prefixes of buckets to dictionaries mapping the network
+        # IDs of neighbours to the time of the last successful sync of the
+        # bucket with the neighbour.
+        self.synced = {}
+        # The event loop handle for the next synchronisation.
+        self.handle = None
+
+    def start(self):
+        """
+        Ensures the synchronisation happens every self.interval seconds.
+        """
+        if self.handle is None:
+            self.handle = self.local_node.event_loop.call_later(
+                self.interval, self._tick)
+
+    def stop(self):
+        """
+        Stops periodic synchronisation.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _tick(self):
+        """
+        Synchronises with the neighbours then schedules the next tick.
+        """
+        self.handle = None
+        try:
+            self.sync()
+        except Exception as ex:
+            log.error('Replica synchronisation failed')
+            log.error(ex)
+        self.start()
+
+    def covers(self, key, now=None):
+        """
+        Returns a boolean indication of whether the item at key is looked
+        after by synchronisation (so doesn't need to be blindly republished).
+        This is the case if the key's bucket has been successfully synced with
+        every neighbour within the last two intervals (before now, defaulting
+        to the current time).
+        """
+        if not (self.local_node.sync_mode and self.prefix is not None and
+                self.neighbours and key.startswith(self.prefix)):
+            return False
+        if now is None:
+            now = time.time()
+        synced = self.synced.get(key[:len(self.prefix) + self.depth], {})
+        oldest = now - 2 * self.interval
+        return all(network_id in synced and synced[network_id] >= oldest
+                   for network_id in self.neighbours)
+
+    def mark_synced(self, contact, buckets, now=None):
+        """
+        Records that the buckets (a list of prefixes) were successfully synced
+        with the contact at now (defaulting to the current time).
+        """
+        if now is None:
+            now = time.time()
+        for bucket in buckets:
+            self.synced.setdefault(bucket, {})[contact.network_id] = now
+
+    def buckets(self, prefix):
+        """
+        Returns a list of the prefixes of every bucket in the range identified
+        by prefix.
+        """
+        return [prefix + '{:0{}x}'.format(i, self.depth)
+                for i in range(16 ** self.depth)]
+
+    def neighbourhood(self):
+        """
+        Returns a tuple containing the prefix of the range of the key space
+        shared by the local node and its neighbours and the list of the
+        neighbours.
+        """
+        node = self.local_node
+        neighbours = node.routing_table.find_close_nodes(node.network_id)
+        prefix = node.network_id
+        for contact in neighbours:
+            prefix = common_prefix(prefix, contact.network_id)
+        return prefix, neighbours
+
+    def entries(self, prefix):
+        """
+        Returns a dictionary mapping the keys of the unexpired items held by
+        the local node in the range identified by prefix to their timestamps.
+        The keys are found with a range scan of the data store's ordered key
+        index (rather than by checking every key). Fragments of erasure coded
+        values are left out since they're held by a single node.
+        """
+        now = time.time()
+        result = {}
+        data_store = self.local_node.data_store
+        for key in list(data_store.range(*prefix_range(prefix))):
+            item = data_store[key]
+            if item.expires > 0.0 and item.expires < now:
+                continue
+            if is_fragment(item.name):
+                continue
+            result[key] = item.timestamp
+        return result
+
+    def sync(self):
+        """
+        If the local node is in sync mode, synchronises the items in its
+        neighbourhood with each neighbour. Returns a list of Futures (one for
+        each neighbour) each resolving with the keys pushed to the neighbour.
+        """
+        if not self.local_node.sync_mode:
+            return []
+        prefix, neighbours = self.neighbourhood()
+        if not neighbours:
+            return []
+        if len(prefix) < self.min_prefix:
+            # The neighbourhood is too wide (neighbours would refuse the
+            # Summary) so leave the items to republication.
+            log.info('Not syncing: neighbourhood "{}" too wide'.format(
+                prefix))
+            self.prefix = None
+            self.synced = {}
+            return []
+        if prefix != self.prefix:
+            # The neighbourhood has moved so forget the old buckets.
+            self.synced = {}
+        self.prefix = prefix
+        self.neighbours = [contact.network_id for contact in neighbours]
+        entries = self.entries(prefix)
+        buckets = bucket_digests(entries, prefix, self.depth)
+        log.info('Syncing {} keys under "{}" with {} neighbours'.format(
+            len(entries), prefix, len(neighbours)))
+        return [self.sync_with(contact, prefix, entries, buckets)
+                for contact in neighbours]
+
+    def sync_with(self, contact, prefix, entries, buckets):
+        """
+        Sends the summary (the bucket digests of the local entries in the
+        range identified by prefix) to the contact and pushes the items that
+        differ once the contact replies. Returns a Future that resolves with
+        the list of the pushed keys.
+        """
+        node = self.local_node
+        result = asyncio.Future()
+        uuid, task = node.send_summary(contact, prefix, buckets)
+        node.metrics.increment('sync.sessions')
+        node.metrics.increment('sync.bytes_sent', payload_size(buckets))
+
+        def on_response(task, contact=contact, prefix=prefix,
+                        entries=entries, result=result):
+            """
+            Called with the response to the Summary message. Pushes the items
+            the contact is missing (or holds an older version of).
+            """
+            if task.cancelled():
+                result.cancel()
+                return
+            if task.exception():
+                result.set_exception(task.exception())
+                return
+            response = task.result()
+            if not isinstance(response, Differences):
+                result.set_exception(ValueError(
+                    'Unexpected response: {}'.format(response)))
+                return
+            node.metrics.increment('sync.bytes_received',
+                                   payload_size(response.buckets) +
+                                   payload_size(response.entries))
+            # The buckets that don't differ are already in sync.
+            self.mark_synced(contact, [bucket for bucket
+                                       in self.buckets(prefix)
+                                       if bucket not in response.buckets])
+            length = len(prefix) + self.depth
+            result.set_result(self.push(contact, entries, response, length))
+
+        task.add_done_callback(on_response)
+        return result
+
+    def push(self, contact, entries, differences, length):
+        """
+        Sends the contact the local items in the differing buckets (whose
+        prefixes are length characters long) that the contact doesn't hold or
+        holds an older version of. Returns a list of the pushed keys. The
+        differing buckets are marked as synced with the contact once every
+        pushed item has been acknowledged.
+        """
+        node = self.local_node
+        remote = differences.entries
+        keys = []
+        for key in sorted(entries):
+            if key[:length] not in differences.buckets:
+                continue
+            if key not in remote or remote[key] < entries[key]:
+                keys.append(key)
+        data_store = node.data_store
+        items = [data_store[key] for key in keys if key in data_store]
+        inline = []
+        by_digest = []
+        for item in items:
+            if data_store.value_digest(item.key) is None:
+                inline.append(item)
+            else:
+                by_digest.append(item)
+        tasks = []
+        if inline:
+            tasks.append(self.push_items(contact, inline))
+        for i in range(0, len(by_digest), STORE_MANY_BATCH_SIZE):
+            tasks.append(self.push_digests(
+                contact, by_digest[i:i + STORE_MANY_BATCH_SIZE]))
+        node.metrics.increment('sync.items_pushed', len(items))
+        buckets = list(differences.buckets)
+        if tasks:
+
+            def on_pushed(pushed, contact=contact, buckets=buckets):
+                """
+                Called once every push has completed.
+                """
+                if not pushed.cancelled() and not pushed.exception():
+                    self.mark_synced(contact, buckets)
+
+            asyncio.gather(*tasks).add_done_callback(on_pushed)
+        else:
+            self.mark_synced(contact, buckets)
+        return [item.key for item in items]
+
+    def push_items(self, contact, items):
+        """
+        Sends the items to the contact in StoreMany messages capped by number
+        and size (see Node.send_items). Returns a Future that resolves once
+        the contact has responded to every message.
+        """
+        node = self.local_node
+        sent = node.send_items(contact, items)
+        node.metrics.increment('sync.bytes_sent',
+                               sum(size for task, size in sent))
+        if len(sent) == 1:
+            return sent[0][0]
+        return asyncio.gather(*[task for task, size in sent])
+
+    def push_digests(self, contact, items):
+        """
+        Sends the items (whose values are held in the local blob store) to
+        the contact in a StoreDigests message with each value replaced by its
+        digest. The items whose values the contact reports missing are then
+        sent in full. Returns a Future that resolves with the number of
+        values that didn't need to be sent once the contact has acknowledged
+        every item.
+        """
+        node = self.local_node
+        result = asyncio.Future()
+        digests = []
+        for item in items:
+            data = item_to_dict(item)
+            data['value'] = node.data_store.value_digest(item.key)
+            digests.append(data)
+        uuid, task = node.send_store_digests(contact, digests)
+        node.metrics.increment('sync.bytes_sent', payload_size(digests))
+
+        def on_response(task, contact=contact, items=items, result=result):
+            """
+            Called with the response to the StoreDigests message. Sends the
+            items whose values the contact doesn't hold.
+            """
+            if task.cancelled():
+                result.cancel()
+                return
+            if task.exception():
+                result.set_exception(task.exception())
+                return
+            response = task.result()
+            missing = []
+            if isinstance(response, Missing):
+                wanted = set(response.keys)
+                missing = [item for item in items if item.key in wanted]
+            skipped = len(items) - len(missing)
+            node.metrics.increment('sync.values_skipped', skipped)
+            if not missing:
+                result.set_result(skipped)
+                return
+
+            def on_sent(sent, result=result, skipped=skipped):
+                """
+                Called once the contact has responded to the messages
+                containing the missing items.
+                """
+                if sent.cancelled():
+                    result.cancel()
+                elif sent.exception():
+                    result.set_exception(sent.exception())
+                else:
+                    result.set_result(skipped)
+
+            self.push_items(contact, missing).add_done_callback(on_sent)
+
+        task.add_done_callback(on_response)
+        return result
+
+    def handle_summary(self, summary, contact):
+        """
+        Given a Summary message from the contact (a neighbour) returns a
+        tuple containing the buckets that differ (mapped to the local
+        digests) and the local entries in those buckets, ready for the reply.
+        The entries of whole buckets (in order) are included until adding
+        another bucket would exceed self.max_entries entries.
+
+        Raises SyncRefused if the local node isn't in sync mode or the
+        contact isn't one of its neighbours and BadMessage if the range is
+        too wide or the buckets don't belong to the range.
+        """
+        node = self.local_node
+        if not node.sync_mode:
+            raise SyncRefused('Not in sync mode')
+        neighbours = node.routing_table.find_close_nodes(node.network_id)
+        if contact not in neighbours:
+            raise SyncRefused('{} is not a neighbour'.format(contact))
+        prefix = summary.prefix
+        if len(prefix) < self.min_prefix:
+            raise BadMessage('Prefix "{}" too short'.format(prefix))
+        depth = len(prefix) + self.depth
+        for bucket in summary.buckets:
+            if len(bucket) != depth or not bucket.startswith(prefix):
+                raise BadMessage('Bucket "{}" not in range'.format(bucket))
+        entries = self.entries(prefix)
+        local = bucket_digests(entries, prefix, self.depth)
+        differing = differing_buckets(summary.buckets, local)
+        by_bucket = {}
+        for key, timestamp in entries.items():
+            if key[:depth] in differing:
+                by_bucket.setdefault(key[:depth], {})[key] = timestamp
+        reply = {}
+        for bucket in sorted(by_bucket):
+            if len(reply) + len(by_bucket[bucket]) > self.max_entries:
+                continue
+            reply.update(by_bucket[bucket])
+        return differing, reply
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Contains a hierarchical timing wheel used by the local node to track the
+deadlines of pending RPCs and lookups.
+
+The local node may have hundreds of thousands of such deadlines live at any
+one time, yet most of them are cancelled (because the response arrived or
+the lookup finished) long before they expire. Scheduling each one with the
+event loop's call_later would fill the loop's heap with TimerHandle
+instances (each insert costs O(log n) and cancelled handles stay in the heap
+until they reach the top). The timing wheel only ever has a single handle
+scheduled with the event loop (the next tick), inserting and cancelling a
+timer are O(1) operations and expired timers are fired in batches once per
+tick.
+"""
+import logging
+import math
+
+
+log = logging.getLogger(__name__)
+
+
+#: The default number of seconds between each tick of the wheel. Timers fire
+#: on the first tick at or after their deadline.
+RESOLUTION = 1.0
+#: The default number of slots in each level of the wheel. A timer in level
+#: n is within the span of the slots of all the levels 0..n. With a resolution
+#: of a second the defaults span over two years.
+SLOTS = (256, 64, 64, 64)
+
+
+class Timer(object):
+    """
+    A callback that is scheduled to be called by a TimerWheel when the tick
+    called "expires" is reached. Returned by TimerWheel.schedule.
+    """
+
+    __slots__ = ('wheel', 'expires', 'callback', 'args', 'slot', 'cancelled')
+
+    def __init__(self, wheel, expires, callback, args):
+        self.wheel = wheel
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        # The set (within a slot of the wheel) that currently holds the timer.
+        self.slot = None
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Ensures the timer does not fire. O(1).
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.count -= 1
+        self.callback = None
+        self.args = None
+
+
+class TimerWheel(object):
+    """
+    A hashed hierarchical timing wheel.
+
+    Level 0 has a slot for each of the next SLOTS[0] ticks. Each slot in
+    level n covers all the ticks of one revolution of level n - 1. When a
+    level has completed a revolution, the timers in the next slot of the
+    level above are "cascaded" into the lower levels.
+
+    The wheel only ticks (via the event loop) when it contains timers.
+    """
+
+    def __init__(self, event_loop, resolution=RESOLUTION, slots=SLOTS):
+        """
+        The resolution is the number of seconds between ticks and slots is a
+        sequence of the number of slots in each level of the wheel.
+        """
+        self.event_loop = event_loop
+        self.resolution = resolution
+        self.slots = tuple(slots)
+        # The number of ticks covered by each slot in each level.
+        self.granularity = []
+        granularity = 1
+        for size in self.slots:
+            self.granularity.append(granularity)
+            granularity *= size
+        # The total number of ticks covered by the wheel.
+        self.span = granularity
+        self.levels = [[set() for i in range(size)] for size in self.slots]
+        # The time from which ticks are counted.
+        self.origin = event_loop.time()
+        # The most recently processed tick.
+        self.current_tick = 0
+        # The number of live timers in the wheel.
+        self.count = 0
+        # The event loop handle for the next tick (if the wheel is running).
+        self.handle = None
+        # Instrumentation.
+        self.fired = 0
+        self.ticks = 0
+
+    def _now_tick(self):
+        """
+        Returns the number of the tick for the current time.
+        """
+        return int((self.event_loop.time() - self.origin) / self.resolution)
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedules the callback to be called with the args after at least
+        delay seconds. Returns a Timer instance that can be cancelled.
+        """
+        if self.handle is None:
+            # The wheel is empty so simply catch up with the current time.
+            self.current_tick = max(self.current_tick, self._now_tick())
+        deadline = self.event_loop.time() + delay - self.origin
+        expires = max(int(math.ceil(deadline / self.resolution)),
+                      self.current_tick + 1)
+        timer = Timer(self, expires, callback, args)
+        self._place(timer)
+        self.count += 1
+        if self.handle is None:
+            self._schedule_tick()
+        return timer
+
+    def _place(self, timer):
+        """
+        Puts the timer in the appropriate slot of the appropriate level.
+        """
+        remaining = timer.expires - self.current_tick
+        expires = timer.expires
+        for level, size in enumerate(self.slots):
+            if remaining < self.granularity[level] * size:
+                break
+        else:
+            # Too far in the future. Park the timer in the furthest slot of
+            # the top level, it'll be placed again when that slot cascades.
+            expires = self.current_tick + self.span - 1
+        index = (expires // self.granularity[level]) % self.slots[level]
+        slot = self.levels[level][index]
+        slot.add(timer)
+        timer.slot = slot
+
+    def _schedule_tick(self):
+        """
+        Asks the event loop to call the _tick method at the time of the next
+        tick.
+        """
+        when = self.origin + (self.current_tick + 1) * self.resolution
+        self.handle = self.event_loop.call_at(when, self._tick)
+
+    def _tick(self):
+        """
+        Processes all the ticks up to and including the current time, firing
+        expired timers in batches. Keeps ticking while there are live timers.
+        """
+        self.handle = None
+        now = self._now_tick()
+        while self.current_tick < now and self.count:
+            self.current_tick += 1
+            self._advance(self.current_tick)
+        if self.count:
+            self._schedule_tick()
+
+    def _advance(self, tick):
+        """
+        Cascades timers from the higher levels that are now due within the
+        lower levels, then fires the timers in the current slot of level 0.
+        """
+        self.ticks += 1
+        for level in range(len(self.slots) - 1, 0, -1):
+            if tick % self.granularity[level] == 0:
+                index = (tick // self.granularity[level]) % self.slots[level]
+                slot = self.levels[level][index]
+                if slot:
+                    self.levels[level][index] = set()
+                    for timer in slot:
+                        self._place(timer)
+        index = tick % self.slots[0]
+        batch = self.levels[0][index]
+        if batch:
+            self.levels[0][index] = set()
+            self.count -= len(batch)
+            self.fired += len(batch)
+            for timer in batch:
+                timer.slot = None
+                callback, args = timer.callback, timer.args
+                timer.cancel()
+                try:
+                    callback(*args)
+                except Exception as ex:
+                    log.error('Exception in timer callback {}'.format(
+                        callback))
+                    log.error(ex)
+
+    def stop(self):
+        """
+        Stops the wheel ticking. All the live timers are discarded.
+        """
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        for level in self.levels:
+            for slot in level:
+                for timer in slot:
+                    timer.slot = None
+                    timer.cancel()
+                slot.clear()
+        self.count = 0
@@ -14,6 +14,23 @@ def validate_timestamp(val):
     return (isinstance(val, float) and val >= 0.0)
 
 
+def validate_load(val):
+    """
+    Returns a boolean indication that a field is a valid load - a non-negative
+    floating point number of requests per second.
+    """
+    return (isinstance(val, float) and val >= 0.0)
+
+
+def validate_lease(val):
+    """
+    Returns a boolean indication that a field is a valid lease - a
+    non-negative integer number of seconds.
+    """
+    return (isinstance(val, int) and not isinstance(val, bool) and
+            val >= 0)
+
+
 def validate_port(val):
     """
     Check the port is an integer and within the valid range of allowed ports.
@@ -77,6 +94,108 @@ def validate_value(val):
     """
     return True
 
+
+def validate_keys(val):
+    """
+    Returns a boolean to indicate that a field is a non-empty list of keys
+    (string representations of sha512 hexdigests) as used by batched
+    requests that target many keys at once.
+    """
+    if isinstance(val, list) and val:
+        for key in val:
+            if not validate_string(key):
+                return False
+        return True
+    return False
+
+
+"""
+The fields that describe an item stored in the DHT. Used to check items that
+are embedded within the results of batched requests.
+"""
+ITEM_FIELDS = ('key', 'value', 'timestamp', 'expires', 'created_with',
+               'public_key', 'name', 'signature')
+
+
+def validate_item(val):
+    """
+    Returns a boolean to indicate that a dictionary contains exactly the
+    fields of an item stored in the DHT and that each field is valid.
+    """
+    if isinstance(val, dict) and len(val) == len(ITEM_FIELDS):
+        for field in ITEM_FIELDS:
+            if field not in val or not VALIDATORS[field](val[field]):
+                return False
+        return True
+    return False
+
+
+def validate_results(val):
+    """
+    Returns a boolean to indicate that a field is a dictionary containing
+    the results of a batched request. Each key in the dictionary must map to
+    either a list of nodes or a dictionary representing an item stored in the
+    DHT.
+    """
+    if isinstance(val, dict):
+        for key, result in val.items():
+            if not validate_string(key):
+                return False
+            if not (validate_nodes(result) or validate_item(result)):
+                return False
+        return True
+    return False
+
+
+def validate_items(val):
+    """
+    Returns a boolean to indicate that a field is a non-empty list of
+    dictionaries each representing a valid item stored in the DHT (as used by
+    batched Store requests).
+    """
+    if isinstance(val, list) and val:
+        for item in val:
+            if not validate_item(item):
+                return False
+        return True
+    return False
+
+
+def validate_prefix(val):
+    """
+    Returns a boolean to indicate that a field is a (possibly empty) prefix
+    of a key (a string of lowercase hexadecimal characters) identifying a
+    range of the key space.
+    """
+    return (isinstance(val, str) and len(val) <= 128 and
+            all(c in '0123456789abcdef' for c in val))
+
+
+def validate_buckets(val):
+    """
+    Returns a boolean to indicate that a field is a dictionary mapping the
+    prefixes of buckets of keys to the digests summarising their contents.
+    """
+    if isinstance(val, dict):
+        for prefix, digest in val.items():
+            if not (validate_prefix(prefix) and validate_string(digest)):
+                return False
+        return True
+    return False
+
+
+def validate_entries(val):
+    """
+    Returns a boolean to indicate that a field is a dictionary mapping keys
+    to the timestamps of the items stored at those keys.
+    """
+    if isinstance(val, dict):
+        for key, timestamp in val.items():
+            if not (validate_string(key) and validate_timestamp(timestamp)):
+                return False
+        return True
+    return False
+
 """
 Lookup for the correct validation function for each type of field a message
 may contain. Explicit is better than implicit (Zen of Python).
@@ -98,5 +217,13 @@ VALIDATORS = {
     'name': validate_string,
     'signature': validate_string,
     'nodes': validate_nodes,
+    'keys': validate_keys,
+    'results': validate_results,
+    'items': validate_items,
+    'prefix': validate_prefix,
+    'buckets': validate_buckets,
+    'entries': validate_entries,
+    'load': validate_load,
+    'lease': validate_lease,
     'reply_port': validate_port
 }
@@ -3,11 +3,22 @@
 Contains the classes used to implement HTTP connectivity. These classes
 handle the network communication "down the wire" in a way that is opaque to
 the local node (from its point of view, messages come in and messages go out).
+
+Large messages are compressed if the peer has said it accepts compressed
+requests. Every response to DHT traffic lists the accepted compression codecs
+in its ACCEPT_ENCODING header (as with the Accept-Encoding response header of
+RFC 7694) and the codec of a compressed request is given in its ENCODING
+header. Custom headers are used so HTTP libraries and proxies don't try to
+handle the compression themselves.
 """
 from ..dht.messages import to_dict, from_dict
 from ..dht.crypto import verify_item
-from ..dht.constants import DUPLICATION_COUNT
+from ..dht.constants import (DUPLICATION_COUNT, COMPRESSION_THRESHOLD,
+                             SUBSCRIPTION_LEASE)
+from ..dht.sync import item_to_dict
+from ..dht.compression import compress, decompress, CODEC
 from .connector import Connector
+from collections import OrderedDict
 from aiohttp import web
 import aiohttp
 import aiohttp.server
@@ -21,6 +32,15 @@ import os
 
 
 DEFAULT_CLEAN_INTERVAL = 60 * 15  # 15 minutes
+#: Lists the compression codecs accepted by a node.
+ACCEPT_ENCODING = 'X-Drogulus-Accept-Encoding'
+#: Names the compression codec of a compressed request.
+ENCODING = 'X-Drogulus-Encoding'
+#: The maximum size of a decompressed request.
+MAX_LENGTH = 1024 * 1024 * 12  # 12mb-ish
+#: The maximum number of peers whose accepted compression codecs are
+#: remembered (the least recently heard from are forgotten first).
+PEER_ACCEPTS_SIZE = 1024
 
 
 log = logging.getLogger(__name__)
@@ -32,9 +52,17 @@ class HttpConnector(Connector):
     of things and the local node within the DHT network.
     """
 
-    def __init__(self, event_loop, clean_interval=DEFAULT_CLEAN_INTERVAL):
+    def __init__(self, event_loop, clean_interval=DEFAULT_CLEAN_INTERVAL,
+                 compress_threshold=COMPRESSION_THRESHOLD):
         super().__init__(event_loop)
         self.lookups = {}
+        # Messages at least this many bytes long are compressed if the peer
+        # accepts compressed requests (None disables compression).
+        self.compress_threshold = compress_threshold
+        # Maps the URIs of peers to the set of compression codecs they
+        # accept (learned from their responses) in order of the latest
+        # response.
+        self.peer_accepts = OrderedDict()
         event_loop.call_later(clean_interval, self._sweep_and_clean_cache,
                               event_loop, clean_interval)
 
@@ -58,14 +86,39 @@ class HttpConnector(Connector):
     def send(self, contact, message, sender=None):
         """
         Sends the message to the referenced contact. The sender argument isn't
-        required for the HTTP implementation.
+        required for the HTTP implementation (if given, it's the local node
+        whose metrics record the cost of compression).
         """
         payload = to_dict(message)
         headers = {'content-type': 'application/json'}
-        return asyncio.Task(aiohttp.request('post',
-                                            contact.uri,
-                                            data=json.dumps(payload),
-                                            headers=headers))
+        data = json.dumps(payload)
+        if CODEC in self.peer_accepts.get(contact.uri, ()):
+            compressed = compress(data.encode('utf-8'),
+                                  self.compress_threshold,
+                                  metrics=getattr(sender, 'metrics', None),
+                                  name='wire.compression')
+            if compressed is not None:
+                data = compressed
+                headers[ENCODING] = CODEC
+        request = aiohttp.request('post', contact.uri, data=data,
+                                  headers=headers)
+        return asyncio.Task(self._learn_encodings(contact.uri, request))
+
+    @asyncio.coroutine
+    def _learn_encodings(self, uri, request):
+        """
+        Waits for the response to the request (a coroutine) to the peer at
+        the URI and notes the compression codecs the peer accepts. Only the
+        PEER_ACCEPTS_SIZE peers most recently heard from are remembered.
+        """
+        response = yield from request
+        accepted = response.headers.get(ACCEPT_ENCODING, '')
+        self.peer_accepts[uri] = set(codec.strip() for codec in
+                                     accepted.split(',') if codec.strip())
+        self.peer_accepts.move_to_end(uri)
+        while len(self.peer_accepts) > PEER_ACCEPTS_SIZE:
+            self.peer_accepts.popitem(last=False)
+        return response
 
     @asyncio.coroutine
     def receive(self, raw, sender, local_node):
@@ -211,6 +264,14 @@ class ApplicationHandler:
         try:
             raw_data = yield from request.read()
             peer = request.transport.get_extra_info('peername')[0]
+            encoding = request.headers.get(ENCODING)
+            if encoding == CODEC:
+                raw_data = decompress(raw_data, MAX_LENGTH,
+                                      getattr(self.local_node, 'metrics',
+                                              None),
+                                      'wire.compression')
+            elif encoding:
+                raise ValueError('Unknown encoding: {}'.format(encoding))
             log.info(peer)
             log.info(raw_data)
             result = yield from self.connector.receive(raw_data, peer,
@@ -222,8 +283,11 @@ class ApplicationHandler:
             log.error(ex)
             raise web.HTTPInternalServerError
         raw_output = json.dumps(data).encode('utf-8')
-        return web.Response(body=raw_output, status=200,
-                            content_type='application/json')
+        response = web.Response(body=raw_output, status=200,
+                                content_type='application/json')
+        if self.connector.compress_threshold is not None:
+            response.headers[ACCEPT_ENCODING] = CODEC
+        return response
 
     @asyncio.coroutine
     def home(self, request):
@@ -316,41 +380,58 @@ class ApplicationHandler:
         Put simply, this co-routine never returns. It yields from the
         receive method to process incoming messages. If / when the connection
         is closed then yielding from receive will raise an exception and the
-        co-routine will complete.
+        co-routine will complete. The keys watched by the client are no
+        longer watched once the connection is closed.
         """
         ws = web.WebSocketResponse()
         ws.start(request)
         peer = request.transport.get_extra_info('peername')[0]
-        while True:
-            incoming = yield from ws.receive()
-            if incoming.tp == aiohttp.MsgType.text:
-                log.info('Incoming request from {}'.format(peer))
-                log.info(incoming)
-                if incoming.data == 'close':
-                    yield from ws.close()
-                else:
-                    try:
-                        message = json.loads(incoming.data)
-                        msg_type = message.get('type', None)
-                        if msg_type == 'get':
-                            self.websoc_handle_get(ws, message)
-                        elif msg_type == 'set':
-                            self.websoc_handle_set(ws, message)
-                        # Ignore all other types of message over the websocket.
-                        # Whereof one cannot speak, thereof one must be silent.
-                    except Exception as ex:
-                        error_msg = 'WEBSOCKET bad data from {}'.format(peer)
-                        log.error(error_msg)
-                        log.error(incoming.data)
-                        log.error(ex)
-                        yield from ws.send_str(json.dumps({'error': True}))
-            elif incoming.tp == aiohttp.MsgType.close:
-                log.info('Websocket with {} closed'.format(peer))
-            elif incoming.tp == aiohttp.MsgType.closed:
-                break
-            elif incoming.tp == aiohttp.MsgType.error:
-                log.error('Websocket connection closed with error')
-                log.error(ws.exception())
+        # Maps the keys watched by the client to the callbacks that push
+        # updates down the web-socket.
+        watches = {}
+        try:
+            while True:
+                incoming = yield from ws.receive()
+                if incoming.tp == aiohttp.MsgType.text:
+                    log.info('Incoming request from {}'.format(peer))
+                    log.info(incoming)
+                    if incoming.data == 'close':
+                        yield from ws.close()
+                    else:
+                        try:
+                            message = json.loads(incoming.data)
+                            msg_type = message.get('type', None)
+                            if msg_type == 'get':
+                                self.websoc_handle_get(ws, message)
+                            elif msg_type == 'set':
+                                self.websoc_handle_set(ws, message)
+                            elif msg_type == 'watch':
+                                self.websoc_handle_watch(ws, message,
+                                                         watches)
+                            elif msg_type == 'unwatch':
+                                self.websoc_handle_unwatch(ws, message,
+                                                           watches)
+                            # Ignore all other types of message over the
+                            # websocket. Whereof one cannot speak, thereof
+                            # one must be silent.
+                        except Exception as ex:
+                            error_msg = 'WEBSOCKET bad data from {}'.format(
+                                peer)
+                            log.error(error_msg)
+                            log.error(incoming.data)
+                            log.error(ex)
+                            yield from ws.send_str(json.dumps(
+                                {'error': True}))
+                elif incoming.tp == aiohttp.MsgType.close:
+                    log.info('Websocket with {} closed'.format(peer))
+                elif incoming.tp == aiohttp.MsgType.closed:
+                    break
+                elif incoming.tp == aiohttp.MsgType.error:
+                    log.error('Websocket connection closed with error')
+                    log.error(ws.exception())
+        finally:
+            for key, callback in watches.items():
+                self.local_node.unwatch(key, callback)
 
     def websoc_handle_get(self, web_socket, message):
         """
@@ -432,6 +513,67 @@ class ApplicationHandler:
         setter = self.connector.async_set(self.local_node, message)
         setter.add_done_callback(handle_setter)
 
+    def websoc_handle_watch(self, web_socket, message, watches):
+        """
+        Handles incoming DHT WATCH messages on the referenced web_socket. Each
+        new version of the item with the key is pushed to the client (rather
+        than the client polling for it with forced GET requests) until the
+        client sends an UNWATCH message or closes the connection. The
+        optional lease (in seconds) is how long each subscription with the
+        nodes responsible for the key lasts before it is renewed. The watches
+        dictionary maps the keys watched by the client to their callbacks.
+        """
+        key = message['key']
+        log.info('Websocket WATCH for {}'.format(key))
+        if key in watches:
+            # Already watched by this client.
+            return
+
+        def handle_update(item, ws=web_socket):
+            """
+            Push the new version of the item to the client.
+            """
+            msg = {
+                'key': key,
+                'status': 'updated',
+                'item': item_to_dict(item),
+            }
+            ws.send_str(json.dumps(msg))
+
+        def handle_subscribed(subscribed, ws=web_socket):
+            """
+            Tell the client how many nodes will push updates. If there are
+            any errors, these will be logged by the local_node.
+            """
+            try:
+                result = {
+                    'key': key,
+                    'watching': len(subscribed.result())
+                }
+            except Exception:
+                result = {'key': key, 'error': True}
+            finally:
+                ws.send_str(json.dumps(result))
+
+        lease = message.get('lease', SUBSCRIPTION_LEASE)
+        if not (isinstance(lease, int) and lease > 0):
+            raise ValueError('Bad lease: {}'.format(lease))
+        watches[key] = handle_update
+        subscribed = self.local_node.watch(key, handle_update, lease)
+        subscribed.add_done_callback(handle_subscribed)
+
+    def websoc_handle_unwatch(self, web_socket, message, watches):
+        """
+        Handles incoming DHT UNWATCH messages on the referenced web_socket.
+        Stops pushing new versions of the item with the key to the client.
+        """
+        key = message['key']
+        log.info('Websocket UNWATCH for {}'.format(key))
+        callback = watches.pop(key, None)
+        if callback is not None:
+            self.local_node.unwatch(key, callback)
+        web_socket.send_str(json.dumps({'key': key, 'watching': 0}))
+
 
 def make_http_handler(event_loop, connector, local_node):
     """
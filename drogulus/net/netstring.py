@@ -3,8 +3,18 @@
 Contains the classes used to implement the Netstring protocol. These classes
 handle the network communication "down the wire" in a way that is opaque to
 the local node (from its point of view, messages come in and messages go out).
+
+Large messages are compressed if the peer at the other end of the connection
+has said it accepts compressed netstrings. Each end of a connection announces
+the compression codecs it accepts (in an ACCEPT netstring) before it first
+sends a large message, or in reply to the other end's announcement.
+Compressed messages are sent as netstrings starting with COMPRESSED. Peers
+that don't understand these netstrings log and ignore them (they're not
+valid JSON) so never receive compressed messages.
 """
 from ..dht.messages import to_dict, from_dict
+from ..dht.compression import compress, decompress, CODEC
+from ..dht.constants import COMPRESSION_THRESHOLD
 from .connector import Connector
 from hashlib import sha512
 import urllib.parse
@@ -15,7 +25,12 @@ import re
 
 
 LENGTH, DATA, COMMA = range(3)
-NUMBER = re.compile('(\d*)(:?)')
+NUMBER = re.compile(b'(\\d*)(:?)')
+#: Starts a netstring announcing the (comma separated) compression codecs
+#: accepted by the sender.
+ACCEPT = b'!accept:'
+#: Starts a netstring containing a compressed message.
+COMPRESSED = '!{}:'.format(CODEC).encode('ascii')
 
 
 log = logging.getLogger(__name__)
@@ -50,6 +65,9 @@ class NetstringProtocol(asyncio.Protocol):
     """
 
     MAX_LENGTH = 1024 * 1024 * 12  # 12mb-ish
+    #: Messages at least this many bytes long are compressed (if the peer
+    #: accepts compressed netstrings). None disables compression.
+    COMPRESSION_THRESHOLD = COMPRESSION_THRESHOLD
 
     def __init__(self, connector, node):
         """
@@ -60,6 +78,32 @@ class NetstringProtocol(asyncio.Protocol):
         self._node = node
         self._reader_state = LENGTH
         self._reader_length = 0
+        # Flag to show the accepted codecs have been announced to the peer.
+        self._announced = False
+        # The compression codecs accepted by the peer.
+        self.peer_accepts = set()
+
+    def frame_received(self, data):
+        """
+        Handles the raw bytes of a complete netstring: announcements of the
+        peer's accepted codecs, compressed messages and plain messages.
+        """
+        if data.startswith(ACCEPT):
+            codecs = data[len(ACCEPT):].decode('ascii').split(',')
+            self.peer_accepts = set(codecs)
+            if not self._announced:
+                self.announce()
+            return
+        if data.startswith(COMPRESSED):
+            data = decompress(data[len(COMPRESSED):], self.MAX_LENGTH,
+                              self._metrics(), 'wire.compression')
+        self.string_received(data.decode('utf-8'))
+
+    def _metrics(self):
+        """
+        Returns the local node's MetricsRegistry (if it has one).
+        """
+        return getattr(self._node, 'metrics', None)
 
     def string_received(self, data):
         """
@@ -85,7 +129,7 @@ class NetstringProtocol(asyncio.Protocol):
         self.__buffer = self.__buffer + buff
         if self._reader_length != 0:
             return
-        self.string_received(self.__buffer.decode('utf-8'))
+        self.frame_received(self.__buffer)
         self._reader_state = COMMA
 
     def handle_comma(self):
@@ -101,7 +145,7 @@ class NetstringProtocol(asyncio.Protocol):
         """
         Process the incoming data if the current status is LENGTH.
         """
-        m = NUMBER.match(self.__data.decode('utf-8'))
+        m = NUMBER.match(self.__data)
         if not m.end():
             raise NetstringParseError(repr(self.__data))
         self.__data = self.__data[m.end():]
@@ -129,17 +173,42 @@ class NetstringProtocol(asyncio.Protocol):
                 else:
                     msg = 'Netstring mode is not DATA, COMMA or LENGTH'
                     raise RuntimeError(msg)
-        except NetstringParseError:
+        except (NetstringParseError, ValueError):
             self.transport.close()
 
+    def send_frame(self, data):
+        """
+        Sends the bytes as a netstring to the node at the other end of
+        self.transport.
+        """
+        self.transport.write('{}:'.format(len(data)).encode('ascii') +
+                             data + b',')
+
+    def announce(self):
+        """
+        Tells the peer which compression codecs are accepted.
+        """
+        self._announced = True
+        self.send_frame(ACCEPT + CODEC.encode('ascii'))
+
     def send_string(self, data):
         """
         Encodes and sends a string of data to the node at the other end of
-        self.transport.
+        self.transport. Large strings are compressed if the peer accepts
+        compressed netstrings.
         """
-        length = len(data.encode('utf-8'))
-        output = '{}:{},'.format(length, data)
-        self.transport.write(output.encode('utf-8'))
+        raw = data.encode('utf-8')
+        threshold = self.COMPRESSION_THRESHOLD
+        if threshold is not None and len(raw) >= threshold:
+            if not self._announced:
+                self.announce()
+            if CODEC in self.peer_accepts:
+                compressed = compress(raw, threshold,
+                                      metrics=self._metrics(),
+                                      name='wire.compression')
+                if compressed is not None:
+                    raw = COMPRESSED + compressed
+        self.send_frame(raw)
 
 
 class NetstringConnector(Connector):
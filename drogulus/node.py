@@ -3,9 +3,14 @@
 Contains the class that defines a node in the drogulus network.
 """
 from .dht.node import Node
-from .dht.constants import DUPLICATION_COUNT, EXPIRY_DURATION
+from .dht.constants import (DUPLICATION_COUNT, EXPIRY_DURATION,
+                            CHUNK_CONCURRENCY, SUBSCRIPTION_LEASE)
 from .dht.crypto import construct_key, get_signed_item
+from .dht.chunking import store_chunked, retrieve_chunked
+from .dht.erasure import (store_coded, retrieve_coded, repair_coded,
+                          check_name)
 from .version import get_version
+import asyncio
 
 
 class Drogulus:
@@ -16,7 +21,10 @@ class Drogulus:
     """
 
     def __init__(self, private_key, public_key, event_loop, connector,
-                 port=1908, whoami=None):
+                 port=1908, whoami=None, data_store=None,
+                 storage_budget=None, blob_threshold=None,
+                 compress_threshold=None, compact=False,
+                 trace_sample_rate=0.0):
         """
         The private and public keys are required for signing and verifying
         items and peers within the drogulus network. The event loop is an
@@ -24,14 +32,28 @@ class Drogulus:
         of a child class of the Connector class. The optional port argument
         indicates the port to which remote notes should connect. The optional
         whoami argument is a dictionary of arbitrary data about the local
-        node.
+        node. The optional data_store argument is the DataStore instance in
+        which the local node holds items (defaults to an in-memory store).
+        The optional storage_budget argument limits the number of bytes held
+        by the default in-memory store. If given a blob_threshold, the
+        default in-memory store holds each distinct value at least that many
+        bytes long only once (see drogulus.dht.blobstore). If the compact
+        flag is set (or given a compress_threshold) the default in-memory
+        store holds items as compact records with values at least
+        compress_threshold bytes long compressed (see CompactDataStore). The
+        trace_sample_rate is the proportion of lookups whose traces are kept
+        (see the dump_metrics method).
         """
         self.private_key = private_key
         self.public_key = public_key
         self.event_loop = event_loop
         self.connector = connector
         self._node = Node(public_key, private_key, event_loop,
-                          connector, port)
+                          connector, port, data_store, storage_budget,
+                          blob_threshold=blob_threshold,
+                          compress_threshold=compress_threshold,
+                          compact=compact,
+                          trace_sample_rate=trace_sample_rate)
         self.network_id = self._node.network_id
         if whoami:
             self.whoami = whoami
@@ -66,6 +88,14 @@ class Drogulus:
         """
         return self._node.routing_table.dump()
 
+    def dump_metrics(self):
+        """
+        Returns a dictionary of the local node's metrics (the counters,
+        histograms and sampled lookup traces) that can be serialised into
+        JSON.
+        """
+        return self._node.metrics.dump()
+
     def whois(self, public_key):
         """
         Given the public key of an entity that uses the drogulus will return a
@@ -74,17 +104,44 @@ class Drogulus:
         """
         return self.get(public_key, public_key)
 
-    def get(self, public_key, key_name):
+    def get(self, public_key, key_name, quorum=1, deadline=None):
         """
         Gets the value associated with a compound key made of the passed in
         public key and meaningful key name. Returns a future that resolves
         when the value is retrieved.
+
+        An optional "quorum" argument specifies the number of values to
+        gather from remote peers before resolving with the newest of them.
+        The optional "deadline" (in seconds) limits how long to wait for the
+        quorum to be reached.
         """
         target = construct_key(public_key, key_name)
-        return self._node.retrieve(target)
+        return self._node.retrieve(target, quorum, deadline)
+
+    def watch(self, public_key, key_name, callback,
+              lease=SUBSCRIPTION_LEASE):
+        """
+        Calls the callback with each new version of the value associated with
+        a compound key made of the passed in public key and meaningful key
+        name (rather than polling with get). Returns a future that resolves
+        with the list of remote peers that will push the new versions.
+
+        The optional "lease" (in seconds) is how long each subscription lasts
+        before it is renewed. Use unwatch to stop watching.
+        """
+        target = construct_key(public_key, key_name)
+        return self._node.watch(target, callback, lease)
+
+    def unwatch(self, public_key, key_name, callback=None):
+        """
+        Stops calling the callback with new versions of the value associated
+        with the compound key (see watch).
+        """
+        target = construct_key(public_key, key_name)
+        return self._node.unwatch(target, callback)
 
     def set(self, key_name, value, duplicate=DUPLICATION_COUNT,
-            expires=EXPIRY_DURATION):
+            expires=EXPIRY_DURATION, write_quorum=None, erasure=None):
         """
         Stores a value at a compound key made from the local node's public key
         and the passed in meaningful key name. Returns a future that resolves
@@ -98,10 +155,90 @@ class Drogulus:
         An optional expires duration (to be added to the current time) is used
         to indicate when the supplied value should be removed from the DHT.
         This defaults to the EXPIRY_DURATION setting.
+
+        An optional "write_quorum" specifies the number of remote peers that
+        must acknowledge the value. If given, the returned future resolves
+        with the list of acknowledging peers as soon as write_quorum of them
+        have done so rather than waiting for the slowest peer (see
+        drogulus.dht.replication.Replication for more information).
+
+        An optional "erasure" tuple of (k, n) stores the value as n erasure
+        coded fragments, any k of which are enough to rebuild it, rather
+        than as duplicate full copies (for example, (10, 20) takes up twice
+        the value's size rather than twenty times). Each fragment is stored
+        at the node closest to its own key and only the small manifest
+        describing the fragments is replicated to duplicate nodes. The
+        returned task resolves with the manifest (acknowledged by
+        write_quorum peers, defaulting to one) once everything is stored. Use
+        get_coded to retrieve such a value (see drogulus.dht.erasure for more
+        information).
+
+        Raises ValueError if the key name ends in ":fragment:<n>" since such
+        names are reserved for erasure coded fragments.
         """
+        check_name(key_name)
+        if erasure:
+            k, n = erasure
+            return asyncio.Task(store_coded(self._node, key_name, value, k,
+                                            n, duplicate, expires,
+                                            write_quorum or 1))
         item = get_signed_item(key_name, value, self.public_key,
                                self.private_key, expires)
         return self._node.replicate(duplicate, item['key'], item['value'],
                                     item['timestamp'], item['expires'],
                                     item['created_with'], item['public_key'],
-                                    item['name'], item['signature'])
+                                    item['name'], item['signature'],
+                                    write_quorum)
+
+    def set_chunked(self, key_name, source, duplicate=DUPLICATION_COUNT,
+                    expires=EXPIRY_DURATION, write_quorum=1,
+                    concurrency=CHUNK_CONCURRENCY):
+        """
+        Stores a value too large to send in a single message at a compound
+        key made from the local node's public key and the passed in
+        meaningful key name. The source is either bytes or a binary file-like
+        object (read a chunk at a time). Returns a task that resolves with the
+        manifest of the value once every chunk and then the manifest have
+        been stored (see drogulus.dht.chunking for more information).
+
+        The duplicate and expires arguments are as for the set method. Each
+        chunk (and the manifest) must be acknowledged by write_quorum peers.
+        No more than concurrency chunks are stored at once. Key names reserved
+        for erasure coded fragments result in a ValueError.
+        """
+        check_name(key_name)
+        return asyncio.Task(store_chunked(self._node, key_name, source,
+                                          duplicate, expires, write_quorum,
+                                          concurrency=concurrency))
+
+    def get_chunked(self, public_key, key_name, sink=None,
+                    concurrency=CHUNK_CONCURRENCY):
+        """
+        Gets a value stored with set_chunked by the entity with the public
+        key under the meaningful key name. Chunks are retrieved in parallel
+        (no more than concurrency at once). Returns a task that resolves with
+        the value as bytes or, if a sink callable (such as the write method
+        of a binary file) is given, passes each chunk to the sink in order as
+        it arrives and resolves with the length of the value.
+        """
+        return asyncio.Task(retrieve_chunked(self._node, public_key,
+                                             key_name, sink, concurrency))
+
+    def get_coded(self, public_key, key_name):
+        """
+        Gets a value stored (with the erasure argument to the set method) as
+        erasure coded fragments by the entity with the public key under the
+        meaningful key name. Fragments are retrieved in parallel. Returns a
+        task that resolves with the rebuilt value.
+        """
+        return asyncio.Task(retrieve_coded(self._node, public_key, key_name))
+
+    def repair_coded(self, key_name):
+        """
+        Checks the fragments of an erasure coded value stored by the local
+        node under the meaningful key name and stores again only the
+        fragments that have gone missing (rebuilt from the others). Returns a
+        task that resolves with the list of the indices of the repaired
+        fragments.
+        """
+        return asyncio.Task(repair_coded(self._node, key_name))
@@ -56,8 +56,52 @@ class TestStart(unittest.TestCase):
         self.assertEqual(str, parser._actions[5].type)
         self.assertEqual('', parser._actions[5].default)
         self.assertEqual('?', parser._actions[5].nargs)
+        # database
+        self.assertEqual('database', parser._actions[6].dest)
+        self.assertEqual(str, parser._actions[6].type)
+        self.assertEqual('', parser._actions[6].default)
+        self.assertEqual('?', parser._actions[6].nargs)
+        # snapshot
+        self.assertEqual('snapshot', parser._actions[7].dest)
+        self.assertEqual(str, parser._actions[7].type)
+        self.assertEqual('', parser._actions[7].default)
+        self.assertEqual('?', parser._actions[7].nargs)
+        # blob threshold
+        self.assertEqual('blob_threshold', parser._actions[8].dest)
+        self.assertEqual(int, parser._actions[8].type)
+        self.assertEqual(0, parser._actions[8].default)
+        self.assertEqual('?', parser._actions[8].nargs)
+        # compress threshold
+        self.assertEqual('compress_threshold', parser._actions[9].dest)
+        self.assertEqual(int, parser._actions[9].type)
+        self.assertEqual(0, parser._actions[9].default)
+        self.assertEqual('?', parser._actions[9].nargs)
+        # log store
+        self.assertEqual('log_store', parser._actions[10].dest)
+        self.assertEqual(str, parser._actions[10].type)
+        self.assertEqual('', parser._actions[10].default)
+        self.assertEqual('?', parser._actions[10].nargs)
+        # compact
+        self.assertEqual('compact', parser._actions[11].dest)
+        self.assertEqual(False, parser._actions[11].default)
+        # trace sample rate
+        self.assertEqual('trace_sample_rate', parser._actions[12].dest)
+        self.assertEqual(float, parser._actions[12].type)
+        self.assertEqual(0.0, parser._actions[12].default)
+        self.assertEqual('?', parser._actions[12].nargs)
+        # metrics
+        self.assertEqual('metrics', parser._actions[13].dest)
+        self.assertEqual(str, parser._actions[13].type)
+        self.assertEqual('', parser._actions[13].default)
+        self.assertEqual('?', parser._actions[13].nargs)
+        # traces
+        self.assertEqual('traces', parser._actions[14].dest)
+        self.assertEqual(str, parser._actions[14].type)
+        self.assertEqual('', parser._actions[14].default)
+        self.assertEqual('?', parser._actions[14].nargs)
 
-    def test_take_action(self):
+    @mock.patch('drogulus.commands.start.Snapshotter')
+    def test_take_action(self, patched_snapshotter):
         """
         Check, given a good case, the appropriate calls are made to start a
         local node. Should this be tested? Probably not, but since this is how
@@ -81,6 +125,16 @@ class TestStart(unittest.TestCase):
         parsed_args.whoami = whoami
         parsed_args.alias = alias
         parsed_args.peers = peers
+        parsed_args.database = ''
+        parsed_args.snapshot = 'snapshot.bin'
+        parsed_args.blob_threshold = 2048
+        parsed_args.compress_threshold = 0
+        parsed_args.log_store = ''
+        parsed_args.compact = True
+        parsed_args.trace_sample_rate = 0.5
+        parsed_args.metrics = ''
+        parsed_args.traces = ''
+        patched_snapshotter.return_value.load.return_value = None
 
         # patch logging
         with mock.patch('drogulus.commands.start.logging.getLogger',
@@ -138,8 +192,36 @@ class TestStart(unittest.TestCase):
                                                   HttpConnector)
                             self.assertEqual(called_with[4], port)
                             self.assertEqual(called_with[5], {})
+                            kwargs = patched_drogulus.call_args[1]
+                            self.assertIsNone(kwargs['data_store'])
+                            self.assertEqual(2048, kwargs['blob_threshold'])
+                            self.assertIsNone(kwargs['compress_threshold'])
+                            self.assertTrue(kwargs['compact'])
+                            self.assertEqual(0.5,
+                                             kwargs['trace_sample_rate'])
                             cc = drog._node.routing_table.dump.call_count
                             self.assertEqual(1, cc)
+                            patched_snapshotter.assert_called_once_with(
+                                drog._node, 'snapshot.bin', items=True)
+                            snapshotter = patched_snapshotter.return_value
+                            self.assertEqual(1,
+                                             snapshotter.load.call_count)
+                            self.assertEqual(1,
+                                             snapshotter.start.call_count)
+                            self.assertEqual(1,
+                                             snapshotter.save_now.call_count)
+
+    def test_take_action_database_and_log_store(self):
+        """
+        Items can't be persisted in both a database and a log store.
+        """
+        parsed_args = mock.MagicMock()
+        parsed_args.passphrase = 'passphrase'
+        parsed_args.database = 'items.db'
+        parsed_args.log_store = 'items'
+        start = Start(None, None)
+        with self.assertRaises(ValueError):
+            start.take_action(parsed_args)
 
     def test_take_action_no_passphrase(self):
         """
@@ -198,7 +280,8 @@ class TestStart(unittest.TestCase):
                         self.assertEqual(2, patched_log.call_count)
                         self.assertEqual(raised.exception.args[0], 'Boom!')
 
-    def test_take_action_no_whoami(self):
+    @mock.patch('drogulus.commands.start.Snapshotter')
+    def test_take_action_no_whoami(self, patched_snapshotter):
         """
         If no valid whoami file is specified ensure this is logged and the
         whoami value is set to None.
@@ -216,6 +299,12 @@ class TestStart(unittest.TestCase):
         parsed_args.whoami = whoami
         parsed_args.alias = alias
         parsed_args.peers = peers
+        parsed_args.database = ''
+        parsed_args.snapshot = 'snapshot.bin'
+        parsed_args.blob_threshold = 2048
+        parsed_args.compress_threshold = 0
+        parsed_args.log_store = ''
+        patched_snapshotter.return_value.load.return_value = None
 
         # patch logging
         with mock.patch('drogulus.commands.start.logging.getLogger',
@@ -260,7 +349,8 @@ class TestStart(unittest.TestCase):
                             called_with = patched_drogulus.call_args[0]
                             self.assertEqual(called_with[5], None)
 
-    def test_take_action_calls_make_http_handler(self):
+    @mock.patch('drogulus.commands.start.Snapshotter')
+    def test_take_action_calls_make_http_handler(self, patched_snapshotter):
         """
         Ensure that the make_http_handler function is called in order to set up
         the HTTP based API.
@@ -278,6 +368,12 @@ class TestStart(unittest.TestCase):
         parsed_args.whoami = whoami
         parsed_args.alias = alias
         parsed_args.peers = peers
+        parsed_args.database = ''
+        parsed_args.snapshot = 'snapshot.bin'
+        parsed_args.blob_threshold = 2048
+        parsed_args.compress_threshold = 0
+        parsed_args.log_store = ''
+        patched_snapshotter.return_value.load.return_value = None
 
         # patch logging
         with mock.patch('drogulus.commands.start.logging.getLogger',
@@ -319,7 +415,8 @@ class TestStart(unittest.TestCase):
                                                  loop.create_server.call_count)
                                 self.assertEqual(1, fake_mhh.call_count)
 
-    def test_take_action_has_peer_file_to_load(self):
+    @mock.patch('drogulus.commands.start.Snapshotter')
+    def test_take_action_has_peer_file_to_load(self, patched_snapshotter):
         """
         If the path to a peer file (containing the peer-nodes backed up from
         an existing routing table) is specified ensure this is loaded and
@@ -339,6 +436,12 @@ class TestStart(unittest.TestCase):
         parsed_args.whoami = whoami
         parsed_args.alias = alias
         parsed_args.peers = peers
+        parsed_args.database = ''
+        parsed_args.snapshot = 'snapshot.bin'
+        parsed_args.blob_threshold = 2048
+        parsed_args.compress_threshold = 0
+        parsed_args.log_store = ''
+        patched_snapshotter.return_value.load.return_value = None
 
         # patch logging
         with mock.patch('drogulus.commands.start.logging.getLogger',
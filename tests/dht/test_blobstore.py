@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the content-addressed blob store works as expected.
+"""
+from drogulus.dht.blobstore import BlobStore, serialise, value_digest
+from hashlib import sha512
+import unittest
+
+
+class TestFunctions(unittest.TestCase):
+    """
+    Ensures the module level functions work as expected.
+    """
+
+    def test_serialise(self):
+        """
+        The serialisation is compact and doesn't depend on the order of the
+        keys of dictionaries.
+        """
+        self.assertEqual(b'{"a":1,"b":[1,2]}', serialise({'b': [1, 2],
+                                                          'a': 1}))
+
+    def test_value_digest(self):
+        expected = sha512(b'{"a":1}').hexdigest()
+        self.assertEqual(expected, value_digest({'a': 1}))
+
+
+class TestBlobStore(unittest.TestCase):
+    """
+    Ensures the BlobStore class works as expected.
+    """
+
+    def setUp(self):
+        self.blobs = BlobStore(threshold=10)
+        self.value = {'text': 'a large document'}
+        self.digest = value_digest(self.value)
+
+    def test_add_small_value(self):
+        """
+        Values smaller than the threshold aren't held.
+        """
+        self.assertIsNone(self.blobs.add('tiny'))
+        self.assertEqual(0, len(self.blobs))
+
+    def test_add(self):
+        """
+        The first copy of a value is held and shared by later (equal) copies.
+        """
+        digest, shared = self.blobs.add(self.value)
+        self.assertEqual(self.digest, digest)
+        self.assertIs(self.value, shared)
+        copy = {'text': 'a large document'}
+        digest, shared = self.blobs.add(copy)
+        self.assertEqual(self.digest, digest)
+        self.assertIs(self.value, shared)
+        self.assertEqual(1, len(self.blobs))
+        self.assertEqual(2, self.blobs.references(digest))
+        self.assertIn(digest, self.blobs)
+        self.assertIs(self.value, self.blobs.get(digest))
+
+    def test_get_missing(self):
+        self.assertIsNone(self.blobs.get('foo'))
+        self.assertEqual('bar', self.blobs.get('foo', 'bar'))
+
+    def test_release(self):
+        """
+        A value is forgotten once nothing refers to it.
+        """
+        self.blobs.add(self.value)
+        self.blobs.add(self.value)
+        self.blobs.release(self.digest)
+        self.assertIn(self.digest, self.blobs)
+        self.blobs.release(self.digest)
+        self.assertNotIn(self.digest, self.blobs)
+        self.assertEqual(0, self.blobs.bytes)
+        self.assertEqual(0, self.blobs.references(self.digest))
+
+    def test_stats(self):
+        size = len(serialise(self.value))
+        self.blobs.add(self.value)
+        self.blobs.add(self.value)
+        self.blobs.add(self.value)
+        expected = {
+            'blobs': 1,
+            'bytes': size,
+            'saved_bytes': 2 * size,
+        }
+        self.assertEqual(expected, self.blobs.stats())
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the storing and retrieval of chunked values works as expected.
+"""
+from drogulus.dht.chunking import (read_chunks, encode_chunk, decode_chunk,
+                                   check_manifest, chunk_name, store_chunked,
+                                   retrieve_chunked, MANIFEST_VERSION)
+from drogulus.dht.node import Node
+from drogulus.dht.messages import from_dict
+from drogulus.dht.crypto import construct_key, verify_item
+from drogulus.dht.errors import BadChunk, ValueNotFound
+from drogulus.version import get_version
+from ..keys import PRIVATE_KEY, PUBLIC_KEY
+from hashlib import sha512
+import asyncio
+import io
+import unittest
+
+
+class FakeConnector:
+    """
+    Pretends to be a connector for sending messages to remote nodes.
+    """
+
+    def send(self, contact, message, sender):
+        return asyncio.Future()
+
+
+class FakeNetwork:
+    """
+    Pretends to be the rest of the DHT: items replicated by the node are
+    held in a dictionary from which they're retrieved. Requests complete on
+    the next iteration of the event loop and the greatest number in flight
+    at once is recorded.
+    """
+
+    def __init__(self, node):
+        self.items = {}
+        # The keys of the items in the order they were stored.
+        self.stored = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_stores = False
+        node.replicate = self.replicate
+        node.retrieve = self.retrieve
+
+    def _complete(self, future, result=None, exception=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        def done():
+            self.in_flight -= 1
+            if future.cancelled():
+                return
+            if exception:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+        asyncio.get_event_loop().call_soon(done)
+        return future
+
+    def replicate(self, duplicate, key, value, timestamp, expires,
+                  created_with, public_key, name, signature,
+                  write_quorum=None):
+        if self.fail_stores:
+            return self._complete(asyncio.Future(),
+                                  exception=ValueError('Bang'))
+        item = {
+            'key': key,
+            'value': value,
+            'timestamp': timestamp,
+            'expires': expires,
+            'created_with': created_with,
+            'public_key': public_key,
+            'name': name,
+            'signature': signature,
+        }
+        assert verify_item(item)
+        message = dict(item, uuid='uuid', sender=PUBLIC_KEY,
+                       recipient=PUBLIC_KEY, reply_port=1908,
+                       version=get_version(), seal='seal', message='store')
+        self.items[key] = from_dict(message)
+        self.stored.append(key)
+        return self._complete(asyncio.Future(), result=[])
+
+    def retrieve(self, key):
+        if key in self.items:
+            return self._complete(asyncio.Future(), result=self.items[key])
+        return self._complete(asyncio.Future(),
+                              exception=ValueNotFound(key))
+
+
+def make_data(size):
+    """
+    Returns size bytes of data whose chunks (of any size) mostly differ.
+    """
+    result = b''
+    i = 0
+    while len(result) < size:
+        result += sha512(str(i).encode('ascii')).digest()
+        i += 1
+    return result[:size]
+
+
+class TestFunctions(unittest.TestCase):
+    """
+    Ensures the module level functions work as expected.
+    """
+
+    def test_read_chunks_bytes(self):
+        self.assertEqual([b'abc', b'def', b'g'],
+                         list(read_chunks(b'abcdefg', 3)))
+        self.assertEqual([], list(read_chunks(b'', 3)))
+
+    def test_read_chunks_file(self):
+        source = io.BytesIO(b'abcdefg')
+        self.assertEqual([b'abc', b'def', b'g'],
+                         list(read_chunks(source, 3)))
+
+    def test_read_chunks_bad_size(self):
+        with self.assertRaises(ValueError):
+            list(read_chunks(b'abc', 0))
+
+    def test_encode_decode_chunk(self):
+        data = make_data(100)
+        encoded = encode_chunk(data)
+        self.assertIsInstance(encoded, str)
+        self.assertEqual(data, decode_chunk(encoded))
+
+    def test_decode_chunk_bad_value(self):
+        for value in ('not base64!', 123, {'foo': 'bar'}, 'caf\xe9'):
+            with self.assertRaises(BadChunk):
+                decode_chunk(value)
+
+    def test_check_manifest(self):
+        manifest = {
+            'manifest': MANIFEST_VERSION,
+            'size': 3,
+            'chunk_size': 3,
+            'digest': 'abc',
+            'chunks': ['abc'],
+        }
+        check_manifest(manifest)
+        bad = [
+            'not a manifest',
+            dict(manifest, manifest=MANIFEST_VERSION + 1),
+            dict(manifest, size='3'),
+            dict(manifest, chunks='abc'),
+        ]
+        for value in bad:
+            with self.assertRaises(BadChunk):
+                check_manifest(value)
+
+
+class TestChunking(unittest.TestCase):
+    """
+    Ensures chunked values are stored and retrieved as expected.
+    """
+
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                         FakeConnector(), 1908)
+        self.network = FakeNetwork(self.node)
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def store(self, data, **kwargs):
+        return self.event_loop.run_until_complete(
+            store_chunked(self.node, 'large', data, chunk_size=100,
+                          **kwargs))
+
+    def retrieve(self, **kwargs):
+        return self.event_loop.run_until_complete(
+            retrieve_chunked(self.node, PUBLIC_KEY, 'large', **kwargs))
+
+    def test_store_chunked(self):
+        """
+        Each chunk is stored as a signed item named by its digest, followed
+        by the manifest.
+        """
+        data = make_data(250)
+        manifest = self.store(data)
+        self.assertEqual(MANIFEST_VERSION, manifest['manifest'])
+        self.assertEqual(250, manifest['size'])
+        self.assertEqual(100, manifest['chunk_size'])
+        self.assertEqual(sha512(data).hexdigest(), manifest['digest'])
+        digests = [sha512(data[i:i + 100]).hexdigest()
+                   for i in range(0, 250, 100)]
+        self.assertEqual(digests, manifest['chunks'])
+        expected = [construct_key(PUBLIC_KEY, chunk_name(digest))
+                    for digest in digests]
+        expected.append(construct_key(PUBLIC_KEY, 'large'))
+        self.assertEqual(expected, self.network.stored)
+        manifest_key = construct_key(PUBLIC_KEY, 'large')
+        self.assertEqual(manifest, self.network.items[manifest_key].value)
+        self.assertEqual(3, self.node.metrics.counters[
+            'chunking.chunks_stored'])
+
+    def test_store_chunked_from_file(self):
+        data = make_data(250)
+        self.assertEqual(self.store(data),
+                         self.store(io.BytesIO(data)))
+
+    def test_store_chunked_identical_chunks(self):
+        """
+        Identical chunks are only stored once.
+        """
+        manifest = self.store(b'x' * 300)
+        self.assertEqual(3, len(manifest['chunks']))
+        self.assertEqual(1, len(set(manifest['chunks'])))
+        self.assertEqual(2, len(self.network.stored))
+
+    def test_store_chunked_concurrency(self):
+        """
+        No more than concurrency chunks are stored at once.
+        """
+        self.store(make_data(1000), concurrency=3)
+        self.assertEqual(11, len(self.network.stored))
+        self.assertEqual(3, self.network.max_in_flight)
+
+    def test_store_chunked_failure(self):
+        """
+        If a chunk can't be stored the exception is raised and the manifest
+        isn't stored.
+        """
+        self.network.fail_stores = True
+        with self.assertRaises(ValueError):
+            self.store(make_data(250))
+        self.assertNotIn(construct_key(PUBLIC_KEY, 'large'),
+                         self.network.items)
+
+    def test_retrieve_chunked(self):
+        data = make_data(1000)
+        self.store(data)
+        self.assertEqual(data, self.retrieve())
+        self.assertEqual(10, self.node.metrics.counters[
+            'chunking.chunks_fetched'])
+
+    def test_retrieve_chunked_empty(self):
+        self.store(b'')
+        self.assertEqual(b'', self.retrieve())
+
+    def test_retrieve_chunked_sink(self):
+        """
+        Chunks are passed to the sink in order and the length of the value
+        is returned.
+        """
+        data = make_data(1000)
+        self.store(data)
+        sink = io.BytesIO()
+        self.assertEqual(1000, self.retrieve(sink=sink.write))
+        self.assertEqual(data, sink.getvalue())
+
+    def test_retrieve_chunked_concurrency(self):
+        """
+        Chunks are fetched in parallel but no more than concurrency at once.
+        """
+        self.store(make_data(1000))
+        self.network.max_in_flight = 0
+        self.retrieve(concurrency=4)
+        self.assertEqual(4, self.network.max_in_flight)
+
+    def test_retrieve_chunked_local(self):
+        """
+        Chunks held in the local data store aren't looked up.
+        """
+        data = make_data(250)
+        manifest = self.store(data)
+        key = construct_key(PUBLIC_KEY, chunk_name(manifest['chunks'][0]))
+        self.node.data_store[key] = self.network.items.pop(key)
+        self.assertEqual(data, self.retrieve())
+
+    def test_retrieve_chunked_not_manifest(self):
+        self.store(make_data(250))
+        key = construct_key(PUBLIC_KEY, 'large')
+        self.network.items[key] = self.network.items[key]._replace(
+            value='not a manifest')
+        with self.assertRaises(BadChunk):
+            self.retrieve()
+
+    def test_retrieve_chunked_corrupt_chunk(self):
+        """
+        A chunk that doesn't match its digest is rejected.
+        """
+        manifest = self.store(make_data(250))
+        key = construct_key(PUBLIC_KEY, chunk_name(manifest['chunks'][1]))
+        self.network.items[key] = self.network.items[key]._replace(
+            value=encode_chunk(b'evil'))
+        with self.assertRaises(BadChunk):
+            self.retrieve()
+
+    def test_retrieve_chunked_missing_chunk(self):
+        """
+        The failure to find a chunk is passed on and the remaining fetches
+        are cancelled.
+        """
+        manifest = self.store(make_data(1000))
+        key = construct_key(PUBLIC_KEY, chunk_name(manifest['chunks'][0]))
+        del self.network.items[key]
+        with self.assertRaises(ValueNotFound):
+            self.retrieve()
+        self.event_loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(0, self.network.in_flight)
+
+    def test_retrieve_chunked_bad_size(self):
+        """
+        The reassembled value must match the manifest.
+        """
+        self.store(make_data(250))
+        key = construct_key(PUBLIC_KEY, 'large')
+        item = self.network.items[key]
+        self.network.items[key] = item._replace(
+            value=dict(item.value, size=251))
+        with self.assertRaises(BadChunk):
+            self.retrieve()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the compression of values and messages works as expected.
+"""
+from drogulus.dht.compression import (compress, decompress, pack_value,
+                                      unpack_value, compression_stats,
+                                      Compressed)
+from drogulus.dht.metrics import MetricsRegistry
+import os
+import zlib
+import unittest
+
+
+class TestCompression(unittest.TestCase):
+    """
+    Ensures the compression functions work as expected.
+    """
+
+    def setUp(self):
+        self.data = b'the same old words ' * 100
+        self.metrics = MetricsRegistry()
+
+    def test_compress(self):
+        """
+        Data at least threshold bytes long is compressed and the outcome
+        recorded in the metrics.
+        """
+        result = compress(self.data, 100, metrics=self.metrics, name='test')
+        self.assertEqual(self.data, zlib.decompress(result))
+        counters = self.metrics.counters
+        self.assertEqual(1, counters['test.compressed'])
+        self.assertEqual(len(self.data), counters['test.bytes_in'])
+        self.assertEqual(len(result), counters['test.bytes_out'])
+        self.assertEqual(1, self.metrics.histograms[
+            'test.compress_seconds'].count)
+
+    def test_compress_small_or_disabled(self):
+        """
+        Data shorter than the threshold isn't compressed, nor is anything if
+        the threshold is None.
+        """
+        self.assertIsNone(compress(self.data, len(self.data) + 1))
+        self.assertIsNone(compress(self.data, None))
+
+    def test_compress_incompressible(self):
+        """
+        Data that doesn't get any smaller isn't compressed.
+        """
+        data = os.urandom(2000)
+        self.assertIsNone(compress(data, 100, metrics=self.metrics))
+        self.assertEqual(1,
+                         self.metrics.counters['compression.incompressible'])
+
+    def test_decompress(self):
+        compressed = zlib.compress(self.data)
+        self.assertEqual(self.data, decompress(compressed,
+                                               metrics=self.metrics))
+        self.assertEqual(1, self.metrics.histograms[
+            'compression.decompress_seconds'].count)
+
+    def test_decompress_too_long(self):
+        """
+        A ValueError is raised if the data decompresses to more than
+        max_length bytes.
+        """
+        compressed = zlib.compress(self.data)
+        with self.assertRaises(ValueError):
+            decompress(compressed, 100)
+
+    def test_decompress_corrupt(self):
+        with self.assertRaises(ValueError):
+            decompress(b'not compressed')
+
+    def test_pack_unpack_value(self):
+        """
+        Large values are held compressed, small values are left alone.
+        """
+        value = {'text': ['the same old words'] * 100, 'number': 1.5}
+        packed = pack_value(value, 100, self.metrics)
+        self.assertIsInstance(packed, Compressed)
+        self.assertEqual(value, unpack_value(packed, self.metrics))
+        self.assertEqual(1, self.metrics.counters[
+            'storage.compression.compressed'])
+        self.assertEqual('small', pack_value('small', 100))
+        self.assertEqual(value, pack_value(value, None))
+        self.assertEqual(123, pack_value(123, 0))
+        self.assertEqual('small', unpack_value('small'))
+
+    def test_compression_stats(self):
+        """
+        The ratio and mean CPU times are summarised.
+        """
+        self.assertEqual(1.0, compression_stats(self.metrics)['ratio'])
+        compressed = compress(self.data, 0, metrics=self.metrics)
+        decompress(compressed, metrics=self.metrics)
+        result = compression_stats(self.metrics)
+        self.assertEqual(1, result['compressed'])
+        self.assertEqual(len(self.data), result['bytes_in'])
+        self.assertEqual(len(self.data) / len(compressed), result['ratio'])
+        self.assertTrue(result['compress_seconds'] >= 0.0)
+        self.assertTrue(result['decompress_seconds'] >= 0.0)
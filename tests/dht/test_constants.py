@@ -19,6 +19,24 @@ class TestConstants(unittest.TestCase):
         self.assertIsInstance(constants.ALPHA, int,
                               "constants.ALPHA must be an integer.")
 
+    def test_adaptive_ALPHA(self):
+        """
+        The bounds within which an adaptive lookup's alpha may vary must be
+        sensible.
+        """
+        self.assertIsInstance(constants.ALPHA_MIN, int)
+        self.assertIsInstance(constants.ALPHA_MAX, int)
+        self.assertTrue(1 <= constants.ALPHA_MIN <= constants.ALPHA)
+        self.assertTrue(constants.ALPHA <= constants.ALPHA_MAX)
+        self.assertTrue(constants.SLOW_RESPONSE > 0)
+
+    def test_MAX_INFLIGHT_RPCS(self):
+        """
+        The node-wide budget of RPCs in flight must be a positive integer.
+        """
+        self.assertIsInstance(constants.MAX_INFLIGHT_RPCS, int)
+        self.assertTrue(constants.MAX_INFLIGHT_RPCS > 0)
+
     def test_K(self):
         """
         The k number (so named from the original Kademlia paper) defines the
@@ -71,6 +89,22 @@ class TestConstants(unittest.TestCase):
         self.assertIsInstance(constants.REFRESH_INTERVAL, int,
                               "constants.REFRESH_INTERVAL must be an integer.")
 
+    def test_REPUBLISH_TICK(self):
+        """
+        The republish tick is the number of seconds between checks for keys
+        that are due republication.
+        """
+        self.assertTrue(constants.REPUBLISH_TICK > 0)
+
+    def test_REPUBLISH_BATCH_SIZE(self):
+        """
+        The republish batch size limits the number of keys processed per tick.
+        """
+        self.assertIsInstance(constants.REPUBLISH_BATCH_SIZE, int,
+                              "constants.REPUBLISH_BATCH_SIZE must be an " +
+                              "integer.")
+        self.assertTrue(constants.REPUBLISH_BATCH_SIZE > 0)
+
     def test_ALLOWED_RPC_FAILS(self):
         """
         The allowed number of rpc failures defines the number of failed
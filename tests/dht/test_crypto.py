@@ -197,6 +197,14 @@ class TestVerifyItem(unittest.TestCase):
         signed_item['public_key'] = BAD_PUBLIC_KEY
         self.assertFalse(verify_item(signed_item))
 
+    def test_ignores_load(self):
+        """
+        The load reported in a HotValue message isn't part of the signed item.
+        """
+        signed_item = get_signed_item('key', 'value', PUBLIC_KEY, PRIVATE_KEY)
+        signed_item['load'] = 12.5
+        self.assertTrue(verify_item(signed_item))
+
     def test_does_not_modify_item(self):
         """
         Ensure that the passed in item is itself not modified by the
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the erasure coding of values works as expected.
+"""
+from drogulus.dht.erasure import (gf_mul, gf_inv, invert, encode, decode,
+                                  coding_row, check_parameters,
+                                  check_manifest, fragment_name, is_fragment,
+                                  check_name, store_coded,
+                                  retrieve_coded, repair_coded,
+                                  MANIFEST_VERSION)
+from drogulus.dht.blobstore import serialise
+from drogulus.dht.chunking import encode_chunk
+from drogulus.dht.node import Node
+from drogulus.dht.crypto import construct_key
+from drogulus.dht.errors import BadChunk, TooFewFragments
+from .test_chunking import FakeConnector, FakeNetwork, make_data
+from ..keys import PRIVATE_KEY, PUBLIC_KEY
+from hashlib import sha512
+from itertools import combinations
+import asyncio
+import unittest
+
+
+class TestArithmetic(unittest.TestCase):
+    """
+    Ensures the arithmetic in GF(256) works as expected.
+    """
+
+    def test_gf_mul(self):
+        self.assertEqual(0, gf_mul(0, 123))
+        self.assertEqual(123, gf_mul(1, 123))
+        self.assertEqual(4, gf_mul(2, 2))
+        # Reduced by the primitive polynomial.
+        self.assertEqual(0x1d, gf_mul(0x80, 2))
+        for a in range(1, 256):
+            self.assertEqual(gf_mul(a, 7), gf_mul(7, a))
+
+    def test_gf_inv(self):
+        for a in range(1, 256):
+            self.assertEqual(1, gf_mul(a, gf_inv(a)))
+        with self.assertRaises(ZeroDivisionError):
+            gf_inv(0)
+
+    def test_invert(self):
+        matrix = [coding_row(i, 3) for i in (1, 3, 4)]
+        inverse = invert(matrix)
+        for i in range(3):
+            for j in range(3):
+                total = 0
+                for x in range(3):
+                    total ^= gf_mul(matrix[i][x], inverse[x][j])
+                self.assertEqual(1 if i == j else 0, total)
+
+    def test_invert_singular(self):
+        with self.assertRaises(ValueError):
+            invert([[1, 2], [1, 2]])
+
+
+class TestCoding(unittest.TestCase):
+    """
+    Ensures values are encoded into fragments and decoded as expected.
+    """
+
+    def test_check_parameters(self):
+        check_parameters(1, 1)
+        check_parameters(10, 256)
+        for k, n in ((0, 1), (3, 2), (10, 257)):
+            with self.assertRaises(ValueError):
+                check_parameters(k, n)
+
+    def test_encode_systematic(self):
+        """
+        The first k fragments are the (padded) data itself.
+        """
+        fragments = encode(b'abcdefg', 3, 5)
+        self.assertEqual(5, len(fragments))
+        self.assertEqual([b'abc', b'def', b'g\x00\x00'], fragments[:3])
+        self.assertEqual(fragments[3:], encode(b'abcdefg', 3, 5, [3, 4]))
+
+    def test_decode_any_k_fragments(self):
+        """
+        Any k of the n fragments are enough to rebuild the data.
+        """
+        data = make_data(1000)
+        fragments = encode(data, 3, 6)
+        for indices in combinations(range(6), 3):
+            available = dict((i, fragments[i]) for i in indices)
+            self.assertEqual(data, decode(available, 3, 6, len(data)))
+
+    def test_decode_default_parameters(self):
+        data = make_data(5000)
+        fragments = encode(data, 10, 20)
+        available = dict((i, fragments[i]) for i in range(5, 15))
+        self.assertEqual(data, decode(available, 10, 20, len(data)))
+
+    def test_decode_empty(self):
+        fragments = encode(b'', 2, 4)
+        self.assertEqual(b'', decode({2: fragments[2], 3: fragments[3]},
+                                     2, 4, 0))
+
+    def test_decode_too_few_fragments(self):
+        fragments = encode(b'abcdefg', 3, 5)
+        with self.assertRaises(TooFewFragments):
+            decode({0: fragments[0], 4: fragments[4]}, 3, 5, 7)
+
+    def test_is_fragment(self):
+        self.assertTrue(is_fragment(fragment_name('coded', 0)))
+        self.assertTrue(is_fragment(fragment_name('a:fragment:b', 12)))
+        self.assertFalse(is_fragment('coded'))
+        self.assertFalse(is_fragment('coded:fragment:'))
+        self.assertFalse(is_fragment('coded:fragment:x'))
+
+    def test_check_name(self):
+        check_name('coded')
+        check_name('coded:fragment:x')
+        with self.assertRaises(ValueError):
+            check_name(fragment_name('coded', 3))
+
+    def test_check_manifest(self):
+        manifest = {
+            'erasure': MANIFEST_VERSION,
+            'k': 1,
+            'n': 2,
+            'size': 3,
+            'digest': 'abc',
+            'fragments': ['abc', 'def'],
+        }
+        check_manifest(manifest)
+        bad = [
+            ['not a manifest'],
+            dict(manifest, erasure=MANIFEST_VERSION + 1),
+            dict(manifest, k='1'),
+            dict(manifest, k=3),
+            dict(manifest, fragments=['abc']),
+        ]
+        for value in bad:
+            with self.assertRaises(BadChunk):
+                check_manifest(value)
+
+
+class TestErasureCodedStorage(unittest.TestCase):
+    """
+    Ensures erasure coded values are stored, retrieved and repaired as
+    expected.
+    """
+
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                         FakeConnector(), 1908)
+        self.network = FakeNetwork(self.node)
+        self.value = {'text': ['the same old words'] * 50}
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def wait(self, coroutine):
+        return self.event_loop.run_until_complete(coroutine)
+
+    def fragment_key(self, index):
+        return construct_key(PUBLIC_KEY, fragment_name('coded', index))
+
+    def test_store_coded(self):
+        """
+        Each fragment is stored as a signed item followed by the manifest.
+        """
+        manifest = self.wait(store_coded(self.node, 'coded', self.value,
+                                         3, 5))
+        data = serialise(self.value)
+        fragments = encode(data, 3, 5)
+        self.assertEqual(MANIFEST_VERSION, manifest['erasure'])
+        self.assertEqual(3, manifest['k'])
+        self.assertEqual(5, manifest['n'])
+        self.assertEqual(len(data), manifest['size'])
+        self.assertEqual(sha512(data).hexdigest(), manifest['digest'])
+        self.assertEqual([sha512(f).hexdigest() for f in fragments],
+                         manifest['fragments'])
+        expected = [self.fragment_key(i) for i in range(5)]
+        expected.append(construct_key(PUBLIC_KEY, 'coded'))
+        self.assertEqual(expected, self.network.stored)
+        self.assertEqual(encode_chunk(fragments[4]),
+                         self.network.items[self.fragment_key(4)].value)
+        self.assertEqual(5, self.node.metrics.counters[
+            'erasure.fragments_stored'])
+
+    def test_store_coded_reserved_name(self):
+        """
+        A value can't be stored under a name reserved for fragments.
+        """
+        with self.assertRaises(ValueError):
+            self.wait(store_coded(self.node, fragment_name('coded', 0),
+                                  self.value, 3, 5))
+        self.assertEqual({}, self.network.items)
+
+    def test_store_coded_failure(self):
+        self.network.fail_stores = True
+        with self.assertRaises(ValueError):
+            self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        self.assertNotIn(construct_key(PUBLIC_KEY, 'coded'),
+                         self.network.items)
+
+    def test_retrieve_coded(self):
+        """
+        Only k fragments are fetched (in parallel) if they're all found.
+        """
+        self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        self.network.max_in_flight = 0
+        result = self.wait(retrieve_coded(self.node, PUBLIC_KEY, 'coded'))
+        self.assertEqual(self.value, result)
+        self.assertEqual(3, self.network.max_in_flight)
+        self.assertNotIn('erasure.fragments_missing',
+                         self.node.metrics.counters)
+
+    def test_retrieve_coded_missing_fragments(self):
+        """
+        The value is rebuilt from any k fragments.
+        """
+        self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        del self.network.items[self.fragment_key(0)]
+        del self.network.items[self.fragment_key(2)]
+        result = self.wait(retrieve_coded(self.node, PUBLIC_KEY, 'coded'))
+        self.assertEqual(self.value, result)
+        self.assertEqual(2, self.node.metrics.counters[
+            'erasure.fragments_missing'])
+
+    def test_retrieve_coded_corrupt_fragment(self):
+        """
+        A fragment that doesn't match its digest is treated as missing.
+        """
+        self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        key = self.fragment_key(1)
+        self.network.items[key] = self.network.items[key]._replace(
+            value=encode_chunk(b'evil'))
+        result = self.wait(retrieve_coded(self.node, PUBLIC_KEY, 'coded'))
+        self.assertEqual(self.value, result)
+
+    def test_retrieve_coded_too_few_fragments(self):
+        self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        for i in range(3):
+            del self.network.items[self.fragment_key(i)]
+        with self.assertRaises(TooFewFragments):
+            self.wait(retrieve_coded(self.node, PUBLIC_KEY, 'coded'))
+
+    def test_repair_coded(self):
+        """
+        Only the missing fragments are rebuilt and stored again.
+        """
+        self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        original = dict(self.network.items)
+        del self.network.items[self.fragment_key(0)]
+        del self.network.items[self.fragment_key(3)]
+        self.network.stored = []
+        repaired = self.wait(repair_coded(self.node, 'coded'))
+        self.assertEqual([0, 3], repaired)
+        self.assertEqual([self.fragment_key(0), self.fragment_key(3)],
+                         self.network.stored)
+        for i in (0, 3):
+            key = self.fragment_key(i)
+            self.assertEqual(original[key].value,
+                             self.network.items[key].value)
+        self.assertEqual(2, self.node.metrics.counters[
+            'erasure.fragments_repaired'])
+
+    def test_repair_coded_nothing_missing(self):
+        self.wait(store_coded(self.node, 'coded', self.value, 3, 5))
+        self.network.stored = []
+        self.assertEqual([], self.wait(repair_coded(self.node, 'coded')))
+        self.assertEqual([], self.network.stored)
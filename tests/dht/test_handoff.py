@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the handoff of items to newly joined peers works as expected.
+"""
+from drogulus.dht.handoff import Handoff
+from drogulus.dht.node import Node
+from drogulus.dht.contact import PeerNode
+from drogulus.dht.erasure import fragment_name
+from drogulus.version import get_version
+from ..items import make_item
+from ..keys import PRIVATE_KEY, PUBLIC_KEY
+from unittest import mock
+import asyncio
+import time
+import unittest
+
+
+class FakeConnector:
+    """
+    Pretends to be a connector for sending messages to remote nodes.
+    """
+
+    def send(self, contact, message, sender):
+        return asyncio.Future()
+
+
+def make_contact(network_id):
+    contact = PeerNode(PUBLIC_KEY, get_version(), 'http://192.168.0.1:1908/',
+                       0)
+    contact.network_id = network_id
+    return contact
+
+
+class TestHandoff(unittest.TestCase):
+    """
+    Ensures the Handoff class works as expected.
+    """
+
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                         FakeConnector(), 1908)
+        self.node.network_id = '8' * 128
+        self.items = [make_item('item {}'.format(i)) for i in range(20)]
+        for item in self.items:
+            self.node.data_store[item.key] = item
+        self.newcomer = make_contact('0' * 128)
+        # By default the newcomer is the only other known node.
+        self.node.routing_table.find_close_nodes = mock.MagicMock(
+            return_value=[self.newcomer, ])
+        self.offer = asyncio.Future()
+        self.node.send_offer = mock.MagicMock(return_value=('uuid',
+                                                            self.offer))
+        self.node.send_items = mock.MagicMock(return_value=[('task', 100)])
+
+    def tearDown(self):
+        self.node.republisher.stop()
+        self.event_loop.close()
+
+    def test_candidates(self):
+        """
+        Keys are handed off if the contact is amongst the closest nodes and
+        the local node is closer to the key than any other known node.
+        """
+        handoff = Handoff(self.node)
+        keys = set(item.key for item in self.items)
+        self.assertEqual(keys, set(handoff.candidates(self.newcomer)))
+        # The contact isn't amongst the closest nodes.
+        find_close_nodes = self.node.routing_table.find_close_nodes
+        find_close_nodes.side_effect = lambda key: [make_contact(key)]
+        self.assertEqual([], handoff.candidates(self.newcomer))
+        # Another holder is closer than the local node so will hand off.
+        find_close_nodes.side_effect = lambda key: [self.newcomer,
+                                                    make_contact(key)]
+        self.assertEqual([], handoff.candidates(self.newcomer))
+        # Other holders are further away than the local node.
+        find_close_nodes.side_effect = lambda key: [
+            self.newcomer, make_contact('{:0128x}'.format(
+                int(key, 16) ^ int('f' * 128, 16)))]
+        self.assertEqual(keys, set(handoff.candidates(self.newcomer)))
+
+    def test_candidates_max_items(self):
+        """
+        Only the max_items keys closest to the contact are considered.
+        """
+        handoff = Handoff(self.node, max_items=5)
+        target = int(self.newcomer.network_id, 16)
+        expected = sorted((item.key for item in self.items),
+                          key=lambda key: int(key, 16) ^ target)[:5]
+        self.assertEqual(expected, handoff.candidates(self.newcomer))
+
+    def test_handoff(self):
+        """
+        The unexpired candidate items (other than fragments of erasure coded
+        values) are offered to the contact and those it is missing are
+        pushed.
+        """
+        expired = make_item('expired', expires=0.001)
+        time.sleep(0.01)
+        self.node.data_store[expired.key] = expired
+        fragment = make_item(fragment_name('coded', 0))
+        self.node.data_store[fragment.key] = fragment
+        handoff = Handoff(self.node)
+        result = handoff.handoff(self.newcomer)
+        contact, entries = self.node.send_offer.call_args[0]
+        self.assertEqual(self.newcomer, contact)
+        self.assertEqual(dict((item.key, item.timestamp)
+                              for item in self.items), entries)
+        wanted = [item.key for item in self.items[:3]]
+        request = mock.MagicMock(uuid='uuid', sender=PUBLIC_KEY)
+        self.offer.set_result(self.node.make_missing(request, wanted))
+        self.event_loop.run_until_complete(result)
+        self.assertEqual(wanted, result.result())
+        contact, items = self.node.send_items.call_args[0]
+        self.assertEqual(self.newcomer, contact)
+        self.assertEqual(wanted, [item.key for item in items])
+        counters = self.node.metrics.counters
+        self.assertEqual(1, counters['handoff.sessions'])
+        self.assertEqual(len(self.items), counters['handoff.keys'])
+        self.assertEqual(3, counters['handoff.items_pushed'])
+        self.assertEqual(100, counters['handoff.bytes_sent'])
+        # Replica synchronisation is untouched.
+        self.assertEqual({}, self.node.synchroniser.synced)
+        self.assertNotIn('sync.sessions', counters)
+
+    def test_handoff_all_held(self):
+        """
+        Nothing is pushed if the contact already holds every offered item.
+        """
+        handoff = Handoff(self.node)
+        result = handoff.handoff(self.newcomer)
+        request = mock.MagicMock(uuid='uuid', sender=PUBLIC_KEY)
+        self.offer.set_result(self.node.make_ok(request))
+        self.event_loop.run_until_complete(result)
+        self.assertEqual([], result.result())
+        self.assertEqual(0, self.node.send_items.call_count)
+
+    def test_handoff_unexpected_response(self):
+        handoff = Handoff(self.node)
+        result = handoff.handoff(self.newcomer)
+        self.offer.set_result('foo')
+        with self.assertRaises(ValueError):
+            self.event_loop.run_until_complete(result)
+        self.assertEqual(0, self.node.send_items.call_count)
+
+    def test_handoff_nothing_to_do(self):
+        self.node.routing_table.find_close_nodes.return_value = []
+        handoff = Handoff(self.node)
+        self.assertIsNone(handoff.handoff(self.newcomer))
+        self.assertEqual(0, self.node.send_offer.call_count)
+
+    def test_queue_and_tick(self):
+        """
+        Contacts are queued once and handed off to one per tick. A contact
+        isn't handed off to again within the interval.
+        """
+        handoff = Handoff(self.node, tick=2)
+        handoff.handoff = mock.MagicMock()
+        other = make_contact('1' * 128)
+        with mock.patch.object(self.event_loop, 'call_later') as mock_call:
+            handoff.contact_added(self.newcomer)
+            handoff.contact_added(self.newcomer)
+            handoff.contact_added(other)
+            mock_call.assert_called_once_with(2, handoff._tick)
+            self.assertEqual(2, len(handoff.queue))
+            handoff._tick()
+            handoff.handoff.assert_called_once_with(self.newcomer)
+            self.assertEqual(2, mock_call.call_count)
+            handoff.handle = None
+            handoff.handoff.side_effect = ValueError('Boom')
+            handoff._tick()
+            self.assertEqual(2, handoff.handoff.call_count)
+            # Nothing left to do so nothing scheduled.
+            self.assertEqual(2, mock_call.call_count)
+            handoff.contact_added(self.newcomer)
+            self.assertEqual(0, len(handoff.queue))
+        handoff.recent[self.newcomer.network_id] = 0.0
+        handoff.contact_added(self.newcomer)
+        self.assertEqual(1, len(handoff.queue))
+        handoff.stop()
+        self.assertIsNone(handoff.handle)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the tracking of hot keys and the sizing of cached copies work as
+expected.
+"""
+from drogulus.dht.hotkeys import RequestRates, cache_copies, cache_lifetime
+from drogulus.dht.constants import (HOT_KEY_RATE, CACHE_COPIES_MAX,
+                                    CACHE_MIN_LIFETIME, REPLICATE_INTERVAL)
+import math
+import unittest
+
+
+class TestFunctions(unittest.TestCase):
+    """
+    Ensures the module level functions work as expected.
+    """
+
+    def test_cache_copies(self):
+        """
+        One copy is cached for each multiple of the hot rate in the load.
+        """
+        self.assertEqual(1, cache_copies(0.0))
+        self.assertEqual(1, cache_copies(HOT_KEY_RATE / 2))
+        self.assertEqual(1, cache_copies(HOT_KEY_RATE))
+        self.assertEqual(3, cache_copies(HOT_KEY_RATE * 2.5))
+        self.assertEqual(CACHE_COPIES_MAX, cache_copies(HOT_KEY_RATE * 1000))
+        self.assertEqual(4, cache_copies(40.0, hot_rate=10.0, maximum=5))
+
+    def test_cache_lifetime(self):
+        """
+        The lifetime halves for each extra bit of distance down to the
+        shortest lifetime.
+        """
+        self.assertEqual(REPLICATE_INTERVAL, cache_lifetime(0))
+        self.assertEqual(REPLICATE_INTERVAL / 2, cache_lifetime(1))
+        self.assertEqual(REPLICATE_INTERVAL / 8, cache_lifetime(3))
+        self.assertEqual(CACHE_MIN_LIFETIME, cache_lifetime(20))
+        self.assertEqual(CACHE_MIN_LIFETIME, cache_lifetime(500))
+        self.assertEqual(100, cache_lifetime(-1, longest=100))
+        self.assertEqual(25, cache_lifetime(2, longest=100, shortest=1))
+
+
+class TestRequestRates(unittest.TestCase):
+    """
+    Ensures the RequestRates class works as expected.
+    """
+
+    def test_init(self):
+        rates = RequestRates(half_life=10, capacity=100)
+        self.assertEqual(10, rates.half_life)
+        self.assertEqual(100, rates.capacity)
+        self.assertEqual(0, len(rates))
+
+    def test_unknown_key(self):
+        rates = RequestRates()
+        self.assertEqual(0.0, rates.rate('foo'))
+        self.assertNotIn('foo', rates)
+
+    def test_steady_rate(self):
+        """
+        A steady rate of requests is estimated correctly.
+        """
+        rates = RequestRates(half_life=10)
+        now = 1000.0
+        for i in range(1000):
+            now += 0.5
+            rate = rates.record('foo', now)
+        self.assertIn('foo', rates)
+        self.assertAlmostEqual(2.0, rate, delta=0.1)
+        self.assertAlmostEqual(2.0, rates.rate('foo', now), delta=0.1)
+
+    def test_decay(self):
+        """
+        The rate halves every half life once requests stop.
+        """
+        rates = RequestRates(half_life=10)
+        rates.record('foo', 100.0)
+        rate = rates.rate('foo', 100.0)
+        self.assertAlmostEqual(math.log(2) / 10, rate)
+        self.assertAlmostEqual(rate / 2, rates.rate('foo', 110.0))
+        self.assertAlmostEqual(rate / 4, rates.rate('foo', 120.0))
+
+    def test_hottest(self):
+        rates = RequestRates()
+        for i in range(3):
+            rates.record('warm', 100.0)
+        for i in range(5):
+            rates.record('hot', 100.0)
+        rates.record('cold', 100.0)
+        result = rates.hottest(2, 100.0)
+        self.assertEqual(['hot', 'warm'], [key for key, rate in result])
+
+    def test_prune(self):
+        """
+        The coldest keys are forgotten once there are too many.
+        """
+        rates = RequestRates(capacity=10)
+        for i in range(5):
+            rates.record('hot', 100.0)
+        for i in range(11):
+            rates.record('key {}'.format(i), 100.0 + i)
+        self.assertEqual(10, len(rates))
+        self.assertIn('hot', rates)
+        # The oldest (so most decayed) single requests went first.
+        self.assertNotIn('key 0', rates)
+        self.assertIn('key 10', rates)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the ordered key index works as expected.
+"""
+from drogulus.dht.keyindex import SortedKeyList, closest_keys, prefix_range
+import random
+import unittest
+
+
+def random_keys(count, length=8):
+    """
+    Returns a list of count random hexadecimal keys of the given length.
+    """
+    return ['{:0{}x}'.format(random.getrandbits(length * 4), length)
+            for i in range(count)]
+
+
+class TestPrefixRange(unittest.TestCase):
+    """
+    Ensures the prefix_range function works as expected.
+    """
+
+    def test_prefix_range(self):
+        self.assertEqual((None, None), prefix_range(''))
+        self.assertEqual(('a', 'b'), prefix_range('a'))
+        self.assertEqual(('0f', '10'), prefix_range('0f'))
+        self.assertEqual(('ff', None), prefix_range('ff'))
+
+
+class TestSortedKeyList(unittest.TestCase):
+    """
+    Ensures the SortedKeyList class works as expected.
+    """
+
+    def setUp(self):
+        random.seed(1908)
+        self.keys = random_keys(1000)
+
+    def test_add_discard(self):
+        """
+        Keys are held in order (across blocks that are split as they grow)
+        and can be removed.
+        """
+        index = SortedKeyList(load=8)
+        for key in self.keys:
+            index.add(key)
+        # Adding a key twice has no effect.
+        index.add(self.keys[0])
+        expected = sorted(set(self.keys))
+        self.assertEqual(expected, list(index))
+        self.assertEqual(len(expected), len(index))
+        self.assertTrue(all(len(block) <= 16 for block in index._blocks))
+        self.assertEqual([block[-1] for block in index._blocks],
+                         index._maxes)
+        for key in self.keys[:500]:
+            index.discard(key)
+        index.discard('not a key')
+        index.discard(self.keys[0])
+        expected = sorted(set(self.keys[500:]) - set(self.keys[:500]))
+        self.assertEqual(expected, list(index))
+        self.assertEqual(len(expected), len(index))
+        self.assertNotIn(self.keys[0], index)
+        self.assertIn(expected[0], index)
+        for key in expected:
+            index.discard(key)
+        self.assertEqual([], list(index))
+        self.assertEqual([], index._maxes)
+
+    def test_init_with_keys(self):
+        index = SortedKeyList(self.keys + self.keys[:10], load=8)
+        self.assertEqual(sorted(set(self.keys)), list(index))
+        self.assertEqual(len(set(self.keys)), len(index))
+
+    def test_irange(self):
+        """
+        The keys in a range (including the lower bound but not the upper
+        bound) are returned in order.
+        """
+        index = SortedKeyList(self.keys, load=8)
+        ordered = sorted(set(self.keys))
+        lower, upper = ordered[100], ordered[200]
+        self.assertEqual(ordered[100:200], list(index.irange(lower, upper)))
+        self.assertEqual(ordered[100:], list(index.irange(lower)))
+        self.assertEqual(ordered[:200], list(index.irange(upper=upper)))
+        self.assertEqual(ordered, list(index.irange()))
+        self.assertEqual([], list(index.irange('ffffffff0')))
+        self.assertEqual([], list(index.irange(upper, lower)))
+        self.assertEqual([], list(SortedKeyList().irange('a', 'b')))
+
+
+class TestClosestKeys(unittest.TestCase):
+    """
+    Ensures the closest_keys function works as expected.
+    """
+
+    def test_closest_keys(self):
+        """
+        Keys are yielded in order of XOR distance from the target.
+        """
+        random.seed(1908)
+        keys = random_keys(5000)
+        index = SortedKeyList(keys, load=64)
+        for target in random_keys(10) + [keys[0], '0' * 8, 'f' * 8]:
+            value = int(target, 16)
+            expected = sorted(set(keys), key=lambda k: int(k, 16) ^ value)
+            result = closest_keys(index.irange, target)
+            self.assertEqual(expected[:100], [next(result)
+                                              for i in range(100)])
+            self.assertEqual(expected, list(closest_keys(index.irange,
+                                                         target)))
+
+    def test_no_keys(self):
+        self.assertEqual([], list(closest_keys(SortedKeyList().irange,
+                                               'abcd')))
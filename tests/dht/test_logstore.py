@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the log-structured data store works as expected.
+"""
+from drogulus.dht.logstore import (LogDataStore, encode_record,
+                                   decode_record)
+from ..items import make_item
+from ..keys import PUBLIC_KEY
+from unittest import mock
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class TestRecords(unittest.TestCase):
+    """
+    Ensures records are encoded and decoded correctly.
+    """
+
+    def test_round_trip(self):
+        record = encode_record('foo', b'bar', 1.0, 2.0)
+        self.assertEqual(('foo', b'bar', 1.0, 2.0, len(record)),
+                         decode_record(b'xx' + record, 2))
+
+    def test_truncated_or_corrupt(self):
+        record = encode_record('foo', b'bar', 1.0, 2.0)
+        self.assertEqual(None, decode_record(record[:-1], 0))
+        self.assertEqual(None, decode_record(record[:5], 0))
+        corrupt = record[:-1] + b'X'
+        self.assertEqual(None, decode_record(corrupt, 0))
+
+
+class TestLogDataStore(unittest.TestCase):
+    """
+    Ensures the LogDataStore class works as expected.
+    """
+
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), 'store')
+        self.items = [make_item('item {}'.format(i)) for i in range(10)]
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def files(self, extension):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(extension))
+
+    def test_set_get(self):
+        """
+        Items can be stored and read back.
+        """
+        store = LogDataStore(self.directory)
+        for item in self.items:
+            store[item.key] = item
+        for item in self.items:
+            self.assertEqual(item, store[item.key])
+            self.assertIn(item.key, store)
+        self.assertEqual(len(self.items), len(store))
+        self.assertEqual(set(item.key for item in self.items), set(store))
+        self.assertFalse(store.get('foo', False))
+        store.close()
+
+    def test_touch_refresh(self):
+        """
+        Access and update times are held in the index. Storing an item again
+        keeps its access time.
+        """
+        store = LogDataStore(self.directory)
+        item = self.items[0]
+        store[item.key] = item
+        self.assertEqual(0.0, store.accessed(item.key))
+        store.touch(item.key)
+        accessed = store.accessed(item.key)
+        self.assertTrue(accessed > 0.0)
+        store._set_item(item.key, (item, 1.0, accessed))
+        store.refresh(item.key)
+        self.assertTrue(store.updated(item.key) > 1.0)
+        store[item.key] = item
+        self.assertEqual(accessed, store.accessed(item.key))
+        store.close()
+
+    def test_purge_expired(self):
+        """
+        Expired items are purged, including those loaded when re-opened.
+        """
+        store = LogDataStore(self.directory)
+        expiring = make_item('expiring', expires=1000)
+        store[expiring.key] = expiring
+        store[self.items[0].key] = self.items[0]
+        store.close()
+        store = LogDataStore(self.directory)
+        self.assertEqual([], store.purge_expired())
+        self.assertEqual([expiring.key],
+                         store.purge_expired(time.time() + 2000))
+        self.assertEqual([self.items[0].key], list(store))
+        store.close()
+
+    def test_publisher_index(self):
+        """
+        Items can be counted and listed by publisher (the index is built by
+        loading the items when first needed) and deletions are reflected.
+        """
+        store = LogDataStore(self.directory)
+        for item in self.items[:5]:
+            store[item.key] = item
+        store.close()
+        store = LogDataStore(self.directory)
+        publisher_id = store.publisher_id(PUBLIC_KEY)
+        self.assertEqual(5, store.count_published(publisher_id))
+        store[self.items[5].key] = self.items[5]
+        del store[self.items[0].key]
+        self.assertEqual(set(item.key for item in self.items[1:6]),
+                         set(store.publisher_keys(publisher_id)))
+        store.close()
+
+    def test_reopen_from_hints(self):
+        """
+        A closed data store is re-opened from the hint files without
+        scanning the segments. Access times are persisted.
+        """
+        store = LogDataStore(self.directory)
+        for item in self.items:
+            store[item.key] = item
+        store.touch(self.items[0].key)
+        accessed = store.accessed(self.items[0].key)
+        del store[self.items[1].key]
+        store.close()
+        with mock.patch('drogulus.dht.logstore.decode_record',
+                        side_effect=AssertionError('Scanned')):
+            store = LogDataStore(self.directory)
+        self.assertEqual(len(self.items) - 1, len(store))
+        self.assertNotIn(self.items[1].key, store)
+        self.assertEqual(accessed, store.accessed(self.items[0].key))
+        self.assertEqual(self.items[2], store[self.items[2].key])
+        store.close()
+
+    def test_recover_without_hint(self):
+        """
+        A segment without a hint file (e.g. after a crash) is scanned and an
+        incomplete record at its end is truncated.
+        """
+        store = LogDataStore(self.directory)
+        for item in self.items:
+            store[item.key] = item
+        del store[self.items[1].key]
+        store.flush()
+        good_size = store._active_size
+        # Simulate a crash half way through appending a record.
+        store._active_file.write(encode_record('foo', b'bar', 1.0, 1.0)[:7])
+        store._active_file.flush()
+        path = store._path(store.active, 'log')
+        store._active_file.close()
+        self.assertEqual([], self.files('.hint'))
+        store = LogDataStore(self.directory)
+        self.assertEqual(len(self.items) - 1, len(store))
+        self.assertNotIn(self.items[1].key, store)
+        self.assertNotIn('foo', store)
+        self.assertEqual(self.items[0], store[self.items[0].key])
+        self.assertEqual(1, len(self.files('.hint')))
+        self.assertEqual(good_size, os.path.getsize(path))
+        store.close()
+
+    def test_roll_segments(self):
+        """
+        The active segment is sealed (with a hint file) once it grows beyond
+        segment_size.
+        """
+        store = LogDataStore(self.directory, segment_size=1000)
+        for item in self.items:
+            store[item.key] = item
+        self.assertTrue(len(self.files('.log')) > 1)
+        self.assertEqual(len(self.files('.log')) - 1,
+                         len(self.files('.hint')))
+        for item in self.items:
+            self.assertEqual(item, store[item.key])
+        store.close()
+        store = LogDataStore(self.directory, segment_size=1000)
+        for item in self.items:
+            self.assertEqual(item, store[item.key])
+        store.close()
+
+    def test_compact(self):
+        """
+        Compaction merges the sealed segments dropping superseded, deleted
+        and expired items.
+        """
+        store = LogDataStore(self.directory, segment_size=1000)
+        for item in self.items:
+            store[item.key] = item
+        updated = make_item('item 0', 'new value')
+        store[updated.key] = updated
+        del store[self.items[1].key]
+        expired = make_item('expired', expires=0.001)
+        time.sleep(0.01)
+        store[expired.key] = expired
+        for item in self.items[5:]:
+            store[item.key] = item
+        before = sum(os.path.getsize(os.path.join(self.directory, name))
+                     for name in self.files('.log'))
+        store.compact()
+        after = sum(os.path.getsize(os.path.join(self.directory, name))
+                    for name in self.files('.log'))
+        self.assertTrue(after < before)
+        self.assertEqual(2, len(self.files('.log')))
+        self.assertEqual(1, store.compactions)
+        self.assertEqual(0, store.dead_bytes)
+        self.assertEqual(updated, store[updated.key])
+        self.assertNotIn(self.items[1].key, store)
+        self.assertNotIn(expired.key, store)
+        for item in self.items[2:]:
+            self.assertEqual(item, store[item.key])
+        store.close()
+        store = LogDataStore(self.directory, segment_size=1000)
+        self.assertEqual(len(self.items) - 1, len(store))
+        self.assertEqual(updated, store[updated.key])
+        self.assertNotIn(self.items[1].key, store)
+        store.close()
+
+    def test_compact_crash_before_hint(self):
+        """
+        If the process dies after the merged segment has replaced the newest
+        sealed segment but before its hint file is written, the merged
+        segment is scanned on startup (the old hint file isn't used).
+        """
+        store = LogDataStore(self.directory, segment_size=1000)
+        for item in self.items:
+            store[item.key] = item
+        del store[self.items[1].key]
+        for item in self.items[5:]:
+            store[item.key] = item
+        with mock.patch.object(store, '_write_hint',
+                               side_effect=OSError('Crash!')):
+            with self.assertRaises(OSError):
+                store.compact()
+        store.sync()
+        store._active_file.close()
+        store = LogDataStore(self.directory, segment_size=1000)
+        self.assertEqual(len(self.items) - 1, len(store))
+        for item in self.items[2:]:
+            self.assertEqual(item, store[item.key])
+        store.close()
+
+    def test_get_item_wrong_key(self):
+        """
+        A record that doesn't belong to the key results in a KeyError rather
+        than the wrong item.
+        """
+        store = LogDataStore(self.directory)
+        first, second = self.items[:2]
+        store[first.key] = first
+        store[second.key] = second
+        location = store.index[second.key]
+        store.index[first.key].offset = location.offset
+        store.index[first.key].length = location.length
+        with self.assertRaises(KeyError):
+            store[first.key]
+        self.assertEqual(second, store[second.key])
+        store.close()
+
+    def test_compaction_scheduled(self):
+        """
+        With an event loop, compaction is started in the background when a
+        segment is sealed and enough of the data is dead.
+        """
+        event_loop = asyncio.new_event_loop()
+        store = LogDataStore(self.directory, segment_size=1000,
+                             threshold=0.5, event_loop=event_loop)
+        item = self.items[0]
+        with mock.patch.object(store, 'compact_in_background',
+                               wraps=store.compact_in_background) as compact:
+            for i in range(10):
+                store[item.key] = item
+            self.assertEqual(1, compact.call_count)
+        for i in range(100):
+            if store.compactions:
+                break
+            event_loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(1, store.compactions)
+        self.assertEqual(item, store[item.key])
+        store.close()
+        event_loop.close()
+
+    def test_compact_in_background(self):
+        """
+        The records are copied in an executor. Items stored or deleted while
+        the records are being copied aren't affected by the compaction.
+        """
+        event_loop = asyncio.new_event_loop()
+        store = LogDataStore(self.directory, segment_size=1000,
+                             event_loop=event_loop)
+        for item in self.items:
+            store[item.key] = item
+        copied = asyncio.Future(loop=event_loop)
+        with mock.patch.object(event_loop, 'run_in_executor',
+                               return_value=copied) as run_in_executor:
+            task = asyncio.Task(store.compact_in_background(),
+                                loop=event_loop)
+            event_loop.run_until_complete(asyncio.sleep(0))
+            function, path, sources = run_in_executor.call_args[0][1:]
+        # Another compaction can't start while this one is in progress.
+        self.assertFalse(store.compact())
+        copied.set_result(function(path, sources))
+        updated = make_item('item 0', 'new value')
+        store[updated.key] = updated
+        del store[self.items[1].key]
+        self.assertTrue(event_loop.run_until_complete(task))
+        self.assertEqual(1, store.compactions)
+        self.assertEqual(updated, store[updated.key])
+        self.assertNotIn(self.items[1].key, store)
+        for item in self.items[2:]:
+            self.assertEqual(item, store[item.key])
+        store.close()
+        store = LogDataStore(self.directory, segment_size=1000)
+        self.assertEqual(len(self.items) - 1, len(store))
+        self.assertEqual(updated, store[updated.key])
+        self.assertNotIn(self.items[1].key, store)
+        for item in self.items[2:]:
+            self.assertEqual(item, store[item.key])
+        store.close()
+        event_loop.close()
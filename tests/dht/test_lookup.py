@@ -2,13 +2,15 @@
 """
 Ensures the Lookup classes work as expected.
 """
-from drogulus.dht.lookup import Lookup
+from drogulus.dht.lookup import Lookup, MultiLookup, AlphaController
 from drogulus.dht.contact import PeerNode
 from drogulus.dht.node import Node
 from drogulus.dht.routingtable import RoutingTable
-from drogulus.dht.messages import FindNode, Nodes, FindValue, Value, OK
+from drogulus.dht.messages import (FindNode, Nodes, FindValue, Value, OK,
+                                   FindValues, FindNodesMulti, MultiResult)
 from drogulus.dht.errors import RoutingTableEmpty
-from drogulus.dht.constants import LOOKUP_TIMEOUT, K, ALPHA
+from drogulus.dht.constants import (LOOKUP_TIMEOUT, K, ALPHA, ALPHA_MIN,
+                                    ALPHA_MAX, SLOW_RESPONSE)
 from drogulus.dht.utils import sort_peer_nodes
 from drogulus.dht.errors import ValueNotFound
 from drogulus.dht.utils import distance
@@ -97,8 +99,7 @@ class TestLookup(unittest.TestCase):
         Ensure instantiating the Lookup class creates an object with the
         expected state.
         """
-        patcher = mock.patch('asyncio.base_events.BaseEventLoop.call_later')
-        mock_call_later = patcher.start()
+        self.node.timers.schedule = mock.MagicMock()
         self.node.routing_table.touch_bucket = mock.MagicMock()
         lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
         self.assertIsInstance(lookup, asyncio.Future)
@@ -110,14 +111,24 @@ class TestLookup(unittest.TestCase):
         self.assertEqual(3, len(lookup.contacted))
         self.assertIsInstance(lookup.pending_requests, dict)
         self.assertEqual(3, len(lookup.pending_requests))
-        mock_call_later.assert_called_once_with(LOOKUP_TIMEOUT,
-                                                lookup.cancel)
+        self.node.timers.schedule.assert_called_once_with(LOOKUP_TIMEOUT,
+                                                          lookup.cancel)
         self.assertEqual(len(lookup.shortlist), len(self.contacts))
         self.node.routing_table.touch_bucket.\
             assert_called_once_with(self.target)
         self.assertEqual(lookup.nearest_node, lookup.shortlist[0])
         self.assertEqual(3, self.node.send_find.call_count)
-        patcher.stop()
+
+    def test_timers_cancelled_when_done(self):
+        """
+        The lookup's timeout and deadline are cancelled when it is done.
+        """
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop,
+                        quorum=2, deadline=5)
+        self.assertEqual(2, len(self.node.timers))
+        lookup.cancel()
+        self.event_loop.run_until_complete(blip())
+        self.assertEqual(0, len(self.node.timers))
 
     def test_init_no_shortlist(self):
         """
@@ -201,6 +212,46 @@ class TestLookup(unittest.TestCase):
         self.assertEqual(lookup._lookup.call_count, 1)
         patcher.stop()
 
+    def test_handle_error_last_request_find_node(self):
+        """
+        If the final pending request of a FindNode lookup fails and there is
+        nobody left to contact then the lookup results in the shortlist
+        rather than stalling until it times out.
+        """
+        patcher = mock.patch('drogulus.dht.lookup.log.info')
+        patcher.start()
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        lookup.contacted = set(lookup.shortlist)
+        uuids = list(lookup.pending_requests.keys())
+        for message_id in uuids[1:]:
+            del lookup.pending_requests[message_id]
+        message_id = uuids[0]
+        contact = lookup.shortlist[0]
+        lookup._handle_error(message_id, contact, Exception('Foo'))
+        self.assertTrue(lookup.done())
+        self.assertEqual(lookup.result(), lookup.shortlist)
+        self.assertNotIn(contact, lookup.result())
+        patcher.stop()
+
+    def test_handle_error_last_request_find_value(self):
+        """
+        If the final pending request of a FindValue lookup fails and there is
+        nobody left to contact then the lookup errbacks with ValueNotFound.
+        """
+        patcher = mock.patch('drogulus.dht.lookup.log.info')
+        patcher.start()
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop)
+        lookup.contacted = set(lookup.shortlist)
+        uuids = list(lookup.pending_requests.keys())
+        for message_id in uuids[1:]:
+            del lookup.pending_requests[message_id]
+        message_id = uuids[0]
+        contact = lookup.shortlist[0]
+        lookup._handle_error(message_id, contact, Exception('Foo'))
+        self.assertTrue(lookup.done())
+        self.assertRaises(ValueNotFound, lookup.result)
+        patcher.stop()
+
     def test_blacklist(self):
         """
         Ensure a blacklist operation (where misbehaving peer nodes are marked
@@ -384,6 +435,94 @@ class TestLookup(unittest.TestCase):
         lookup._handle_response(uuid, contact, response)
         self.assertEqual(lookup.result(), msg)
 
+    def make_value(self, message_id, timestamp):
+        """
+        Returns a Value message for the target with the given timestamp.
+        """
+        return Value(message_id, self.node.network_id, self.node.network_id,
+                     self.reply_port, self.version, self.seal, self.target,
+                     'value', timestamp, 0.0, self.version, PUBLIC_KEY,
+                     'name', 'signature')
+
+    def test_quorum_read_waits_for_quorum(self):
+        """
+        A quorum read keeps looking until enough values are found and then
+        resolves with the one with the newest timestamp.
+        """
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop,
+                        quorum=2)
+        uuids = [uuid for uuid in lookup.pending_requests.keys()]
+        first = lookup.shortlist[0]
+        newer = self.make_value(uuids[0], 2.0)
+        response = asyncio.Future()
+        response.set_result(newer)
+        lookup._handle_response(uuids[0], first, response)
+        self.assertFalse(lookup.done())
+        self.assertEqual([(first, newer)], lookup.values)
+        self.assertNotIn(first, lookup.shortlist)
+        # Another request takes the place of the one that returned a value.
+        self.assertEqual(ALPHA, len(lookup.pending_requests))
+        second = lookup.shortlist[0]
+        older = self.make_value(uuids[1], 1.0)
+        response = asyncio.Future()
+        response.set_result(older)
+        lookup._handle_response(uuids[1], second, response)
+        self.assertTrue(lookup.done())
+        self.assertEqual(newer, lookup.result())
+        self.assertEqual(newer, lookup.newest_value())
+        self.assertEqual({}, lookup.pending_requests)
+
+    def test_quorum_read_deadline(self):
+        """
+        If the deadline passes before the quorum is reached the lookup
+        resolves with the newest value found so far.
+        """
+        with mock.patch.object(self.node.timers, 'schedule',
+                               wraps=self.node.timers.schedule) as mock_call:
+            lookup = Lookup(FindValue, self.target, self.node,
+                            self.event_loop, quorum=3, deadline=5)
+            mock_call.assert_any_call(5, lookup._on_deadline)
+        uuids = [uuid for uuid in lookup.pending_requests.keys()]
+        contact = lookup.shortlist[0]
+        msg = self.make_value(uuids[0], 1.0)
+        response = asyncio.Future()
+        response.set_result(msg)
+        lookup._handle_response(uuids[0], contact, response)
+        self.assertFalse(lookup.done())
+        lookup._on_deadline()
+        self.assertTrue(lookup.done())
+        self.assertEqual(msg, lookup.result())
+
+    def test_quorum_read_deadline_no_values(self):
+        """
+        If no values have been found when the deadline passes the lookup
+        resolves with the next value to arrive.
+        """
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop,
+                        quorum=3, deadline=5)
+        lookup._on_deadline()
+        self.assertFalse(lookup.done())
+        uuids = [uuid for uuid in lookup.pending_requests.keys()]
+        contact = lookup.shortlist[0]
+        msg = self.make_value(uuids[0], 1.0)
+        response = asyncio.Future()
+        response.set_result(msg)
+        lookup._handle_response(uuids[0], contact, response)
+        self.assertTrue(lookup.done())
+        self.assertEqual(msg, lookup.result())
+
+    def test_quorum_read_exhausted(self):
+        """
+        If a quorum read runs out of peers to ask having found some values it
+        resolves with the newest rather than a ValueNotFound error.
+        """
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop,
+                        quorum=5)
+        msg = self.make_value('abc', 1.0)
+        lookup.values.append((lookup.shortlist[0], msg))
+        lookup._finish()
+        self.assertEqual(msg, lookup.result())
+
     def test_handle_response_nodes_adds_closest_nodes_to_shortlist(self):
         """
         Ensures a Nodes message causes the referenced peer nodes to be added
@@ -686,3 +825,392 @@ class TestLookup(unittest.TestCase):
             v.set_result('foo')
             self.event_loop.run_until_complete(v)
         self.assertEqual(lookup._handle_response.call_count, 0)
+
+    def test_init_instrumentation(self):
+        """
+        Ensure a new lookup records its start time, first round and initial
+        distance to the target.
+        """
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        self.assertTrue(lookup.start_time <= time.time())
+        self.assertEqual(None, lookup.end_time)
+        self.assertEqual(1, lookup.rounds)
+        self.assertEqual(ALPHA, lookup.rpcs_sent)
+        self.assertEqual(1, len(lookup.distance_curve))
+        self.assertEqual(distance(lookup.nearest_node.network_id,
+                                  self.target),
+                         lookup.distance_curve[0][1])
+        self.assertEqual(None, lookup.termination)
+
+    def test_handle_response_counts_rpcs(self):
+        """
+        Successful and failed responses are counted.
+        """
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        lookup._lookup = mock.MagicMock()
+        uuids = list(lookup.pending_requests.keys())
+        contact = lookup.shortlist[0]
+        ok = asyncio.Future()
+        ok.set_result(Nodes(uuids[0], self.node.network_id,
+                            self.node.network_id, self.reply_port,
+                            self.version, self.seal, self.remote_nodes))
+        lookup._handle_response(uuids[0], contact, ok)
+        failed = asyncio.Future()
+        failed.set_exception(Exception('Boom'))
+        lookup._handle_response(uuids[1], contact, failed)
+        self.assertEqual(1, lookup.rpcs_succeeded)
+        self.assertEqual(1, lookup.rpcs_failed)
+        lookup._cancel_pending_requests()
+        self.assertEqual(1, lookup.rpcs_cancelled)
+
+    def test_publish_metrics(self):
+        """
+        When the lookup is done its statistics are published to the local
+        node's metrics registry.
+        """
+        self.node.metrics.trace_sample_rate = 1.0
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop)
+        lookup.set_exception(ValueNotFound('Boom'))
+        self.event_loop.run_until_complete(blip())
+        self.assertEqual('value_not_found', lookup.termination)
+        self.assertTrue(lookup.end_time >= lookup.start_time)
+        counters = self.node.metrics.counters
+        self.assertEqual(1, counters['lookup.findvalue.value_not_found'])
+        self.assertEqual(ALPHA, counters['lookup.findvalue.rpcs_sent'])
+        histogram = self.node.metrics.histograms['lookup.findvalue.duration']
+        self.assertEqual(1, histogram.count)
+        trace = self.node.metrics.traces[0]
+        self.assertEqual(trace['target'], self.target)
+        self.assertEqual(ALPHA, len(trace['contacted']))
+
+    def test_termination_reason(self):
+        """
+        Ensure the reason for the termination of the lookup is correctly
+        identified.
+        """
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        lookup.set_result([])
+        lookup.end_time = time.time()
+        self.assertEqual('nodes_found', lookup._termination_reason())
+        lookup = Lookup(FindValue, self.target, self.node, self.event_loop)
+        lookup.set_result('foo')
+        lookup.end_time = time.time()
+        self.assertEqual('value_found', lookup._termination_reason())
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        lookup.cancel()
+        lookup.end_time = time.time()
+        self.assertEqual('cancelled', lookup._termination_reason())
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop,
+                        timeout=0)
+        lookup.cancel()
+        lookup.end_time = time.time()
+        self.assertEqual('timed_out', lookup._termination_reason())
+        self.node.routing_table = RoutingTable(self.node.network_id)
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        lookup.end_time = time.time()
+        self.assertEqual('routing_table_empty', lookup._termination_reason())
+
+    def test_init_fixed_concurrency(self):
+        """
+        By default the concurrency of a lookup is fixed at ALPHA.
+        """
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        self.assertEqual(ALPHA, lookup.concurrency.alpha)
+        self.assertEqual(ALPHA, lookup.concurrency.minimum)
+        self.assertEqual(ALPHA, lookup.concurrency.maximum)
+
+    def test_init_adaptive_concurrency(self):
+        """
+        If the local node's adaptive_alpha flag is set then the concurrency
+        of the lookup varies within the expected bounds.
+        """
+        self.node.adaptive_alpha = True
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        self.assertEqual(ALPHA, lookup.concurrency.alpha)
+        self.assertEqual(ALPHA_MIN, lookup.concurrency.minimum)
+        self.assertEqual(ALPHA_MAX, lookup.concurrency.maximum)
+
+    def test_adaptive_lookup_widens_on_failure(self):
+        """
+        A failed request causes an adaptive lookup to widen its concurrency
+        and immediately make use of the extra capacity.
+        """
+        self.node.adaptive_alpha = True
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        uuid = list(lookup.pending_requests.keys())[0]
+        contact = lookup.shortlist[0]
+        response = asyncio.Future()
+        response.set_exception(Exception('Boom'))
+        lookup._handle_response(uuid, contact, response)
+        self.assertEqual(ALPHA + 1, lookup.concurrency.alpha)
+        self.assertEqual(ALPHA + 1, len(lookup.pending_requests))
+
+    def test_adaptive_lookup_widens_on_slow_response(self):
+        """
+        A slow response causes an adaptive lookup to widen its concurrency.
+        """
+        self.node.adaptive_alpha = True
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        uuid = list(lookup.pending_requests.keys())[0]
+        lookup.sent_at[uuid] -= SLOW_RESPONSE * 2
+        contact = lookup.shortlist[0]
+        msg = Nodes(uuid, self.node.network_id, self.node.network_id,
+                    self.reply_port, self.version, self.seal, [])
+        response = asyncio.Future()
+        response.set_result(msg)
+        lookup._handle_response(uuid, contact, response)
+        self.assertEqual(ALPHA + 1, lookup.concurrency.alpha)
+        self.assertEqual(ALPHA + 1, len(lookup.pending_requests))
+
+    def test_lookup_respects_inflight_budget(self):
+        """
+        No further requests are sent if the local node has too many requests
+        in flight. However, the lookup is always allowed one request so it
+        can make progress.
+        """
+        for i in range(300):
+            self.node.pending[str(i)] = asyncio.Future()
+        lookup = Lookup(FindNode, self.target, self.node, self.event_loop)
+        self.assertEqual(1, len(lookup.pending_requests))
+        self.assertEqual(1, self.node.send_find.call_count)
+
+
+class TestMultiLookup(unittest.TestCase):
+    """
+    Ensures the MultiLookup class works as expected.
+    """
+
+    def setUp(self):
+        """
+        Common vars.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.event_loop = asyncio.get_event_loop()
+        self.version = get_version()
+        self.reply_port = 1908
+        self.node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                         mock.MagicMock(), self.reply_port)
+        self.targets = [sha512(t.encode('utf-8')).hexdigest()
+                        for t in CLOSEST_TO_TARGET[:3]]
+        self.seal = 'afakesealthatwillnotverify'
+
+        def side_effect(*args, **kwargs):
+            return (str(uuid.uuid4()), asyncio.Future())
+        self.node.send_find_multi = mock.MagicMock(side_effect=side_effect)
+        for i in range(20):
+            uri = 'netstring://192.168.0.%d:%d/' % (i, self.reply_port)
+            contact = PeerNode(ORDERED_HASHES[i], self.version, uri, 0)
+            self.node.routing_table.add_contact(contact)
+
+    def make_result(self, uuid, results):
+        """
+        Returns a MultiResult message containing the referenced results.
+        """
+        return MultiResult(uuid, self.node.network_id, self.node.network_id,
+                           self.reply_port, self.version, self.seal, results)
+
+    def test_init(self):
+        """
+        Ensure instantiating the MultiLookup class batches the targets so
+        that each contacted peer receives a single message.
+        """
+        lookup = MultiLookup(FindValues, self.targets + self.targets[:1],
+                             self.node, self.event_loop)
+        self.assertIsInstance(lookup, asyncio.Future)
+        # Duplicate targets are ignored.
+        self.assertEqual(lookup.targets, self.targets)
+        # Each contacted peer receives a single message covering all the
+        # targets it is relevant for.
+        calls = self.node.send_find_multi.call_args_list
+        self.assertTrue(len(calls) < ALPHA * len(self.targets))
+        contacts = [call[0][0] for call in calls]
+        self.assertEqual(len(contacts), len(set(contacts)))
+        for call in calls:
+            self.assertEqual(call[0][2], FindValues)
+        for target in self.targets:
+            self.assertTrue(lookup.in_flight[target] >= ALPHA)
+            self.assertEqual(lookup.in_flight[target],
+                             len(lookup.contacted[target]))
+
+    def test_init_no_shortlist(self):
+        """
+        Ensure the Future is marked as done with a RoutingTableEmpty exception.
+        """
+        self.node.routing_table = RoutingTable(self.node.network_id)
+        lookup = MultiLookup(FindValues, self.targets, self.node,
+                             self.event_loop)
+        self.assertTrue(lookup.done())
+        self.assertRaises(RoutingTableEmpty, lookup.result)
+
+    def test_handle_response_value(self):
+        """
+        A valid item returned for a target finishes the lookup for that
+        target only.
+        """
+        lookup = MultiLookup(FindValues, self.targets, self.node,
+                             self.event_loop)
+        uuid = list(lookup.pending_requests.keys())[0]
+        contact = self.node.send_find_multi.call_args_list[0][0][0]
+        item = {
+            'key': self.targets[0],
+            'value': 'value',
+            'timestamp': time.time(),
+            'expires': 0.0,
+            'created_with': self.version,
+            'public_key': PUBLIC_KEY,
+            'name': 'name',
+            'signature': 'signature',
+        }
+        response = asyncio.Future()
+        response.set_result(self.make_result(uuid, {self.targets[0]: item}))
+        lookup._handle_response(uuid, contact, response)
+        self.assertIn(self.targets[0], lookup.finished)
+        result = lookup.results[self.targets[0]]
+        self.assertIsInstance(result, Value)
+        self.assertEqual(result.value, 'value')
+        self.assertNotIn(contact, lookup.shortlists[self.targets[0]])
+        # The other targets are still being looked up.
+        self.assertFalse(lookup.done())
+        self.assertNotIn(self.targets[1], lookup.finished)
+
+    def test_handle_response_value_wrong_key(self):
+        """
+        An item whose key doesn't match the target results in the peer being
+        blacklisted.
+        """
+        lookup = MultiLookup(FindValues, self.targets, self.node,
+                             self.event_loop)
+        uuid = list(lookup.pending_requests.keys())[0]
+        contact = self.node.send_find_multi.call_args_list[0][0][0]
+        item = {
+            'key': self.targets[1],
+            'value': 'value',
+            'timestamp': time.time(),
+            'expires': 0.0,
+            'created_with': self.version,
+            'public_key': PUBLIC_KEY,
+            'name': 'name',
+            'signature': 'signature',
+        }
+        response = asyncio.Future()
+        response.set_result(self.make_result(uuid, {self.targets[0]: item}))
+        lookup._blacklist = mock.MagicMock()
+        lookup._handle_response(uuid, contact, response)
+        lookup._blacklist.assert_called_once_with(contact)
+        self.assertNotIn(self.targets[0], lookup.finished)
+
+    def test_handle_response_wrong_message_type(self):
+        """
+        A response that isn't a MultiResult results in the peer being
+        blacklisted.
+        """
+        lookup = MultiLookup(FindValues, self.targets, self.node,
+                             self.event_loop)
+        uuid = list(lookup.pending_requests.keys())[0]
+        contact = self.node.send_find_multi.call_args_list[0][0][0]
+        msg = OK(uuid, self.node.network_id, self.node.network_id,
+                 self.reply_port, self.version, self.seal)
+        response = asyncio.Future()
+        response.set_result(msg)
+        lookup._blacklist = mock.MagicMock()
+        lookup._handle_response(uuid, contact, response)
+        lookup._blacklist.assert_called_once_with(contact)
+        self.assertNotIn(uuid, lookup.pending_requests)
+
+    def test_all_targets_finished_find_nodes(self):
+        """
+        When every contact has responded without any closer nodes the lookup
+        resolves with a dictionary mapping targets to their shortlists.
+        """
+        lookup = MultiLookup(FindNodesMulti, self.targets, self.node,
+                             self.event_loop)
+        while not lookup.done():
+            uuid = list(lookup.pending_requests.keys())[0]
+            future = lookup.pending_requests[uuid]
+            targets = lookup.pending_targets[uuid]
+            future.set_result(self.make_result(uuid, {t: [] for t in
+                                                      targets}))
+            self.event_loop.run_until_complete(blip())
+        result = lookup.result()
+        self.assertEqual(set(result.keys()), set(self.targets))
+        for target in self.targets:
+            self.assertEqual(result[target], lookup.shortlists[target])
+        # Each of the known peers is contacted at most once.
+        self.assertTrue(self.node.send_find_multi.call_count <= K)
+
+    def test_all_targets_finished_values_not_found(self):
+        """
+        When no values are found the lookup resolves with an empty dictionary.
+        """
+        lookup = MultiLookup(FindValues, self.targets, self.node,
+                             self.event_loop)
+        while not lookup.done():
+            uuid = list(lookup.pending_requests.keys())[0]
+            future = lookup.pending_requests[uuid]
+            targets = lookup.pending_targets[uuid]
+            future.set_result(self.make_result(uuid, {t: [] for t in
+                                                      targets}))
+            self.event_loop.run_until_complete(blip())
+        self.assertEqual({}, lookup.result())
+
+
+class TestAlphaController(unittest.TestCase):
+    """
+    Ensures the AlphaController class works as expected.
+    """
+
+    def test_init(self):
+        """
+        Ensure the initial value of alpha is within the bounds.
+        """
+        controller = AlphaController()
+        self.assertEqual(ALPHA, controller.alpha)
+        self.assertEqual(ALPHA_MIN, controller.minimum)
+        self.assertEqual(ALPHA_MAX, controller.maximum)
+        self.assertEqual(SLOW_RESPONSE, controller.slow)
+        controller = AlphaController(20, 1, 5)
+        self.assertEqual(5, controller.alpha)
+
+    def test_widen_and_narrow_within_bounds(self):
+        """
+        Alpha never goes beyond its bounds.
+        """
+        controller = AlphaController(2, 1, 3)
+        self.assertTrue(controller.widen())
+        self.assertFalse(controller.widen())
+        self.assertEqual(3, controller.alpha)
+        self.assertTrue(controller.narrow())
+        self.assertTrue(controller.narrow())
+        self.assertFalse(controller.narrow())
+        self.assertEqual(1, controller.alpha)
+
+    def test_on_response(self):
+        """
+        Slow responses widen alpha, fast improving responses narrow it and
+        fast responses that don't improve the lookup leave it unchanged.
+        """
+        controller = AlphaController(3, 1, 5, 1.0)
+        self.assertTrue(controller.on_response(2.0, False))
+        self.assertEqual(4, controller.alpha)
+        self.assertFalse(controller.on_response(0.1, True))
+        self.assertEqual(3, controller.alpha)
+        self.assertFalse(controller.on_response(0.1, False))
+        self.assertEqual(3, controller.alpha)
+
+    def test_on_failure(self):
+        """
+        Failures widen alpha.
+        """
+        controller = AlphaController(3, 1, 5)
+        self.assertTrue(controller.on_failure())
+        self.assertEqual(4, controller.alpha)
+
+    def test_fixed(self):
+        """
+        A controller with the same minimum and maximum never changes.
+        """
+        controller = AlphaController(ALPHA, ALPHA, ALPHA)
+        controller.on_failure()
+        controller.on_response(0.1, True)
+        self.assertEqual(ALPHA, controller.alpha)
@@ -11,7 +11,12 @@ much TDD as a reminder to my future self (and other maintainers).
 ;-)
 """
 from drogulus.dht.messages import (OK, Store, FindNode, Nodes, FindValue,
-                                   Value, to_dict, from_dict, make_message)
+                                   Value, FindValues, FindNodesMulti,
+                                   MultiResult, StoreMany, Summary,
+                                   Differences, StoreDigests, Missing,
+                                   Offer, HotValue, Subscribe, Notify, to_dict,
+                                   from_dict,
+                                   make_message)
 from drogulus.dht.crypto import get_signed_item, construct_key
 from drogulus.version import get_version
 from hashlib import sha512
@@ -342,6 +347,289 @@ class TestDictConversion(unittest.TestCase):
         self.assertEqual(result.name, self.name)
         self.assertEqual(result.signature, self.signature)
 
+    def test_from_dict_findvalues(self):
+        """
+        Ensures a valid findvalues message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'findvalues',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'keys': [self.key, ]
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, FindValues)
+        self.assertEqual(result.uuid, self.uuid)
+        self.assertEqual(result.seal, self.seal)
+        self.assertEqual(result.keys, [self.key, ])
+
+    def test_from_dict_findnodesmulti(self):
+        """
+        Ensures a valid findnodesmulti message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'findnodesmulti',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'keys': [self.key, ]
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, FindNodesMulti)
+        self.assertEqual(result.uuid, self.uuid)
+        self.assertEqual(result.keys, [self.key, ])
+
+    def test_from_dict_multiresult(self):
+        """
+        Ensures a valid multiresult message is correctly parsed.
+        """
+        results = {
+            self.key: self.nodes,
+        }
+        mock_message = {
+            'message': 'multiresult',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'results': results
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, MultiResult)
+        self.assertEqual(result.uuid, self.uuid)
+        self.assertEqual(result.results, results)
+        self.assertEqual('multiresult', to_dict(result)['message'])
+
+    def test_from_dict_storemany(self):
+        """
+        Ensures a valid storemany message is correctly parsed.
+        """
+        item = {
+            'key': self.key,
+            'value': self.value,
+            'timestamp': self.timestamp,
+            'expires': self.expires,
+            'created_with': self.created_with,
+            'public_key': self.public_key,
+            'name': self.name,
+            'signature': self.signature,
+        }
+        mock_message = {
+            'message': 'storemany',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'items': [item, ]
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, StoreMany)
+        self.assertEqual(result.uuid, self.uuid)
+        self.assertEqual(result.items, [item, ])
+        self.assertEqual('storemany', to_dict(result)['message'])
+
+    def test_from_dict_summary(self):
+        """
+        Ensures a valid summary message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'summary',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'prefix': 'ab',
+            'buckets': {'abcd': '1234'},
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, Summary)
+        self.assertEqual(result.prefix, 'ab')
+        self.assertEqual(result.buckets, {'abcd': '1234'})
+        self.assertEqual('summary', to_dict(result)['message'])
+
+    def test_from_dict_differences(self):
+        """
+        Ensures a valid differences message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'differences',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'buckets': {'abcd': ''},
+            'entries': {self.key: self.timestamp},
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, Differences)
+        self.assertEqual(result.buckets, {'abcd': ''})
+        self.assertEqual(result.entries, {self.key: self.timestamp})
+        self.assertEqual('differences', to_dict(result)['message'])
+
+    def test_from_dict_storedigests(self):
+        """
+        Ensures a valid storedigests message is correctly parsed.
+        """
+        item = {
+            'key': self.key,
+            'value': sha512(b'value').hexdigest(),
+            'timestamp': self.timestamp,
+            'expires': self.expires,
+            'created_with': self.created_with,
+            'public_key': self.public_key,
+            'name': self.name,
+            'signature': self.signature,
+        }
+        mock_message = {
+            'message': 'storedigests',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'items': [item, ]
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, StoreDigests)
+        self.assertEqual(result.items, [item, ])
+        self.assertEqual('storedigests', to_dict(result)['message'])
+
+    def test_from_dict_missing(self):
+        """
+        Ensures a valid missing message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'missing',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'keys': [self.key, ],
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, Missing)
+        self.assertEqual(result.keys, [self.key, ])
+        self.assertEqual('missing', to_dict(result)['message'])
+
+    def test_from_dict_offer(self):
+        """
+        Ensures a valid offer message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'offer',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'entries': {self.key: 1234.5},
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, Offer)
+        self.assertEqual(result.entries, {self.key: 1234.5})
+        self.assertEqual('offer', to_dict(result)['message'])
+
+    def test_from_dict_hotvalue(self):
+        """
+        Ensures a valid hotvalue message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'hotvalue',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'key': self.key,
+            'value': self.value,
+            'timestamp': self.timestamp,
+            'expires': self.expires,
+            'created_with': self.created_with,
+            'public_key': self.public_key,
+            'name': self.name,
+            'signature': self.signature,
+            'load': 12.5,
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, HotValue)
+        self.assertEqual(self.value, result.value)
+        self.assertEqual(12.5, result.load)
+        self.assertEqual('hotvalue', to_dict(result)['message'])
+        mock_message['load'] = -1.0
+        with self.assertRaises(ValueError):
+            from_dict(mock_message)
+
+    def test_from_dict_subscribe(self):
+        """
+        Ensures a valid subscribe message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'subscribe',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'key': self.key,
+            'lease': 300,
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, Subscribe)
+        self.assertEqual(self.key, result.key)
+        self.assertEqual(300, result.lease)
+        self.assertEqual('subscribe', to_dict(result)['message'])
+        mock_message['lease'] = -1
+        with self.assertRaises(ValueError):
+            from_dict(mock_message)
+
+    def test_from_dict_notify(self):
+        """
+        Ensures a valid notify message is correctly parsed.
+        """
+        mock_message = {
+            'message': 'notify',
+            'uuid': self.uuid,
+            'recipient': self.node,
+            'sender': self.node,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'seal': self.seal,
+            'key': self.key,
+            'value': self.value,
+            'timestamp': self.timestamp,
+            'expires': self.expires,
+            'created_with': self.created_with,
+            'public_key': self.public_key,
+            'name': self.name,
+            'signature': self.signature,
+        }
+        result = from_dict(mock_message)
+        self.assertIsInstance(result, Notify)
+        self.assertEqual(self.value, result.value)
+        self.assertEqual(self.timestamp, result.timestamp)
+        self.assertEqual('notify', to_dict(result)['message'])
+
     def test_from_dict_unknown_request(self):
         """
         Ensures the correct exception is raised if the message is not
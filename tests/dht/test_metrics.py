@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the in-process metrics registry works as expected.
+"""
+from drogulus.dht.metrics import Histogram, MetricsRegistry, LATENCY_BOUNDS
+from unittest import mock
+import io
+import json
+import unittest
+
+
+class TestHistogram(unittest.TestCase):
+    """
+    Ensures the Histogram class works as expected.
+    """
+
+    def test_init(self):
+        """
+        Ensure the histogram starts empty with the expected buckets.
+        """
+        histogram = Histogram()
+        self.assertEqual(LATENCY_BOUNDS, histogram.bounds)
+        self.assertEqual(len(LATENCY_BOUNDS) + 1, len(histogram.buckets))
+        self.assertEqual(0, histogram.count)
+        self.assertEqual(0.0, histogram.mean())
+
+    def test_observe(self):
+        """
+        Values are counted in the first bucket whose bound is greater than or
+        equal to them. Larger values are counted in the overflow bucket.
+        """
+        histogram = Histogram((1.0, 2.0))
+        histogram.observe(0.5)
+        histogram.observe(1.0)
+        histogram.observe(1.5)
+        histogram.observe(99.0)
+        self.assertEqual([2, 1, 1], histogram.buckets)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.5, histogram.minimum)
+        self.assertEqual(99.0, histogram.maximum)
+        self.assertEqual(102.0 / 4, histogram.mean())
+
+    def test_dump(self):
+        """
+        Ensure the dump can be serialised into JSON.
+        """
+        histogram = Histogram((1.0, 2.0))
+        histogram.observe(3.0)
+        result = histogram.dump()
+        self.assertEqual(1, result['count'])
+        self.assertEqual(1, result['buckets']['+inf'])
+        self.assertEqual(0, result['buckets']['1.0'])
+        json.dumps(result)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """
+    Ensures the MetricsRegistry class works as expected.
+    """
+
+    def test_increment(self):
+        """
+        Counters are created on demand and incremented by the given amount.
+        """
+        metrics = MetricsRegistry()
+        metrics.increment('foo')
+        metrics.increment('foo', 2)
+        self.assertEqual(3, metrics.counters['foo'])
+
+    def test_observe(self):
+        """
+        Histograms are created on demand.
+        """
+        metrics = MetricsRegistry()
+        metrics.observe('foo', 0.1)
+        metrics.observe('foo', 0.2)
+        self.assertEqual(2, metrics.histograms['foo'].count)
+
+    def test_sample_trace_not_sampled(self):
+        """
+        By default no traces are kept.
+        """
+        metrics = MetricsRegistry()
+        self.assertFalse(metrics.sample_trace({'foo': 'bar'}))
+        self.assertEqual(0, len(metrics.traces))
+
+    def test_sample_trace(self):
+        """
+        Traces are kept with the configured probability and the number of
+        traces is bounded.
+        """
+        metrics = MetricsRegistry(trace_sample_rate=0.5, max_traces=2)
+        with mock.patch('drogulus.dht.metrics.random.random',
+                        return_value=0.1):
+            for i in range(3):
+                self.assertTrue(metrics.sample_trace({'i': i}))
+        with mock.patch('drogulus.dht.metrics.random.random',
+                        return_value=0.9):
+            self.assertFalse(metrics.sample_trace({'i': 4}))
+        self.assertEqual([{'i': 1}, {'i': 2}], list(metrics.traces))
+
+    def test_dump(self):
+        """
+        Ensure the dump contains all the metrics and can be serialised into
+        JSON.
+        """
+        metrics = MetricsRegistry(trace_sample_rate=1.0)
+        metrics.increment('foo')
+        metrics.observe('bar', 0.1)
+        metrics.sample_trace({'baz': 'qux'})
+        result = metrics.dump()
+        self.assertEqual({'foo': 1}, result['counters'])
+        self.assertEqual(1, result['histograms']['bar']['count'])
+        self.assertEqual([{'baz': 'qux'}], result['traces'])
+        json.dumps(result)
+
+    def test_dump_traces(self):
+        """
+        Traces are written to the output as lines of JSON.
+        """
+        metrics = MetricsRegistry(trace_sample_rate=1.0)
+        metrics.sample_trace({'foo': 1})
+        metrics.sample_trace({'foo': 2})
+        output = io.StringIO()
+        metrics.dump_traces(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([{'foo': 1}, {'foo': 2}],
+                         [json.loads(line) for line in lines])
@@ -6,23 +6,42 @@ expected
 from drogulus.version import get_version
 from drogulus.dht.node import Node
 from drogulus.dht.routingtable import RoutingTable
-from drogulus.dht.storage import DictDataStore
+from drogulus.dht.replication import Replication
+from drogulus.dht.storage import (DictDataStore, BoundedDataStore,
+                                  SQLiteDataStore, CompactDataStore)
+from drogulus.dht.blobstore import BlobStore, value_digest
 from drogulus.dht.messages import (OK, Store, FindNode, Nodes,
-                                   FindValue, Value, from_dict, to_dict)
+                                   FindValue, Value, FindValues,
+                                   FindNodesMulti, MultiResult, StoreMany,
+                                   Summary, Differences, StoreDigests,
+                                   Missing, Offer, HotValue, Subscribe,
+                                   Notify, from_dict, to_dict)
 from drogulus.dht.crypto import (get_signed_item, get_seal, check_seal,
                                  construct_key, _get_hash, verify_item)
 from drogulus.dht.errors import (BadMessage, ExpiredMessage, OutOfDateMessage,
                                  UnverifiableProvenance, TimedOut,
-                                 RoutingTableEmpty)
+                                 RoutingTableEmpty, QuotaExceeded, TooBig,
+                                 SyncRefused)
 from drogulus.dht.contact import PeerNode
-from drogulus.dht.constants import (REPLICATE_INTERVAL, REFRESH_INTERVAL,
-                                    RESPONSE_TIMEOUT)
+from drogulus.dht.constants import (REFRESH_INTERVAL, RESPONSE_TIMEOUT,
+                                    SYNC_INTERVAL,
+                                    EXPIRY_SWEEP_INTERVAL, EXPIRY_SWEEP_SIZE,
+                                    HOT_KEY_RATE, CACHE_MIN_LIFETIME, K,
+                                    SUBSCRIPTION_LEASE_MAX, REPLICATE_INTERVAL,
+                                    HANDOFF_MAX_ITEMS)
 from drogulus.dht.bucket import Bucket
+from drogulus.dht.hotkeys import cache_lifetime
+from drogulus.dht.subscriptions import Watch
+from drogulus.dht.erasure import fragment_name
 from ..keys import PRIVATE_KEY, PUBLIC_KEY, BAD_PUBLIC_KEY
 from unittest.mock import MagicMock, patch
+from collections import namedtuple
 from hashlib import sha512
 from unittest import mock
 import rsa
+import os
+import shutil
+import tempfile
 import binascii
 import asyncio
 import uuid
@@ -137,6 +156,104 @@ class TestNode(unittest.TestCase):
         self.assertEqual(node.pending, {})
         self.assertEqual(node.version, self.version)
 
+    def test_init_with_data_store(self):
+        """
+        Ensures the node uses the data store it is given.
+        """
+        data_store = DictDataStore()
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, data_store)
+        self.assertIs(node.data_store, data_store)
+
+    def test_init_with_storage_budget(self):
+        """
+        Ensures the node bounds its in-memory data store if given a storage
+        budget.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, storage_budget=1024)
+        self.assertIsInstance(node.data_store, BoundedDataStore)
+        self.assertEqual(1024, node.data_store.max_bytes)
+        self.assertIs(node.routing_table, node.data_store.routing_table)
+        self.assertIs(node.metrics, node.data_store.metrics)
+
+    def test_init_with_blob_threshold(self):
+        """
+        Ensures the node's in-memory data store (bounded or not) shares large
+        values in a blob store if given a blob threshold.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, blob_threshold=10)
+        self.assertIsInstance(node.data_store.blobs, BlobStore)
+        self.assertEqual(10, node.data_store.blobs.threshold)
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, storage_budget=1024, blob_threshold=10)
+        self.assertIsInstance(node.data_store, BoundedDataStore)
+        self.assertIsInstance(node.data_store.blobs, BlobStore)
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.assertIsNone(node.data_store.blobs)
+
+    def test_init_with_compress_threshold(self):
+        """
+        Ensures the node holds items compressed in a CompactDataStore if
+        given a compress threshold (a bounded store can't compress).
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, compress_threshold=100)
+        self.assertIsInstance(node.data_store, CompactDataStore)
+        self.assertEqual(100, node.data_store.compress_threshold)
+        self.assertIs(node.metrics, node.data_store.metrics)
+        item = get_signed_item('large', 'x' * 1000, PUBLIC_KEY, PRIVATE_KEY)
+        item['message'] = 'store'
+        message = from_dict(dict(self.signed_item, **item))
+        node.handle_store(message, self.contact)
+        self.assertEqual('x' * 1000, node.data_store[message.key].value)
+        counters = node.metrics.counters
+        self.assertEqual(1, counters['storage.compression.compressed'])
+        with self.assertRaises(ValueError):
+            Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                 self.reply_port, storage_budget=1024,
+                 compress_threshold=100)
+        node.republisher.stop()
+
+    def test_init_compact(self):
+        """
+        Ensures the node holds items in a CompactDataStore (without
+        compression) if the compact flag is set.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, compact=True, blob_threshold=10)
+        self.assertIsInstance(node.data_store, CompactDataStore)
+        self.assertIsNone(node.data_store.compress_threshold)
+        self.assertIsInstance(node.data_store.blobs, BlobStore)
+        with self.assertRaises(ValueError):
+            Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                 self.reply_port, storage_budget=1024, compact=True)
+        node.republisher.stop()
+
+    def test_init_with_trace_sample_rate(self):
+        """
+        Ensures the node's metrics keep the given proportion of traces.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.assertEqual(0.0, node.metrics.trace_sample_rate)
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, trace_sample_rate=0.25)
+        self.assertEqual(0.25, node.metrics.trace_sample_rate)
+
+    def test_init_data_store_metrics(self):
+        """
+        A given data store that reports to a MetricsRegistry but doesn't
+        have one reports to the node's.
+        """
+        data_store = SQLiteDataStore(':memory:', compress_threshold=100)
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, data_store)
+        self.assertIs(node.metrics, data_store.metrics)
+        data_store.close()
+
     def test_join(self):
         """
         Ensures the join method works with a populated routing table.
@@ -148,7 +265,11 @@ class TestNode(unittest.TestCase):
         mock_lookup = lookup_patcher.start()
         with patch.object(self.event_loop, 'call_later') as mock_call:
             node.join(self.data_dump)
-            mock_call.assert_called_once_with(REFRESH_INTERVAL, node.refresh)
+            self.assertEqual(3, mock_call.call_count)
+            mock_call.assert_any_call(REFRESH_INTERVAL, node.refresh)
+            mock_call.assert_any_call(EXPIRY_SWEEP_INTERVAL,
+                                      node.purge_expired)
+            mock_call.assert_any_call(SYNC_INTERVAL, node.synchroniser._tick)
         mock_lookup.assert_called_once_with(FindNode, node.network_id, node,
                                             node.event_loop)
         lookup_patcher.stop()
@@ -327,18 +448,12 @@ class TestNode(unittest.TestCase):
                     self.reply_port)
         self.signed_item['message'] = 'store'
         message = from_dict(self.signed_item)
-        with patch.object(self.event_loop, 'call_later') as mock_call:
+        with patch.object(node.republisher, 'schedule') as mock_call:
             result = node.handle_store(message, self.contact)
             self.assertIsInstance(result, OK)
             self.assertEqual(result.uuid, message.uuid)
             self.assertEqual(result.recipient, message.sender)
-            self.assertEqual(1, mock_call.call_count)
-            self.assertEqual(mock_call.call_args_list[0][0][0],
-                             REPLICATE_INTERVAL)
-            self.assertEqual(mock_call.call_args_list[0][0][1],
-                             node.republish)
-            self.assertEqual(mock_call.call_args_list[0][0][2],
-                             message.key)
+            mock_call.assert_called_once_with(message.key)
         self.assertEqual(message, node.data_store[message.key])
 
     def test_handle_store_bad_signature(self):
@@ -452,6 +567,35 @@ class TestNode(unittest.TestCase):
             node.handle_store(older_message, self.contact)
         self.assertIn('Most recent timestamp: ', ex.exception.args[0])
 
+    def test_handle_store_publisher_quota(self):
+        """
+        If the publisher of a new item already has publisher_quota items in
+        the local data store then raise an error.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.publisher_quota = 0
+        with self.assertRaises(QuotaExceeded):
+            node.handle_store(self.message, self.contact)
+        self.assertNotIn(self.message.key, node.data_store)
+
+    def test_message_received_new_contact_handoff(self):
+        """
+        Ensure a contact newly added to the routing table is queued for the
+        handoff of items while a known contact isn't.
+        """
+        # The message is from a different node.
+        node = Node(BAD_PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                    self.connector, self.reply_port)
+        node.handoff.contact_added = mock.MagicMock()
+        node.handle_store = mock.MagicMock()
+        node.message_received(self.message, 'http', '192.168.0.1', 1908)
+        self.assertEqual(1, node.handoff.contact_added.call_count)
+        contact = node.handoff.contact_added.call_args[0][0]
+        self.assertEqual(self.contact.network_id, contact.network_id)
+        node.message_received(self.message, 'http', '192.168.0.1', 1908)
+        self.assertEqual(1, node.handoff.contact_added.call_count)
+
     def test_message_received_find_node(self):
         """
         Make sure a FindNode message is handled correctly.
@@ -580,6 +724,56 @@ class TestNode(unittest.TestCase):
         self.assertEqual(1, node.data_store.touch.call_count)
         node.data_store.touch.assert_called_once_with(k)
 
+    def test_handle_find_value_hot(self):
+        """
+        Make sure a FindValue message for a hot key (requested at least
+        HOT_KEY_RATE times a second) causes a HotValue message reporting the
+        load to be sent to the remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.data_store[self.message.key] = self.message
+        node.request_rates.record = MagicMock(return_value=HOT_KEY_RATE * 3)
+        msg_dict = {
+            'uuid': str(uuid.uuid4()),
+            'recipient': PUBLIC_KEY,
+            'sender': PUBLIC_KEY,
+            'reply_port': 1908,
+            'version': self.version,
+            'key': self.message.key,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'findvalue'
+        message = from_dict(msg_dict)
+        result = node.handle_find_value(message, self.contact)
+        node.request_rates.record.assert_called_once_with(self.message.key)
+        self.assertIsInstance(result, HotValue)
+        self.assertEqual(message.uuid, result.uuid)
+        self.assertEqual(HOT_KEY_RATE * 3, result.load)
+        self.assertEqual(self.message.value, result.value)
+        self.assertTrue(check_seal(result))
+        self.assertTrue(verify_item(to_dict(result)))
+        self.assertEqual(1, node.metrics.counters['cache.hot_responses'])
+
+    def test_handle_find_value_records_rate(self):
+        """
+        Requests are counted even if the local node doesn't hold the key.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        msg_dict = {
+            'uuid': str(uuid.uuid4()),
+            'recipient': PUBLIC_KEY,
+            'sender': PUBLIC_KEY,
+            'reply_port': 1908,
+            'version': self.version,
+            'key': self.message.key,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'findvalue'
+        node.handle_find_value(from_dict(msg_dict), self.contact)
+        self.assertTrue(node.request_rates.rate(self.message.key) > 0.0)
+
     def test_handle_find_value_unknown_key(self):
         """
         Make sure a FindValue message for an unknown key/value pair causes the
@@ -604,6 +798,36 @@ class TestNode(unittest.TestCase):
         node.handle_find_value(message, self.contact)
         node.handle_find_node.assert_called_once_with(message, self.contact)
 
+    def test_handle_find_value_expired(self):
+        """
+        Make sure an expired item is never served in response to a FindValue
+        message. Instead it is deleted and the message is handled as if the
+        item were unknown.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        expired = self.message._replace(expires=1.0)
+        node.data_store[expired.key] = expired
+        node.make_value = mock.MagicMock()
+        node.handle_find_node = mock.MagicMock()
+        msg_dict = {
+            'uuid': str(uuid.uuid4()),
+            'recipient': PUBLIC_KEY,
+            'sender': PUBLIC_KEY,
+            'reply_port': 1908,
+            'version': self.version,
+            'key': expired.key,
+        }
+        seal = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = 'findvalue'
+        message = from_dict(msg_dict)
+        node.handle_find_value(message, self.contact)
+        self.assertEqual(0, node.make_value.call_count)
+        node.handle_find_node.assert_called_once_with(message, self.contact)
+        self.assertNotIn(expired.key, node.data_store)
+        self.assertEqual(1, node.metrics.counters['storage.expired'])
+
     def test_message_received_value(self):
         """
         Ensure that Value messages are handled correctly.
@@ -703,6 +927,162 @@ class TestNode(unittest.TestCase):
         node.handle_nodes(message)
         node.trigger_task.assert_called_once_with(message)
 
+    def make_batched_message(self, message_type, keys):
+        """
+        Returns a sealed batched request of the referenced message type for
+        the given keys.
+        """
+        msg_dict = {
+            'uuid': str(uuid.uuid4()),
+            'recipient': PUBLIC_KEY,
+            'sender': PUBLIC_KEY,
+            'reply_port': 1908,
+            'version': self.version,
+            'keys': keys,
+        }
+        seal = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['seal'] = seal
+        msg_dict['message'] = message_type
+        return from_dict(msg_dict)
+
+    def test_message_received_find_values(self):
+        """
+        Make sure a FindValues message is handled correctly.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.handle_find_values = mock.MagicMock()
+        message = self.make_batched_message('findvalues', [self.key, ])
+        node.message_received(message, 'http', '192.168.0.1', 1908)
+        node.handle_find_values.assert_called_once_with(message,
+                                                        self.contact)
+
+    def test_handle_find_values(self):
+        """
+        Make sure a FindValues message returns a MultiResult containing items
+        for known keys and nodes for unknown keys. Known items are touched.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.data_store[self.key] = self.message
+        node.data_store.touch = mock.MagicMock()
+        unknown = sha512('a key'.encode('utf-8')).hexdigest()
+        message = self.make_batched_message('findvalues',
+                                            [self.key, unknown])
+        result = node.handle_find_values(message, self.contact)
+        self.assertIsInstance(result, MultiResult)
+        self.assertEqual(result.uuid, message.uuid)
+        self.assertEqual(result.recipient, message.sender)
+        self.assertTrue(check_seal(result))
+        item = result.results[self.key]
+        self.assertEqual(item['value'], self.value)
+        self.assertTrue(verify_item(item))
+        self.assertIsInstance(result.results[unknown], list)
+        node.data_store.touch.assert_called_once_with(self.key)
+
+    def test_handle_find_nodes_multi(self):
+        """
+        Make sure a FindNodesMulti message returns a MultiResult containing
+        nodes for each requested key.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.data_store[self.key] = self.message
+        other = sha512('a key'.encode('utf-8')).hexdigest()
+        message = self.make_batched_message('findnodesmulti',
+                                            [self.key, other])
+        result = node.message_received(message, 'http', '192.168.0.1', 1908)
+        self.assertIsInstance(result, MultiResult)
+        self.assertIsInstance(result.results[self.key], list)
+        self.assertIsInstance(result.results[other], list)
+
+    def test_handle_multi_result_valid(self):
+        """
+        Ensure a MultiResult message containing valid items resolves the
+        correct Future.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.data_store[self.key] = self.message
+        request = self.make_batched_message('findvalues', [self.key, ])
+        message = node.handle_find_values(request, self.contact)
+        node.trigger_task = mock.MagicMock()
+        node.handle_multi_result(message, self.contact)
+        node.trigger_task.assert_called_once_with(message)
+
+    def test_handle_multi_result_not_valid(self):
+        """
+        Ensure a MultiResult message containing an invalid item results in
+        the remote peer being removed from the routing table and the correct
+        Future being resolved with the expected exception.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        item = {
+            'key': self.key,
+            'value': 'tampered value',
+            'timestamp': self.timestamp,
+            'expires': self.expires,
+            'created_with': self.created_with,
+            'public_key': self.public_key,
+            'name': self.name,
+            'signature': self.signature,
+        }
+        message = node.make_multi_result(self.message, {self.key: item})
+        node.trigger_task = mock.MagicMock()
+        node.routing_table.remove_contact = MagicMock()
+        with patch('drogulus.dht.node.log.error'):
+            node.handle_multi_result(message, self.contact)
+        node.routing_table.remove_contact.\
+            assert_called_once_with(self.contact.network_id, True)
+        e = node.trigger_task.call_args_list[0][1]['error']
+        self.assertIsInstance(e, UnverifiableProvenance)
+
+    def test_send_find_multi(self):
+        """
+        Ensure that batched FindValues and FindNodesMulti messages are
+        correctly constructed and sent to the remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        node.send_find_multi(self.contact, [self.key, ], FindValues)
+        node.send_find_multi(self.contact, [self.key, ], FindNodesMulti)
+        self.assertEqual(2, node.send_message.call_count)
+        msg = node.send_message.call_args_list[0][0][1]
+        self.assertIsInstance(msg, FindValues)
+        self.assertEqual([self.key, ], msg.keys)
+        self.assertTrue(check_seal(msg))
+        msg = node.send_message.call_args_list[1][0][1]
+        self.assertIsInstance(msg, FindNodesMulti)
+
+    def test_retrieve_many(self):
+        """
+        Ensure a call to retrieve_many returns a MultiLookup for the
+        referenced keys.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        patcher = patch('drogulus.dht.node.MultiLookup')
+        mock_lookup = patcher.start()
+        node.retrieve_many([self.key, ])
+        mock_lookup.assert_called_once_with(FindValues, [self.key, ], node,
+                                            node.event_loop)
+        patcher.stop()
+
+    def test_retrieve_many_no_keys(self):
+        """
+        Ensure retrieving no keys resolves straight away (rather than waiting
+        for a lookup to time out).
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        with patch('drogulus.dht.node.MultiLookup') as mock_lookup:
+            result = node.retrieve_many([])
+            self.assertEqual(0, mock_lookup.call_count)
+        self.assertTrue(result.done())
+        self.assertEqual({}, result.result())
+
     def test_trigger_task(self):
         """
         Ensure the referenced task is resolved with the passed in message. The
@@ -752,14 +1132,15 @@ class TestNode(unittest.TestCase):
         Ensure that the send_message creates a task that is added to the
         local node's pending dict, adds an on_complete callback and returns
         the task as a result. Additionally, checks that a the task times out
-        after RESPONSE_TIMEOUT seconds.
+        after RESPONSE_TIMEOUT seconds (via the node's timer wheel).
 
         When the task is resolved the on_complete callback should remove it
-        from the local node's pending dict.
+        from the local node's pending dict and the timeout is cancelled.
         """
         node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
                     self.reply_port)
-        with patch.object(self.event_loop, 'call_later') as mock_call:
+        with patch.object(node.timers, 'schedule',
+                          wraps=node.timers.schedule) as mock_call:
             uuid, task = node.send_message(self.contact, self.message)
             self.connector.future.set_result('done')
             self.event_loop.run_until_complete(blip())
@@ -774,10 +1155,30 @@ class TestNode(unittest.TestCase):
         self.assertEqual(self.message.uuid, uuid)
         self.assertIn(self.message.uuid, node.pending)
         self.assertEqual(task, node.pending[self.message.uuid])
-        self.assertEqual(1, len(task._callbacks))
+        self.assertEqual(2, len(task._callbacks))
+        self.assertEqual(1, len(node.timers))
         self.event_loop.call_soon(task.set_result, 'foo')
         self.event_loop.run_until_complete(blip())
         self.assertNotIn(self.message.uuid, node.pending)
+        self.assertEqual(0, len(node.timers))
+
+    def test_send_message_records_metrics(self):
+        """
+        Ensure the outcome and latency of responses are recorded by message
+        type in the node's metrics registry.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        uuid, future = node.send_message(self.contact, self.message)
+        future.set_result('foo')
+        uuid, failed = node.send_message(self.contact, self.message)
+        failed.set_exception(TimedOut())
+        self.event_loop.run_until_complete(blip())
+        counters = node.metrics.counters
+        self.assertEqual(2, counters['rpc.value.sent'])
+        self.assertEqual(1, counters['rpc.value.succeeded'])
+        self.assertEqual(1, counters['rpc.value.failed'])
+        self.assertEqual(1, node.metrics.histograms['rpc.value.latency'].count)
 
     def test_send_message_fire_and_forget(self):
         """
@@ -1130,6 +1531,75 @@ class TestNode(unittest.TestCase):
         self.event_loop.run_until_complete(result)
         self.assertTrue(result.done())
 
+    def test_replicate_write_quorum(self):
+        """
+        Make sure that, given a write quorum, replicate returns a Replication
+        that starts storing the item once the Lookup instance completes and
+        resolves when enough peers acknowledge it.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        nodes = []
+        for i in range(20):
+            uri = 'http://192.168.0.%d:9999/' % i
+            contact = PeerNode(str(i), self.version, uri, 0)
+            node.routing_table.add_contact(contact)
+            nodes.append([PUBLIC_KEY, self.version, uri])
+
+        def side_effect(*args):
+            """
+            Ensures the mock_send_find returns something useful.
+            """
+            u = str(uuid.uuid4())
+            task = asyncio.Future()
+            msg_dict = {
+                'uuid': u,
+                'recipient': PUBLIC_KEY,
+                'sender': PUBLIC_KEY,
+                'reply_port': 1908,
+                'version': self.version,
+                'nodes': nodes
+            }
+            seal = get_seal(msg_dict, PRIVATE_KEY)
+            msg_dict['seal'] = seal
+            msg_dict['message'] = 'nodes'
+            message = from_dict(msg_dict)
+            task.set_result(message)
+            return (u, task)
+
+        def store_side_effect(*args):
+            """
+            Every peer acknowledges the item.
+            """
+            task = asyncio.Future()
+            task.set_result('ok')
+            return (str(uuid.uuid4()), task)
+
+        node.send_find = MagicMock(side_effect=side_effect)
+        node.send_store = MagicMock(side_effect=store_side_effect)
+        result = node.replicate(5, self.key, self.value, self.timestamp,
+                                self.expires, self.created_with,
+                                self.public_key, self.name, self.signature,
+                                write_quorum=3)
+        self.assertIsInstance(result, Replication)
+        self.event_loop.run_until_complete(result)
+        self.assertEqual(3, len(result.result()))
+        self.assertEqual(5, node.send_store.call_count)
+
+    def test_replicate_write_quorum_empty_routing_table(self):
+        """
+        Ensure a replication with a write quorum errbacks if the routing
+        table is empty.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        result = node.replicate(5, self.key, self.value, self.timestamp,
+                                self.expires, self.created_with,
+                                self.public_key, self.name, self.signature,
+                                write_quorum=3)
+        self.assertIsInstance(result, Replication)
+        self.assertIsInstance(result.exception(), RoutingTableEmpty)
+
     def test_replicate_future_resolves_with_expected_exception(self):
         """
         Make sure the Future returned from replicate is fired with a the
@@ -1299,6 +1769,51 @@ class TestNode(unittest.TestCase):
                                                 self.message.name,
                                                 self.message.signature)
 
+    def test_retrieve_hot_value_causes_more_caching(self):
+        """
+        Ensure the retrieval of a value from a node reporting a high load
+        causes the value to be cached at more of the closest nodes that did
+        not return it.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        for i in range(20):
+            uri = 'http://192.168.0.%d:9999/'
+            contact = PeerNode(PUBLIC_KEY, self.version, uri, 0)
+            contact.network_id = hex(2 ** i)
+            node.routing_table.add_contact(contact)
+
+        def side_effect(*args):
+            """
+            Ensures the mock returns something useful.
+            """
+            u = str(uuid.uuid4())
+            task = asyncio.Future()
+            return (u, task)
+
+        node.send_find = MagicMock(side_effect=side_effect)
+        lookup = node.retrieve(self.message.key)
+        node.send_store = MagicMock()
+
+        uid = [i for i in lookup.pending_requests.keys()][0]
+        contact = lookup.shortlist[0]
+        response = asyncio.Future()
+        hot = HotValue(*(tuple(self.message) + (HOT_KEY_RATE * 10, )))
+        response.set_result(hot)
+        lookup._handle_response(uid, contact, response)
+        self.event_loop.run_until_complete(blip())
+        self.assertEqual(hot, lookup.result())
+        expected = [candidate for candidate in lookup.shortlist
+                    if candidate in lookup.contacted]
+        self.assertTrue(len(expected) > 1)
+        self.assertEqual(len(expected), node.send_store.call_count)
+        for call, candidate in zip(node.send_store.call_args_list,
+                                   expected):
+            self.assertEqual(candidate, call[0][0])
+            self.assertEqual(self.message.value, call[0][2])
+        self.assertEqual(len(expected),
+                         node.metrics.counters['cache.copies_sent'])
+
     def test_retrieve_with_bad_result(self):
         """
         If the result is not found or bad in some way (i.e. the lookup has
@@ -1329,7 +1844,97 @@ class TestNode(unittest.TestCase):
         self.event_loop.run_until_complete(blip())
         self.assertEqual(0, node.send_store.call_count)
 
-    def test_refresh(self):
+    def test_retrieve_quorum_read_repair(self):
+        """
+        Ensure a quorum read resolves with the newest value and pushes it to
+        the peers that returned an older version or no value at all.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        for i in range(20):
+            uri = 'http://192.168.0.%d:9999/'
+            contact = PeerNode(PUBLIC_KEY, self.version, uri, 0)
+            contact.network_id = hex(2 ** i)
+            node.routing_table.add_contact(contact)
+
+        def side_effect(*args):
+            """
+            Ensures the mock returns something useful.
+            """
+            u = str(uuid.uuid4())
+            task = asyncio.Future()
+            return (u, task)
+
+        node.send_find = MagicMock(side_effect=side_effect)
+        key = self.message.key
+        lookup = node.retrieve(key, quorum=2)
+        node.send_store = MagicMock()
+        self.assertEqual(2, lookup.quorum)
+        uids = [i for i in lookup.pending_requests.keys()]
+        no_value, stale, fresh = lookup.shortlist[:3]
+        # The first peer has no value.
+        nodes = Nodes(uids[0], node.network_id, node.network_id,
+                      self.reply_port, self.version, 'seal', [])
+        response = asyncio.Future()
+        response.set_result(nodes)
+        lookup._handle_response(uids[0], no_value, response)
+        # The second peer has a stale value.
+        old_message = self.message._replace(timestamp=1.0)
+        response = asyncio.Future()
+        response.set_result(old_message)
+        lookup._handle_response(uids[1], stale, response)
+        self.assertFalse(lookup.done())
+        # The third peer has the newest value.
+        response = asyncio.Future()
+        response.set_result(self.message)
+        lookup._handle_response(uids[2], fresh, response)
+        self.event_loop.run_until_complete(blip())
+        self.assertTrue(lookup.done())
+        self.assertEqual(self.message, lookup.result())
+        self.assertEqual(2, node.send_store.call_count)
+        repaired = [c[0][0] for c in node.send_store.call_args_list]
+        self.assertEqual([stale, no_value], repaired)
+        node.send_store.assert_called_with(no_value, self.message.key,
+                                           self.message.value,
+                                           self.message.timestamp,
+                                           self.message.expires,
+                                           self.message.created_with,
+                                           self.message.public_key,
+                                           self.message.name,
+                                           self.message.signature)
+        self.assertEqual(2, node.metrics.counters['read_repair.stores'])
+
+    def test_purge_expired(self):
+        """
+        Ensure expired items are deleted from the data store in sweeps and
+        the next sweep is scheduled.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        expired = self.message._replace(expires=1.0)
+        node.data_store[expired.key] = expired
+        with patch.object(self.event_loop, 'call_later') as mock_call:
+            node.purge_expired()
+            mock_call.assert_called_once_with(EXPIRY_SWEEP_INTERVAL,
+                                              node.purge_expired)
+        self.assertNotIn(expired.key, node.data_store)
+        self.assertEqual(1, node.metrics.counters['storage.expired'])
+
+    def test_purge_expired_more_to_come(self):
+        """
+        If a sweep reaches its limit the next sweep happens immediately.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.data_store.purge_expired = mock.MagicMock(
+            return_value=['key'] * EXPIRY_SWEEP_SIZE)
+        with patch.object(self.event_loop, 'call_soon') as mock_call:
+            node.purge_expired()
+            mock_call.assert_called_once_with(node.purge_expired)
+        node.data_store.purge_expired.assert_called_once_with(
+            limit=EXPIRY_SWEEP_SIZE)
+
+    def test_refresh(self):
         """
         Ensure that the refresh method sends the required number of lookups to
         keep the routing table fresh.
@@ -1353,6 +1958,81 @@ class TestNode(unittest.TestCase):
         self.assertEqual(1, mock_lookup.call_count)
         lookup_patcher.stop()
 
+    def test_handle_store_duplicate_one_schedule(self):
+        """
+        Ensure that storing the same item more than once results in only a
+        single scheduled republication check.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        node.handle_store(message, self.contact)
+        node.handle_store(message, self.contact)
+        self.assertEqual(1, len(node.republisher))
+        self.assertIn(message.key, node.republisher)
+        node.republisher.stop()
+
+    def test_handle_store_duplicate_fast_path(self):
+        """
+        Storing an identical copy of an item already held refreshes its
+        last-update time and acknowledges it without verifying the item
+        again or rescheduling its republication check.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        node.handle_store(message, self.contact)
+        node.data_store._set_item(message.key, (message, 123.45, 0.0))
+        with patch('drogulus.dht.node.verify_item') as mock_verify:
+            with patch.object(node.republisher, 'schedule') as mock_call:
+                result = node.handle_store(message, self.contact)
+                self.assertEqual(0, mock_call.call_count)
+            self.assertEqual(0, mock_verify.call_count)
+        self.assertIsInstance(result, OK)
+        self.assertTrue(node.data_store.updated(message.key) > 123.45)
+        self.assertEqual(1, node.metrics.counters['store.duplicates'])
+        node.republisher.stop()
+
+    def test_handle_store_duplicate_expired(self):
+        """
+        An expired copy of an item is rejected even if an identical copy is
+        held (rather than being refreshed).
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        node.handle_store(message, self.contact)
+        node.data_store._set_item(message.key, (message, 123.45, 0.0))
+        expired = message._replace(expires=1.0)
+        node._is_duplicate = MagicMock(return_value=True)
+        with self.assertRaises(ExpiredMessage):
+            node.handle_store(expired, self.contact)
+        self.assertEqual(0, node._is_duplicate.call_count)
+        self.assertEqual(123.45, node.data_store.updated(message.key))
+        self.assertNotIn('store.duplicates', node.metrics.counters)
+        node.republisher.stop()
+
+    def test_handle_store_not_duplicate_if_different(self):
+        """
+        An item with the same key but a different signature is verified (and
+        rejected if it can't be).
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.routing_table.blacklist = mock.MagicMock()
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        node.handle_store(message, self.contact)
+        self.signed_item['value'] = 'a different value'
+        forged = from_dict(self.signed_item)
+        with self.assertRaises(UnverifiableProvenance):
+            node.handle_store(forged, self.contact)
+        self.assertEqual(self.value, node.data_store[message.key].value)
+        node.republisher.stop()
+
     def test_republish_no_item(self):
         """
         Check that the republish check works when the affected item has
@@ -1422,12 +2102,11 @@ class TestNode(unittest.TestCase):
         node.data_store[message.key] = message
         patcher = patch('drogulus.dht.node.log.info')
         mock_log = patcher.start()
-        mock_handler = MagicMock()
-        with patch.object(self.event_loop, 'call_later',
-                          return_value=mock_handler) as mock_call:
+        node.republisher.schedule(message.key)
+        with patch.object(node.republisher, 'schedule') as mock_call:
             node.republish(message.key)
-            mock_call.assert_called_once_with(REPLICATE_INTERVAL,
-                                              node.republish, message.key)
+            self.assertEqual(0, mock_call.call_count)
+        self.assertNotIn(message.key, node.republisher)
         self.assertEqual(2, mock_log.call_count)
         expected = 'Republish check for key: %s' % message.key
         self.assertEqual(expected, mock_log.call_args_list[0][0][0])
@@ -1458,12 +2137,10 @@ class TestNode(unittest.TestCase):
         node.data_store._set_item(message.key, (message, 123.45, now))
         patcher = patch('drogulus.dht.node.log.info')
         mock_log = patcher.start()
-        mock_handler = MagicMock()
-        with patch.object(self.event_loop, 'call_later',
-                          return_value=mock_handler) as mock_call:
+        with patch.object(node.republisher, 'schedule') as mock_call:
             node.republish(message.key)
-            mock_call.assert_called_once_with(REPLICATE_INTERVAL,
-                                              node.republish, message.key)
+            mock_call.assert_called_once_with(message.key)
+        self.assertEqual([message, ], node.republication_queue)
         self.assertEqual(2, mock_log.call_count)
         expected = 'Republish check for key: %s' % message.key
         self.assertEqual(expected, mock_log.call_args_list[0][0][0])
@@ -1495,17 +2172,42 @@ class TestNode(unittest.TestCase):
         node.data_store._set_item(message.key, (message, now, now))
         patcher = patch('drogulus.dht.node.log.info')
         mock_log = patcher.start()
-        mock_handler = MagicMock()
-        with patch.object(self.event_loop, 'call_later',
-                          return_value=mock_handler) as mock_call:
+        with patch.object(node.republisher, 'schedule') as mock_call:
             node.republish(message.key)
-            mock_call.assert_called_once_with(REPLICATE_INTERVAL,
-                                              node.republish, message.key)
+            mock_call.assert_called_once_with(message.key)
         self.assertEqual(1, mock_log.call_count)
         expected = 'Republish check for key: %s' % message.key
         self.assertEqual(expected, mock_log.call_args_list[0][0][0])
         patcher.stop()
 
+    def test_republish_fragment(self):
+        """
+        Fragments of erasure coded values are never replicated to K peers
+        nor removed due to lack of activity, but are checked again (so they
+        are removed once expired).
+        """
+        signed_item = get_signed_item(fragment_name(self.name, 3), self.value,
+                                      PUBLIC_KEY, PRIVATE_KEY, 0)
+        signed_item['uuid'] = self.uuid
+        signed_item['sender'] = self.sender
+        signed_item['recipient'] = self.recipient
+        signed_item['reply_port'] = self.reply_port
+        signed_item['version'] = self.version
+        signed_item['seal'] = get_seal(signed_item, PRIVATE_KEY)
+        signed_item['message'] = 'store'
+        message = from_dict(signed_item)
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.replicate = MagicMock()
+        node.data_store._set_item(message.key, (message, 123.45, 123.45))
+        with patch.object(node.republisher, 'schedule') as mock_call:
+            node.republish(message.key)
+            mock_call.assert_called_once_with(message.key)
+        self.assertEqual([], node.republication_queue)
+        self.assertEqual([], node.flush_republication())
+        self.assertEqual(0, node.replicate.call_count)
+        self.assertIn(message.key, node.data_store)
+
     def test_republish_replication_lack_of_activity(self):
         """
         Check that the republish check kicks off replication if the
@@ -1530,13 +2232,12 @@ class TestNode(unittest.TestCase):
         node.data_store._set_item(message.key, (message, 123.45, 123.45))
         patcher = patch('drogulus.dht.node.log.info')
         mock_log = patcher.start()
-        mock_handler = MagicMock()
-        mock_handler.cancel = MagicMock()
-        with patch.object(self.event_loop, 'call_later',
-                          return_value=mock_handler) as mock_call:
+        node.republisher.schedule(message.key)
+        with patch.object(node.republisher, 'schedule') as mock_call:
             node.republish(message.key)
-            mock_call.assert_called_once_with(REPLICATE_INTERVAL,
-                                              node.republish, message.key)
+            self.assertEqual(0, mock_call.call_count)
+        self.assertNotIn(message.key, node.republisher)
+        self.assertEqual([message, ], node.republication_queue)
         self.assertEqual(3, mock_log.call_count)
         expected = 'Republish check for key: %s' % message.key
         self.assertEqual(expected, mock_log.call_args_list[0][0][0])
@@ -1544,7 +2245,6 @@ class TestNode(unittest.TestCase):
         self.assertEqual(msg, mock_log.call_args_list[1][0][0])
         msg = 'Removing %s due to lack of activity.' % message.key
         self.assertEqual(msg, mock_log.call_args_list[2][0][0])
-        self.assertEqual(1, mock_handler.cancel.call_count)
         patcher.stop()
 
     def test_republish_no_replication_lack_of_activity(self):
@@ -1572,17 +2272,917 @@ class TestNode(unittest.TestCase):
         node.data_store[message.key] = message
         patcher = patch('drogulus.dht.node.log.info')
         mock_log = patcher.start()
-        mock_handler = MagicMock()
-        mock_handler.cancel = MagicMock()
-        with patch.object(self.event_loop, 'call_later',
-                          return_value=mock_handler) as mock_call:
+        node.republisher.schedule(message.key)
+        with patch.object(node.republisher, 'schedule') as mock_call:
             node.republish(message.key)
-            mock_call.assert_called_once_with(REPLICATE_INTERVAL,
-                                              node.republish, message.key)
+            self.assertEqual(0, mock_call.call_count)
+        self.assertNotIn(message.key, node.republisher)
         self.assertEqual(2, mock_log.call_count)
         expected = 'Republish check for key: %s' % message.key
         self.assertEqual(expected, mock_log.call_args_list[0][0][0])
         msg = 'Removing %s due to lack of activity.' % message.key
         self.assertEqual(msg, mock_log.call_args_list[1][0][0])
-        self.assertEqual(1, mock_handler.cancel.call_count)
         patcher.stop()
+
+    def close_contacts(self, key):
+        """
+        Returns K contacts (far) closer to the key than the local node.
+        """
+        result = []
+        for i in range(K):
+            contact = PeerNode(PUBLIC_KEY, self.version,
+                               'http://192.168.0.1:%d/' % i, 0)
+            contact.network_id = '{:0128x}'.format(int(key, 16) ^ 2 ** i)
+            result.append(contact)
+        return result
+
+    def test_cache_lifetime(self):
+        """
+        The local node holds a cached copy if it isn't amongst the K closest
+        nodes it knows of to the key. The lifetime shrinks with each extra bit
+        of distance.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        key = '0' * 128
+        contacts = self.close_contacts(key)
+        node.routing_table.find_close_nodes = MagicMock(return_value=[])
+        self.assertIsNone(node.cache_lifetime(key))
+        node.routing_table.find_close_nodes.return_value = contacts
+        node.network_id = '{:0128x}'.format(2 ** 30)
+        # The furthest contact is 2 ** (K - 1) from the key.
+        self.assertEqual(cache_lifetime(31 - K), node.cache_lifetime(key))
+        node.network_id = '{:0128x}'.format(1)
+        self.assertIsNone(node.cache_lifetime(key))
+
+    def test_store_item_cached_copy(self):
+        """
+        A cached copy is checked once its lifetime has passed (rather than
+        scheduled for republication).
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.routing_table.find_close_nodes = MagicMock(
+            return_value=self.close_contacts(self.message.key))
+        with patch.object(node.republisher, 'schedule') as mock_call:
+            node._store_item(self.message)
+            mock_call.assert_called_once_with(self.message.key,
+                                              CACHE_MIN_LIFETIME)
+        self.assertEqual(CACHE_MIN_LIFETIME,
+                         node.cache_lifetimes[self.message.key])
+        # Stored again once the local node is amongst the closest nodes.
+        node.routing_table.find_close_nodes.return_value = []
+        with patch.object(node.republisher, 'schedule') as mock_call:
+            node._store_item(self.message)
+            mock_call.assert_called_once_with(self.message.key)
+        self.assertNotIn(self.message.key, node.cache_lifetimes)
+
+    def test_republish_cached_copy_lack_of_activity(self):
+        """
+        A cached copy that hasn't been requested for its lifetime is deleted
+        without being republished.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        key = self.message.key
+        node.routing_table.find_close_nodes = MagicMock(
+            return_value=self.close_contacts(key))
+        old = time.time() - CACHE_MIN_LIFETIME - 1
+        node.data_store._set_item(key, (self.message, old, old))
+        node.cache_lifetimes[key] = CACHE_MIN_LIFETIME
+        node.republisher.schedule(key)
+        node.republish(key)
+        self.assertNotIn(key, node.data_store)
+        self.assertNotIn(key, node.cache_lifetimes)
+        self.assertNotIn(key, node.republisher)
+        self.assertEqual([], node.republication_queue)
+        self.assertEqual(1, node.metrics.counters['cache.evicted'])
+
+    def test_republish_cached_copy_requested(self):
+        """
+        A cached copy that has been requested recently is kept (but not
+        republished) and checked again when it would reach the end of its
+        lifetime.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        key = self.message.key
+        node.routing_table.find_close_nodes = MagicMock(
+            return_value=self.close_contacts(key))
+        node.data_store._set_item(key, (self.message, 123.45, time.time()))
+        node.cache_lifetimes[key] = CACHE_MIN_LIFETIME
+        with patch.object(node.republisher, 'schedule') as mock_call:
+            node.republish(key)
+            self.assertEqual(1, mock_call.call_count)
+            delay = mock_call.call_args[0][1]
+            self.assertTrue(0 < delay <= CACHE_MIN_LIFETIME)
+        self.assertIn(key, node.data_store)
+        self.assertEqual([], node.republication_queue)
+
+    def test_republish_cached_copy_promoted(self):
+        """
+        A cached copy becomes a replica if the local node has become one of
+        the K closest nodes it knows of to the key.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        key = self.message.key
+        node.routing_table.find_close_nodes = MagicMock(return_value=[])
+        node.data_store._set_item(key, (self.message, 123.45, 123.45))
+        node.cache_lifetimes[key] = CACHE_MIN_LIFETIME
+        with patch.object(node.republisher, 'schedule') as mock_call:
+            node.republish(key)
+            mock_call.assert_called_once_with(key)
+        self.assertIn(key, node.data_store)
+        self.assertNotIn(key, node.cache_lifetimes)
+
+    def make_store_many(self, items):
+        """
+        Returns a StoreMany message containing the given items.
+        """
+        msg_dict = {
+            'uuid': self.uuid,
+            'recipient': self.recipient,
+            'sender': self.sender,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'items': items,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'storemany'
+        return from_dict(msg_dict)
+
+    def test_handle_store_many(self):
+        """
+        Ensure a StoreMany message results in each item being checked and
+        stored (with a republication check scheduled) and an OK being
+        returned to the remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        items = [get_signed_item('name %d' % i, 'value', PUBLIC_KEY,
+                                 PRIVATE_KEY, 0) for i in range(3)]
+        message = self.make_store_many(items)
+        with patch.object(node.republisher, 'schedule') as mock_call:
+            result = node.message_received(message, 'http', '192.168.0.1',
+                                           1908)
+            self.assertEqual(3, mock_call.call_count)
+        self.assertIsInstance(result, OK)
+        self.assertEqual(result.uuid, message.uuid)
+        for item in items:
+            stored = node.data_store[item['key']]
+            self.assertIsInstance(stored, Store)
+            self.assertEqual(item['value'], stored.value)
+            self.assertEqual(item['signature'], stored.signature)
+            self.assertTrue(verify_item(to_dict(stored)))
+
+    def test_handle_store_many_skips_out_of_date(self):
+        """
+        Items that are out of date are skipped while the rest of the items
+        are stored.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        old = get_signed_item('foo', 'old', PUBLIC_KEY, PRIVATE_KEY, 0)
+        new = get_signed_item('foo', 'new', PUBLIC_KEY, PRIVATE_KEY, 0)
+        other = get_signed_item('bar', 'bar', PUBLIC_KEY, PRIVATE_KEY, 0)
+        node.handle_store_many(self.make_store_many([new, ]), self.contact)
+        with patch('drogulus.dht.node.verify_item',
+                   return_value=True) as mock_verify:
+            result = node.handle_store_many(
+                self.make_store_many([old, other, new]), self.contact)
+            # The duplicate isn't verified again.
+            self.assertEqual(2, mock_verify.call_count)
+        self.assertEqual(1, node.metrics.counters['store.duplicates'])
+        self.assertIsInstance(result, OK)
+        self.assertEqual('new', node.data_store[new['key']].value)
+        self.assertEqual('bar', node.data_store[other['key']].value)
+        node.republisher.stop()
+
+    def test_handle_store_many_skips_expired_duplicate(self):
+        """
+        Expired items are skipped (not refreshed) even if an identical copy
+        is held.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        item = get_signed_item('foo', 'foo', PUBLIC_KEY, PRIVATE_KEY, 0)
+        node.handle_store_many(self.make_store_many([item, ]), self.contact)
+        node.data_store._set_item(item['key'],
+                                  (node.data_store[item['key']], 123.45, 0.0))
+        expired = dict(item, expires=1.0)
+        node._is_duplicate = MagicMock(return_value=True)
+        result = node.handle_store_many(self.make_store_many([expired, ]),
+                                        self.contact)
+        self.assertIsInstance(result, OK)
+        self.assertEqual(0, node._is_duplicate.call_count)
+        self.assertEqual(123.45, node.data_store.updated(item['key']))
+        node.republisher.stop()
+
+    def test_handle_store_many_publisher_quota(self):
+        """
+        New items from a publisher that has used up its quota are skipped
+        but updates of items already held are still accepted.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.publisher_quota = 2
+        items = [get_signed_item('name %d' % i, 'value', PUBLIC_KEY,
+                                 PRIVATE_KEY, 0) for i in range(3)]
+        result = node.handle_store_many(self.make_store_many(items),
+                                        self.contact)
+        self.assertIsInstance(result, OK)
+        self.assertIn(items[0]['key'], node.data_store)
+        self.assertIn(items[1]['key'], node.data_store)
+        self.assertNotIn(items[2]['key'], node.data_store)
+        self.assertEqual(1, node.metrics.counters['store.quota_exceeded'])
+        update = get_signed_item('name 0', 'new', PUBLIC_KEY, PRIVATE_KEY, 0)
+        node.handle_store_many(self.make_store_many([update, ]),
+                               self.contact)
+        self.assertEqual('new', node.data_store[update['key']].value)
+        publisher_id = node.data_store.publisher_id(PUBLIC_KEY)
+        self.assertEqual(2, node.data_store.count_published(publisher_id))
+        node.republisher.stop()
+
+    def test_handle_store_many_bad_signature(self):
+        """
+        If any item in a StoreMany message can't be verified none of the
+        items are stored and the sending node is blacklisted.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.routing_table.blacklist = mock.MagicMock()
+        good = get_signed_item('foo', 'value', PUBLIC_KEY, PRIVATE_KEY, 0)
+        bad = get_signed_item('bar', 'value', PUBLIC_KEY, PRIVATE_KEY, 0)
+        bad['signature'] = 'thiswillfail'
+        message = self.make_store_many([good, bad])
+        with self.assertRaises(UnverifiableProvenance):
+            node.handle_store_many(message, self.contact)
+        node.routing_table.blacklist.assert_called_once_with(self.contact)
+        self.assertNotIn(good['key'], node.data_store)
+
+    def make_store_digests(self, items):
+        """
+        Returns a StoreDigests message containing the given items with their
+        values replaced by digests.
+        """
+        digests = []
+        for item in items:
+            item = dict(item)
+            item['value'] = value_digest(item['value'])
+            digests.append(item)
+        msg_dict = {
+            'uuid': self.uuid,
+            'recipient': self.recipient,
+            'sender': self.sender,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'items': digests,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'storedigests'
+        return from_dict(msg_dict)
+
+    def test_handle_store_digests(self):
+        """
+        Items whose values are held in the local blob store are verified and
+        stored with the shared value. The keys of the other items are
+        returned in a Missing message.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port,
+                    data_store=DictDataStore(BlobStore(threshold=10)))
+        document = {'text': 'a large document'}
+        held = get_signed_item('held', document, PUBLIC_KEY, PRIVATE_KEY, 0)
+        held['message'] = 'store'
+        node.handle_store(from_dict(dict(self.signed_item, **held)),
+                          self.contact)
+        found = get_signed_item('found', document, PUBLIC_KEY, PRIVATE_KEY,
+                                0)
+        other = get_signed_item('other', {'text': 'something else'},
+                                PUBLIC_KEY, PRIVATE_KEY, 0)
+        message = self.make_store_digests([found, other])
+        result = node.message_received(message, 'http', '192.168.0.1', 1908)
+        self.assertIsInstance(result, Missing)
+        self.assertEqual(message.uuid, result.uuid)
+        self.assertEqual([other['key'], ], result.keys)
+        stored = node.data_store[found['key']]
+        self.assertTrue(verify_item(to_dict(stored)))
+        self.assertIs(node.data_store[held['key']].value, stored.value)
+        self.assertNotIn(other['key'], node.data_store)
+        self.assertEqual(1, node.metrics.counters['blobs.digests_found'])
+        self.assertEqual(1, node.metrics.counters['blobs.digests_missing'])
+        # Once every value is held an OK is returned.
+        result = node.handle_store_digests(self.make_store_digests([found]),
+                                           self.contact)
+        self.assertIsInstance(result, OK)
+        node.republisher.stop()
+
+    def test_handle_store_digests_no_blob_store(self):
+        """
+        Without a blob store every item is reported missing.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        item = get_signed_item('foo', 'value', PUBLIC_KEY, PRIVATE_KEY, 0)
+        result = node.handle_store_digests(self.make_store_digests([item]),
+                                           self.contact)
+        self.assertIsInstance(result, Missing)
+        self.assertEqual([item['key'], ], result.keys)
+        self.assertEqual(0, len(node.data_store))
+
+    def make_offer(self, entries):
+        """
+        Returns an Offer message containing the given entries.
+        """
+        msg_dict = {
+            'uuid': self.uuid,
+            'recipient': self.recipient,
+            'sender': self.sender,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'entries': entries,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'offer'
+        return from_dict(msg_dict)
+
+    def test_handle_offer(self):
+        """
+        The keys of the offered items that aren't held (or are held in an
+        older version) are returned in a Missing message. Once every item is
+        held an OK message is returned.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.signed_item['message'] = 'store'
+        node.handle_store(from_dict(self.signed_item), self.contact)
+        other = get_signed_item('other', 'value', PUBLIC_KEY, PRIVATE_KEY, 0)
+        message = self.make_offer({self.key: self.timestamp,
+                                   other['key']: other['timestamp']})
+        result = node.message_received(message, 'http', '192.168.0.1', 1908)
+        self.assertIsInstance(result, Missing)
+        self.assertEqual(message.uuid, result.uuid)
+        self.assertEqual([other['key'], ], result.keys)
+        # A newer version is missing too.
+        message = self.make_offer({self.key: self.timestamp + 1})
+        result = node.handle_offer(message, self.contact)
+        self.assertEqual([self.key, ], result.keys)
+        result = node.handle_offer(self.make_offer({self.key:
+                                                    self.timestamp}),
+                                   self.contact)
+        self.assertIsInstance(result, OK)
+        node.republisher.stop()
+
+    def test_handle_offer_too_big(self):
+        """
+        Offers of more than HANDOFF_MAX_ITEMS items are refused.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        entries = dict((sha512(str(i).encode('utf-8')).hexdigest(), 1.0)
+                       for i in range(HANDOFF_MAX_ITEMS + 1))
+        with self.assertRaises(TooBig):
+            node.handle_offer(self.make_offer(entries), self.contact)
+
+    def test_send_offer(self):
+        """
+        Ensure that an Offer message is correctly constructed and sent to the
+        remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        node.send_offer(self.contact, {self.key: self.timestamp})
+        self.assertEqual(1, node.send_message.call_count)
+        contact, msg = node.send_message.call_args[0]
+        self.assertEqual(self.contact, contact)
+        self.assertIsInstance(msg, Offer)
+        self.assertTrue(check_seal(msg))
+        self.assertEqual({self.key: self.timestamp}, msg.entries)
+
+    def test_send_store_digests(self):
+        """
+        Ensure that a StoreDigests message is correctly constructed and sent
+        to the remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        item = dict((field, self.signed_item[field]) for field in
+                    ('key', 'value', 'timestamp', 'expires', 'created_with',
+                     'public_key', 'name', 'signature'))
+        item['value'] = value_digest(item['value'])
+        node.send_store_digests(self.contact, [item, ])
+        self.assertEqual(1, node.send_message.call_count)
+        contact, msg = node.send_message.call_args[0]
+        self.assertEqual(self.contact, contact)
+        self.assertIsInstance(msg, StoreDigests)
+        self.assertEqual([item, ], msg.items)
+        self.assertTrue(check_seal(msg))
+
+    def test_send_store_many(self):
+        """
+        Ensure that a StoreMany message is correctly constructed from the
+        stored items and sent to the remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        self.signed_item['message'] = 'store'
+        store = from_dict(self.signed_item)
+        node.send_store_many(self.contact, [store, ])
+        self.assertEqual(1, node.send_message.call_count)
+        self.assertEqual(node.send_message.call_args_list[0][0][0],
+                         self.contact)
+        msg = node.send_message.call_args_list[0][0][1]
+        self.assertIsInstance(msg, StoreMany)
+        self.assertTrue(check_seal(msg))
+        self.assertEqual(1, len(msg.items))
+        self.assertTrue(verify_item(msg.items[0]))
+        self.assertEqual(store.key, msg.items[0]['key'])
+
+    def test_send_items(self):
+        """
+        Items are sent in StoreMany messages capped by size and an item too
+        big to share a message is sent in a Store message of its own.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock(return_value=('uuid', 'task'))
+        self.signed_item['message'] = 'store'
+        items = []
+        for name in ('a', 'b', 'c'):
+            signed = dict(self.signed_item)
+            signed.update(get_signed_item(name, self.value, PUBLIC_KEY,
+                                          PRIVATE_KEY, 0))
+            items.append(from_dict(signed))
+        megabyte = 1024 * 1024
+        sizes = {items[0].key: 3 * megabyte, items[1].key: 3 * megabyte,
+                 items[2].key: 5 * megabyte}
+        result = node.send_items(self.contact, items, sizes)
+        self.assertEqual([('task', 3 * megabyte)] * 2 +
+                         [('task', 5 * megabyte)], result)
+        messages = [call[0][1] for call in node.send_message.call_args_list]
+        self.assertIsInstance(messages[0], StoreMany)
+        self.assertEqual(items[0].key, messages[0].items[0]['key'])
+        self.assertIsInstance(messages[1], StoreMany)
+        self.assertIsInstance(messages[2], Store)
+        self.assertEqual(items[2].key, messages[2].key)
+        self.assertTrue(verify_item(to_dict(messages[2])))
+        # Sizes are measured if not given.
+        node.send_message.reset_mock()
+        self.assertEqual(1, len(node.send_items(self.contact, items)))
+        self.assertIsInstance(node.send_message.call_args[0][1], StoreMany)
+
+    def make_subscribe(self, lease):
+        """
+        Returns a Subscribe message for self.key with the given lease.
+        """
+        msg_dict = {
+            'uuid': str(uuid.uuid4()),
+            'recipient': PUBLIC_KEY,
+            'sender': PUBLIC_KEY,
+            'reply_port': 1908,
+            'version': self.version,
+            'key': self.key,
+            'lease': lease,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'subscribe'
+        return from_dict(msg_dict)
+
+    def make_notify(self):
+        """
+        Returns a Notify message containing the item in self.signed_item.
+        """
+        self.signed_item['message'] = 'notify'
+        return from_dict(self.signed_item)
+
+    def test_message_received_subscribe(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.handle_subscribe = mock.MagicMock()
+        message = self.make_subscribe(300)
+        node.message_received(message, 'http', '192.168.0.1', 1908)
+        node.handle_subscribe.assert_called_once_with(message, self.contact)
+
+    def test_message_received_notify(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.handle_notify = mock.MagicMock()
+        message = self.make_notify()
+        node.message_received(message, 'http', '192.168.0.1', 1908)
+        node.handle_notify.assert_called_once_with(message, self.contact)
+
+    def test_handle_subscribe(self):
+        """
+        The remote peer is subscribed to the key for (at most)
+        SUBSCRIPTION_LEASE_MAX seconds and a lease of zero cancels the
+        subscription.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        message = self.make_subscribe(SUBSCRIPTION_LEASE_MAX * 2)
+        result = node.handle_subscribe(message, self.contact)
+        self.assertIsInstance(result, OK)
+        self.assertEqual(message.uuid, result.uuid)
+        self.assertEqual([self.contact],
+                         node.subscriptions.subscribers(self.key))
+        later = time.time() + SUBSCRIPTION_LEASE_MAX + 1
+        self.assertEqual([], node.subscriptions.subscribers(self.key, later))
+        node.handle_subscribe(message, self.contact)
+        result = node.handle_subscribe(self.make_subscribe(0), self.contact)
+        self.assertIsInstance(result, OK)
+        self.assertEqual([], node.subscriptions.subscribers(self.key))
+        self.assertEqual(2, node.metrics.counters['subscriptions.added'])
+        self.assertEqual(1, node.metrics.counters['subscriptions.removed'])
+
+    def test_store_item_notifies_subscribers(self):
+        """
+        A newly stored item is pushed to the subscribers of its key but a
+        duplicate isn't.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.subscriptions.add(self.key, self.contact, 300)
+        node.send_notify = MagicMock()
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        node.handle_store(message, self.contact)
+        node.send_notify.assert_called_once_with(self.contact, message)
+        self.assertEqual(1, node.metrics.counters['subscriptions.notified'])
+        node.handle_store(message, self.contact)
+        self.assertEqual(1, node.send_notify.call_count)
+
+    def test_send_subscribe(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        node.send_subscribe(self.contact, self.key, 300)
+        contact, msg = node.send_message.call_args[0]
+        self.assertEqual(self.contact, contact)
+        self.assertIsInstance(msg, Subscribe)
+        self.assertEqual(self.key, msg.key)
+        self.assertEqual(300, msg.lease)
+        self.assertTrue(check_seal(msg))
+
+    def test_send_notify(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        node.send_notify(self.contact, self.message)
+        contact, msg = node.send_message.call_args[0]
+        self.assertEqual(self.contact, contact)
+        self.assertIsInstance(msg, Notify)
+        self.assertEqual(self.value, msg.value)
+        self.assertTrue(check_seal(msg))
+        self.assertTrue(verify_item(to_dict(msg)))
+
+    def test_handle_notify(self):
+        """
+        A new version of a watched key is passed to the watch's callbacks.
+        Old versions and unwatched keys are ignored.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        callback = MagicMock()
+        node.watches[self.key] = Watch(self.key)
+        node.watches[self.key].callbacks.append(callback)
+        message = self.make_notify()
+        result = node.handle_notify(message, self.contact)
+        self.assertIsInstance(result, OK)
+        self.assertEqual(message.uuid, result.uuid)
+        callback.assert_called_once_with(message)
+        node.handle_notify(message, self.contact)
+        del node.watches[self.key]
+        node.handle_notify(message, self.contact)
+        self.assertEqual(1, callback.call_count)
+        self.assertEqual(1, node.metrics.counters['subscriptions.updates'])
+        self.assertEqual(2, node.metrics.counters['subscriptions.ignored'])
+
+    def test_handle_notify_bad_signature(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.routing_table.blacklist = MagicMock()
+        self.signed_item['public_key'] = BAD_PUBLIC_KEY
+        with patch('drogulus.dht.node.log.error'):
+            with self.assertRaises(UnverifiableProvenance):
+                node.handle_notify(self.make_notify(), self.contact)
+        node.routing_table.blacklist.assert_called_once_with(self.contact)
+
+    def test_handle_notify_key_mismatch(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        message = self.make_notify()._replace(key='foo')
+        with patch('drogulus.dht.node.verify_item', return_value=True):
+            with self.assertRaises(BadMessage):
+                node.handle_notify(message, self.contact)
+
+    def test_watch(self):
+        """
+        Watching a key subscribes with the closest nodes found to the key and
+        schedules the renewal of the subscriptions.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        other = PeerNode(BAD_PUBLIC_KEY, self.version,
+                         'http://192.168.0.2:1908')
+        lookup = asyncio.Future()
+        acks = [asyncio.Future(), asyncio.Future()]
+        node.send_subscribe = MagicMock(side_effect=[('1', acks[0]),
+                                                     ('2', acks[1])])
+        callback = MagicMock()
+        with patch('drogulus.dht.node.Lookup',
+                   return_value=lookup) as mock_lookup:
+            result = node.watch(self.key, callback, 100)
+            mock_lookup.assert_called_once_with(FindNode, self.key, node,
+                                                node.event_loop)
+        watch = node.watches[self.key]
+        self.assertEqual([callback], watch.callbacks)
+        self.assertEqual(100, watch.lease)
+        self.assertIs(result, watch.subscribed)
+        self.assertIsNotNone(watch.renewal)
+        lookup.set_result([self.contact, other])
+        self.event_loop.run_until_complete(blip())
+        node.send_subscribe.assert_any_call(self.contact, self.key, 100)
+        node.send_subscribe.assert_any_call(other, self.key, 100)
+        acks[0].set_result('ok')
+        acks[1].set_exception(TimedOut())
+        self.event_loop.run_until_complete(result)
+        self.assertEqual([self.contact], result.result())
+        self.assertEqual([self.contact], watch.contacts)
+        self.assertEqual(2, node.metrics.counters['subscriptions.sent'])
+        watch.renewal.cancel()
+
+    def test_watch_existing(self):
+        """
+        Another callback for a watched key doesn't cause more subscriptions.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.subscribe = MagicMock()
+        node.watch(self.key, 'first')
+        node.watch(self.key, 'second')
+        self.assertEqual(1, node.subscribe.call_count)
+        self.assertEqual(['first', 'second'],
+                         node.watches[self.key].callbacks)
+
+    def test_watch_caps_lease(self):
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.subscribe = MagicMock()
+        node.watch(self.key, 'callback', SUBSCRIPTION_LEASE_MAX * 2)
+        self.assertEqual(SUBSCRIPTION_LEASE_MAX, node.watches[self.key].lease)
+
+    def test_watch_empty_routing_table(self):
+        """
+        The subscriptions fail (but are retried when the renewal is due).
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        result = node.watch(self.key, 'callback')
+        self.assertTrue(result.done())
+        with self.assertRaises(RoutingTableEmpty):
+            result.result()
+        self.assertIsNotNone(node.watches[self.key].renewal)
+        node.watches[self.key].renewal.cancel()
+
+    def test_unwatch(self):
+        """
+        The subscriptions are only cancelled once the last callback is
+        removed.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.subscribe = MagicMock()
+        node.watch(self.key, 'first')
+        node.watch(self.key, 'second')
+        watch = node.watches[self.key]
+        watch.contacts = [self.contact, ]
+        watch.renewal = MagicMock()
+        task = asyncio.Future()
+        node.send_subscribe = MagicMock(return_value=('1', task))
+        self.assertEqual([], node.unwatch(self.key, 'first'))
+        self.assertIn(self.key, node.watches)
+        self.assertEqual([task], node.unwatch(self.key, 'second'))
+        self.assertNotIn(self.key, node.watches)
+        watch.renewal.cancel.assert_called_once_with()
+        node.send_subscribe.assert_called_once_with(self.contact, self.key, 0)
+        self.assertEqual([], node.unwatch(self.key))
+
+    def test_flush_republication_groups_by_region(self):
+        """
+        Queued items are grouped by the prefix of their keys. Regions with a
+        single item are replicated as usual, the others share a lookup.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.replicate = MagicMock()
+        node.republish_region = MagicMock()
+        Item = namedtuple('Item', ['key', 'value', 'timestamp', 'expires',
+                                   'created_with', 'public_key', 'name',
+                                   'signature'])
+        a1 = Item('abc1', 'v', 1.0, 0.0, 'x', 'pk', 'a1', 'sig')
+        a2 = Item('abc2', 'v', 1.0, 0.0, 'x', 'pk', 'a2', 'sig')
+        b = Item('def1', 'v', 1.0, 0.0, 'x', 'pk', 'b', 'sig')
+        node.republication_queue = [a1, b, a2, a1]
+        result = node.flush_republication()
+        self.assertEqual(2, len(result))
+        self.assertEqual([], node.republication_queue)
+        node.replicate.assert_called_once_with(20, 'def1', 'v', 1.0, 0.0,
+                                               'x', 'pk', 'b', 'sig')
+        self.assertEqual(1, node.republish_region.call_count)
+        region = node.republish_region.call_args[0][0]
+        self.assertEqual(set([a1, a2]), set(region))
+
+    def test_republish_region(self):
+        """
+        A single lookup finds the replicas for all the items in a region.
+        Each replica is sent the items it should hold in a single StoreMany
+        message.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        contacts = []
+        for i in range(30):
+            uri = 'http://192.168.0.%d:9999/' % i
+            contact = PeerNode(str(i), self.version, uri, 0)
+            contacts.append(contact)
+        lookup = asyncio.Future()
+        items = []
+        for i in range(3):
+            signed = get_signed_item('name %d' % i, 'value', PUBLIC_KEY,
+                                     PRIVATE_KEY, 0)
+            signed['uuid'] = self.uuid
+            signed['sender'] = self.sender
+            signed['recipient'] = self.recipient
+            signed['reply_port'] = self.reply_port
+            signed['version'] = self.version
+            signed['seal'] = 'seal'
+            signed['message'] = 'store'
+            items.append(from_dict(signed))
+        node.send_store_many = MagicMock(return_value=('uuid',
+                                                       asyncio.Future()))
+        with patch('drogulus.dht.node.Lookup',
+                   return_value=lookup) as mock_lookup:
+            result = node.republish_region(items)
+            self.assertEqual(1, mock_lookup.call_count)
+            target = mock_lookup.call_args[0][1]
+            self.assertIn(target, [item.key for item in items])
+        lookup.set_result(contacts)
+        self.event_loop.run_until_complete(result)
+        tasks = result.result()
+        self.assertEqual(len(tasks), node.send_store_many.call_count)
+        sent = {}
+        for call in node.send_store_many.call_args_list:
+            contact, batch = call[0]
+            self.assertNotIn(contact, sent)
+            sent[contact] = batch
+        # Each item is sent to its K closest peers.
+        for item in items:
+            holders = [c for c, batch in sent.items() if item in batch]
+            self.assertEqual(20, len(holders))
+        self.assertEqual(1, node.metrics.counters['republish.lookups'])
+        self.assertEqual(60, node.metrics.counters['republish.items_sent'])
+
+    def test_republish_synced_item(self):
+        """
+        In sync mode, items in the node's neighbourhood of the key space are
+        not queued for republication once their bucket has been synced.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        now = time.time()
+        node.data_store._set_item(message.key, (message, 123.45, now))
+        node.sync_mode = True
+        node.synchroniser.prefix = message.key[:2]
+        node.synchroniser.neighbours = [self.contact.network_id, ]
+        # The bucket hasn't been synced (e.g. the neighbour didn't respond).
+        node.republish(message.key)
+        self.assertEqual([message, ], node.republication_queue)
+        node.republication_queue = []
+        node.synchroniser.mark_synced(self.contact, [message.key[:4], ])
+        node.republish(message.key)
+        self.assertEqual([], node.republication_queue)
+        self.assertIn(message.key, node.republisher)
+        node.sync_mode = False
+        node.republish(message.key)
+        self.assertEqual([message, ], node.republication_queue)
+        node.republisher.stop()
+
+    def test_schedule_stored(self):
+        """
+        Items in a re-opened database are scheduled for republication checks
+        when they'd next need republishing (or straight away if overdue).
+        Items already scheduled are left alone.
+        """
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'items.db')
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        self.signed_item['key'] = construct_key(PUBLIC_KEY, 'other')
+        other = from_dict(self.signed_item)
+        now = time.time()
+        data_store = SQLiteDataStore(path)
+        data_store._set_item(message.key, (message, now, now))
+        data_store._set_item(other.key, (other, now - REPLICATE_INTERVAL - 1,
+                                         now))
+        data_store.close()
+        data_store = SQLiteDataStore(path)
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port, data_store)
+        self.assertEqual(2, node.schedule_stored())
+        self.assertIn(message.key, node.republisher)
+        self.assertIn(other.key, node.republisher)
+        self.assertTrue(node.republisher.due[message.key] >=
+                        now + REPLICATE_INTERVAL)
+        self.assertTrue(node.republisher.due[other.key] <= time.time())
+        self.assertEqual(0, node.schedule_stored())
+        node.republisher.stop()
+        data_store.close()
+        shutil.rmtree(directory)
+
+    def make_summary(self, prefix, buckets):
+        """
+        Returns a Summary message for the range identified by prefix.
+        """
+        msg_dict = {
+            'uuid': self.uuid,
+            'recipient': self.recipient,
+            'sender': self.sender,
+            'reply_port': self.reply_port,
+            'version': self.version,
+            'prefix': prefix,
+            'buckets': buckets,
+        }
+        msg_dict['seal'] = get_seal(msg_dict, PRIVATE_KEY)
+        msg_dict['message'] = 'summary'
+        return from_dict(msg_dict)
+
+    def test_handle_summary(self):
+        """
+        A Summary message from a neighbour is answered with a Differences
+        message listing the local entries in the buckets that differ.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.sync_mode = True
+        node.routing_table.find_close_nodes = MagicMock(
+            return_value=[self.contact, ])
+        self.signed_item['message'] = 'store'
+        message = from_dict(self.signed_item)
+        node.data_store[message.key] = message
+        summary = self.make_summary(message.key[:2], {})
+        result = node.message_received(summary, 'http', '192.168.0.1', 1908)
+        self.assertIsInstance(result, Differences)
+        self.assertEqual(self.uuid, result.uuid)
+        self.assertEqual([message.key[:4]], list(result.buckets.keys()))
+        self.assertEqual({message.key: message.timestamp}, result.entries)
+        node.republisher.stop()
+
+    def test_handle_summary_refused(self):
+        """
+        Summaries are refused if the local node isn't in sync mode or the
+        contact isn't a neighbour. Summaries of ranges that are too wide (or
+        with buckets outside the range) are bad messages.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.routing_table.find_close_nodes = MagicMock(
+            return_value=[self.contact, ])
+        summary = self.make_summary('ab', {'ab00': '1234'})
+        with self.assertRaises(SyncRefused):
+            node.handle_summary(summary, self.contact)
+        node.sync_mode = True
+        result = node.handle_summary(summary, self.contact)
+        self.assertIsInstance(result, Differences)
+        node.routing_table.find_close_nodes.return_value = []
+        with self.assertRaises(SyncRefused):
+            node.handle_summary(summary, self.contact)
+        node.routing_table.find_close_nodes.return_value = [self.contact, ]
+        with self.assertRaises(BadMessage):
+            node.handle_summary(self.make_summary('a', {}), self.contact)
+        with self.assertRaises(BadMessage):
+            node.handle_summary(self.make_summary('ab', {'ac00': '1234'}),
+                                self.contact)
+        with self.assertRaises(BadMessage):
+            node.handle_summary(self.make_summary('ab', {'ab0': '1234'}),
+                                self.contact)
+
+    def test_send_summary(self):
+        """
+        Ensure that a Summary message is correctly constructed and sent to the
+        remote peer.
+        """
+        node = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop, self.connector,
+                    self.reply_port)
+        node.send_message = MagicMock()
+        node.send_summary(self.contact, 'ab', {'abcd': '1234'})
+        msg = node.send_message.call_args_list[0][0][1]
+        self.assertIsInstance(msg, Summary)
+        self.assertTrue(check_seal(msg))
+        self.assertEqual('ab', msg.prefix)
+        self.assertEqual({'abcd': '1234'}, msg.buckets)
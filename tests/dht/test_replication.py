@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the replication of items with a write quorum works as expected.
+"""
+from drogulus.dht.replication import Replication
+from drogulus.dht.contact import PeerNode
+from drogulus.dht.errors import QuorumNotReached, RoutingTableEmpty
+from drogulus.version import get_version
+from unittest import mock
+import asyncio
+import uuid
+import unittest
+
+
+class TestReplication(unittest.TestCase):
+    """
+    Ensures the Replication class works as expected.
+    """
+
+    def setUp(self):
+        """
+        Common vars.
+        """
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.version = get_version()
+        self.node = mock.MagicMock()
+        self.node.event_loop = self.event_loop
+        self.requests = []
+
+        def side_effect(contact, *args):
+            task = asyncio.Future()
+            self.requests.append((contact, task))
+            return (str(uuid.uuid4()), task)
+
+        self.node.send_store = mock.MagicMock(side_effect=side_effect)
+        self.contacts = []
+        for i in range(10):
+            uri = 'http://192.168.0.%d:9999/' % i
+            self.contacts.append(PeerNode(str(i), self.version, uri, 0))
+        self.item = ('key', 'value', 1.0, 0.0, self.version, 'public_key',
+                     'name', 'signature')
+
+    def tearDown(self):
+        self.event_loop.close()
+
+    def make_replication(self, duplicate, write_quorum):
+        return Replication(self.node, duplicate, write_quorum, *self.item)
+
+    def drain(self, replication):
+        """
+        Returns a list of all the outcomes in the replication's queue.
+        """
+        self.event_loop.run_until_complete(asyncio.sleep(0))
+        outcomes = []
+        while not replication.outcomes.empty():
+            outcomes.append(replication.outcomes.get_nowait())
+        return outcomes
+
+    def test_init_bad_arguments(self):
+        """
+        The duplication count and write quorum must be sensible.
+        """
+        with self.assertRaises(ValueError):
+            self.make_replication(0, 1)
+        with self.assertRaises(ValueError):
+            self.make_replication(3, 0)
+        with self.assertRaises(ValueError):
+            self.make_replication(3, 4)
+
+    def test_start(self):
+        """
+        The item is sent to the "duplicate" closest candidates.
+        """
+        replication = self.make_replication(3, 2)
+        replication.start(self.contacts)
+        self.assertEqual(3, self.node.send_store.call_count)
+        self.node.send_store.assert_any_call(self.contacts[0], *self.item)
+        self.assertEqual(self.contacts[3:], replication.candidates)
+        self.assertEqual(3, len(replication.pending_requests))
+        self.assertFalse(replication.done())
+
+    def test_start_no_candidates(self):
+        """
+        An empty list of candidates is an error.
+        """
+        replication = self.make_replication(3, 2)
+        with self.assertRaises(ValueError):
+            replication.start([])
+
+    def test_start_too_few_candidates(self):
+        """
+        If there are fewer candidates than the write quorum errback at once.
+        """
+        replication = self.make_replication(3, 3)
+        replication.start(self.contacts[:2])
+        self.assertTrue(replication.done())
+        self.assertIsInstance(replication.exception(), QuorumNotReached)
+
+    def test_quorum_reached(self):
+        """
+        The replication resolves as soon as write_quorum peers acknowledge
+        the item. The local node stops waiting for the others.
+        """
+        replication = self.make_replication(3, 2)
+        replication.start(self.contacts)
+        self.requests[0][1].set_result('ok')
+        self.requests[2][1].set_result('ok')
+        outcomes = self.drain(replication)
+        self.assertTrue(replication.done())
+        self.assertEqual([self.contacts[0], self.contacts[2]],
+                         replication.result())
+        self.assertTrue(self.requests[1][1].cancelled())
+        self.assertEqual([(self.contacts[0], 'ok'), (self.contacts[2], 'ok'),
+                          (self.contacts[1], 'cancelled'), None], outcomes)
+
+    def test_failure_retries_next_candidate(self):
+        """
+        If a peer fails to store the item it is sent to the next closest
+        candidate.
+        """
+        replication = self.make_replication(3, 3)
+        replication.start(self.contacts)
+        self.requests[1][1].set_exception(Exception('Boom'))
+        outcomes = self.drain(replication)
+        self.assertEqual([(self.contacts[1], 'failed')], outcomes)
+        self.assertEqual(4, self.node.send_store.call_count)
+        self.assertEqual(self.contacts[3], self.requests[3][0])
+        for i in (0, 2, 3):
+            self.requests[i][1].set_result('ok')
+        outcomes = self.drain(replication)
+        self.assertEqual([self.contacts[0], self.contacts[2],
+                          self.contacts[3]], replication.result())
+        self.assertEqual(None, outcomes[-1])
+
+    def test_quorum_not_reached(self):
+        """
+        If there are no more candidates and too few peers can acknowledge
+        the item then errback with QuorumNotReached.
+        """
+        replication = self.make_replication(3, 2)
+        replication.start(self.contacts[:3])
+        self.requests[0][1].set_exception(Exception('Boom'))
+        self.event_loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(replication.done())
+        self.requests[1][1].set_exception(Exception('Boom'))
+        outcomes = self.drain(replication)
+        self.assertTrue(replication.done())
+        self.assertIsInstance(replication.exception(), QuorumNotReached)
+        self.assertTrue(self.requests[2][1].cancelled())
+        self.assertEqual((self.contacts[2], 'cancelled'), outcomes[-2])
+        self.assertEqual(None, outcomes[-1])
+
+    def test_abort(self):
+        """
+        Aborting a replication errbacks with the given exception.
+        """
+        replication = self.make_replication(3, 2)
+        ex = RoutingTableEmpty()
+        replication.abort(ex)
+        self.assertEqual(ex, replication.exception())
+        self.assertEqual([None], self.drain(replication))
+
+    def test_cancel(self):
+        """
+        Cancelling a replication cleanly cancels the pending requests.
+        """
+        replication = self.make_replication(3, 2)
+        replication.start(self.contacts)
+        self.assertTrue(replication.cancel())
+        outcomes = self.drain(replication)
+        self.assertTrue(replication.cancelled())
+        for contact, task in self.requests:
+            self.assertTrue(task.cancelled())
+        self.assertEqual(4, len(outcomes))
+        self.assertFalse(replication.cancel())
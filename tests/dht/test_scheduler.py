@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the republish scheduler works as expected.
+"""
+from drogulus.dht.scheduler import RepublishScheduler
+from drogulus.dht.metrics import MetricsRegistry
+from drogulus.dht.constants import (REPLICATE_INTERVAL, REPUBLISH_TICK,
+                                    REPUBLISH_BATCH_SIZE)
+from unittest import mock
+import json
+import unittest
+
+
+class TestRepublishScheduler(unittest.TestCase):
+    """
+    Ensures the RepublishScheduler class works as expected.
+    """
+
+    def setUp(self):
+        self.event_loop = mock.MagicMock()
+        self.callback = mock.MagicMock()
+        self.now = 1000.0
+        patcher = mock.patch('drogulus.dht.scheduler.time.time',
+                             side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_scheduler(self, **kwargs):
+        return RepublishScheduler(self.event_loop, self.callback, **kwargs)
+
+    def test_init(self):
+        """
+        Ensure the scheduler has the expected defaults.
+        """
+        scheduler = self.make_scheduler()
+        self.assertEqual(REPLICATE_INTERVAL, scheduler.interval)
+        self.assertEqual(REPUBLISH_TICK, scheduler.tick)
+        self.assertEqual(REPUBLISH_BATCH_SIZE, scheduler.batch_size)
+        self.assertEqual(0, len(scheduler))
+        self.assertEqual(None, scheduler.handle)
+
+    def test_schedule(self):
+        """
+        Scheduling a key makes it due after the interval and starts the
+        scheduler ticking.
+        """
+        scheduler = self.make_scheduler()
+        scheduler.schedule('foo')
+        self.assertIn('foo', scheduler)
+        self.assertEqual(1000.0 + REPLICATE_INTERVAL, scheduler.due['foo'])
+        self.event_loop.call_later.assert_called_once_with(REPUBLISH_TICK,
+                                                           scheduler._tick)
+        # Only one tick is ever scheduled.
+        scheduler.schedule('bar', 10)
+        self.assertEqual(1, self.event_loop.call_later.call_count)
+        self.assertEqual(1010.0, scheduler.due['bar'])
+
+    def test_schedule_deduplicates(self):
+        """
+        Scheduling a key twice replaces the earlier schedule.
+        """
+        scheduler = self.make_scheduler()
+        scheduler.schedule('foo', 10)
+        scheduler.schedule('foo', 20)
+        self.assertEqual(1, len(scheduler))
+        self.now += 15
+        self.assertEqual([], scheduler.pop_due(self.now, 10))
+        self.now += 10
+        self.assertEqual(['foo'], scheduler.pop_due(self.now, 10))
+        self.assertEqual(0, len(scheduler))
+
+    def test_compact(self):
+        """
+        Obsolete heap entries are removed when they accumulate.
+        """
+        scheduler = self.make_scheduler(batch_size=2)
+        for i in range(10):
+            scheduler.schedule('foo', i)
+        self.assertTrue(len(scheduler.heap) <= 4)
+        self.assertEqual(1, len(scheduler))
+
+    def test_unschedule(self):
+        """
+        An unscheduled key is never passed to the callback.
+        """
+        scheduler = self.make_scheduler()
+        scheduler.schedule('foo', 10)
+        scheduler.unschedule('foo')
+        scheduler.unschedule('bar')
+        self.assertNotIn('foo', scheduler)
+        self.now += 20
+        scheduler._tick()
+        self.assertEqual(0, self.callback.call_count)
+        self.assertEqual([], scheduler.heap)
+
+    def test_tick_rate_limited(self):
+        """
+        At most batch_size due keys are processed per tick, earliest first.
+        """
+        metrics = MetricsRegistry()
+        scheduler = self.make_scheduler(batch_size=2, metrics=metrics)
+        for i in range(5):
+            scheduler.schedule(str(i), 10 + i)
+        self.now += 100
+        scheduler._tick()
+        self.assertEqual([mock.call('0'), mock.call('1')],
+                         self.callback.call_args_list)
+        self.assertEqual(3, len(scheduler))
+        self.assertEqual(2, metrics.counters['republish.processed'])
+        # Keeps ticking since there are still keys scheduled.
+        self.assertEqual(2, self.event_loop.call_later.call_count)
+        scheduler._tick()
+        scheduler._tick()
+        self.assertEqual(5, self.callback.call_count)
+        self.assertEqual(0, len(scheduler))
+        self.assertEqual(5, scheduler.processed)
+        self.assertEqual(3, scheduler.batches)
+        # Stops ticking when there's nothing left to do.
+        self.assertEqual(None, scheduler.handle)
+
+    def test_tick_callback_exception(self):
+        """
+        An exception in the callback is logged and doesn't stop the other
+        keys in the batch being processed.
+        """
+        self.callback.side_effect = [ValueError('Boom'), None]
+        scheduler = self.make_scheduler()
+        scheduler.schedule('foo', 1)
+        scheduler.schedule('bar', 2)
+        self.now += 10
+        with mock.patch('drogulus.dht.scheduler.log.error') as mock_log:
+            scheduler._tick()
+            self.assertEqual(2, mock_log.call_count)
+        self.assertEqual(2, self.callback.call_count)
+
+    def test_tick_flush(self):
+        """
+        The flush callable is called once after each batch of due keys has
+        been passed to the callback (but not when there were no due keys).
+        """
+        flush = mock.MagicMock()
+        scheduler = self.make_scheduler(flush=flush)
+        scheduler.schedule('foo', 1)
+        scheduler.schedule('bar', 2)
+        scheduler.schedule('baz', 100)
+        scheduler._tick()
+        self.assertEqual(0, flush.call_count)
+        self.now += 10
+        scheduler._tick()
+        self.assertEqual(2, self.callback.call_count)
+        flush.assert_called_once_with()
+        scheduler.stop()
+
+    def test_stats(self):
+        """
+        The stats describe the queue depth and throughput and can be
+        serialised into JSON.
+        """
+        scheduler = self.make_scheduler()
+        scheduler.schedule('foo', 1)
+        scheduler.schedule('bar', 1)
+        scheduler.schedule('baz', 100)
+        self.now += 10
+        stats = scheduler.stats()
+        self.assertEqual(3, stats['depth'])
+        self.assertEqual(2, stats['due'])
+        scheduler._tick()
+        stats = scheduler.stats()
+        self.assertEqual(1, stats['depth'])
+        self.assertEqual(2, stats['processed'])
+        self.assertEqual(2 / 10, stats['throughput'])
+        json.dumps(stats)
+
+    def test_stop(self):
+        """
+        Stopping the scheduler cancels the next tick.
+        """
+        scheduler = self.make_scheduler()
+        scheduler.schedule('foo')
+        handle = scheduler.handle
+        scheduler.stop()
+        handle.cancel.assert_called_once_with()
+        self.assertEqual(None, scheduler.handle)
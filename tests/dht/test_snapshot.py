@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures snapshots of a local node's state are written and restored as
+expected.
+"""
+from drogulus.dht.snapshot import (capture, encode, decode, write_snapshot,
+                                   read_snapshot, restore, Snapshotter, MAGIC,
+                                   HEADER_V1, ITEM_V1, HEADER_V2, ITEM,
+                                   DEADLINE, LENGTH, CHECKSUM)
+from drogulus.dht.node import Node
+from drogulus.dht.contact import PeerNode
+from drogulus.dht.messages import to_dict
+from drogulus.dht.storage import SQLiteDataStore
+from drogulus.version import get_version
+from ..items import make_item
+from ..keys import PRIVATE_KEY, PUBLIC_KEY, BAD_PUBLIC_KEY
+from unittest import mock
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zlib
+
+
+class FakeConnector:
+    """
+    Pretends to be a connector for sending messages to remote nodes.
+    """
+
+    def send(self, contact, message, sender):
+        return asyncio.Future()
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Ensures the snapshot functions and Snapshotter class work as expected.
+    """
+
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.node = self.make_node()
+        self.contact = PeerNode(PUBLIC_KEY, get_version(),
+                                'http://192.168.0.1:1908/', 0)
+        self.node.routing_table.add_contact(self.contact)
+        self.node.routing_table.blacklist(
+            PeerNode(BAD_PUBLIC_KEY, get_version(),
+                     'http://192.168.0.2:1908/', 0))
+        self.items = [make_item('item {}'.format(i)) for i in range(5)]
+        for item in self.items:
+            self.node.data_store.load_item(item.key, item, 123.0, 456.0)
+        self.node.republisher.schedule(self.items[0].key, 60)
+        self.node.cache_lifetimes[self.items[1].key] = 300.0
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'snapshot.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        self.event_loop.close()
+
+    def make_node(self, data_store=None):
+        node = Node(BAD_PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                    FakeConnector(), 1908, data_store)
+        node.event_loop = mock.MagicMock()
+        return node
+
+    def test_capture(self):
+        """
+        The captured state contains the contacts, blacklist, items (with
+        their timestamps), republish due times and cached copy lifetimes of
+        the local node.
+        """
+        state = capture(self.node)
+        self.assertEqual(self.node.routing_table.dump()['contacts'],
+                         state['contacts'])
+        self.assertEqual(1, len(state['blacklist']))
+        self.assertEqual(5, len(state['items']))
+        items = {item.key: (updated, accessed)
+                 for item, updated, accessed in state['items']}
+        self.assertEqual((123.0, 456.0), items[self.items[0].key])
+        key = self.items[0].key
+        self.assertEqual([(key, self.node.republisher.due[key])],
+                         state['deadlines'])
+        self.assertEqual([(self.items[1].key, 300.0)], state['cached'])
+
+    def test_capture_no_items(self):
+        """
+        Items aren't captured if the items flag isn't set but the republish
+        due times are.
+        """
+        state = capture(self.node, items=False)
+        self.assertEqual([], state['items'])
+        self.assertEqual(1, len(state['contacts']))
+        key = self.items[0].key
+        self.assertEqual([(key, self.node.republisher.due[key])],
+                         state['deadlines'])
+
+    def test_encode_decode(self):
+        """
+        Decoding an encoded snapshot results in the original state.
+        """
+        state = capture(self.node)
+        data = encode(state)
+        self.assertTrue(data.startswith(MAGIC))
+        result = decode(data)
+        self.assertEqual(state['created'], result['created'])
+        self.assertEqual(state['contacts'], result['contacts'])
+        self.assertEqual(state['blacklist'], result['blacklist'])
+        self.assertEqual(len(state['items']), len(result['items']))
+        for expected, actual in zip(state['items'], result['items']):
+            self.assertEqual(to_dict(expected[0]), to_dict(actual[0]))
+            self.assertEqual(expected[1:], actual[1:])
+        self.assertEqual(state['deadlines'], result['deadlines'])
+        self.assertEqual(state['cached'], result['cached'])
+
+    def test_decode_version_2(self):
+        """
+        A version 2 snapshot (without cached copies) can still be read.
+        """
+        item = self.items[0]
+        text = json.dumps(to_dict(item)).encode('utf-8')
+        key = item.key.encode('utf-8')
+        chunks = [HEADER_V2.pack(MAGIC, 2, 100.0, 0, 0, 1, 1),
+                  ITEM.pack(123.0, 456.0), LENGTH.pack(len(text)), text,
+                  LENGTH.pack(len(key)), key, DEADLINE.pack(200.0)]
+        data = b''.join(chunks)
+        result = decode(data + CHECKSUM.pack(zlib.crc32(data)))
+        self.assertEqual(100.0, result['created'])
+        self.assertEqual(1, len(result['items']))
+        self.assertEqual((123.0, 456.0), result['items'][0][1:])
+        self.assertEqual([(item.key, 200.0)], result['deadlines'])
+        self.assertEqual([], result['cached'])
+
+    def test_decode_version_1(self):
+        """
+        A version 1 snapshot (with the due times held in the items) can
+        still be read.
+        """
+        item = self.items[0]
+        text = json.dumps(to_dict(item)).encode('utf-8')
+        chunks = [HEADER_V1.pack(MAGIC, 1, 100.0, 0, 0, 2)]
+        for due in (200.0, -1.0):
+            chunks.append(ITEM_V1.pack(123.0, 456.0, due))
+            chunks.append(LENGTH.pack(len(text)))
+            chunks.append(text)
+        data = b''.join(chunks)
+        result = decode(data + CHECKSUM.pack(zlib.crc32(data)))
+        self.assertEqual(100.0, result['created'])
+        self.assertEqual(2, len(result['items']))
+        self.assertEqual((123.0, 456.0), result['items'][0][1:])
+        self.assertEqual([(item.key, 200.0)], result['deadlines'])
+        self.assertEqual([], result['cached'])
+
+    def test_decode_corrupt(self):
+        """
+        A snapshot with a bad checksum, magic bytes or version, or that has
+        been truncated, results in a ValueError.
+        """
+        data = encode(capture(self.node))
+        corrupt = data[:20] + bytes([data[20] ^ 0xff]) + data[21:]
+        with self.assertRaises(ValueError):
+            decode(corrupt)
+        with self.assertRaises(ValueError):
+            decode(data[:-10])
+        with self.assertRaises(ValueError):
+            decode(data[:5])
+        with self.assertRaises(ValueError):
+            decode(b'NOTASNAP' + data[8:])
+
+    def test_write_read_snapshot(self):
+        """
+        The snapshot is written atomically (no temporary file is left
+        behind) and can be read back.
+        """
+        state = capture(self.node)
+        write_snapshot(self.path, state)
+        self.assertEqual(['snapshot.bin'], os.listdir(self.tempdir))
+        result = read_snapshot(self.path)
+        self.assertEqual(5, len(result['items']))
+        # Replacing an existing snapshot.
+        write_snapshot(self.path, capture(self.node, items=False))
+        result = read_snapshot(self.path)
+        self.assertEqual([], result['items'])
+        self.assertEqual(1, len(result['deadlines']))
+
+    def test_restore(self):
+        """
+        Items are restored with their timestamps, expired items are skipped
+        and republication checks are scheduled when they were due.
+        """
+        expired = make_item('expired')._replace(expires=time.time() - 100)
+        state = capture(self.node)
+        state['items'].append((expired, 1.0, 2.0))
+        state['deadlines'].append((expired.key, time.time()))
+        node = self.make_node()
+        result = restore(node, decode(encode(state)))
+        self.assertEqual(5, result)
+        self.assertEqual(5, len(node.data_store))
+        self.assertNotIn(expired.key, node.data_store)
+        key = self.items[0].key
+        self.assertEqual(123.0, node.data_store.updated(key))
+        self.assertEqual(456.0, node.data_store.accessed(key))
+        self.assertAlmostEqual(self.node.republisher.due[key],
+                               node.republisher.due[key], delta=1)
+        for item in self.items:
+            self.assertIn(item.key, node.republisher.due)
+        self.assertNotIn(expired.key, node.republisher)
+
+    def test_restore_cached(self):
+        """
+        Cached copies are restored as cached copies (so they aren't
+        republished as replicas) and, without a deadline, are checked at the
+        end of their lifetime. Lifetimes of keys that aren't held are
+        ignored.
+        """
+        state = capture(self.node)
+        state['deadlines'] = []
+        state['cached'].append((make_item('other').key, 300.0))
+        node = self.make_node()
+        restore(node, decode(encode(state)))
+        key = self.items[1].key
+        self.assertEqual({key: 300.0}, node.cache_lifetimes)
+        self.assertAlmostEqual(time.time() + 300.0, node.republisher.due[key],
+                               delta=1)
+        with mock.patch.object(node, 'cache_lifetime', return_value=300.0):
+            node.republish(key)
+        self.assertEqual([], node.republication_queue)
+
+    def test_restore_deadlines_database(self):
+        """
+        Without items in the snapshot, the deadlines of the keys held in a
+        database-backed data store are rescheduled. Deadlines for keys that
+        aren't held are ignored.
+        """
+        state = capture(self.node, items=False)
+        state['deadlines'].append((make_item('other').key, time.time()))
+        data_store = SQLiteDataStore(os.path.join(self.tempdir, 'items.db'))
+        for item in self.items:
+            data_store.load_item(item.key, item, 123.0, 456.0)
+        node = self.make_node(data_store)
+        self.assertEqual(0, restore(node, decode(encode(state))))
+        key = self.items[0].key
+        self.assertEqual(1, len(node.republisher))
+        self.assertAlmostEqual(self.node.republisher.due[key],
+                               node.republisher.due[key], delta=1)
+        data_store.close()
+
+    def test_snapshotter_start_stop(self):
+        """
+        Starting the snapshotter schedules a snapshot, stopping it cancels
+        the scheduled snapshot.
+        """
+        snapshotter = Snapshotter(self.node, self.path, interval=10)
+        snapshotter.start()
+        self.node.event_loop.call_later.assert_called_once_with(
+            10, snapshotter._tick)
+        handle = snapshotter.handle
+        snapshotter.stop()
+        handle.cancel.assert_called_once_with()
+        self.assertIsNone(snapshotter.handle)
+
+    def test_snapshotter_save(self):
+        """
+        Snapshots are written by the event loop's executor and skipped while
+        the previous snapshot is still being written.
+        """
+        snapshotter = Snapshotter(self.node, self.path)
+        writing = snapshotter.save()
+        run_in_executor = self.node.event_loop.run_in_executor
+        self.assertEqual(writing, run_in_executor.return_value)
+        args = run_in_executor.call_args[0]
+        self.assertEqual((None, write_snapshot, self.path), args[:3])
+        writing.done.return_value = False
+        self.assertIsNone(snapshotter.save())
+        self.assertEqual(1, run_in_executor.call_count)
+        writing.done.return_value = True
+        snapshotter.save()
+        self.assertEqual(2, run_in_executor.call_count)
+
+    def test_snapshotter_tick(self):
+        """
+        A tick saves a snapshot and schedules the next one, even if saving
+        fails.
+        """
+        snapshotter = Snapshotter(self.node, self.path)
+        snapshotter.save = mock.MagicMock(side_effect=OSError('Bang!'))
+        snapshotter._tick()
+        self.assertEqual(1, snapshotter.save.call_count)
+        self.assertIsNotNone(snapshotter.handle)
+
+    def test_snapshotter_save_now_and_load(self):
+        """
+        A snapshot saved by one snapshotter is restored by another.
+        """
+        Snapshotter(self.node, self.path).save_now()
+        node = self.make_node()
+        state = Snapshotter(node, self.path).load()
+        self.assertEqual(1, len(state['contacts']))
+        self.assertEqual(5, len(node.data_store))
+
+    def test_snapshotter_load_missing_or_corrupt(self):
+        """
+        Nothing is restored if there is no snapshot or it is corrupt.
+        """
+        snapshotter = Snapshotter(self.node, self.path)
+        self.assertIsNone(snapshotter.load())
+        with open(self.path, 'wb') as output:
+            output.write(b'rubbish')
+        self.assertIsNone(snapshotter.load())
@@ -4,9 +4,24 @@ Ensures datastore related classes work as expected.
 """
 import unittest
 import time
-from drogulus.dht.storage import DataStore, DictDataStore
+from drogulus.dht.storage import (DataStore, DictDataStore, SQLiteDataStore,
+                                  BoundedDataStore, CompactDataStore,
+                                  pack_hex, unpack_hex)
+from drogulus.dht.messages import Value, to_dict
+from drogulus.dht.blobstore import BlobStore, value_digest
+from drogulus.dht.compression import Compressed
+from drogulus.dht.metrics import MetricsRegistry
+from drogulus.dht.validators import ITEM_FIELDS
+from drogulus.dht.constants import K
+from drogulus.dht.crypto import verify_item
 from unittest.mock import MagicMock
-from ..keys import PUBLIC_KEY
+from ..items import make_item
+from ..keys import PUBLIC_KEY, BAD_PUBLIC_KEY
+from hashlib import sha512
+import json
+import os
+import shutil
+import tempfile
 
 
 class TestDataStore(unittest.TestCase):
@@ -41,6 +56,23 @@ class TestDataStore(unittest.TestCase):
         self.assertEqual(args[1][1], timestamp)
         self.assertTrue(args[1][2] > timestamp)
 
+    def test_refresh(self):
+        """
+        Ensure that the refresh method updates the last-update timestamp for
+        a referenced item without changing the item or its access time.
+        """
+        ds = DataStore()
+        timestamp = time.time()
+        ds._get_item = MagicMock(return_value=('bar', timestamp, timestamp))
+        ds._set_item = MagicMock()
+        ds.refresh('foo')
+        self.assertEqual(1, ds._set_item.call_count)
+        args = ds._set_item.call_args_list[0][0]
+        self.assertEqual('foo', args[0])
+        self.assertEqual('bar', args[1][0])
+        self.assertTrue(args[1][1] > timestamp)
+        self.assertEqual(args[1][2], timestamp)
+
     def test_updated(self):
         """
         Check the DataStore base class gets the requested item and returns the
@@ -98,6 +130,18 @@ class TestDataStore(unittest.TestCase):
         self.assertEqual(timestamp, result)
         ds._get_item.assert_called_once_with('foo')
 
+    def test_load_item(self):
+        """
+        Check the DataStore base class stores the item with the given
+        timestamps (rather than the current time) and indexes it.
+        """
+        ds = DataStore()
+        ds._set_item = MagicMock()
+        ds._index_item = MagicMock()
+        ds.load_item('foo', 'bar', 123.0, 456.0)
+        ds._set_item.assert_called_once_with('foo', ('bar', 123.0, 456.0))
+        ds._index_item.assert_called_once_with('foo', 'bar')
+
     def test_set_item(self):
         """
         Check the DataStore base class has a set_item method.
@@ -273,3 +317,737 @@ class TestDictDataStore(unittest.TestCase):
         self.assertEqual(1, len(store.keys()))
         del store['foo']
         self.assertEqual(0, len(store.keys()))
+
+    def test_purge_expired(self):
+        """
+        Ensures expired items are purged in order of expiry, up to the limit,
+        and that items that don't expire (or whose expiry has changed) are
+        left alone.
+        """
+        store = DictDataStore()
+        items = [make_item('item {}'.format(i), expires=1000)
+                 for i in range(5)]
+        for item in items:
+            store[item.key] = item
+        forever = make_item('forever')
+        store[forever.key] = forever
+        now = time.time() + 2000
+        # Re-storing an item with the same expiry doesn't duplicate it.
+        store[items[0].key] = items[0]
+        self.assertEqual(5, len(store._expiry))
+        # An updated item that no longer expires is kept.
+        store[items[1].key] = forever._replace(key=items[1].key)
+        # A deleted item is skipped.
+        del store[items[2].key]
+        purged = store.purge_expired(now, limit=1)
+        self.assertEqual(1, len(purged))
+        purged += store.purge_expired(now)
+        self.assertEqual(set([items[0].key, items[3].key, items[4].key]),
+                         set(purged))
+        self.assertEqual(set([forever.key, items[1].key]), set(store))
+        self.assertEqual([], store.purge_expired(now))
+        self.assertEqual({}, store._expiring)
+
+    def test_purge_expired_not_yet(self):
+        """
+        Items are only purged once they have expired.
+        """
+        store = DictDataStore()
+        item = make_item('foo', expires=1000)
+        store[item.key] = item
+        self.assertEqual([], store.purge_expired())
+        self.assertIn(item.key, store)
+
+
+class TestSQLiteDataStore(unittest.TestCase):
+    """
+    Ensures the SQLiteDataStore class works as expected.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'items.db')
+        self.item = make_item('foo')
+        self.other = make_item('bar')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_init(self):
+        """
+        The database is created in WAL mode with the expected indexes.
+        """
+        store = SQLiteDataStore(self.path)
+        mode = store._connection.execute('PRAGMA journal_mode').fetchone()
+        self.assertEqual('wal', mode[0])
+        indexes = set(row[0] for row in store._connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"))
+        for name in ('items_updated', 'items_accessed', 'items_expires',
+                     'items_publisher'):
+            self.assertIn(name, indexes)
+        store.close()
+
+    def test_set_get(self):
+        """
+        Items can be stored and retrieved (whether or not the write has been
+        committed).
+        """
+        store = SQLiteDataStore(self.path)
+        store[self.item.key] = self.item
+        self.assertEqual(self.item, store[self.item.key])
+        self.assertIn(self.item.key, store)
+        self.assertNotIn(self.other.key, store)
+        store.flush()
+        self.assertEqual(self.item, store[self.item.key])
+        self.assertTrue(store.updated(self.item.key) > 0.0)
+        self.assertEqual(0.0, store.accessed(self.item.key))
+        with self.assertRaises(KeyError):
+            store[self.other.key]
+        self.assertFalse(store.get(self.other.key, False))
+        store.close()
+
+    def test_persists(self):
+        """
+        Items survive the data store being closed and re-opened.
+        """
+        store = SQLiteDataStore(self.path)
+        store[self.item.key] = self.item
+        store.touch(self.item.key)
+        accessed = store.accessed(self.item.key)
+        store.close()
+        store = SQLiteDataStore(self.path)
+        self.assertEqual(self.item, store[self.item.key])
+        self.assertEqual(accessed, store.accessed(self.item.key))
+        self.assertEqual([self.item.key], store.keys())
+        store.close()
+
+    def test_group_commit(self):
+        """
+        Pending writes are committed in a single transaction once batch_size
+        writes are pending.
+        """
+        store = SQLiteDataStore(self.path, batch_size=2)
+        store[self.item.key] = self.item
+        self.assertEqual(0, store.commits)
+        store[self.other.key] = self.other
+        self.assertEqual(1, store.commits)
+        self.assertEqual({}, store._pending)
+        store.close()
+
+    def test_commit_interval(self):
+        """
+        With an event loop, pending writes are committed commit_interval
+        seconds after the first pending write.
+        """
+        event_loop = MagicMock()
+        store = SQLiteDataStore(self.path, commit_interval=0.5,
+                                event_loop=event_loop)
+        store[self.item.key] = self.item
+        store[self.other.key] = self.other
+        event_loop.call_later.assert_called_once_with(0.5, store.flush)
+        store.flush()
+        self.assertEqual(1, store.commits)
+        self.assertEqual(None, store._handle)
+        store.close()
+
+    def test_touch_refresh_keep_item(self):
+        """
+        Touching or refreshing an item only changes the relevant timestamp.
+        Storing an item again keeps its last access time.
+        """
+        store = SQLiteDataStore(self.path)
+        store._set_item(self.item.key, (self.item, 1.0, 2.0))
+        store.flush()
+        store.touch(self.item.key)
+        self.assertEqual(1.0, store.updated(self.item.key))
+        self.assertTrue(store.accessed(self.item.key) > 2.0)
+        store._set_item(self.item.key, (self.item, 1.0, 2.0))
+        store.refresh(self.item.key)
+        self.assertTrue(store.updated(self.item.key) > 1.0)
+        self.assertEqual(2.0, store.accessed(self.item.key))
+        store[self.item.key] = self.item
+        self.assertEqual(2.0, store.accessed(self.item.key))
+        self.assertEqual(self.item, store[self.item.key])
+        store.close()
+
+    def test_delete_len_iter(self):
+        """
+        Items can be deleted and the data store counted and iterated over.
+        """
+        store = SQLiteDataStore(self.path)
+        store[self.item.key] = self.item
+        store[self.other.key] = self.other
+        self.assertEqual(2, len(store))
+        self.assertEqual(set([self.item.key, self.other.key]), set(store))
+        del store[self.item.key]
+        self.assertNotIn(self.item.key, store)
+        with self.assertRaises(KeyError):
+            store[self.item.key]
+        with self.assertRaises(KeyError):
+            del store[self.item.key]
+        self.assertEqual(1, len(store))
+        self.assertEqual([self.other.key], store.keys())
+        store.close()
+
+    def test_purge_expired(self):
+        """
+        Expired items are found (in order of expiry) via the index on the
+        expires column, including pending writes.
+        """
+        store = SQLiteDataStore(self.path)
+        soon = make_item('soon', expires=1000)
+        later = make_item('later', expires=1500)
+        for item in (soon, later, self.item):
+            store[item.key] = item
+        self.assertEqual([], store.purge_expired())
+        now = time.time() + 2000
+        self.assertEqual([soon.key], store.purge_expired(now, limit=1))
+        self.assertEqual([later.key], store.purge_expired(now))
+        self.assertEqual([self.item.key], store.keys())
+        store.close()
+
+
+class TestBoundedDataStore(unittest.TestCase):
+    """
+    Ensures the BoundedDataStore class works as expected.
+    """
+
+    def setUp(self):
+        self.items = [make_item('item {}'.format(i)) for i in range(10)]
+        self.size = max(len(json.dumps(to_dict(item)))
+                        for item in self.items)
+        self.routing_table = MagicMock()
+        # By default the local node isn't responsible for any key.
+        self.routing_table.find_close_nodes = MagicMock(
+            side_effect=lambda key: [MagicMock(network_id=key)] * K)
+        self.network_id = '0' * 128
+
+    def make_store(self, count):
+        """
+        Returns a store with a budget for (roughly) count items.
+        """
+        return BoundedDataStore(self.size * count, self.network_id,
+                                self.routing_table, MagicMock())
+
+    def test_sizes(self):
+        """
+        The store tracks the size of each item and the total, including when
+        an item is replaced or deleted.
+        """
+        store = self.make_store(100)
+        item = self.items[0]
+        store[item.key] = item
+        size = len(json.dumps(to_dict(item)))
+        self.assertEqual(size, store.sizes[item.key])
+        self.assertEqual(size, store.bytes)
+        store.touch(item.key)
+        self.assertEqual(size, store.bytes)
+        store[item.key] = self.items[1]
+        self.assertEqual(len(json.dumps(to_dict(self.items[1]))),
+                         store.bytes)
+        del store[item.key]
+        self.assertEqual(0, store.bytes)
+        self.assertEqual({}, store.sizes)
+
+    def test_evicts_when_over_budget(self):
+        """
+        Once over budget the store evicts items until back under the low
+        water mark and records the evictions.
+        """
+        store = self.make_store(5)
+        for item in self.items:
+            store[item.key] = item
+            self.assertTrue(store.bytes <= store.max_bytes)
+        self.assertTrue(store.evictions > 0)
+        self.assertEqual(len(self.items), store.evictions + len(store))
+        # The most recently stored item is always kept.
+        self.assertIn(self.items[-1].key, store)
+        evicted = sum(args[1] for args, kwargs in
+                      store.metrics.increment.call_args_list
+                      if args[0] == 'storage.evictions')
+        self.assertEqual(store.evictions, evicted)
+        stats = store.stats()
+        self.assertEqual(len(store), stats['items'])
+        self.assertEqual(store.bytes, stats['bytes'])
+        self.assertEqual(store.max_bytes, stats['max_bytes'])
+        self.assertEqual(store.evictions, stats['evictions'])
+        self.assertTrue(stats['evicted_bytes'] > 0)
+        self.assertEqual(store.bytes / store.max_bytes, stats['occupancy'])
+
+    def test_eviction_order(self):
+        """
+        Keys furthest from the local node are evicted first and, at the same
+        distance, the least recently accessed.
+        """
+        store = self.make_store(100)
+        near = '0' * 127 + '1'
+        far_old = 'f' * 128
+        far_new = '8' * 128
+        store._set_item(near, (self.items[0], 1.0, 1.0))
+        store._set_item(far_new, (self.items[1], 1.0, 3.0))
+        store._set_item(far_old, (self.items[2], 1.0, 2.0))
+        self.assertEqual([far_old, far_new, near],
+                         list(store.eviction_order()))
+        # Accessing an item moves it back in the order.
+        store._set_item(far_old, (self.items[2], 1.0, 4.0))
+        self.assertEqual([far_new, far_old, near],
+                         list(store.eviction_order()))
+
+    def test_never_evicts_responsible_keys(self):
+        """
+        Items whose keys the local node is amongst the K closest nodes to
+        are never evicted (even if the store stays over budget).
+        """
+        self.routing_table.find_close_nodes = MagicMock(return_value=[])
+        store = self.make_store(5)
+        for item in self.items:
+            store[item.key] = item
+        self.assertEqual(len(self.items), len(store))
+        self.assertEqual(0, store.evictions)
+        self.assertTrue(store.stats()['occupancy'] > 1.0)
+
+    def test_eviction_only_when_grown(self):
+        """
+        Touching, refreshing or storing a smaller version of an item never
+        triggers eviction, even when over budget.
+        """
+        store = self.make_store(2)
+        for item in self.items[:4]:
+            store._dict[item.key] = (item, 1.0, 1.0)
+            store.sizes[item.key] = self.size
+            store.bytes += self.size
+        store.evict = MagicMock()
+        key = self.items[0].key
+        store.touch(key)
+        store.refresh(key)
+        store[key] = store[key]
+        smaller = self.items[0]._replace(value='')
+        store[key] = smaller
+        self.assertEqual(0, store.evict.call_count)
+        store[key] = self.items[0]
+        self.assertEqual(1, store.evict.call_count)
+
+    def test_eviction_stalled(self):
+        """
+        After a pass that can't get back under the low water mark, eviction
+        isn't attempted again until another low water mark's worth of items
+        has been stored.
+        """
+        store = self.make_store(20)
+        store.is_responsible = MagicMock(return_value=True)
+        for i in range(21):
+            store._set_item('{:0128x}'.format(i), (self.items[0], 1.0, 1.0))
+        self.assertEqual(20, store.is_responsible.call_count)
+        store.is_responsible.reset_mock()
+        store[self.items[1].key] = self.items[1]
+        self.assertEqual(0, store.is_responsible.call_count)
+        for item in self.items[2:5]:
+            store[item.key] = item
+        self.assertTrue(store.is_responsible.call_count > 0)
+        self.assertEqual(0, store.evictions)
+
+    def test_is_responsible(self):
+        """
+        The local node is responsible for a key if it knows of fewer than K
+        nodes or is closer to the key than the furthest of the K closest.
+        """
+        store = self.make_store(5)
+        key = '0' * 127 + '1'
+        self.assertFalse(store.is_responsible(key))
+        furthest = MagicMock(network_id='f' * 128)
+        self.routing_table.find_close_nodes = MagicMock(
+            return_value=[furthest] * K)
+        self.assertTrue(store.is_responsible(key))
+        self.routing_table.find_close_nodes = MagicMock(
+            return_value=[furthest])
+        self.assertTrue(store.is_responsible('f' * 128))
+
+
+class TestPackHex(unittest.TestCase):
+    """
+    Ensures the pack_hex and unpack_hex functions work as expected.
+    """
+
+    def test_round_trip(self):
+        self.assertEqual(b'\x01\xab', pack_hex('01ab'))
+        self.assertEqual('01ab', unpack_hex(pack_hex('01ab')))
+
+    def test_not_hexadecimal(self):
+        """
+        Text that isn't (even length, lowercase) hexadecimal is unchanged.
+        """
+        for text in ('foo', '01AB', '012', ''):
+            self.assertEqual(text, pack_hex(text))
+            self.assertEqual(text, unpack_hex(pack_hex(text)))
+
+
+class TestCompactDataStore(unittest.TestCase):
+    """
+    Ensures the CompactDataStore class works as expected.
+    """
+
+    def setUp(self):
+        self.items = [make_item('item {}'.format(i)) for i in range(5)]
+
+    def test_set_get(self):
+        """
+        Items are returned as Value messages containing the same item fields
+        as the stored message.
+        """
+        store = CompactDataStore()
+        for item in self.items:
+            store[item.key] = item
+        for item in self.items:
+            result = store[item.key]
+            self.assertIsInstance(result, Value)
+            for field in ITEM_FIELDS:
+                self.assertEqual(getattr(item, field), getattr(result, field))
+            self.assertIn(item.key, store)
+        self.assertEqual(len(self.items), len(store))
+        self.assertEqual(set(item.key for item in self.items), set(store))
+        self.assertEqual(set(store), set(store.keys()))
+        self.assertFalse(store.get('foo', False))
+        self.assertEqual(self.items[0].public_key,
+                         store.publisher(self.items[0].key))
+        self.assertEqual(self.items[0].timestamp,
+                         store.created(self.items[0].key))
+
+    def test_compact_representation(self):
+        """
+        Keys and signatures are held as bytes and public keys are shared.
+        """
+        store = CompactDataStore()
+        copy = self.items[1]._replace(public_key=(PUBLIC_KEY + ' ')[:-1])
+        store[self.items[0].key] = self.items[0]
+        store[copy.key] = copy
+        records = store._records
+        self.assertEqual(set(pack_hex(item.key) for item in self.items[:2]),
+                         set(records))
+        first = records[pack_hex(self.items[0].key)]
+        second = records[pack_hex(copy.key)]
+        self.assertIsInstance(first.signature, bytes)
+        self.assertIs(first.public_key, second.public_key)
+        self.assertEqual(2, store._publishers[PUBLIC_KEY][1])
+        del store[self.items[0].key]
+        self.assertEqual(1, store._publishers[PUBLIC_KEY][1])
+        store[copy.key] = copy
+        self.assertEqual(1, store._publishers[PUBLIC_KEY][1])
+        del store[copy.key]
+        self.assertEqual({}, store._publishers)
+        with self.assertRaises(KeyError):
+            del store[copy.key]
+
+    def test_touch_refresh(self):
+        """
+        Access and update times are updated in place. Storing an item again
+        keeps its access time.
+        """
+        store = CompactDataStore()
+        item = self.items[0]
+        store[item.key] = item
+        record = store._records[pack_hex(item.key)]
+        self.assertEqual(0.0, store.accessed(item.key))
+        store.touch(item.key)
+        accessed = store.accessed(item.key)
+        self.assertTrue(accessed > 0.0)
+        self.assertIs(record, store._records[pack_hex(item.key)])
+        store._set_item(item.key, (item, 1.0, accessed))
+        self.assertEqual(1.0, store.updated(item.key))
+        store.refresh(item.key)
+        self.assertTrue(store.updated(item.key) > 1.0)
+        store[item.key] = item
+        self.assertEqual(accessed, store.accessed(item.key))
+        self.assertEqual(accessed, store._get_item(item.key)[2])
+
+    def test_purge_expired(self):
+        """
+        Expired items are purged.
+        """
+        store = CompactDataStore()
+        item = make_item('foo', expires=1000)
+        store[item.key] = item
+        self.assertEqual([item.key], store.purge_expired(time.time() + 2000))
+        self.assertEqual(0, len(store))
+
+
+class PublisherIndexMixin(object):
+    """
+    Tests of the publisher index shared by all the data stores. Child
+    classes provide a make_store method.
+    """
+
+    def setUp(self):
+        super(PublisherIndexMixin, self).setUp()
+        self.mine = [make_item('mine {}'.format(i)) for i in range(3)]
+        # The data stores don't check signatures.
+        self.theirs = [make_item('theirs {}'.format(i))._replace(
+                       public_key=BAD_PUBLIC_KEY) for i in range(2)]
+        self.my_id = sha512(PUBLIC_KEY.encode('ascii')).hexdigest()
+        self.their_id = sha512(BAD_PUBLIC_KEY.encode('ascii')).hexdigest()
+
+    def check_index(self, store):
+        self.assertEqual(set(item.key for item in self.mine),
+                         set(store.publisher_keys(self.my_id)))
+        self.assertEqual(3, store.count_published(self.my_id))
+        self.assertEqual(2, store.count_published(self.their_id))
+        self.assertEqual(0, store.count_published('unknown'))
+        self.assertEqual([], store.publisher_keys('unknown'))
+        self.assertEqual({self.my_id: 3, self.their_id: 2},
+                         store.publisher_counts())
+        exported = store.export_published(self.their_id)
+        self.assertEqual(set(item.signature for item in self.theirs),
+                         set(item['signature'] for item in exported))
+        self.assertEqual(set(ITEM_FIELDS), set(exported[0].keys()))
+        json.dumps(exported)
+
+    def test_publisher_index(self):
+        """
+        Items can be listed, counted and exported by publisher whether the
+        items were stored before or after the index was first used.
+        """
+        store = self.make_store()
+        for item in self.mine[:2] + self.theirs:
+            store[item.key] = item
+        self.assertEqual(2, store.count_published(self.my_id))
+        store[self.mine[2].key] = self.mine[2]
+        # Storing the same item again doesn't count twice.
+        store[self.mine[2].key] = self.mine[2]
+        self.check_index(store)
+        for item in self.theirs:
+            del store[item.key]
+        self.assertEqual(0, store.count_published(self.their_id))
+        self.assertEqual({self.my_id: 3}, store.publisher_counts())
+
+
+class TestDictPublisherIndex(PublisherIndexMixin, unittest.TestCase):
+    """
+    Ensures the publisher index works with the DictDataStore.
+    """
+
+    def make_store(self):
+        return DictDataStore()
+
+    def test_index_built_lazily(self):
+        """
+        The index is only built when it is first needed.
+        """
+        store = self.make_store()
+        store[self.mine[0].key] = self.mine[0]
+        self.assertIsNone(store._by_publisher)
+        self.assertEqual(1, store.count_published(self.my_id))
+        self.assertEqual({self.my_id: set([self.mine[0].key])},
+                         store._by_publisher)
+
+
+class TestCompactPublisherIndex(PublisherIndexMixin, unittest.TestCase):
+    """
+    Ensures the publisher index works with the CompactDataStore.
+    """
+
+    def make_store(self):
+        return CompactDataStore()
+
+
+class TestSQLitePublisherIndex(PublisherIndexMixin, unittest.TestCase):
+    """
+    Ensures the publisher queries work with the SQLiteDataStore (using the
+    index on the publisher column).
+    """
+
+    def make_store(self):
+        return SQLiteDataStore(':memory:')
+
+    def test_queries_dont_commit(self):
+        """
+        Publishers' items are listed and counted without committing the
+        pending writes (which are taken into account).
+        """
+        store = self.make_store()
+        for item in self.mine + self.theirs:
+            store[item.key] = item
+        store.flush()
+        self.assertEqual(3, store.count_published(self.my_id))
+        commits = store.commits
+        # The first of their items is replaced by one of mine and the second
+        # is deleted.
+        moved = self.theirs[0]._replace(public_key=PUBLIC_KEY)
+        store[moved.key] = moved
+        del store[self.theirs[1].key]
+        store.touch(self.mine[0].key)
+        new = make_item('mine 3')
+        store[new.key] = new
+        self.assertEqual(5, store.count_published(self.my_id))
+        self.assertEqual(0, store.count_published(self.their_id))
+        self.assertEqual(set(item.key for item in self.mine) |
+                         set([moved.key, new.key]),
+                         set(store.publisher_keys(self.my_id)))
+        self.assertEqual([], store.publisher_keys(self.their_id))
+        self.assertEqual(5, len(store.export_published(self.my_id)))
+        self.assertEqual({self.my_id: 5}, store.publisher_counts())
+        self.assertEqual(commits, store.commits)
+        store.flush()
+        self.assertEqual(5, store.count_published(self.my_id))
+        self.assertEqual({self.my_id: 5}, store.publisher_counts())
+
+
+class KeyIndexMixin(object):
+    """
+    Tests of the range and closest queries shared by all the data stores.
+    Child classes provide a make_store method.
+    """
+
+    def test_range_closest(self):
+        """
+        Keys can be found by range or distance from a target whether they
+        were stored before or after the index was first used.
+        """
+        store = self.make_store()
+        items = [make_item('item {}'.format(i)) for i in range(20)]
+        for item in items[:10]:
+            store[item.key] = item
+        keys = sorted(item.key for item in items[:10])
+        self.assertEqual(keys, list(store.range()))
+        for item in items[10:]:
+            store[item.key] = item
+        del store[items[0].key]
+        keys = sorted(item.key for item in items[1:])
+        self.assertEqual(keys, list(store.range()))
+        self.assertEqual(keys[5:10], list(store.range(keys[5], keys[10])))
+        self.assertEqual(keys[5:], list(store.range(keys[5])))
+        self.assertEqual(keys[:10], list(store.range(upper=keys[10])))
+        target = items[3].key
+        expected = sorted(keys, key=lambda k: int(k, 16) ^ int(target, 16))
+        self.assertEqual(expected[:5], list(store.closest(target, 5)))
+        self.assertEqual(target, next(store.closest(target, 1)))
+
+
+class TestDictKeyIndex(KeyIndexMixin, unittest.TestCase):
+    def make_store(self):
+        return DictDataStore()
+
+
+class TestCompactKeyIndex(KeyIndexMixin, unittest.TestCase):
+    def make_store(self):
+        return CompactDataStore()
+
+
+class TestSQLiteKeyIndex(KeyIndexMixin, unittest.TestCase):
+    def make_store(self):
+        return SQLiteDataStore(':memory:')
+
+
+class BlobSharingMixin(object):
+    """
+    Tests of the sharing of large values (via a BlobStore) by the in-memory
+    data stores. Child classes provide a make_store method.
+    """
+
+    def test_shares_values(self):
+        """
+        Equal large values stored under different keys are held once and
+        forgotten once no item refers to them. Small values aren't shared.
+        """
+        blobs = BlobStore(threshold=10)
+        store = self.make_store(blobs)
+        document = {'text': 'a large document'}
+        first = make_item('first', document)
+        # A separate (but equal) copy of the value, as if off the wire.
+        second = make_item('second', {'text': 'a large document'})
+        small = make_item('small', 'tiny')
+        for item in (first, second, small):
+            store[item.key] = item
+        self.assertEqual(1, len(blobs))
+        self.assertIs(store[first.key].value, store[second.key].value)
+        self.assertEqual(second.signature, store[second.key].signature)
+        digest = value_digest(document)
+        self.assertEqual(digest, store.value_digest(first.key))
+        self.assertEqual(digest, store.value_digest(second.key))
+        self.assertIsNone(store.value_digest(small.key))
+        self.assertEqual(2, blobs.references(digest))
+        # Replacing an item releases its previous value.
+        store[second.key] = make_item('second', 'tiny')
+        self.assertEqual(1, blobs.references(digest))
+        self.assertIsNone(store.value_digest(second.key))
+        del store[first.key]
+        self.assertEqual(0, len(blobs))
+        self.assertIsNone(store.value_digest(first.key))
+
+    def test_no_blob_store(self):
+        """
+        Without a blob store values aren't shared.
+        """
+        store = self.make_store(None)
+        item = make_item('first', {'text': 'a large document'})
+        store[item.key] = item
+        self.assertIsNone(store.value_digest(item.key))
+
+
+class TestDictBlobSharing(BlobSharingMixin, unittest.TestCase):
+    def make_store(self, blobs):
+        return DictDataStore(blobs)
+
+
+class TestCompactBlobSharing(BlobSharingMixin, unittest.TestCase):
+    def make_store(self, blobs):
+        return CompactDataStore(blobs)
+
+
+class CompressionMixin(object):
+    """
+    Tests of the compression of large items at rest shared by the data
+    stores that support it. Child classes provide a make_store method and
+    the number of the two items stored that are large enough to compress.
+    """
+
+    compressed = 1
+
+    def test_compresses_large_values(self):
+        """
+        Large items are held compressed but read back unchanged (so their
+        signatures still verify). The cost is reported to the metrics.
+        """
+        metrics = MetricsRegistry()
+        store = self.make_store(100, metrics)
+        large = make_item('large', {'text': ['the same old words'] * 100})
+        small = make_item('small', 'tiny')
+        store[large.key] = large
+        store[small.key] = small
+        for item in (large, small):
+            result = store[item.key]
+            self.assertEqual(item.value, result.value)
+            self.assertTrue(verify_item(to_dict(result)))
+        self.assertEqual(self.compressed, metrics.counters[
+            'storage.compression.compressed'])
+        exported = store.export_published(store.publisher_id(PUBLIC_KEY))
+        self.assertEqual(set([large.key, small.key]),
+                         set(item['key'] for item in exported))
+
+
+class TestCompactCompression(CompressionMixin, unittest.TestCase):
+    def make_store(self, threshold, metrics):
+        return CompactDataStore(compress_threshold=threshold,
+                                metrics=metrics)
+
+    def test_record_holds_compressed_value(self):
+        store = self.make_store(100, None)
+        large = make_item('large', {'text': ['the same old words'] * 100})
+        store[large.key] = large
+        record = store._records[pack_hex(large.key)]
+        self.assertIsInstance(record.value, Compressed)
+
+
+class TestSQLiteCompression(CompressionMixin, unittest.TestCase):
+    # Whole rows are compressed, so the small item's row (with its public key
+    # and signature) is over the threshold too.
+    compressed = 2
+
+    def make_store(self, threshold, metrics):
+        return SQLiteDataStore(':memory:', compress_threshold=threshold,
+                               metrics=metrics)
+
+    def test_row_holds_compressed_item(self):
+        store = self.make_store(100, None)
+        large = make_item('large', {'text': ['the same old words'] * 100})
+        store[large.key] = large
+        store.flush()
+        self.assertIsInstance(store._get_row(large.key)[1], bytes)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the subscriptions to the updates of keys work as expected.
+"""
+from drogulus.dht.subscriptions import Subscriptions, Watch
+from drogulus.dht.contact import PeerNode
+from drogulus.dht.constants import (SUBSCRIPTION_LEASE, SUBSCRIPTION_LEASE_MAX,
+                                    SUBSCRIPTIONS_MAX)
+from drogulus.dht.errors import QuotaExceeded
+from drogulus.version import get_version
+from collections import namedtuple
+from unittest import mock
+import unittest
+
+
+Item = namedtuple('Item', ['key', 'timestamp'])
+
+
+def make_contact(index):
+    """
+    Returns a contact with a network ID derived from the index.
+    """
+    contact = PeerNode('key {}'.format(index), get_version(),
+                       'http://192.168.0.{}:1908/'.format(index), 0)
+    contact.network_id = '{:0128x}'.format(index)
+    return contact
+
+
+class TestSubscriptions(unittest.TestCase):
+    """
+    Ensures the Subscriptions class works as expected.
+    """
+
+    def test_init(self):
+        subscriptions = Subscriptions()
+        self.assertEqual(SUBSCRIPTIONS_MAX, subscriptions.capacity)
+        self.assertEqual(SUBSCRIPTION_LEASE_MAX, subscriptions.longest)
+        self.assertEqual(0, len(subscriptions))
+
+    def test_add(self):
+        subscriptions = Subscriptions()
+        contact = make_contact(1)
+        self.assertEqual(300, subscriptions.add('foo', contact, 300, 100.0))
+        self.assertEqual(1, len(subscriptions))
+        self.assertEqual([contact], subscriptions.subscribers('foo', 400.0))
+        self.assertEqual([], subscriptions.subscribers('bar', 100.0))
+
+    def test_add_caps_lease(self):
+        subscriptions = Subscriptions(longest=60)
+        contact = make_contact(1)
+        self.assertEqual(60, subscriptions.add('foo', contact, 300, 100.0))
+        self.assertEqual([], subscriptions.subscribers('foo', 161.0))
+
+    def test_renew(self):
+        """
+        Subscribing again extends the lease rather than adding another
+        subscription.
+        """
+        subscriptions = Subscriptions()
+        contact = make_contact(1)
+        subscriptions.add('foo', contact, 300, 100.0)
+        subscriptions.add('foo', contact, 300, 300.0)
+        self.assertEqual(1, len(subscriptions))
+        self.assertEqual([contact], subscriptions.subscribers('foo', 500.0))
+
+    def test_capacity(self):
+        """
+        Lapsed subscriptions make way for new ones, otherwise QuotaExceeded
+        is raised.
+        """
+        subscriptions = Subscriptions(capacity=2)
+        subscriptions.add('foo', make_contact(1), 10, 100.0)
+        subscriptions.add('bar', make_contact(2), 300, 100.0)
+        # Renewals are always accepted.
+        subscriptions.add('bar', make_contact(2), 300, 105.0)
+        with self.assertRaises(QuotaExceeded):
+            subscriptions.add('baz', make_contact(3), 300, 105.0)
+        subscriptions.add('baz', make_contact(3), 300, 111.0)
+        self.assertEqual(2, len(subscriptions))
+        self.assertEqual([], subscriptions.subscribers('foo', 111.0))
+
+    def test_remove(self):
+        subscriptions = Subscriptions()
+        first = make_contact(1)
+        second = make_contact(2)
+        subscriptions.add('foo', first, 300, 100.0)
+        subscriptions.add('foo', second, 300, 100.0)
+        subscriptions.remove('foo', first)
+        self.assertEqual(1, len(subscriptions))
+        self.assertEqual([second], subscriptions.subscribers('foo', 100.0))
+        # Removing an unknown subscription does nothing.
+        subscriptions.remove('foo', first)
+        subscriptions.remove('bar', first)
+        self.assertEqual(1, len(subscriptions))
+
+    def test_expire(self):
+        subscriptions = Subscriptions()
+        subscriptions.add('foo', make_contact(1), 10, 100.0)
+        subscriptions.add('foo', make_contact(2), 300, 100.0)
+        subscriptions.add('bar', make_contact(1), 10, 100.0)
+        self.assertEqual(2, subscriptions.expire(200.0))
+        self.assertEqual(1, len(subscriptions))
+        self.assertEqual(0, subscriptions.expire(200.0))
+
+
+class TestWatch(unittest.TestCase):
+    """
+    Ensures the Watch class works as expected.
+    """
+
+    def test_init(self):
+        watch = Watch('foo')
+        self.assertEqual('foo', watch.key)
+        self.assertEqual(SUBSCRIPTION_LEASE, watch.lease)
+        self.assertEqual([], watch.callbacks)
+        self.assertEqual([], watch.contacts)
+        self.assertEqual(0.0, watch.timestamp)
+        self.assertIsNone(watch.subscribed)
+        self.assertIsNone(watch.renewal)
+
+    def test_update(self):
+        """
+        Only versions newer than the latest seen are passed on.
+        """
+        watch = Watch('foo')
+        callback = mock.MagicMock()
+        watch.callbacks.append(callback)
+        item = Item('foo', 123.0)
+        self.assertTrue(watch.update(item))
+        callback.assert_called_once_with(item)
+        self.assertFalse(watch.update(Item('foo', 123.0)))
+        self.assertFalse(watch.update(Item('foo', 100.0)))
+        self.assertEqual(1, callback.call_count)
+        self.assertTrue(watch.update(Item('foo', 124.0)))
+        self.assertEqual(2, callback.call_count)
+        self.assertEqual(124.0, watch.timestamp)
+
+    def test_update_callback_error(self):
+        """
+        A failing callback is logged and doesn't stop the others.
+        """
+        watch = Watch('foo')
+        watch.callbacks.append(mock.MagicMock(side_effect=ValueError()))
+        callback = mock.MagicMock()
+        watch.callbacks.append(callback)
+        with mock.patch('drogulus.dht.subscriptions.log.exception') as log:
+            self.assertTrue(watch.update(Item('foo', 123.0)))
+            self.assertEqual(1, log.call_count)
+        self.assertEqual(1, callback.call_count)
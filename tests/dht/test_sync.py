@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the anti-entropy replica synchronisation works as expected.
+"""
+from drogulus.dht.sync import (Synchroniser, common_prefix, bucket_digests,
+                               differing_buckets, payload_size, batch_items)
+from drogulus.dht.node import Node
+from drogulus.dht.storage import DictDataStore
+from drogulus.dht.blobstore import BlobStore
+from drogulus.dht.contact import PeerNode
+from drogulus.dht.messages import from_dict
+from drogulus.dht.erasure import fragment_name
+from drogulus.version import get_version
+from ..items import make_item
+from ..keys import PRIVATE_KEY, PUBLIC_KEY
+from unittest import mock
+import asyncio
+import time
+import unittest
+
+
+class FakeConnector:
+    """
+    Pretends to be a connector for sending messages to remote nodes.
+    """
+
+    def send(self, contact, message, sender):
+        return asyncio.Future()
+
+
+class TestFunctions(unittest.TestCase):
+    """
+    Ensures the module level functions work as expected.
+    """
+
+    def test_common_prefix(self):
+        self.assertEqual('ab', common_prefix('abc', 'abd'))
+        self.assertEqual('', common_prefix('abc', 'xbc'))
+        self.assertEqual('abc', common_prefix('abc', 'abc'))
+
+    def test_bucket_digests(self):
+        """
+        Keys are split into buckets by the characters following the prefix
+        and each bucket is summarised by a digest of its keys and timestamps.
+        """
+        entries = {'a01': 1.0, 'a02': 2.0, 'a11': 3.0}
+        result = bucket_digests(entries, 'a', 1, 16)
+        self.assertEqual(set(['a0', 'a1']), set(result.keys()))
+        self.assertEqual(16, len(result['a0']))
+        # The digest changes if a timestamp changes.
+        entries['a02'] = 2.5
+        changed = bucket_digests(entries, 'a', 1, 16)
+        self.assertNotEqual(result['a0'], changed['a0'])
+        self.assertEqual(result['a1'], changed['a1'])
+
+    def test_differing_buckets(self):
+        """
+        Buckets that differ (including those that are missing at either end)
+        are mapped to the local digest.
+        """
+        remote = {'a0': 'x', 'a1': 'y', 'a2': 'z'}
+        local = {'a0': 'x', 'a1': 'w', 'a3': 'v'}
+        expected = {'a1': 'w', 'a2': '', 'a3': 'v'}
+        self.assertEqual(expected, differing_buckets(remote, local))
+
+    def test_payload_size(self):
+        self.assertEqual(len('{"a": 1}'), payload_size({'a': 1}))
+
+    def test_batch_items(self):
+        """
+        Batches are capped by the number of items and their total size. An
+        item bigger than the cap is in a batch of its own.
+        """
+        items = [mock.MagicMock(key=str(i)) for i in range(6)]
+        sizes = {'0': 10, '1': 10, '2': 10, '3': 10, '4': 100, '5': 10}
+        batches = batch_items(items, sizes, max_items=3, max_bytes=25)
+        self.assertEqual([(items[0:2], 20), (items[2:4], 20),
+                          (items[4:5], 100), (items[5:6], 10)], batches)
+        batches = batch_items(items[:4], sizes, max_items=3, max_bytes=100)
+        self.assertEqual([(items[0:3], 30), (items[3:4], 10)], batches)
+        self.assertEqual([], batch_items([], sizes))
+
+
+class TestSynchroniser(unittest.TestCase):
+    """
+    Ensures the Synchroniser class works as expected.
+    """
+
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.version = get_version()
+        self.local = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                          FakeConnector(), 1908)
+        self.remote = Node(PUBLIC_KEY, PRIVATE_KEY, self.event_loop,
+                           FakeConnector(), 1908)
+        self.contact = PeerNode(PUBLIC_KEY, self.version,
+                                'http://192.168.0.1:1908/', 0)
+        self.contact.network_id = self.local.network_id[:1] + 'f' * 127
+        self.local.routing_table.find_close_nodes = mock.MagicMock(
+            return_value=[self.contact, ])
+
+        def send_summary(contact, prefix, buckets):
+            """
+            Delivers the summary straight to the remote node.
+            """
+            msg_dict = {
+                'uuid': 'uuid',
+                'recipient': PUBLIC_KEY,
+                'sender': PUBLIC_KEY,
+                'reply_port': 1908,
+                'version': self.version,
+                'seal': 'seal',
+                'prefix': prefix,
+                'buckets': buckets,
+                'message': 'summary',
+            }
+            summary = from_dict(msg_dict)
+            task = asyncio.Future()
+            try:
+                task.set_result(self.remote.handle_summary(summary,
+                                                           self.contact))
+            except Exception as ex:
+                task.set_exception(ex)
+            return ('uuid', task)
+
+        self.local.send_summary = mock.MagicMock(side_effect=send_summary)
+        self.local.send_store_many = mock.MagicMock(
+            return_value=('uuid', asyncio.Future()))
+        self.local.sync_mode = True
+        self.remote.sync_mode = True
+        self.remote.routing_table.find_close_nodes = mock.MagicMock(
+            return_value=[self.contact, ])
+        # The tests sync ranges wider than a real network would.
+        self.local.synchroniser.min_prefix = 0
+        self.remote.synchroniser.min_prefix = 0
+
+    def tearDown(self):
+        self.local.republisher.stop()
+        self.remote.republisher.stop()
+        self.event_loop.close()
+
+    def store(self, node, item):
+        node.data_store[item.key] = item
+
+    def sync(self):
+        """
+        Runs a synchronisation and returns the keys pushed to the contact.
+        """
+        results = self.local.synchroniser.sync()
+        self.assertEqual(1, len(results))
+        self.event_loop.run_until_complete(results[0])
+        return results[0].result()
+
+    def test_sync_not_in_sync_mode(self):
+        """
+        Nothing happens if the local node isn't in sync mode.
+        """
+        self.local.sync_mode = False
+        self.assertEqual([], self.local.synchroniser.sync())
+        self.assertEqual(0, self.local.send_summary.call_count)
+
+    def test_sync_neighbourhood_too_wide(self):
+        """
+        Nothing is synced (the items are left to republication) if the
+        neighbourhood's prefix is shorter than the minimum.
+        """
+        synchroniser = self.local.synchroniser
+        synchroniser.min_prefix = 2
+        synchroniser.prefix = 'ab'
+        self.assertEqual([], synchroniser.sync())
+        self.assertEqual(0, self.local.send_summary.call_count)
+        self.assertIsNone(synchroniser.prefix)
+
+    def test_neighbourhood(self):
+        """
+        The range synced is the prefix shared with all the neighbours.
+        """
+        prefix, neighbours = self.local.synchroniser.neighbourhood()
+        self.assertEqual(self.local.network_id[:1], prefix)
+        self.assertEqual([self.contact, ], neighbours)
+
+    def test_entries_skips_expired_and_out_of_range(self):
+        """
+        Only unexpired items in the range are included in the entries.
+        Fragments of erasure coded values are never included.
+        """
+        items = [make_item('item %d' % i) for i in range(20)]
+        for item in items:
+            self.store(self.local, item)
+        expired = make_item('expired', expires=0.001)
+        time.sleep(0.01)
+        self.store(self.local, expired)
+        self.store(self.local, make_item(fragment_name('coded', 0)))
+        entries = self.local.synchroniser.entries('')
+        self.assertEqual(set([item.key for item in items]),
+                         set(entries.keys()))
+        prefix = items[0].key[0]
+        entries = self.local.synchroniser.entries(prefix)
+        expected = set([item.key for item in items
+                        if item.key.startswith(prefix)])
+        self.assertEqual(expected, set(entries.keys()))
+
+    def test_sync_identical(self):
+        """
+        If both nodes hold identical items nothing is pushed and only the
+        summary is sent.
+        """
+        self.local.synchroniser.neighbourhood = mock.MagicMock(
+            return_value=('', [self.contact, ]))
+        for i in range(10):
+            item = make_item('item %d' % i)
+            self.store(self.local, item)
+            self.store(self.remote, item)
+        self.assertEqual([], self.sync())
+        self.assertEqual(0, self.local.send_store_many.call_count)
+        counters = self.local.metrics.counters
+        self.assertEqual(1, counters['sync.sessions'])
+        self.assertEqual(0, counters['sync.items_pushed'])
+        self.assertTrue(counters['sync.bytes_sent'] > 0)
+
+    def test_sync_pushes_differences(self):
+        """
+        Only items the contact is missing or holds an older version of are
+        pushed.
+        """
+        self.local.synchroniser.neighbourhood = mock.MagicMock(
+            return_value=('', [self.contact, ]))
+        same = make_item('same')
+        old = make_item('changed', 'old')
+        new = make_item('changed', 'new')
+        missing = make_item('missing')
+        remote_only = make_item('remote only')
+        for item in (same, new, missing):
+            self.store(self.local, item)
+        for item in (same, old, remote_only):
+            self.store(self.remote, item)
+        pushed = self.sync()
+        self.assertEqual(sorted([new.key, missing.key]), sorted(pushed))
+        self.assertEqual(1, self.local.send_store_many.call_count)
+        contact, batch = self.local.send_store_many.call_args[0]
+        self.assertEqual(self.contact, contact)
+        self.assertEqual(set([new, missing]), set(batch))
+        self.assertEqual(2, self.local.metrics.counters['sync.items_pushed'])
+
+    def test_handle_summary_max_entries(self):
+        """
+        The reply holds the entries of whole differing buckets up to the
+        maximum. Every differing bucket is reported (so the items in the
+        buckets left out are pushed in full).
+        """
+        self.remote.synchroniser.depth = 1
+        items = [make_item('item %d' % i) for i in range(20)]
+        for item in items:
+            self.store(self.remote, item)
+        summary = mock.MagicMock(prefix='', buckets={})
+        synchroniser = self.remote.synchroniser
+        buckets, entries = synchroniser.handle_summary(summary, self.contact)
+        self.assertEqual(20, len(entries))
+        synchroniser.max_entries = 5
+        capped, entries = synchroniser.handle_summary(summary, self.contact)
+        self.assertEqual(buckets, capped)
+        self.assertTrue(0 < len(entries) <= 5)
+        for key in entries:
+            bucket = [item.key for item in items if item.key[0] == key[0]]
+            self.assertTrue(set(bucket) <= set(entries))
+
+    def test_push_items_capped(self):
+        """
+        Items are pushed in messages capped by size (see Node.send_items) and
+        the result resolves once every message has been acknowledged.
+        """
+        first = asyncio.Future()
+        second = asyncio.Future()
+        self.local.send_items = mock.MagicMock(
+            return_value=[(first, 10), (second, 20)])
+        items = [make_item('item {}'.format(i)) for i in range(2)]
+        result = self.local.synchroniser.push_items(self.contact, items)
+        self.local.send_items.assert_called_once_with(self.contact, items)
+        self.assertEqual(30, self.local.metrics.counters['sync.bytes_sent'])
+        first.set_result('ok')
+        self.event_loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(result.done())
+        second.set_result('ok')
+        self.event_loop.run_until_complete(result)
+        self.assertEqual(['ok', 'ok'], result.result())
+
+    def test_sync_pushes_large_values_by_digest(self):
+        """
+        Items with values held in the blob store are pushed by digest. Only
+        the items whose values the contact doesn't already hold (under any
+        key) are then sent in full.
+        """
+        self.local.data_store = DictDataStore(BlobStore(threshold=10))
+        self.remote.data_store = DictDataStore(BlobStore(threshold=10))
+        self.local.synchroniser.neighbourhood = mock.MagicMock(
+            return_value=('', [self.contact, ]))
+        document = {'text': 'a large document ' * 10}
+        first = make_item('first', document)
+        second = make_item('second', document)
+        other = make_item('other', {'text': 'another large document'})
+        small = make_item('small', 'tiny')
+        for item in (first, second, other, small):
+            self.store(self.local, item)
+        self.store(self.remote, make_item('elsewhere', document))
+
+        def send_store_digests(contact, items):
+            """
+            Delivers the StoreDigests message straight to the remote node.
+            """
+            msg_dict = {
+                'uuid': 'uuid',
+                'recipient': PUBLIC_KEY,
+                'sender': PUBLIC_KEY,
+                'reply_port': 1908,
+                'version': self.version,
+                'seal': 'seal',
+                'items': items,
+                'message': 'storedigests',
+            }
+            task = asyncio.Future()
+            task.set_result(self.remote.handle_store_digests(
+                from_dict(msg_dict), self.contact))
+            return ('uuid', task)
+
+        self.local.send_store_digests = mock.MagicMock(
+            side_effect=send_store_digests)
+        pushed = self.sync()
+        self.assertEqual(4, len(pushed))
+        self.assertEqual(1, self.local.send_store_digests.call_count)
+        digests = self.local.send_store_digests.call_args[0][1]
+        self.assertEqual(3, len(digests))
+        for data in digests:
+            self.assertEqual(self.local.data_store.value_digest(data['key']),
+                             data['value'])
+        self.event_loop.run_until_complete(asyncio.sleep(0))
+        # The small item and the item whose value the remote node doesn't
+        # hold are sent in full.
+        batches = [call[0][1] for call in
+                   self.local.send_store_many.call_args_list]
+        self.assertEqual([[small], [other]], batches)
+        self.assertIn(first.key, self.remote.data_store)
+        self.assertIn(second.key, self.remote.data_store)
+        self.assertEqual(1, len(self.remote.data_store.blobs))
+        counters = self.local.metrics.counters
+        self.assertEqual(2, counters['sync.values_skipped'])
+        counters = self.remote.metrics.counters
+        self.assertEqual(2, counters['blobs.digests_found'])
+        self.assertEqual(1, counters['blobs.digests_missing'])
+
+    def test_sync_sets_covered_range(self):
+        """
+        Once synced, the keys in the range are covered by synchronisation
+        (so won't be blindly republished).
+        """
+        self.assertFalse(self.local.synchroniser.covers(
+            self.local.network_id))
+        self.sync()
+        self.assertTrue(self.local.synchroniser.covers(
+            self.local.network_id))
+        self.local.sync_mode = False
+        self.assertFalse(self.local.synchroniser.covers(
+            self.local.network_id))
+
+    def test_covers_needs_every_neighbour(self):
+        """
+        A bucket is only covered once it has been synced with every neighbour
+        within the last two intervals.
+        """
+        synchroniser = self.local.synchroniser
+        other = PeerNode(PUBLIC_KEY, self.version, 'http://192.168.0.2:1908',
+                         0)
+        other.network_id = '0' * 128
+        synchroniser.prefix = 'a'
+        synchroniser.neighbours = [self.contact.network_id, other.network_id]
+        key = 'ab' + '0' * 126
+        synchroniser.mark_synced(self.contact, ['ab0'], 1000.0)
+        self.assertFalse(synchroniser.covers(key, 1000.0))
+        synchroniser.mark_synced(other, ['ab0'], 1000.0)
+        self.assertTrue(synchroniser.covers(key, 1000.0))
+        self.assertFalse(synchroniser.covers('ab1' + '0' * 125, 1000.0))
+        later = 1000.0 + 2 * synchroniser.interval + 1
+        self.assertFalse(synchroniser.covers(key, later))
+
+    def test_sync_failed_not_covered(self):
+        """
+        If the neighbour doesn't reply the range isn't covered, so the items
+        fall back to republication.
+        """
+        task = asyncio.Future()
+        task.set_exception(ValueError('Boom'))
+        self.local.send_summary = mock.MagicMock(return_value=('uuid', task))
+        results = self.local.synchroniser.sync()
+        with self.assertRaises(ValueError):
+            self.event_loop.run_until_complete(results[0])
+        self.assertFalse(self.local.synchroniser.covers(
+            self.local.network_id))
+
+    def test_sync_differing_bucket_covered_once_pushed(self):
+        """
+        A bucket that differs is only covered once the pushed items are
+        acknowledged.
+        """
+        self.local.synchroniser.neighbourhood = mock.MagicMock(
+            return_value=('', [self.contact, ]))
+        item = make_item('missing')
+        self.store(self.local, item)
+        same = make_item('same')
+        self.store(self.local, same)
+        self.store(self.remote, same)
+        ack = asyncio.Future()
+        self.local.send_store_many = mock.MagicMock(
+            return_value=('uuid', ack))
+        self.assertEqual([item.key], self.sync())
+        synchroniser = self.local.synchroniser
+        self.assertFalse(synchroniser.covers(item.key))
+        if item.key[:2] != same.key[:2]:
+            self.assertTrue(synchroniser.covers(same.key))
+        ack.set_result('ok')
+        self.event_loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(synchroniser.covers(item.key))
+
+    def test_sync_failed_response(self):
+        """
+        A failure of the Summary request is passed on via the Future.
+        """
+        task = asyncio.Future()
+        task.set_exception(ValueError('Boom'))
+        self.local.send_summary = mock.MagicMock(return_value=('uuid', task))
+        results = self.local.synchroniser.sync()
+        with self.assertRaises(ValueError):
+            self.event_loop.run_until_complete(results[0])
+        self.assertEqual(0, self.local.send_store_many.call_count)
+
+    def test_start_tick(self):
+        """
+        Synchronisation happens every interval seconds.
+        """
+        synchroniser = Synchroniser(self.local, interval=10)
+        with mock.patch.object(self.event_loop, 'call_later') as mock_call:
+            synchroniser.start()
+            synchroniser.start()
+            mock_call.assert_called_once_with(10, synchroniser._tick)
+            synchroniser.handle = None
+            synchroniser.sync = mock.MagicMock(side_effect=ValueError('Boom'))
+            synchroniser._tick()
+            self.assertEqual(2, mock_call.call_count)
+        synchroniser.stop()
+        self.assertEqual(None, synchroniser.handle)
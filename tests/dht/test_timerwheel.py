@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Ensures the hierarchical timing wheel works as expected.
+"""
+from drogulus.dht.timerwheel import TimerWheel, Timer, RESOLUTION, SLOTS
+from unittest import mock
+import asyncio
+import unittest
+
+
+class FakeLoop(object):
+    """
+    An event loop whose clock is advanced by the tests.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.call_at = mock.MagicMock()
+
+    def time(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Ensures the TimerWheel class works as expected.
+    """
+
+    def setUp(self):
+        self.loop = FakeLoop()
+        self.wheel = TimerWheel(self.loop, 1.0, (4, 4, 4))
+
+    def advance(self, seconds):
+        """
+        Moves the clock on by the given number of seconds and ticks the wheel
+        (if it is running).
+        """
+        self.loop.now += seconds
+        if self.wheel.handle is not None:
+            self.wheel._tick()
+
+    def test_init(self):
+        """
+        Ensure the wheel is set up with the expected levels.
+        """
+        wheel = TimerWheel(self.loop)
+        self.assertEqual(RESOLUTION, wheel.resolution)
+        self.assertEqual(SLOTS, wheel.slots)
+        self.assertEqual(len(SLOTS), len(wheel.levels))
+        self.assertEqual(0, len(wheel))
+        self.assertEqual(None, wheel.handle)
+        self.assertEqual([1, 4, 16], self.wheel.granularity)
+        self.assertEqual(64, self.wheel.span)
+
+    def test_schedule(self):
+        """
+        Scheduling a timer returns a Timer and starts the wheel ticking.
+        """
+        callback = mock.MagicMock()
+        timer = self.wheel.schedule(2, callback, 'foo')
+        self.assertIsInstance(timer, Timer)
+        self.assertEqual(1, len(self.wheel))
+        self.assertEqual(2, timer.expires)
+        self.assertIn(timer, self.wheel.levels[0][2])
+        self.loop.call_at.assert_called_once_with(1001.0, self.wheel._tick)
+
+    def test_fires_on_time(self):
+        """
+        A timer fires on the first tick at or after its deadline.
+        """
+        callback = mock.MagicMock()
+        self.wheel.schedule(2.5, callback, 'foo')
+        self.advance(2)
+        self.assertEqual(0, callback.call_count)
+        self.advance(1)
+        callback.assert_called_once_with('foo')
+        self.assertEqual(0, len(self.wheel))
+        # The wheel stops ticking when it is empty.
+        self.assertEqual(None, self.wheel.handle)
+
+    def test_cascade(self):
+        """
+        Timers beyond the span of level 0 are cascaded into the lower levels
+        and fire at the correct tick.
+        """
+        fired = []
+        for delay in (3, 5, 17, 40, 63):
+            self.wheel.schedule(delay, fired.append, delay)
+        self.assertIn(5, [t.args[0] for t in self.wheel.levels[1][1]])
+        for second in range(1, 64):
+            self.advance(1)
+            self.assertEqual([d for d in (3, 5, 17, 40, 63) if d <= second],
+                             fired)
+
+    def test_beyond_span(self):
+        """
+        Timers further in the future than the span of the wheel still fire
+        at the correct tick.
+        """
+        callback = mock.MagicMock()
+        self.wheel.schedule(150, callback)
+        for second in range(149):
+            self.advance(1)
+        self.assertEqual(0, callback.call_count)
+        self.advance(1)
+        self.assertEqual(1, callback.call_count)
+
+    def test_cancel(self):
+        """
+        A cancelled timer doesn't fire.
+        """
+        callback = mock.MagicMock()
+        timer = self.wheel.schedule(2, callback)
+        timer.cancel()
+        self.assertTrue(timer.cancelled)
+        self.assertEqual(0, len(self.wheel))
+        # Cancelling twice is harmless.
+        timer.cancel()
+        self.assertEqual(0, len(self.wheel))
+        self.advance(3)
+        self.assertEqual(0, callback.call_count)
+
+    def test_batch_and_catch_up(self):
+        """
+        All timers due when the wheel ticks late are fired in a single batch.
+        """
+        fired = []
+        for delay in (1, 2, 3):
+            self.wheel.schedule(delay, fired.append, delay)
+        self.advance(10)
+        self.assertEqual([1, 2, 3], sorted(fired))
+        self.assertEqual(3, self.wheel.fired)
+
+    def test_callback_exception_logged(self):
+        """
+        An exception in a callback is logged and doesn't stop other timers
+        from firing.
+        """
+        callback = mock.MagicMock()
+        self.wheel.schedule(1, mock.MagicMock(side_effect=ValueError()))
+        self.wheel.schedule(1, callback)
+        with mock.patch('drogulus.dht.timerwheel.log.error') as mock_log:
+            self.advance(1)
+            self.assertEqual(2, mock_log.call_count)
+        self.assertEqual(1, callback.call_count)
+
+    def test_restart_after_idle(self):
+        """
+        A timer scheduled after the wheel has been idle fires at the correct
+        time.
+        """
+        callback = mock.MagicMock()
+        self.loop.now += 500
+        self.wheel.schedule(2, callback)
+        self.advance(1)
+        self.assertEqual(0, callback.call_count)
+        self.advance(1)
+        self.assertEqual(1, callback.call_count)
+
+    def test_stop(self):
+        """
+        Stopping the wheel discards all the timers.
+        """
+        timer = self.wheel.schedule(2, mock.MagicMock())
+        handle = self.wheel.handle
+        self.wheel.stop()
+        handle.cancel.assert_called_once_with()
+        self.assertEqual(None, self.wheel.handle)
+        self.assertEqual(0, len(self.wheel))
+        self.assertTrue(timer.cancelled)
+
+    def test_real_event_loop(self):
+        """
+        Ensure the wheel works with a real event loop.
+        """
+        event_loop = asyncio.new_event_loop()
+        wheel = TimerWheel(event_loop, 0.01)
+        result = asyncio.Future(loop=event_loop)
+        wheel.schedule(0.02, result.set_result, 'done')
+        event_loop.run_until_complete(result)
+        self.assertEqual('done', result.result())
+        self.assertEqual(None, wheel.handle)
+        event_loop.close()
@@ -6,7 +6,12 @@ work correctly.
 from drogulus.dht.validators import (validate_timestamp, validate_port,
                                      validate_string, validate_dict,
                                      validate_node, validate_nodes,
-                                     validate_value, VALIDATORS)
+                                     validate_value, validate_keys,
+                                     validate_item, validate_results,
+                                     validate_items, validate_prefix,
+                                     validate_buckets, validate_entries,
+                                     validate_load, validate_lease,
+                                     VALIDATORS)
 import unittest
 import time
 
@@ -141,12 +146,137 @@ class TestValidators(unittest.TestCase):
         """
         self.assertTrue(validate_value('foo'))
 
+    def test_validate_keys(self):
+        """
+        A non-empty list of strings is a valid list of keys.
+        """
+        self.assertTrue(validate_keys(['foo', 'bar']))
+
+    def test_validate_keys_empty_or_wrong_type(self):
+        """
+        Keys can only be expressed as a non-empty list of strings.
+        """
+        self.assertFalse(validate_keys([]))
+        self.assertFalse(validate_keys(('foo', 'bar')))
+        self.assertFalse(validate_keys(['foo', 123]))
+
+    def test_validate_item(self):
+        """
+        An item must contain exactly the expected fields with valid values.
+        """
+        item = {
+            'key': 'foo',
+            'value': 'bar',
+            'timestamp': time.time(),
+            'expires': 0.0,
+            'created_with': '0.1',
+            'public_key': 'baz',
+            'name': 'qux',
+            'signature': 'abc',
+        }
+        self.assertTrue(validate_item(item))
+        item['timestamp'] = 'not a timestamp'
+        self.assertFalse(validate_item(item))
+        del item['timestamp']
+        self.assertFalse(validate_item(item))
+
+    def test_validate_results(self):
+        """
+        The results of a batched request map keys to either a list of nodes or
+        a valid item.
+        """
+        item = {
+            'key': 'foo',
+            'value': 'bar',
+            'timestamp': time.time(),
+            'expires': 0.0,
+            'created_with': '0.1',
+            'public_key': 'baz',
+            'name': 'qux',
+            'signature': 'abc',
+        }
+        nodes = [['id', '0.1', 'http://192.168.0.1:9999/'], ]
+        self.assertTrue(validate_results({'foo': item, 'bar': nodes}))
+        self.assertTrue(validate_results({}))
+        self.assertFalse(validate_results({'foo': 'bar'}))
+        self.assertFalse(validate_results([nodes, ]))
+
+    def test_validate_items(self):
+        """
+        A non-empty list of valid items is valid.
+        """
+        item = {
+            'key': 'foo',
+            'value': 'bar',
+            'timestamp': time.time(),
+            'expires': 0.0,
+            'created_with': '0.1',
+            'public_key': 'baz',
+            'name': 'qux',
+            'signature': 'abc',
+        }
+        self.assertTrue(validate_items([item, item]))
+        self.assertFalse(validate_items([]))
+        self.assertFalse(validate_items((item, )))
+        self.assertFalse(validate_items([item, {'key': 'foo'}]))
+
+    def test_validate_prefix(self):
+        """
+        A prefix is a (possibly empty) string of lowercase hex characters.
+        """
+        self.assertTrue(validate_prefix(''))
+        self.assertTrue(validate_prefix('0af'))
+        self.assertFalse(validate_prefix('0AF'))
+        self.assertFalse(validate_prefix('xyz'))
+        self.assertFalse(validate_prefix(123))
+        self.assertFalse(validate_prefix('a' * 129))
+
+    def test_validate_buckets(self):
+        """
+        Buckets map prefixes to digest strings.
+        """
+        self.assertTrue(validate_buckets({}))
+        self.assertTrue(validate_buckets({'ab': '1234'}))
+        self.assertFalse(validate_buckets({'xy': '1234'}))
+        self.assertFalse(validate_buckets({'ab': 1234}))
+        self.assertFalse(validate_buckets([]))
+
+    def test_validate_entries(self):
+        """
+        Entries map keys to timestamps.
+        """
+        self.assertTrue(validate_entries({}))
+        self.assertTrue(validate_entries({'foo': time.time()}))
+        self.assertFalse(validate_entries({'foo': 'bar'}))
+        self.assertFalse(validate_entries([]))
+
+    def test_validate_load(self):
+        """
+        A load is a non-negative float.
+        """
+        self.assertTrue(validate_load(0.0))
+        self.assertTrue(validate_load(12.5))
+        self.assertFalse(validate_load(-1.0))
+        self.assertFalse(validate_load(3))
+        self.assertFalse(validate_load('3.0'))
+
+    def test_validate_lease(self):
+        """
+        A lease is a non-negative integer number of seconds.
+        """
+        self.assertTrue(validate_lease(0))
+        self.assertTrue(validate_lease(300))
+        self.assertFalse(validate_lease(-1))
+        self.assertFalse(validate_lease(300.0))
+        self.assertFalse(validate_lease(True))
+        self.assertFalse(validate_lease('300'))
+
     def test_validate_VALIDATORS(self):
         """
         Ensures that the VALIDATORS dict maps the field names to validator
         functions correctly.
         """
-        self.assertEqual(17, len(VALIDATORS))
+        self.assertEqual(25, len(VALIDATORS))
         self.assertEqual(VALIDATORS['uuid'], validate_string)
         self.assertEqual(VALIDATORS['recipient'], validate_string)
         self.assertEqual(VALIDATORS['sender'], validate_string)
@@ -164,3 +294,11 @@ class TestValidators(unittest.TestCase):
         self.assertEqual(VALIDATORS['signature'], validate_string)
         self.assertEqual(VALIDATORS['nodes'], validate_nodes)
         self.assertEqual(VALIDATORS['reply_port'], validate_port)
+        self.assertEqual(VALIDATORS['keys'], validate_keys)
+        self.assertEqual(VALIDATORS['results'], validate_results)
+        self.assertEqual(VALIDATORS['items'], validate_items)
+        self.assertEqual(VALIDATORS['prefix'], validate_prefix)
+        self.assertEqual(VALIDATORS['buckets'], validate_buckets)
+        self.assertEqual(VALIDATORS['entries'], validate_entries)
+        self.assertEqual(VALIDATORS['load'], validate_load)
+        self.assertEqual(VALIDATORS['lease'], validate_lease)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Contains a factory for the items used for the purposes of testing.
+"""
+from drogulus.dht.messages import from_dict
+from drogulus.dht.crypto import get_signed_item
+from drogulus.version import get_version
+from .keys import PRIVATE_KEY, PUBLIC_KEY
+
+
+def make_item(name, value='value', expires=0):
+    """
+    Returns a Store message for an item with the given name and value.
+    """
+    signed = get_signed_item(name, value, PUBLIC_KEY, PRIVATE_KEY, expires)
+    signed['uuid'] = 'uuid'
+    signed['sender'] = PUBLIC_KEY
+    signed['recipient'] = PUBLIC_KEY
+    signed['reply_port'] = 1908
+    signed['version'] = get_version()
+    signed['seal'] = 'seal'
+    signed['message'] = 'store'
+    return from_dict(signed)
@@ -3,12 +3,15 @@
 Ensures that the HTTP Protocol and Connector classes work as expected.
 """
 from drogulus.net.http import (HttpConnector, ApplicationHandler,
-                               make_http_handler, DEFAULT_CLEAN_INTERVAL)
+                               make_http_handler, DEFAULT_CLEAN_INTERVAL,
+                               ENCODING, ACCEPT_ENCODING, PEER_ACCEPTS_SIZE)
 from drogulus.dht.messages import OK, to_dict, from_dict
+from drogulus.dht.compression import decompress
 from drogulus.dht.contact import PeerNode
 from drogulus.dht.crypto import get_seal, get_signed_item
 from drogulus.dht.node import Node
-from drogulus.dht.constants import DUPLICATION_COUNT
+from drogulus.dht.constants import DUPLICATION_COUNT, SUBSCRIPTION_LEASE
+from drogulus.dht.sync import item_to_dict
 from drogulus.version import get_version
 from ..keys import PUBLIC_KEY, PRIVATE_KEY
 from unittest import mock
@@ -171,6 +174,62 @@ class TestHttpConnector(unittest.TestCase):
             request.assert_called_once_with('post', contact.uri, data=msg_json,
                                             headers=headers)
 
+    def test_send_compressed(self):
+        """
+        Large messages are compressed (and the encoding given in a header)
+        once the peer has announced that it accepts compressed requests.
+        """
+        contact = PeerNode(PUBLIC_KEY, self.version, 'http://192.168.0.1:80')
+        msg = OK('uuid', 'recipient', 'sender' * 500, 9999, 'version',
+                 'seal')
+        msg_json = json.dumps(to_dict(msg))
+        connector = HttpConnector(self.event_loop)
+        connector.peer_accepts[contact.uri] = set(['zlib'])
+
+        @asyncio.coroutine
+        def faux_request(*args, **kwargs):
+            return 'foo'
+
+        with mock.patch.object(aiohttp, 'request',
+                               return_value=faux_request()) as request:
+            connector.send(contact, msg)
+            args, kwargs = request.call_args
+            self.assertEqual('zlib', kwargs['headers'][ENCODING])
+            self.assertEqual(msg_json,
+                             decompress(kwargs['data']).decode('utf-8'))
+
+    def test_learn_encodings_bounded(self):
+        """
+        The codecs accepted by peers are learned from their responses but
+        only the PEER_ACCEPTS_SIZE peers most recently heard from are
+        remembered.
+        """
+        connector = HttpConnector(self.event_loop)
+        response = mock.MagicMock()
+        response.headers = {ACCEPT_ENCODING: 'zlib, foo'}
+
+        @asyncio.coroutine
+        def faux_request():
+            return response
+
+        uris = ['http://192.168.0.{}:80'.format(i)
+                for i in range(PEER_ACCEPTS_SIZE + 1)]
+        for uri in uris:
+            result = self.event_loop.run_until_complete(
+                connector._learn_encodings(uri, faux_request()))
+            self.assertIs(response, result)
+        self.assertEqual(PEER_ACCEPTS_SIZE, len(connector.peer_accepts))
+        self.assertNotIn(uris[0], connector.peer_accepts)
+        self.assertEqual(set(['zlib', 'foo']),
+                         connector.peer_accepts[uris[-1]])
+        # Hearing from a peer again means it is remembered for longer.
+        self.event_loop.run_until_complete(
+            connector._learn_encodings(uris[1], faux_request()))
+        self.event_loop.run_until_complete(
+            connector._learn_encodings(uris[0], faux_request()))
+        self.assertIn(uris[1], connector.peer_accepts)
+        self.assertNotIn(uris[2], connector.peer_accepts)
+
     def test_receive(self):
         """
         The good case. Should return whatever handler.message_received
@@ -1253,6 +1312,146 @@ class TestApplicationHandler(unittest.TestCase):
             self.assertEqual(json.dumps({'key': self.path,
                                         'status': 'failed'}), call[0][0])
 
+    def test_websoc_watch(self):
+        """
+        Make sure an incoming request to watch a key is processed correctly
+        and the key is no longer watched once the web-socket closes.
+        """
+        ah = ApplicationHandler(self.event_loop, self.connector,
+                                self.local_node)
+
+        faux_read_counter = mock.MagicMock()
+
+        @asyncio.coroutine
+        def faux_read(*args, **kwargs):
+            incoming = mock.MagicMock()
+            incoming.tp = aiohttp.MsgType.text
+            if faux_read_counter.call_count == 0:
+                incoming.data = json.dumps({
+                    'type': 'watch',
+                    'key': self.path,
+                })
+            else:
+                incoming.data = 'close'
+            faux_read_counter()
+            return incoming
+
+        faux_reader = mock.MagicMock()
+        faux_reader.read = mock.MagicMock(side_effect=faux_read)
+
+        class FauxWebSocketResponse(web.WebSocketResponse):
+            def start(self, request):
+                self._reader = faux_reader
+
+            @asyncio.coroutine
+            def close(self, *args, **kwargs):
+                self._closed = True
+                return True
+
+        def faux_watch(ws, message, watches):
+            watches[message['key']] = 'callback'
+
+        self.request.transport = mock.MagicMock()
+        p = ('192.168.0.1', 8888)  # Peer
+        self.request.transport.get_extra_info = mock.MagicMock(return_value=p)
+        ah.websoc_handle_watch = mock.MagicMock(side_effect=faux_watch)
+        self.local_node.unwatch = mock.MagicMock()
+        with mock.patch.object(web, 'WebSocketResponse',
+                               side_effect=FauxWebSocketResponse):
+            self.event_loop.run_until_complete(ah.web_soc(self.request))
+            self.assertEqual(1, ah.websoc_handle_watch.call_count)
+        self.local_node.unwatch.assert_called_once_with(self.path,
+                                                        'callback')
+
+    def test_websoc_handle_watch(self):
+        """
+        Ensure the function to handle incoming DHT WATCH requests reports the
+        number of nodes subscribed to and pushes updates to the client.
+        """
+        ws = mock.MagicMock()
+        ws.send_str = mock.MagicMock()
+        subscribed = asyncio.Future()
+        self.local_node.watch = mock.MagicMock(return_value=subscribed)
+        ah = ApplicationHandler(self.event_loop, self.connector,
+                                self.local_node)
+        message = {'type': 'watch', 'key': self.path}
+        watches = {}
+
+        @asyncio.coroutine
+        def run_test():
+            ah.websoc_handle_watch(ws, message, watches)
+            subscribed.set_result(['a', 'b', 'c'])
+            yield from asyncio.sleep(0)
+
+        self.event_loop.run_until_complete(run_test())
+        callback = watches[self.path]
+        self.local_node.watch.assert_called_once_with(self.path, callback,
+                                                      SUBSCRIPTION_LEASE)
+        ws.send_str.assert_called_once_with(json.dumps({
+            'key': self.path,
+            'watching': 3
+        }))
+        item = mock.MagicMock()
+        for field in ('key', 'value', 'timestamp', 'expires', 'created_with',
+                      'public_key', 'name', 'signature'):
+            setattr(item, field, field)
+        callback(item)
+        self.assertEqual(json.dumps({
+            'key': self.path,
+            'status': 'updated',
+            'item': item_to_dict(item),
+        }), ws.send_str.call_args[0][0])
+        # Watching the same key again does nothing.
+        ah.websoc_handle_watch(ws, message, watches)
+        self.assertEqual(1, self.local_node.watch.call_count)
+
+    def test_websoc_handle_watch_error(self):
+        ws = mock.MagicMock()
+        ws.send_str = mock.MagicMock()
+        subscribed = asyncio.Future()
+        self.local_node.watch = mock.MagicMock(return_value=subscribed)
+        ah = ApplicationHandler(self.event_loop, self.connector,
+                                self.local_node)
+        message = {'type': 'watch', 'key': self.path, 'lease': 60}
+
+        @asyncio.coroutine
+        def run_test():
+            ah.websoc_handle_watch(ws, message, {})
+            subscribed.set_exception(ValueError('Bang'))
+            yield from asyncio.sleep(0)
+
+        self.event_loop.run_until_complete(run_test())
+        self.assertEqual(60, self.local_node.watch.call_args[0][2])
+        ws.send_str.assert_called_once_with(json.dumps({
+            'key': self.path,
+            'error': True
+        }))
+
+    def test_websoc_handle_watch_bad_lease(self):
+        ah = ApplicationHandler(self.event_loop, self.connector,
+                                self.local_node)
+        self.local_node.watch = mock.MagicMock()
+        message = {'type': 'watch', 'key': self.path, 'lease': -1}
+        with self.assertRaises(ValueError):
+            ah.websoc_handle_watch(mock.MagicMock(), message, {})
+        self.assertEqual(0, self.local_node.watch.call_count)
+
+    def test_websoc_handle_unwatch(self):
+        ws = mock.MagicMock()
+        ws.send_str = mock.MagicMock()
+        self.local_node.unwatch = mock.MagicMock()
+        ah = ApplicationHandler(self.event_loop, self.connector,
+                                self.local_node)
+        message = {'type': 'unwatch', 'key': self.path}
+        watches = {self.path: 'callback'}
+        ah.websoc_handle_unwatch(ws, message, watches)
+        self.local_node.unwatch.assert_called_once_with(self.path, 'callback')
+        self.assertEqual({}, watches)
+        ws.send_str.assert_called_once_with(json.dumps({
+            'key': self.path,
+            'watching': 0
+        }))
+
 
 class TestMakeHttpHandler(unittest.TestCase):
     """
@@ -4,7 +4,8 @@ Ensures that the netstring example Protocol and Connector class implementations
 work as expected.
 """
 from drogulus.net.netstring import (NetstringProtocol, NetstringConnector,
-                                    LENGTH)
+                                    LENGTH, ACCEPT, COMPRESSED)
+from drogulus.dht.metrics import MetricsRegistry
 from drogulus.dht.messages import OK, to_dict, from_dict
 from drogulus.dht.contact import PeerNode
 from drogulus.dht.crypto import get_seal
@@ -195,6 +196,96 @@ class TestNetstringProtocol(unittest.TestCase):
         expected = '%d:zɐq ɹɐq ooɟ,' % length
         transport.write.assert_called_once_with(expected.encode('utf-8'))
 
+    def make_protocol(self):
+        node = mock.MagicMock()
+        node.metrics = MetricsRegistry()
+        p = NetstringProtocol(mock.MagicMock(), node)
+        p.connection_made(mock.MagicMock())
+        p.string_received = mock.MagicMock()
+        return p
+
+    def test_send_large_string_announces_codecs(self):
+        """
+        The accepted compression codecs are announced before the first large
+        string is sent (uncompressed since the peer hasn't announced that it
+        accepts compressed netstrings).
+        """
+        p = self.make_protocol()
+        data = 'x' * p.COMPRESSION_THRESHOLD
+        p.send_string(data)
+        p.send_string(data)
+        calls = p.transport.write.call_args_list
+        self.assertEqual(3, len(calls))
+        announcement = ACCEPT + b'zlib'
+        self.assertEqual('{}:'.format(len(announcement)).encode('ascii') +
+                         announcement + b',', calls[0][0][0])
+        expected = '{}:{},'.format(len(data), data).encode('utf-8')
+        self.assertEqual(expected, calls[1][0][0])
+        self.assertEqual(expected, calls[2][0][0])
+
+    def test_compression_negotiated(self):
+        """
+        Once both ends have announced the codecs they accept, large strings
+        are sent compressed and decompressed on arrival.
+        """
+        client = self.make_protocol()
+        server = self.make_protocol()
+        pending = []
+        client.transport.write.side_effect = lambda data: pending.append(
+            (server, data))
+        server.transport.write.side_effect = lambda data: pending.append(
+            (client, data))
+
+        def deliver():
+            while pending:
+                protocol, data = pending.pop(0)
+                protocol.data_received(data)
+
+        data = 'the same old words ' * 100
+        client.send_string(data)
+        deliver()
+        self.assertEqual(set(['zlib']), server.peer_accepts)
+        self.assertEqual(set(['zlib']), client.peer_accepts)
+        client.send_string(data)
+        deliver()
+        server.string_received.assert_called_with(data)
+        self.assertEqual(2, server.string_received.call_count)
+        written = client.transport.write.call_args_list[-1][0][0]
+        self.assertIn(COMPRESSED, written)
+        self.assertTrue(len(written) < len(data))
+        self.assertEqual(1, client._node.metrics.counters[
+            'wire.compression.compressed'])
+        # Small strings aren't compressed.
+        client.send_string('small')
+        deliver()
+        self.assertEqual(b'5:small,',
+                         client.transport.write.call_args_list[-1][0][0])
+        server.string_received.assert_called_with('small')
+
+    def test_compression_disabled(self):
+        """
+        Nothing is announced or compressed if the threshold is None.
+        """
+        p = self.make_protocol()
+        p.COMPRESSION_THRESHOLD = None
+        p.peer_accepts = set(['zlib'])
+        data = 'the same old words ' * 100
+        p.send_string(data)
+        p.transport.write.assert_called_once_with(
+            '{}:{},'.format(len(data), data).encode('utf-8'))
+
+    def test_data_received_bad_compressed_data(self):
+        """
+        The connection is dropped if a compressed netstring can't be
+        decompressed.
+        """
+        p = self.make_protocol()
+        frame = COMPRESSED + b'rubbish'
+        p.data_received('{}:'.format(len(frame)).encode('ascii') + frame +
+                        b',')
+        p.transport.close.assert_called_once_with()
+        self.assertEqual(0, p.string_received.call_count)
+
 
 class TestNetstringConnector(unittest.TestCase):
     """
@@ -5,11 +5,15 @@ Tests for the core Drogulus class
 from drogulus.version import get_version
 from drogulus.node import Drogulus
 from drogulus.dht.node import Node
+from drogulus.dht.storage import DictDataStore, CompactDataStore
 from drogulus.dht.crypto import construct_key
-from drogulus.dht.constants import DUPLICATION_COUNT
+from drogulus.dht.contact import PeerNode
+from drogulus.dht.blobstore import value_digest
+from drogulus.dht.constants import DUPLICATION_COUNT, CHUNK_CONCURRENCY
 from drogulus.net.netstring import NetstringConnector
+from .items import make_item
 from .keys import PUBLIC_KEY, BAD_PUBLIC_KEY, PRIVATE_KEY
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import unittest
 import json
 import asyncio
@@ -61,6 +65,80 @@ class TestDrogulus(unittest.TestCase):
                      port=9999)
         self.assertEqual(d._node.reply_port, 9999)
 
+    def test_init_with_data_store(self):
+        """
+        Ensure the Drogulus instance passes on the data store to its Node
+        instance.
+        """
+        data_store = DictDataStore()
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     data_store=data_store)
+        self.assertIs(d._node.data_store, data_store)
+
+    def test_init_with_storage_budget(self):
+        """
+        Ensure the Drogulus instance passes on the storage budget to its Node
+        instance.
+        """
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     storage_budget=1024)
+        self.assertEqual(1024, d._node.data_store.max_bytes)
+
+    def test_init_with_blob_threshold(self):
+        """
+        Ensure the Drogulus instance's in-memory store shares large values
+        in a blob store if given a blob threshold.
+        """
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     blob_threshold=10)
+        node = d._node
+        self.assertEqual(10, node.data_store.blobs.threshold)
+        value = {'text': 'a large document'}
+        contact = PeerNode(PUBLIC_KEY, self.version,
+                           'http://192.168.0.1:1908')
+        foo = make_item('foo', value)
+        bar = make_item('bar', value)
+        node.handle_store(foo, contact)
+        node.handle_store(bar, contact)
+        self.assertEqual(2, len(node.data_store))
+        self.assertEqual(1, len(node.data_store.blobs))
+        foo = node.data_store[foo.key]
+        bar = node.data_store[bar.key]
+        self.assertIs(foo.value, bar.value)
+        self.assertEqual(value_digest(value),
+                         node.data_store.value_digest(foo.key))
+        node.republisher.stop()
+
+    def test_init_with_compress_threshold(self):
+        """
+        Ensure the Drogulus instance passes on the compress threshold to its
+        Node instance.
+        """
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     compress_threshold=100)
+        self.assertEqual(100, d._node.data_store.compress_threshold)
+        d._node.republisher.stop()
+
+    def test_init_compact(self):
+        """
+        Ensure the Drogulus instance passes on the compact flag to its Node
+        instance.
+        """
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     compact=True)
+        self.assertIsInstance(d._node.data_store, CompactDataStore)
+        d._node.republisher.stop()
+
+    def test_init_with_trace_sample_rate(self):
+        """
+        Ensure the Drogulus instance passes on the trace sample rate to its
+        Node instance's metrics.
+        """
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     trace_sample_rate=0.5)
+        self.assertEqual(0.5, d._node.metrics.trace_sample_rate)
+        d._node.republisher.stop()
+
     def test_init_with_whoami_dict(self):
         """
         Ensure that arbitrary data passed in as the whoami argument ends up
@@ -139,6 +217,21 @@ class TestDrogulus(unittest.TestCase):
         serialised = json.dumps(result)
         self.assertIsInstance(serialised, str)
 
+    def test_dump_metrics(self):
+        """
+        Ensure the local node's metrics are returned in a form that can be
+        serialised into JSON.
+        """
+        d = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop, self.connector,
+                     trace_sample_rate=1.0)
+        d._node.metrics.increment('foo')
+        d._node.metrics.sample_trace({'bar': 1})
+        result = d.dump_metrics()
+        self.assertEqual(1, result['counters']['foo'])
+        self.assertEqual([{'bar': 1}], result['traces'])
+        self.assertEqual(result, json.loads(json.dumps(result)))
+        d._node.republisher.stop()
+
     def test_whois(self):
         """
         Check that the whois method makes the appropriate request to the
@@ -162,7 +255,38 @@ class TestDrogulus(unittest.TestCase):
         drog._node.retrieve = MagicMock(return_value=result)
         pending_result = drog.get(PUBLIC_KEY, 'foo')
         expected = construct_key(PUBLIC_KEY, 'foo')
-        drog._node.retrieve.assert_called_once_with(expected)
+        drog._node.retrieve.assert_called_once_with(expected, 1, None)
+        self.assertEqual(result, pending_result)
+
+    def test_watch(self):
+        """
+        Ensure the watch and unwatch methods pass the compound key on to the
+        local node.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+        result = asyncio.Future()
+        drog._node.watch = MagicMock(return_value=result)
+        drog._node.unwatch = MagicMock(return_value=[])
+        callback = MagicMock()
+        self.assertEqual(result, drog.watch(PUBLIC_KEY, 'foo', callback, 60))
+        expected = construct_key(PUBLIC_KEY, 'foo')
+        drog._node.watch.assert_called_once_with(expected, callback, 60)
+        self.assertEqual([], drog.unwatch(PUBLIC_KEY, 'foo', callback))
+        drog._node.unwatch.assert_called_once_with(expected, callback)
+
+    def test_get_quorum(self):
+        """
+        Ensure the quorum and deadline arguments are passed on to the
+        retrieve method.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+        result = asyncio.Future()
+        drog._node.retrieve = MagicMock(return_value=result)
+        pending_result = drog.get(PUBLIC_KEY, 'foo', quorum=3, deadline=5)
+        expected = construct_key(PUBLIC_KEY, 'foo')
+        drog._node.retrieve.assert_called_once_with(expected, 3, 5)
         self.assertEqual(result, pending_result)
 
     def test_set(self):
@@ -189,6 +313,22 @@ class TestDrogulus(unittest.TestCase):
         self.assertEqual(called_with[7], 'foo')
         self.assertIsInstance(called_with[8], str)
 
+    def test_set_reserved_name(self):
+        """
+        Key names reserved for erasure coded fragments result in a
+        ValueError rather than a value that's mistaken for a fragment.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+        drog._node.replicate = MagicMock()
+        with self.assertRaises(ValueError):
+            drog.set('foo:fragment:1', 'bar')
+        with self.assertRaises(ValueError):
+            drog.set('foo:fragment:1', 'bar', erasure=(10, 20))
+        with self.assertRaises(ValueError):
+            drog.set_chunked('foo:fragment:1', b'bar')
+        self.assertEqual(0, drog._node.replicate.call_count)
+
     def test_set_with_expiry(self):
         """
         Ensure the expiry setting is passed into the replicate method.
@@ -213,6 +353,20 @@ class TestDrogulus(unittest.TestCase):
         self.assertEqual(called_with[7], 'foo')
         self.assertIsInstance(called_with[8], str)
 
+    def test_set_write_quorum(self):
+        """
+        Ensure the write quorum is passed into the replicate method.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+        result = asyncio.Future()
+        drog._node.replicate = MagicMock(return_value=result)
+        pending_result = drog.set('foo', 'bar', write_quorum=3)
+        self.assertEqual(result, pending_result)
+        called_with = drog._node.replicate.call_args_list[0][0]
+        self.assertEqual(called_with[0], DUPLICATION_COUNT)
+        self.assertEqual(called_with[9], 3)
+
     def test_set_bespoke_duplication_count(self):
         """
         Ensure the duplication count is passed into the replicate method.
@@ -236,3 +390,84 @@ class TestDrogulus(unittest.TestCase):
         self.assertEqual(called_with[6], PUBLIC_KEY)
         self.assertEqual(called_with[7], 'foo')
         self.assertIsInstance(called_with[8], str)
+
+    def test_set_chunked(self):
+        """
+        Ensure the chunked value is stored by a task with the local node.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+
+        @asyncio.coroutine
+        def faux_store(*args, **kwargs):
+            return {'manifest': 1}
+
+        with patch('drogulus.node.store_chunked',
+                   side_effect=faux_store) as store:
+            task = drog.set_chunked('foo', b'bar', duplicate=5,
+                                    concurrency=2)
+            self.assertIsInstance(task, asyncio.Task)
+            self.assertEqual({'manifest': 1},
+                             self.event_loop.run_until_complete(task))
+            store.assert_called_once_with(drog._node, 'foo', b'bar', 5, -1,
+                                          1, concurrency=2)
+
+    def test_get_chunked(self):
+        """
+        Ensure the chunked value is retrieved by a task with the local node.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+        sink = MagicMock()
+
+        @asyncio.coroutine
+        def faux_retrieve(*args, **kwargs):
+            return 3
+
+        with patch('drogulus.node.retrieve_chunked',
+                   side_effect=faux_retrieve) as retrieve:
+            task = drog.get_chunked(PUBLIC_KEY, 'foo', sink)
+            self.assertIsInstance(task, asyncio.Task)
+            self.assertEqual(3, self.event_loop.run_until_complete(task))
+            retrieve.assert_called_once_with(drog._node, PUBLIC_KEY, 'foo',
+                                             sink, CHUNK_CONCURRENCY)
+
+    def test_set_erasure(self):
+        """
+        Ensure a value is stored as erasure coded fragments by a task if the
+        erasure argument is given.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+        drog._node.replicate = MagicMock()
+
+        @asyncio.coroutine
+        def faux_store(*args, **kwargs):
+            return {'erasure': 1}
+
+        with patch('drogulus.node.store_coded',
+                   side_effect=faux_store) as store:
+            task = drog.set('foo', 'bar', erasure=(10, 20))
+            self.assertIsInstance(task, asyncio.Task)
+            self.assertEqual({'erasure': 1},
+                             self.event_loop.run_until_complete(task))
+            store.assert_called_once_with(drog._node, 'foo', 'bar', 10, 20,
+                                          DUPLICATION_COUNT, -1, 1)
+        self.assertEqual(0, drog._node.replicate.call_count)
+
+    def test_get_coded(self):
+        """
+        Ensure an erasure coded value is retrieved by a task.
+        """
+        drog = Drogulus(PRIVATE_KEY, PUBLIC_KEY, self.event_loop,
+                        self.connector)
+
+        @asyncio.coroutine
+        def faux_retrieve(*args, **kwargs):
+            return 'bar'
+
+        with patch('drogulus.node.retrieve_coded',
+                   side_effect=faux_retrieve) as retrieve:
+            task = drog.get_coded(PUBLIC_KEY, 'foo')
+            self.assertEqual('bar', self.event_loop.run_until_complete(task))
+            retrieve.assert_called_once_with(drog._node, PUBLIC_KEY, 'foo')